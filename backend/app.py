@@ -7,9 +7,10 @@ Las preguntas se generan dinámicamente usando OpenAI + RAG (Retrieval-Augmented
 
 import os
 import json
+import time
 import logging
 import sys
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from pathlib import Path
@@ -18,7 +19,15 @@ from datetime import datetime
 from openai import OpenAI
 from services.rag_service import get_rag_service
 from prompts.question_generator_prompt import get_question_generator_prompt
-from services.chatbot import generate_conversational_response
+from services.chatbot import generate_conversational_response, generate_turn, stream_turn
+from services.message_store import open_message_store
+from services.rag_lifecycle import RAGInitializer
+from services.question_prefetcher import QuestionPrefetcher
+from services.question_bank import get_question_bank
+from services.session_store import get_session_store
+from services.streaming import (
+    STREAM_MIMETYPES, JsonStringFieldStreamer, stream_mode, delta, final, format_event, relay_text, final_event
+)
 
 # Configure logging
 logging.basicConfig(
@@ -56,50 +65,83 @@ else:
     logger.error("❌ OpenAI API key NO encontrada!")
     openai_client = None
 
-# RAG Service (inicializado después de cargar mensajes)
+# RAG Service: se inicializa en background al arrancar (ver rag_initializer)
 rag_service = None
-_rag_initialized = False
 
-def ensure_rag_initialized():
-    """Asegura que el RAG service esté inicializado."""
-    global rag_service, _rag_initialized
+def build_rag_service():
+    """Carga mensajes y construye (o carga desde cache) el índice RAG."""
+    # Crear instancia del RAG service
+    service = get_rag_service(os.getenv('OPENAI_API_KEY'))
+    
+    if service.read_only:
+        # Worker multi-proceso: el cache ya lo preparó un único proceso (ver gunicorn.conf.py)
+        service.load_shared_index()
+        return service
+    
+    # Cargar mensajes regulares
+    all_messages = load_all_messages()
+    logger.info(f"📥 {len(all_messages)} mensajes cargados para RAG")
+    
+    # Cargar chunks prioritarios de transcripción
+    from services.spaces_loader import SpacesDataLoader
+    spaces_loader = SpacesDataLoader()
+    priority_messages = spaces_loader.download_priority_transcription()
+    logger.info(f"🎯 {len(priority_messages)} chunks prioritarios cargados")
+    
+    # Construir índice (o cargar desde cache) con prioridades
+    service.build_index(all_messages, force_rebuild=False, priority_messages=priority_messages)
+    return service
+
+
+def _initialize_rag():
+    """Inicializa el RAG service y los caches que dependen de él. Corre en el hilo de warm-up."""
+    global rag_service
+    
+    logger.info("📡 Inicializando RAG Service...")
+    print("📡 Inicializando RAG Service...")
+    
+    service = build_rag_service()
+    
+    # Mostrar estadísticas
+    stats = service.get_statistics()
+    logger.info(f"✅ RAG inicializado - Chunks: {stats.get('total_chunks', 0):,}")
+    print(f"✅ RAG inicializado - {stats.get('total_chunks', 0):,} chunks")
     
-    if _rag_initialized and rag_service is not None:
-        return rag_service
+    rag_service = service
     
+    # Contexto por tema y transcripción listos antes del primer request
     try:
-        logger.info("📡 Inicializando RAG Service...")
-        print("📡 Inicializando RAG Service...")
-        
-        # Crear instancia del RAG service
-        rag_service = get_rag_service(os.getenv('OPENAI_API_KEY'))
-        
-        # Cargar mensajes regulares
-        all_messages = load_all_messages()
-        logger.info(f"📥 {len(all_messages)} mensajes cargados para RAG")
-        
-        # Cargar chunks prioritarios de transcripción
-        from services.spaces_loader import SpacesDataLoader
-        spaces_loader = SpacesDataLoader()
-        priority_messages = spaces_loader.download_priority_transcription()
-        logger.info(f"🎯 {len(priority_messages)} chunks prioritarios cargados")
-        
-        # Construir índice (o cargar desde cache) con prioridades
-        rag_service.build_index(all_messages, force_rebuild=False, priority_messages=priority_messages)
-        
-        # Mostrar estadísticas
-        stats = rag_service.get_statistics()
-        logger.info(f"✅ RAG inicializado - Chunks: {stats.get('total_chunks', 0):,}")
-        print(f"✅ RAG inicializado - {stats.get('total_chunks', 0):,} chunks")
-        
-        _rag_initialized = True
-        return rag_service
-        
+        from services.question_context import get_question_context_cache, get_transcription_cache
+        get_transcription_cache().get()
+        get_question_context_cache().precompute(service)
     except Exception as e:
-        logger.error(f"❌ Error inicializando RAG: {e}")
-        print(f"❌ Error inicializando RAG: {e}")
-        rag_service = None
-        return None
+        logger.warning(f"⚠️ No se pudo precalcular el contexto de preguntas: {e}")
+    
+    # Reponer en background las variantes que falten en el banco de preguntas
+    question_bank.start(_bank_question)
+    
+    return service
+
+rag_initializer = RAGInitializer(_initialize_rag)
+
+def ensure_rag_initialized():
+    """
+    Devuelve el RAG service si ya está listo, o None sin bloquear.
+    Si todavía no arrancó (o falló hace rato) lanza la inicialización en background.
+    """
+    return rag_initializer.get()
+
+def rag_not_ready_response():
+    """Respuesta 503 para endpoints que necesitan el RAG mientras se inicializa."""
+    status = rag_initializer.status()
+    response = jsonify({
+        "success": False,
+        "error": "El sistema se está preparando, intenta de nuevo en unos segundos.",
+        "rag_status": status
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(status.get('retry_in_seconds') or 5))
+    return response
 
 # Conversation data path - resolver ruta absoluta
 CONVERSATION_PATH = os.getenv('CONVERSATION_DATA_PATH', '../karemramos_1184297046409691')
@@ -110,68 +152,84 @@ CONVERSATION_PATH = CONVERSATION_PATH.resolve()
 logger.info(f"📂 Ruta de conversación: {CONVERSATION_PATH}")
 print(f"📂 Ruta de conversación: {CONVERSATION_PATH}")
 
-# Global state with file persistence for production
-# Estructura: {session_id: {questions, current_index, answers, etc}}
-quiz_sessions = {}
+# Sesiones del quiz: una fila por sesión en el session store (SQLite WAL + LRU en memoria)
+# Estructura de cada sesión: {questions_asked, current_question_index, answers_history, etc}
+session_store = get_session_store()
 
-def load_quiz_sessions():
-    """Carga sesiones desde archivo para persistencia"""
-    global quiz_sessions
+def save_quiz_session(session_id: str, session: dict):
+    """Persiste una sesión (sólo la que cambió)"""
     try:
-        sessions_file = Path('cache/quiz_sessions.json')
-        if sessions_file.exists():
-            with open(sessions_file, 'r', encoding='utf-8') as f:
-                quiz_sessions = json.load(f)
-            print(f"📂 {len(quiz_sessions)} sesiones cargadas desde cache")
-        else:
-            print("📂 No hay sesiones previas, iniciando limpio")
+        session_store.put(session_id, session)
     except Exception as e:
-        print(f"❌ Error cargando sesiones: {e}")
-        quiz_sessions = {}
+        print(f"❌ Error guardando sesión {session_id}: {e}")
 
-def save_quiz_sessions():
-    """Guarda sesiones en archivo para persistencia"""
-    try:
-        cache_dir = Path('cache')
-        cache_dir.mkdir(exist_ok=True)
-        sessions_file = cache_dir / 'quiz_sessions.json'
-        
-        with open(sessions_file, 'w', encoding='utf-8') as f:
-            json.dump(quiz_sessions, f, ensure_ascii=False, indent=2)
-        print(f"💾 {len(quiz_sessions)} sesiones guardadas en cache")
-    except Exception as e:
-        print(f"❌ Error guardando sesiones: {e}")
 
-# Cargar sesiones al iniciar
-load_quiz_sessions()
+# Respuestas recordadas por sesión para reintentos con la misma Idempotency-Key
+IDEMPOTENT_RESPONSES_PER_SESSION = 10
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+
+
+def get_idempotency_key(data: dict, headers=None):
+    """Idempotency-Key del request (header o campo "idempotency_key" del body)."""
+    headers = request.headers if headers is None else headers
+    key = headers.get('Idempotency-Key') or data.get('idempotency_key')
+    key = str(key).strip()[:IDEMPOTENCY_KEY_MAX_LENGTH] if key else ''
+    return key or None
+
+
+def cached_response(session: dict, idempotency_key: str):
+    """Respuesta ya enviada para esta Idempotency-Key, o None."""
+    if not idempotency_key:
+        return None
+    return session.get('idempotent_responses', {}).get(idempotency_key)
+
+
+def remember_response(session: dict, idempotency_key: str, event: dict):
+    responses = session.setdefault('idempotent_responses', {})
+    responses[idempotency_key] = {'status': event['status'], 'data': event['data']}
+    while len(responses) > IDEMPOTENT_RESPONSES_PER_SESSION:
+        responses.pop(next(iter(responses)))
+
+
+def replay_events(cached: dict, stream: bool = False):
+    """Eventos de una respuesta repetida (en streaming, el mensaje sale en un solo delta)."""
+    if stream and cached['data'].get('message'):
+        yield delta(cached['data']['message'])
+    yield final(cached['data'], cached['status'])
+
+
+def persist_session_events(session_id: str, session: dict, events, idempotency_key: str = None):
+    """
+    Reemite los eventos de un endpoint del quiz guardando la sesión justo
+    antes del evento final (o al cortarse el flujo, p.ej. si el cliente
+    cierra el stream), así ninguna rama queda sin persistir. Con
+    `idempotency_key` la respuesta final queda guardada en la sesión.
+    """
+    saved = False
+    try:
+        for event in events:
+            if event['type'] == 'final':
+                if idempotency_key:
+                    remember_response(session, idempotency_key, event)
+                save_quiz_session(session_id, session)
+                saved = True
+            yield event
+    finally:
+        if not saved:
+            save_quiz_session(session_id, session)
 
 
 def load_messages_sample(max_messages: int = 1000):
     """Carga una muestra de mensajes para análisis."""
     print(f"📂 Cargando mensajes desde {CONVERSATION_PATH}...")
     
-    all_messages = []
-    conversation_dir = Path(CONVERSATION_PATH)
-    
-    # Leer todos los archivos de mensajes
-    for msg_file in sorted(conversation_dir.glob('message_*.json')):
-        try:
-            with open(msg_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                messages = data.get('messages', [])
-                all_messages.extend(messages)
-                
-                # Limitar para no cargar todo
-                if len(all_messages) >= max_messages:
-                    break
-        except Exception as e:
-            print(f"⚠️  Error leyendo {msg_file.name}: {e}")
-    
-    # Ordenar por timestamp
-    all_messages.sort(key=lambda x: x.get('timestamp_ms', 0))
+    store = open_message_store(CONVERSATION_PATH)
+    if store is None:
+        print(f"⚠️  No se encontraron mensajes en {CONVERSATION_PATH}")
+        return []
     
-    # Tomar solo los más recientes
-    recent_messages = all_messages[-max_messages:] if len(all_messages) > max_messages else all_messages
+    # El store ya está ordenado por timestamp: tomar solo los más recientes
+    recent_messages = store.to_messages(max(0, len(store) - max_messages))
     
     print(f"✅ {len(recent_messages)} mensajes cargados")
     return recent_messages
@@ -253,17 +311,13 @@ def load_all_messages():
             print(f"❌ Error listando directorio: {e}")
         return []
     
-    # Leer todos los archivos de mensajes
-    for msg_file in sorted(json_files):
-        try:
-            print(f"📖 Leyendo {msg_file.name}...")
-            with open(msg_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                messages = data.get('messages', [])
-                all_messages.extend(messages)
-                print(f"  ✅ {len(messages)} mensajes cargados desde {msg_file.name}")
-        except Exception as e:
-            print(f"⚠️  Error leyendo {msg_file.name}: {e}")
+    # Leer mensajes desde el store columnar (se construye una sola vez desde los JSON)
+    try:
+        store = open_message_store(conversation_dir)
+        all_messages.extend(store.to_messages())
+        print(f"  ✅ {len(store):,} mensajes cargados desde message store")
+    except Exception as e:
+        print(f"⚠️  Error leyendo message store: {e}")
     
     # Agregar archivos adicionales de transcripción e historia
     additional_messages = load_additional_story_files()
@@ -297,8 +351,9 @@ def load_additional_story_files():
                         additional_messages.append({
                             'sender_name': 'historia_transcripcion',
                             'content': content,
-                            'timestamp_ms': int(datetime.now().timestamp() * 1000),
-                            'type': 'historia_completa'
+                            'timestamp_ms': 0,  # Fijo: la huella RAG depende sólo del contenido
+                            'type': 'historia_completa',
+                            'document': True  # Al cambiar reemplaza sus chunks en el RAG
                         })
                         print(f"  ✅ Historia completa cargada desde {file_path}")
                         
@@ -311,8 +366,9 @@ def load_additional_story_files():
                         additional_messages.append({
                             'sender_name': 'timeline_estructurado',
                             'content': content,
-                            'timestamp_ms': int(datetime.now().timestamp() * 1000),
-                            'type': 'timeline_estructurado'
+                            'timestamp_ms': 0,  # Fijo: la huella RAG depende sólo del contenido
+                            'type': 'timeline_estructurado',
+                            'document': True  # Al cambiar reemplaza sus chunks en el RAG
                         })
                         print(f"  ✅ Timeline estructurado cargado desde {file_path}")
             else:
@@ -339,162 +395,27 @@ def format_messages_for_ai(messages: list) -> str:
     return "\n".join(formatted[-200:])  # Últimos 200 mensajes
 
 
-def generate_single_question_with_openai(messages: list, question_number: int, previous_questions: list = None) -> dict:
-    """
-    Genera UNA pregunta específica usando OpenAI + RAG.
-    Usa búsqueda semántica para encontrar contexto relevante en los mensajes.
-    """
-    # Asegurar que RAG esté inicializado - OBLIGATORIO, sin fallbacks
-    current_rag = ensure_rag_initialized()
-    if not current_rag:
-        print("❌ RAG service no disponible - no se pueden generar preguntas sin datos reales")
-        return None
-    
-    print(f"🤖 Generando pregunta #{question_number} con OpenAI + RAG...")
-    
-    # 🔍 PASO 1: Momentos importantes de la relación para búsqueda específica
-    # CADA TEMA se enfoca en HITOS REALES de su historia juntos
-    question_topics = [
-        "primer beso viernes reunión amigos trabajo besábamos fiestas",  # Primer beso
-        "flores tulipanes amarillos julio Rosatel Cusco entrega confundieron",  # Primer regalo de flores
-        "anticuchos lomo agosto 23 conversando vida bonito propuesta",  # Primer encuentro romántico
-        "página web flores especial enamorada innovar única manera",  # La propuesta especial
-        "Chimbote viaje planeado almorzar casa trabajo lindo pasaron",  # Viaje a Chimbote
-        "playa primer beso romántico viernes tarde abrazados besaron",  # Primer beso en la playa
-        "cine Lima septiembre primera vez juntos películas abrazados japonesa",  # Primera cita en Lima
-        "Trujillo hotel playa mar hermano conoció copas comer besaron",  # Segundo viaje
-        "papás familia septiembre acercó compartió familias conocer",  # Acercamiento familias
-        "Lima octubre trabajo mudó primeros días conseguir empleo",  # Karem se muda a Lima
-        "te amo domingo 5 octubre madrugada hablaron día siguiente",  # Declaración de amor
-        "restaurante especial primer invitó importante momento relación",  # Restaurante especial
-        "marzo 2025 empezamos amigos juntábamos amiga físicamente atraído",  # Inicio de la relación
-        "química conexión especial miércoles conocimos reuniones fiestas",  # Conexión inicial
-        "cocinar Chimbote primera vez preparó rico encantó comida"  # Primera vez cocinando
-    ]
-    
-    # Usar el índice exacto de la pregunta (sin rotar) para variedad
-    topic_index = min(question_number - 1, len(question_topics) - 1)
-    search_query = question_topics[topic_index]
-    
-    print(f"🔍 Búsqueda RAG: '{search_query}'...")
-    
-    # PRIORIDAD 1: Cargar TODA la transcripción completa de momentos importantes
+def build_question_messages(current_rag, question_number: int, previous_questions: list = None) -> list:
+    """Mensajes para OpenAI de la pregunta `question_number` (contexto del tema + transcripción)."""
+    # 🔍 PASO 1: Contexto del tema (chunks RAG + análisis de palabras), igual para todas
+    # las sesiones: se precalcula al arrancar y se sirve desde cache
+    from services.question_context import get_question_context_cache, get_transcription_cache
+    context = get_question_context_cache().get(current_rag, question_number)
+    print(f"🔍 Tema RAG: '{context['search_query']}' ({context['relevant_message_count']} mensajes, "
+          f"{context['high_quality_count']} de alta calidad)")
+    
+    # PRIORIDAD 1: TODA la transcripción completa de momentos importantes (revalidada con ETag)
     transcription_content = ""
-    
     try:
-        from services.spaces_loader import SpacesDataLoader
-        spaces_loader = SpacesDataLoader()
-        transcription_content = spaces_loader.download_complete_transcription()
-        
-        if not transcription_content:
-            # Fallback: intentar archivo local
-            transcription_path = Path(__file__).parent / "data/historia_completa_transcripcion.txt"
-            if transcription_path.exists():
-                with open(transcription_path, 'r', encoding='utf-8') as f:
-                    transcription_content = f.read()
-                print(f"✅ TRANSCRIPCIÓN desde archivo local: {len(transcription_content)} caracteres")
-        else:
-            print(f"✅ TRANSCRIPCIÓN desde Spaces: {len(transcription_content)} caracteres")
-            
+        transcription_content = get_transcription_cache().get()
     except Exception as e:
         print(f"❌ Error cargando transcripción: {e}")
     
-    # PRIORIDAD 2: Buscar chunks adicionales en RAG como complemento
-    relevant_chunks = current_rag.search(search_query, k=8)  # Menos chunks, transcripción es prioritaria
-    
-    # Extraer mensajes adicionales de RAG
-    relevant_messages = []
-    for chunk in relevant_chunks:
-        relevant_messages.extend(chunk['messages_in_chunk'])
-    
-    print(f"📚 Transcripción completa + {len(relevant_messages)} mensajes adicionales")
-    
-    # 📊 PASO 2: ANÁLISIS CONTEXTUAL ULTRA PROFUNDO
-    print(f"🔬 Analizando {len(relevant_messages)} mensajes para encontrar contextos únicos e irrepetibles...")
-    
-    # Filtrar mensajes por calidad, relevancia Y fecha (solo 2025)
-    high_quality_messages = []
-    for msg in relevant_messages:
-        content = msg.get('content', '').strip()
-        # Verificar que el mensaje sea de 2025
-        timestamp = msg.get('timestamp', 0)
-        if timestamp > 0:
-            from datetime import datetime
-            msg_date = datetime.fromtimestamp(timestamp)
-            if msg_date.year != 2025:
-                continue  # Saltar mensajes que no sean del 2025
-        
-        if len(content) > 10 and len(content) < 300:  # Mensajes de longitud óptima
-            high_quality_messages.append(msg)
-    
-    print(f"📋 {len(high_quality_messages)} mensajes de alta calidad seleccionados para análisis profundo")
-    
-    # Recopilar todos los mensajes completos para análisis detallado
-    detailed_messages = []
-    word_frequency = {}
-    phrase_patterns = {}
-    unique_contexts = {}
-    
-    for msg in relevant_messages:
-        content = msg.get('content', '')
-        sender = msg.get('sender_name', 'Unknown')
-        timestamp = msg.get('timestamp_ms', 0)
-        
-        if not content.strip():
-            continue
-            
-        date_str = datetime.fromtimestamp(timestamp / 1000).strftime('%d/%m/%Y %H:%M') if timestamp else 'fecha desconocida'
-        
-        # Guardar mensaje completo para análisis contextual
-        detailed_messages.append({
-            'sender': sender,
-            'content': content,
-            'date': date_str,
-            'timestamp': timestamp,
-            'length': len(content)
-        })
-        
-        # Análisis de frecuencia de palabras (dinámico)
-        words = content.lower().split()
-        for word in words:
-            if len(word) > 2:  # Ignorar palabras muy cortas
-                word_frequency[word] = word_frequency.get(word, 0) + 1
-        
-        # Detectar patrones de frases (bigramas y trigramas)
-        for i in range(len(words) - 1):
-            bigram = ' '.join(words[i:i+2])
-            phrase_patterns[bigram] = phrase_patterns.get(bigram, 0) + 1
-            
-        for i in range(len(words) - 2):
-            trigram = ' '.join(words[i:i+3])
-            phrase_patterns[trigram] = phrase_patterns.get(trigram, 0) + 1
-    
-    # Filtrar y ordenar por relevancia
-    significant_words = {word: count for word, count in word_frequency.items() 
-                        if count >= 2 and word not in ['que', 'para', 'con', 'por', 'una', 'del', 'las', 'los', 'pero', 'como', 'más', 'ser', 'hay', 'muy', 'fue', 'sus', 'son', 'ese', 'esa']}
-    
-    significant_phrases = {phrase: count for phrase, count in phrase_patterns.items() 
-                          if count >= 2 and len(phrase.split()) >= 2}
-    
-    # Ordenar por frecuencia
-    top_words = sorted(significant_words.items(), key=lambda x: x[1], reverse=True)[:10]
-    top_phrases = sorted(significant_phrases.items(), key=lambda x: x[1], reverse=True)[:10]
-    
-    print(f"📈 Palabras más frecuentes: {[f'{word}({count})' for word, count in top_words[:5]]}")
-    print(f"📈 Frases más frecuentes: {[f'{phrase}({count})' for phrase, count in top_phrases[:3]]}")
-    
-    # Usar los nuevos datos dinámicos en lugar de hardcodeados
-    dynamic_nicknames = top_words  # Las palabras más frecuentes pueden incluir apodos
-    dynamic_phrases = top_phrases
-    dynamic_locations = [(word, count) for word, count in top_words if any(loc in word for loc in ['casa', 'parque', 'cine', 'restaurante', 'lugar', 'café', 'playa'])]
-    
-    # 📝 Crear contexto rico con mensajes reales detallados
-    # Ordenar mensajes por timestamp para obtener fechas correctas (más reciente primero)
-    sorted_messages = sorted(detailed_messages, key=lambda x: x.get('timestamp', 0), reverse=True)
-    first_date = sorted_messages[-1]['date'] if sorted_messages else "fecha no disponible"  # Más antiguo
-    last_date = sorted_messages[0]['date'] if sorted_messages else "fecha no disponible"   # Más reciente
-    
-    print(f"📅 Rango de fechas: {first_date} hasta {last_date}")
+    # 📊 PASO 2: Datos dinámicos del análisis del tema
+    dynamic_nicknames = context['top_words']  # Las palabras más frecuentes pueden incluir apodos
+    dynamic_phrases = context['top_phrases']
+    dynamic_locations = context['top_locations']
+    last_date = context['last_date']
     
     # PRIORIDAD 1: Incluir TODA la transcripción de momentos importantes
     examples_text = "🌹 HISTORIA COMPLETA DE MOMENTOS ROMÁNTICOS IMPORTANTES:\n"
@@ -504,7 +425,7 @@ def generate_single_question_with_openai(messages: list, question_number: int, p
     # PRIORIDAD 2: Agregar mensajes adicionales como contexto complementario
     examples_text += "📱 MENSAJES ADICIONALES DE CONTEXTO:\n" + "\n".join([
         f"- [{msg['date']}] {msg['sender']}: \"{msg['content']}\""
-        for msg in detailed_messages[:8]  # Menos mensajes, transcripción es prioritaria
+        for msg in context['example_messages']  # Menos mensajes, transcripción es prioritaria
     ])
     
     previous_qs = "\n".join([f"- {q.get('question', '')}" for q in (previous_questions or [])]) if previous_questions else "ninguna"
@@ -519,22 +440,73 @@ def generate_single_question_with_openai(messages: list, question_number: int, p
         previous_qs=previous_qs,
         question_number=question_number
     )
+    
+    return [
+        {
+            "role": "system",
+            "content": "Eres un experto en crear quizzes románticos personalizados. Respondes SIEMPRE en JSON válido sin formato markdown."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+
+# Parámetros de la llamada que genera preguntas
+QUESTION_GENERATION_PARAMS = {
+    'model': "gpt-4o",
+    'temperature': 0.7,
+    'response_format': {"type": "json_object"}
+}
+
+
+def question_from_result(result: dict, previous_questions: list = None) -> dict:
+    """Normaliza el JSON de OpenAI al formato de pregunta de la sesión."""
+    # Validar que las opciones no se repitan con preguntas anteriores
+    new_options = set(result.get('options', []))
+    if previous_questions:
+        for prev_q in previous_questions:
+            prev_options = set(prev_q.get('options', []))
+            overlapping = new_options & prev_options
+            if overlapping:
+                print(f"⚠️ ADVERTENCIA: Opciones repetidas detectadas: {overlapping}")
+    
+    question_data = {
+        "question": result.get('question', ''),
+        "options": result.get('options', []),
+        "correct_answers": result.get('correct_answers', []),
+        "hints": result.get('hints', []),
+        "success_message": result.get('success_message', 'Correcto.'),
+        "category": result.get('category', 'general'),
+        "difficulty": result.get('difficulty', 'medium'),
+        "data_source": result.get('data_source', 'Datos de conversación')
+    }
+    
+    print(f"📋 Pregunta: {question_data['question']}")
+    print(f"🎯 Respuestas correctas: {question_data['correct_answers']}")
+    print(f"📊 Fuente: {question_data['data_source']}")
+    
+    return question_data
+
+
+def generate_single_question_with_openai(messages: list, question_number: int, previous_questions: list = None) -> dict:
+    """
+    Genera UNA pregunta específica usando OpenAI + RAG.
+    Usa búsqueda semántica para encontrar contexto relevante en los mensajes.
+    """
+    # RAG obligatorio, sin fallbacks (no bloquea: None si aún se está inicializando)
+    current_rag = ensure_rag_initialized()
+    if not current_rag:
+        print("❌ RAG service no disponible - no se pueden generar preguntas sin datos reales")
+        return None
+    
+    print(f"🤖 Generando pregunta #{question_number} con OpenAI + RAG...")
 
     try:
         response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un experto en crear quizzes románticos personalizados. Respondes SIEMPRE en JSON válido sin formato markdown."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
+            messages=build_question_messages(current_rag, question_number, previous_questions),
+            **QUESTION_GENERATION_PARAMS
         )
         
         result = json.loads(response.choices[0].message.content)
@@ -542,31 +514,7 @@ def generate_single_question_with_openai(messages: list, question_number: int, p
         
         print(f"✅ Pregunta generada ({tokens_used} tokens, ~${tokens_used * 0.000005:.4f})")
         
-        # Validar que las opciones no se repitan con preguntas anteriores
-        new_options = set(result.get('options', []))
-        if previous_questions:
-            for prev_q in previous_questions:
-                prev_options = set(prev_q.get('options', []))
-                overlapping = new_options & prev_options
-                if overlapping:
-                    print(f"⚠️ ADVERTENCIA: Opciones repetidas detectadas: {overlapping}")
-        
-        question_data = {
-            "question": result.get('question', ''),
-            "options": result.get('options', []),
-            "correct_answers": result.get('correct_answers', []),
-            "hints": result.get('hints', []),
-            "success_message": result.get('success_message', 'Correcto.'),
-            "category": result.get('category', 'general'),
-            "difficulty": result.get('difficulty', 'medium'),
-            "data_source": result.get('data_source', 'Datos de conversación')
-        }
-        
-        print(f"📋 Pregunta: {question_data['question']}")
-        print(f"🎯 Respuestas correctas: {question_data['correct_answers']}")
-        print(f"📊 Fuente: {question_data['data_source']}")
-        
-        return question_data
+        return question_from_result(result, previous_questions)
     
     except Exception as e:
         print(f"❌ Error generando pregunta con OpenAI: {e}")
@@ -578,132 +526,204 @@ def generate_single_question_with_openai(messages: list, question_number: int, p
         return None
 
 
-# Health check endpoint for monitoring and Docker
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint for deployment verification"""
-    logger.info("🔍 Health check endpoint called")
+def stream_single_question_with_openai(question_number: int, previous_questions: list = None):
+    """
+    Versión en streaming de generate_single_question_with_openai: emite el
+    texto de la pregunta a medida que OpenAI genera el JSON.
+    
+    Yields:
+        Fragmentos del campo "question"
+    
+    Returns:
+        La pregunta completa (como generate_single_question_with_openai) o None
+    """
+    current_rag = ensure_rag_initialized()
+    if not current_rag:
+        print("❌ RAG service no disponible - no se pueden generar preguntas sin datos reales")
+        return None
+    
+    print(f"🤖 Generando pregunta #{question_number} con OpenAI + RAG (streaming)...")
+    
     try:
-        current_rag = ensure_rag_initialized()
-        rag_enabled = current_rag is not None
-        total_messages = len(current_rag.chunk_texts) if current_rag else 0
+        stream = openai_client.chat.completions.create(
+            messages=build_question_messages(current_rag, question_number, previous_questions),
+            stream=True,
+            **QUESTION_GENERATION_PARAMS
+        )
         
-        logger.info(f"✅ Health check successful - RAG: {rag_enabled}, Messages: {total_messages}")
+        question_text = JsonStringFieldStreamer('question')
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content or ""
+            parts.append(text)
+            fragment = question_text.feed(text)
+            if fragment:
+                yield fragment
         
-        return jsonify({
-            "status": "ok",
-            "timestamp": datetime.now().isoformat(),
-            "rag_enabled": rag_enabled,
-            "total_messages": total_messages,
-            "environment": os.environ.get('FLASK_ENV', 'development'),
-            "port": os.environ.get('BACKEND_PORT', '5000')
-        })
+        result = json.loads("".join(parts))
+        print("✅ Pregunta generada (streaming)")
+        return question_from_result(result, previous_questions)
+    
     except Exception as e:
-        logger.error(f"❌ Health check failed: {str(e)}")
-        return jsonify({
-            "status": "error", 
-            "error": str(e)
-        }), 500
+        print(f"❌ Error generando pregunta con OpenAI: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+question_bank = get_question_bank()
+
+
+def _bank_question(question_number: int, previous_questions: list):
+    return generate_single_question_with_openai([], question_number=question_number, previous_questions=previous_questions)
+
+
+def draw_or_generate_question(messages: list, question_number: int, previous_questions: list = None) -> dict:
+    """
+    Saca la pregunta del banco pre-generado (O(1)); si no hay una variante
+    utilizable para el tema, la genera en vivo con OpenAI + RAG.
+    """
+    question = question_bank.draw(question_number, previous_questions)
+    if question:
+        return question
+    return generate_single_question_with_openai(messages, question_number=question_number, previous_questions=previous_questions)
+
+
+def _prefetch_question(question_number: int, previous_questions: list):
+    # Del banco primero: si el prefetch se descarta, la variante vuelve al banco (return_question)
+    return draw_or_generate_question([], question_number=question_number, previous_questions=previous_questions)
+
+
+def _prefetch_intro(next_question: dict, session_info: dict) -> str:
+    from services.chatbot import generate_next_question_intro
+    return generate_next_question_intro(openai_client=openai_client, next_question=next_question, session_info=session_info)
+
+
+question_prefetcher = QuestionPrefetcher(_prefetch_question, _prefetch_intro, return_question=question_bank.put_back)
+
+
+def schedule_question_prefetch(session_id: str, session: dict, prefetcher: QuestionPrefetcher = None):
+    """
+    Empieza a generar en background la pregunta que seguirá a la actual
+    (siguiente si acierta, reemplazo si agota los intentos).
+    """
+    prefetcher = prefetcher or question_prefetcher
+    total_questions = session['total_questions']
+    # Si acertar la pregunta actual completa el quiz, agotar sus intentos tampoco deja preguntas
+    if session.get('completed') or session['correct_answers'] + 1 >= total_questions:
+        prefetcher.discard(session_id)
+        return
+    
+    prefetcher.schedule(
+        session_id,
+        question_number=len(session['questions_asked']) + 1,
+        previous_questions=session['questions_asked'],
+        intro_session_info={
+            'current_question': session['current_question_index'] + 1,
+            'total_questions': total_questions,
+            'correct_answers': session['correct_answers'] + 1
+        }
+    )
+
+
+# Health check endpoints for monitoring and Docker
+@app.route('/health', methods=['GET'])
+@app.route('/api/health', methods=['GET'])
+@app.route('/api/health/live', methods=['GET'])
+def health_check():
+    """
+    Liveness: el proceso responde. Nunca espera al RAG; sólo informa su estado.
+    Para saber si puede atender tráfico usar /api/health/ready.
+    """
+    current_rag = ensure_rag_initialized()
+    rag_status = rag_initializer.status()
+    
+    return jsonify({
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "rag_enabled": current_rag is not None,
+        "rag_status": rag_status,
+        "total_messages": len(current_rag.chunk_texts) if current_rag else 0,
+        "environment": os.environ.get('FLASK_ENV', 'development'),
+        "port": os.environ.get('BACKEND_PORT', '5000')
+    })
+
+
+@app.route('/ready', methods=['GET'])
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 sólo cuando el RAG está listo; 503 mientras se inicializa o si falló."""
+    current_rag = ensure_rag_initialized()
+    rag_status = rag_initializer.status()
+    
+    if current_rag is None:
+        response = jsonify({"status": "not_ready", "timestamp": datetime.now().isoformat(), "rag_status": rag_status})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(rag_status.get('retry_in_seconds') or 5))
+        return response
+    
+    return jsonify({
+        "status": "ready",
+        "timestamp": datetime.now().isoformat(),
+        "rag_status": rag_status,
+        "total_chunks": len(current_rag.chunk_texts)
+    })
 
 def analyze_conversation_data():
     """Analiza los datos reales de conversación cargados"""
     try:
         from services.spaces_loader import load_messages_from_spaces
+        from services.conversation_stats import ConversationColumns, format_local_date
+        from services.stats_partials import get_stats_ledger
         
         print("📊 Analizando datos reales de conversación...")
         
-        # Intentar cargar mensajes desde Spaces o local
-        messages = []
+        # Intentar cargar mensajes desde Spaces o local; cada fuente tiene sus
+        # parciales por día y sólo se agregan los mensajes nuevos
+        ledger = None
         try:
             messages = load_messages_from_spaces()
-            print(f"✅ Mensajes cargados desde Spaces: {len(messages)}")
+            if messages:
+                print(f"✅ Mensajes cargados desde Spaces: {len(messages)}")
+                ledger = get_stats_ledger('spaces')
+                ledger.update_from_columns(ConversationColumns.from_messages(messages))
         except:
             print("⚠️ No se pudieron cargar desde Spaces, usando datos locales...")
-            # Cargar desde archivos locales como fallback
-            pass
         
-        if not messages:
-            return None
-            
-        # ANÁLISIS REAL DE DATOS
-        total_messages = len(messages)
-        
-        # Extraer fechas de los mensajes
-        dates = []
-        message_times = []
-        senders = {}
-        content_analysis = {
-            'total_chars': 0,
-            'romantic_keywords': 0,
-            'emojis': {},
-            'longest_message': 0,
-            'conversations_by_date': {}
-        }
+        if ledger is None:
+            # Fallback: parciales del message store local
+            store = open_message_store(CONVERSATION_PATH)
+            if store is None:
+                return None
+            ledger = get_stats_ledger('local')
+            ledger.update_from_store(store)
+            print(f"✅ Mensajes en message store: {len(store)}")
         
-        for msg in messages:
-            try:
-                # Análisis de fecha y hora
-                if 'timestamp_ms' in msg:
-                    timestamp = datetime.fromtimestamp(msg['timestamp_ms'] / 1000)
-                    dates.append(timestamp)
-                    message_times.append(timestamp.hour)
-                    date_key = timestamp.strftime('%Y-%m')
-                    content_analysis['conversations_by_date'][date_key] = content_analysis['conversations_by_date'].get(date_key, 0) + 1
-                
-                # Análisis de remitente
-                sender = msg.get('sender_name', 'Unknown')
-                senders[sender] = senders.get(sender, 0) + 1
-                
-                # Análisis de contenido
-                content = msg.get('content', '')
-                if content:
-                    content_analysis['total_chars'] += len(content)
-                    content_analysis['longest_message'] = max(content_analysis['longest_message'], len(content))
-                    
-                    # Buscar palabras románticas
-                    romantic_words = ['amor', 'te amo', 'mi vida', 'corazón', 'besitos', 'hermosa', 'princesa', 'mi amor', 'baby', 'cariño']
-                    content_lower = content.lower()
-                    for word in romantic_words:
-                        if word in content_lower:
-                            content_analysis['romantic_keywords'] += 1
-                    
-                    # Contar emojis
-                    import re
-                    emoji_pattern = re.compile("["
-                        "\U0001F600-\U0001F64F"  # emoticons
-                        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-                        "\U0001F680-\U0001F6FF"  # transport & map symbols
-                        "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                        "\U00002702-\U000027B0"
-                        "\U000024C2-\U0001F251"
-                        "]+", flags=re.UNICODE)
-                    
-                    emojis_found = emoji_pattern.findall(content)
-                    for emoji in emojis_found:
-                        content_analysis['emojis'][emoji] = content_analysis['emojis'].get(emoji, 0) + 1
-                        
-            except Exception as e:
-                print(f"Error procesando mensaje: {e}")
-                continue
+        # ANÁLISIS REAL DE DATOS (combinando los parciales por día)
+        start = time.perf_counter()
+        stats = ledger.conversation_stats()
+        print(f"⚡ Estadísticas combinadas de {len(ledger.buckets)} días en {(time.perf_counter() - start) * 1000:.0f}ms")
         
         # Calcular estadísticas
-        if dates:
-            dates.sort()
-            total_days = (dates[-1] - dates[0]).days + 1
+        if stats:
+            total_messages = stats['total_messages']
+            total_days = stats['total_days']
             avg_messages_per_day = round(total_messages / total_days, 1) if total_days > 0 else 0
             
             # Hora más activa
-            most_active_hour = max(set(message_times), key=message_times.count) if message_times else 12
+            hour_histogram = stats['hour_histogram']
+            most_active_hour = hour_histogram.index(max(hour_histogram))
             
             # Score de sentimiento basado en palabras románticas
-            sentiment_score = min(10, round((content_analysis['romantic_keywords'] / total_messages) * 100 + 5, 1))
+            sentiment_score = min(10, round((stats['romantic_keywords'] / total_messages) * 100 + 5, 1))
             
             # Top emojis
-            top_emojis = sorted(content_analysis['emojis'].items(), key=lambda x: x[1], reverse=True)[:5]
-            top_emojis_list = [emoji[0] for emoji in top_emojis] if top_emojis else ['❤', '�', '💜']
+            top_emojis_list = list(stats['emoji_counts']) or ['❤', '�', '💜']
             
             # Fases de la relación basadas en datos reales
-            monthly_data = sorted(content_analysis['conversations_by_date'].items())
+            monthly_data = sorted(stats['monthly_counts'].items())
             phases = []
             if len(monthly_data) >= 3:
                 third = len(monthly_data) // 3
@@ -731,16 +751,16 @@ def analyze_conversation_data():
                 "totalMessages": total_messages,
                 "totalDays": total_days,
                 "avgMessagesPerDay": avg_messages_per_day,
-                "longestConversation": content_analysis['longest_message'],
+                "longestConversation": stats['longest_message'],
                 "mostActiveHour": most_active_hour,
                 "sentimentScore": sentiment_score,
                 "relationshipPhases": phases,
                 "topEmojis": top_emojis_list,
-                "specialMoments": content_analysis['romantic_keywords'],
-                "senderDistribution": senders,
-                "totalChars": content_analysis['total_chars'],
-                "firstMessage": dates[0].strftime('%Y-%m-%d') if dates else None,
-                "lastMessage": dates[-1].strftime('%Y-%m-%d') if dates else None
+                "specialMoments": stats['romantic_keywords'],
+                "senderDistribution": stats['sender_counts'],
+                "totalChars": stats['total_chars'],
+                "firstMessage": format_local_date(stats['first_ms']),
+                "lastMessage": format_local_date(stats['last_ms'])
             }
         
         return None
@@ -873,6 +893,15 @@ def regenerate_relationship_stats():
     try:
         print("🔄 Forzando regeneración de estadísticas mejoradas...")
         
+        # Los parciales por día ya están al día con los mensajes nuevos; sólo
+        # se reconstruyen desde cero si se pide explícitamente
+        data = request.get_json(silent=True) or {}
+        if data.get('rebuild_partials'):
+            from services.stats_partials import get_stats_ledger
+            get_stats_ledger('local').clear()
+            get_stats_ledger('spaces').clear()
+            print("🗑️ Parciales de estadísticas descartados")
+        
         # Importar y ejecutar el analizador mejorado
         sys.path.append('..')
         from enhanced_stats_analyzer import EnhancedStatsAnalyzer
@@ -923,11 +952,13 @@ def get_stats_cache_info():
     """Obtiene información del cache de estadísticas"""
     try:
         from services.stats_cache import get_stats_cache
+        from services.stats_partials import get_stats_ledger
         stats_cache = get_stats_cache()
         
         cache_info = stats_cache.get_cache_info()
         return jsonify({
             "cache_info": cache_info,
+            "partials": {name: get_stats_ledger(name).info() for name in ('local', 'spaces')},
             "success": True
         })
     except Exception as e:
@@ -956,6 +987,76 @@ def clear_stats_cache():
         }), 500
 
 
+@app.route('/api/cache/question-context-info', methods=['GET'])
+def get_question_context_info():
+    """Estado del cache de contexto por tema y de la transcripción"""
+    try:
+        from services.question_context import get_question_context_cache, get_transcription_cache
+        return jsonify({
+            "question_context": get_question_context_cache().info(),
+            "transcription": get_transcription_cache().info(),
+            "question_prefetch": question_prefetcher.info(),
+            "question_bank": question_bank.info(),
+            "success": True
+        })
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "success": False
+        }), 500
+
+
+@app.route('/api/cache/clear-question-context', methods=['POST'])
+def clear_question_context_cache():
+    """Invalida el contexto por tema (y opcionalmente la transcripción y el banco de preguntas) para recalcularlo"""
+    try:
+        from services.question_context import get_question_context_cache, get_transcription_cache
+        data = request.get_json(silent=True) or {}
+        get_question_context_cache().invalidate(data.get('question_number'))
+        if data.get('transcription'):
+            get_transcription_cache().invalidate()
+        if data.get('question_bank'):
+            question_bank.clear(data.get('question_number'))
+        return jsonify({
+            "message": "Cache de contexto de preguntas invalidado",
+            "success": True
+        })
+    except Exception as e:
+        return jsonify({
+            "error": str(e),
+            "success": False
+        }), 500
+
+
+def quiz_response(events):
+    """
+    Responde con los eventos de un endpoint del quiz: JSON completo (evento
+    final) o, si el cliente lo pide (?stream=sse|ndjson o header Accept),
+    en streaming a medida que se generan.
+    """
+    mode = stream_mode(request.args.get('stream'), request.headers.get('Accept'))
+    if mode is None:
+        result = final_event(events)
+        return jsonify(result['data']), result['status']
+    
+    def generate():
+        try:
+            for event in events:
+                yield format_event(event, mode)
+        except Exception as e:
+            print(f"❌ Error en respuesta streaming: {e}")
+            yield format_event(final({"success": False, "error": "Error generando la respuesta."}, 500), mode)
+    
+    response = Response(generate(), mimetype=STREAM_MIMETYPES[mode])
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Sin buffering en proxies (nginx)
+    return response
+
+
+def wants_stream() -> bool:
+    return stream_mode(request.args.get('stream'), request.headers.get('Accept')) is not None
+
+
 @app.route('/api/start', methods=['POST'])
 @app.route('/api/start-quiz', methods=['POST'])  # Alias para compatibilidad con frontend
 def start_quiz():
@@ -977,9 +1078,11 @@ def start_quiz():
         "current_question": 1,
         "total_questions": 7
     }
-    """
-    global rag_service
     
+    Con ?stream=sse (o ndjson) emite un evento start con el session_id,
+    deltas del mensaje a medida que se genera la pregunta y un evento final
+    con el JSON de arriba.
+    """
     data = request.get_json()
     user_name = data.get('user_name', 'Mi Amor')
     total_questions = data.get('total_questions', 7)
@@ -991,34 +1094,70 @@ def start_quiz():
     print(f"🎯 Nueva sesión iniciada: {session_id}")
     print(f"{'='*60}")
     
-    # Asegurar que RAG esté inicializado
+    # El RAG se inicializa en background al arrancar: si aún no está listo, 503 sin bloquear
     current_rag = ensure_rag_initialized()
     if not current_rag:
-        return jsonify({
-            "success": False,
-            "error": "No se pudo inicializar el sistema RAG. Verifique la configuración."
-        }), 500
+        return rag_not_ready_response()
     
+    return quiz_response(_start_quiz_events(session_id, user_name, total_questions, stream=wants_stream()))
+
+
+def _start_quiz_events(session_id: str, user_name: str, total_questions: int, stream: bool = False):
+    """Eventos de start_quiz (ver quiz_response)."""
     # 🤖 Generar primera pregunta con OpenAI + RAG
     print(f"🤖 Generando pregunta #1 para {user_name}...")
     
     # Obtener mensajes de muestra para contexto inicial (ya no necesario con RAG, pero lo dejamos por compatibilidad)
     messages_sample = []
     
-    first_question = generate_single_question_with_openai(
-        messages_sample,
-        question_number=1,
-        previous_questions=None
-    )
+    greeting_intro = quiz_greeting(user_name, total_questions)
+    
+    if stream:
+        # El saludo no depende de OpenAI: sale de inmediato, y la pregunta token a token
+        yield {'type': 'start', 'session_id': session_id, 'total_questions': total_questions}
+        yield delta(greeting_intro)
+        first_question = question_bank.draw(1)
+        if first_question:
+            yield delta(first_question['question'])
+        else:
+            first_question = yield from relay_text(stream_single_question_with_openai(question_number=1, previous_questions=None))
+    else:
+        first_question = draw_or_generate_question(
+            messages_sample,
+            question_number=1,
+            previous_questions=None
+        )
     
     if not first_question or not first_question.get('question'):
-        return jsonify({
+        yield final({
             "success": False,
             "error": "No se pudo generar la primera pregunta. Sistema RAG requerido para preguntas personalizadas."
-        }), 500
+        }, 500)
+        return
     
     # Inicializar sesión
-    quiz_sessions[session_id] = {
+    session = new_quiz_session(user_name, total_questions, first_question, messages_sample)
+    
+    # Guardar sesión para persistencia
+    save_quiz_session(session_id, session)
+    
+    # ⚡ Pre-generar la pregunta 2 mientras se responde la 1
+    schedule_question_prefetch(session_id, session)
+    
+    yield final(start_quiz_result(session_id, greeting_intro, first_question, total_questions))
+
+
+def quiz_greeting(user_name: str, total_questions: int) -> str:
+    return (
+        f"Hola {user_name}.\n\n"
+        f"He preparado {total_questions} preguntas basadas en nuestras conversaciones. "
+        f"Al completarlas, tengo algo que decirte.\n\n"
+        f"Pregunta 1 de {total_questions}:\n\n"
+    )
+
+
+def new_quiz_session(user_name: str, total_questions: int, first_question: dict, messages_sample: list) -> dict:
+    return {
         "user_name": user_name,
         "total_questions": total_questions,
         "questions_asked": [first_question],
@@ -1033,28 +1172,19 @@ def start_quiz():
         "completed": False,
         "started_at": datetime.now().isoformat()
     }
-    
-    # Guardar sesión para persistencia
-    save_quiz_sessions()
-    
-    greeting = (
-        f"Hola {user_name}.\n\n"
-        f"He preparado {total_questions} preguntas basadas en nuestras conversaciones. "
-        f"Al completarlas, tengo algo que decirte.\n\n"
-        f"Pregunta 1 de {total_questions}:\n\n"
-        f"{first_question['question']}"
-    )
-    
-    return jsonify({
+
+
+def start_quiz_result(session_id: str, greeting_intro: str, first_question: dict, total_questions: int) -> dict:
+    return {
         "success": True,
         "session_id": session_id,
-        "message": greeting,
+        "message": greeting_intro + first_question['question'],
         "question": first_question['question'],  # Para frontend
         "options": first_question.get('options', []),
         "current_question": 1,
         "total_questions": total_questions,
         "attempts_left": 3
-    })
+    }
 
 
 @app.route('/api/answer', methods=['POST'])
@@ -1066,7 +1196,8 @@ def answer_question():
     Expected JSON body:
     {
         "session_id": "uuid",
-        "message": "user's answer"
+        "message": "user's answer",
+        "idempotency_key": "uuid"  (opcional, también como header Idempotency-Key)
     }
     
     Returns:
@@ -1080,46 +1211,119 @@ def answer_question():
         "is_correct": boolean,
         "completed": boolean
     }
+    
+    Con ?stream=sse (o ndjson) emite deltas del mensaje (los tokens de la
+    respuesta conversacional y de la pregunta a medida que llegan) y un
+    evento final con el JSON de arriba.
+    
+    Un reintento con la misma Idempotency-Key devuelve la respuesta del
+    primer envío sin volver a procesarlo.
     """
     data = request.get_json()
     session_id = data.get('session_id')
     user_message = data.get('message', '').strip().lower()
+    idempotency_key = get_idempotency_key(data)
     
-    if not session_id or session_id not in quiz_sessions:
+    session = session_store.get(session_id) if session_id else None
+    if session is None:
         return jsonify({
             "success": False,
             "error": "Invalid session ID"
         }), 400
     
-    session = quiz_sessions[session_id]
+    cached = cached_response(session, idempotency_key)
+    if cached:
+        print(f"♻️ Respuesta repetida (Idempotency-Key {idempotency_key}), se devuelve la anterior")
+        return quiz_response(replay_events(cached, stream=wants_stream()))
     
-    if session['completed']:
+    error = answer_precondition_error(session)
+    if error:
         return jsonify({
             "success": False,
-            "error": "Quiz already completed"
+            "error": error
         }), 400
     
-    current_index = session['current_question_index']
-    questions_asked = session['questions_asked']
-    total_questions = session['total_questions']
+    return quiz_response(_locked_answer_events(session_id, user_message, idempotency_key, stream=wants_stream()))
+
+
+def answer_precondition_error(session: dict):
+    """Motivo por el que la sesión no puede recibir una respuesta, o None."""
+    if session['completed']:
+        return "Quiz already completed"
     
     # Get current question
-    if current_index >= len(questions_asked):
-        return jsonify({
-            "success": False,
-            "error": "No current question available"
-        }), 400
-    
-    current_question = questions_asked[current_index]
-    correct_answers = current_question.get('correct_answers', [])
-    
-    # Check if answer is correct (case-insensitive, flexible matching)
-    is_correct = any(
+    if session['current_question_index'] >= len(session['questions_asked']):
+        return "No current question available"
+    return None
+
+
+def _locked_answer_events(session_id: str, user_message: str, idempotency_key: str = None, stream: bool = False):
+    """
+    Procesa la respuesta con la sesión bloqueada: dos envíos simultáneos
+    (doble click) se serializan en vez de pasar ambos el control de intentos
+    y disparar dos generaciones. Si el segundo trae la misma Idempotency-Key
+    recibe la respuesta del primero sin llamar a OpenAI.
+    """
+    with session_store.lock(session_id):
+        # Releer: la sesión pudo cambiar mientras se esperaba el lock
+        session = session_store.get(session_id)
+        if session is None:
+            yield final({"success": False, "error": "Invalid session ID"}, 400)
+            return
+        
+        cached = cached_response(session, idempotency_key)
+        if cached:
+            print(f"♻️ Respuesta repetida (Idempotency-Key {idempotency_key}), se devuelve la anterior")
+            yield from replay_events(cached, stream)
+            return
+        
+        error = answer_precondition_error(session)
+        if error:
+            yield final({"success": False, "error": error}, 400)
+            return
+        
+        yield from persist_session_events(
+            session_id, session, _answer_events(session_id, session, user_message, stream=stream),
+            idempotency_key=idempotency_key
+        )
+
+
+def is_correct_answer(correct_answers: list, user_message: str) -> bool:
+    """La respuesta es correcta si contiene (o está contenida en) alguna respuesta correcta."""
+    return any(
         correct.lower() in user_message or user_message in correct.lower()
         for correct in correct_answers
     )
+
+
+def hint_tail(current_question: dict, attempts: int, attempts_left: int) -> str:
+    """Pista del intento actual (si hay) y los intentos que quedan."""
+    hints = current_question.get('hints', [])
+    hint_text = ""
+    if attempts > 0 and attempts <= len(hints):
+        hint_text = f"\n\n💡 Pista: {hints[attempts - 1]}"
+    return f"{hint_text}\n\n¡Te quedan {attempts_left} intentos!"
+
+
+def apply_answer(session_id: str, session: dict, user_message: str, prefetcher: QuestionPrefetcher = None) -> dict:
+    """
+    Aplica una respuesta a la sesión (aciertos, intentos, pistas, historial y
+    fin del quiz) y decide la rama que sigue. Es la máquina de estados del
+    quiz, compartida con asgi.py: los endpoints sólo agregan las llamadas a
+    OpenAI de cada rama.
     
-    if is_correct:
+    Returns:
+        {'outcome': 'completed' | 'next_question' | 'exhausted' | 'replace_question' | 'hint',
+         'current_question', 'session_info'} más 'next_question_number' (next_question,
+         replace_question) o 'attempts' y 'attempts_left' (hint)
+    """
+    prefetcher = prefetcher or question_prefetcher
+    current_index = session['current_question_index']
+    total_questions = session['total_questions']
+    current_question = session['questions_asked'][current_index]
+    
+    # Check if answer is correct (case-insensitive, flexible matching)
+    if is_correct_answer(current_question.get('correct_answers', []), user_message):
         # ✅ RESPUESTA CORRECTA
         session['correct_answers'] += 1
         session['attempts_current_question'] = 0
@@ -1129,128 +1333,353 @@ def answer_question():
             'correct': True,
             'attempts': session['attempts_current_question']
         })
-        
         print(f"✅ Respuesta correcta! Total: {session['correct_answers']}/{total_questions}")
+        step = {'current_question': current_question, 'session_info': quiz_session_info(session)}
         
         # 🎉 CHECK IF QUIZ COMPLETED
         if session['correct_answers'] >= total_questions:
             session['completed'] = True
-            
-            # 🤖 Generar mensaje de completación conversacional con OpenAI
+            prefetcher.discard(session_id)
+            return {**step, 'outcome': 'completed'}
+        return {**step, 'outcome': 'next_question', 'next_question_number': current_index + 2}
+    
+    # ❌ RESPUESTA INCORRECTA
+    session['attempts_current_question'] += 1
+    attempts = session['attempts_current_question']
+    max_attempts = session.get('max_attempts_per_question', 3)
+    attempts_left = max_attempts - attempts
+    step = {'current_question': current_question, 'session_info': quiz_session_info(session)}
+    
+    print(f"❌ Respuesta incorrecta. Intento {attempts}/{max_attempts}")
+    
+    if attempts < max_attempts:
+        # 💡 DAR PISTA (aún tiene intentos)
+        session['hints_used'] += 1
+        return {**step, 'outcome': 'hint', 'attempts': attempts, 'attempts_left': attempts_left}
+    
+    # ⚠️ AGOTÓ LOS INTENTOS - Cambiar de pregunta
+    print(f"⚠️ Agotó los {max_attempts} intentos. Cambiando de pregunta...")
+    session['questions_skipped'] += 1
+    session['attempts_current_question'] = 0
+    session['answers_history'].append({
+        'question': current_question.get('question', ''),
+        'answer': user_message,
+        'correct': False,
+        'attempts': attempts,
+        'skipped': True
+    })
+    
+    # Verificar si aún puede completar el quiz
+    questions_remaining = total_questions - (session['correct_answers'] + session['questions_skipped'])
+    if questions_remaining <= 0:
+        session['completed'] = True
+        prefetcher.discard(session_id)
+        return {**step, 'outcome': 'exhausted'}
+    
+    next_question_number = len(session['questions_asked']) + 1
+    print(f"🤖 Generando pregunta de reemplazo #{next_question_number}...")
+    return {**step, 'outcome': 'replace_question', 'next_question_number': next_question_number}
+
+
+def quiz_session_info(session: dict) -> dict:
+    """session_info de la pregunta actual para los prompts del chatbot."""
+    return {
+        'current_question': session['current_question_index'] + 1,
+        'total_questions': session['total_questions'],
+        'correct_answers': session['correct_answers']
+    }
+
+
+EXHAUSTED_MESSAGE = "Has agotado los intentos disponibles.\n\nPuedes intentarlo de nuevo cuando gustes."
+
+
+def completion_event(completion_message: str) -> dict:
+    return final({
+        "success": True,
+        "message": completion_message,
+        "completed": True,
+        "is_correct": True,
+        "options": []
+    })
+
+
+def completion_error_event() -> dict:
+    return final({
+        "success": False,
+        "error": "No se pudo generar mensaje de completación personalizado.",
+        "completed": True
+    }, 500)
+
+
+def turn_error_event() -> dict:
+    return final({
+        "success": False,
+        "error": "No se pudo generar respuesta conversacional personalizada.",
+        "completed": True
+    }, 500)
+
+
+def exhausted_event() -> dict:
+    return final({
+        "success": True,
+        "message": EXHAUSTED_MESSAGE,
+        "completed": True,
+        "is_correct": False,
+        "options": []
+    })
+
+
+def question_failed_event(session: dict, replacement: bool = False) -> dict:
+    """Sin fallbacks: si no se pudo generar la pregunta, el quiz termina."""
+    session['completed'] = True
+    if replacement:
+        return final({
+            "success": False,
+            "error": "No se pudo generar pregunta de reemplazo. Quiz finalizado.",
+            "completed": True
+        }, 500)
+    return final({
+        "success": False,
+        "error": "No se pudo generar la siguiente pregunta. Quiz finalizado.",
+        "completed": True,
+        "message": "El quiz ha terminado debido a problemas técnicos."
+    }, 500)
+
+
+def advance_question(session: dict, question: dict):
+    session['questions_asked'].append(question)
+    session['current_question_index'] += 1
+
+
+def next_question_event(session_id: str, session: dict, step: dict, next_question: dict, response_message: str,
+                        prefetcher: QuestionPrefetcher = None) -> dict:
+    """Evento final tras un acierto (la pregunta ya se agregó con advance_question)."""
+    # ⚡ Pre-generar la pregunta que sigue a la que se acaba de mostrar
+    schedule_question_prefetch(session_id, session, prefetcher)
+    return final({
+        "success": True,
+        "message": response_message,
+        "options": next_question.get('options', []),
+        "current_question": step['next_question_number'],
+        "total_questions": session['total_questions'],
+        "correct_answers": session['correct_answers'],
+        "is_correct": True,
+        "completed": False,
+        "attempts_left": 3
+    })
+
+
+def replacement_intro(step: dict, session: dict) -> str:
+    return (
+        f"Probemos con otra pregunta.\n\n"
+        f"Pregunta {step['next_question_number']} de {session['total_questions']}:\n\n"
+    )
+
+
+def replacement_event(session_id: str, session: dict, step: dict, new_question: dict, response_intro: str,
+                      prefetcher: QuestionPrefetcher = None) -> dict:
+    """Muestra la pregunta de reemplazo tras agotar los intentos."""
+    advance_question(session, new_question)
+    schedule_question_prefetch(session_id, session, prefetcher)
+    return final({
+        "success": True,
+        "message": response_intro + new_question['question'],
+        "options": new_question.get('options', []),
+        "current_question": step['next_question_number'],
+        "total_questions": session['total_questions'],
+        "correct_answers": session['correct_answers'],
+        "is_correct": False,
+        "completed": False,
+        "attempts_left": 3,
+        "question_skipped": True
+    })
+
+
+def fallback_incorrect_response(current_question: dict) -> str:
+    correct_answer = current_question.get('correct_answers', ['la respuesta correcta'])[0]
+    return f"No exactamente, mi amor. La respuesta correcta era: {correct_answer} 💕"
+
+
+def hint_event(session: dict, step: dict, conversational_response: str, tail: str) -> dict:
+    # MANTENER LAS OPCIONES VISIBLES
+    return final({
+        "success": True,
+        "message": f"{conversational_response}{tail}",
+        "options": step['current_question'].get('options', []),  # ✅ Opciones siguen visibles
+        "current_question": step['session_info']['current_question'],
+        "total_questions": session['total_questions'],
+        "correct_answers": session['correct_answers'],
+        "is_correct": False,
+        "completed": False,
+        "attempts_left": step['attempts_left'],
+        "hint_given": True
+    })
+
+
+def _answer_events(session_id: str, session: dict, user_message: str, stream: bool = False):
+    """Eventos de answer_question (ver quiz_response); la máquina de estados está en apply_answer."""
+    step = apply_answer(session_id, session, user_message)
+    current_question = step['current_question']
+    session_info = step['session_info']
+    questions_asked = session['questions_asked']
+    
+    if step['outcome'] == 'completed':
+        # 🤖 Generar mensaje de completación conversacional con OpenAI
+        try:
+            from services.chatbot import generate_completion_message
+            completion_message = generate_completion_message(
+                openai_client=openai_client,
+                session_info=session_info,
+                rag_service=rag_service
+            )
+        except Exception as e:
+            print(f"❌ Error generando mensaje de completación: {e}")
+            yield completion_error_event()
+            return
+        
+        if stream:
+            yield delta(completion_message)
+        yield completion_event(completion_message)
+        return
+    
+    if step['outcome'] == 'next_question':
+        # 🤖 SIGUIENTE PREGUNTA: pre-generada en background si está disponible
+        next_question_number = step['next_question_number']
+        # En streaming no se espera a una pre-generación en curso: sigue mientras se emite la respuesta
+        prefetched = question_prefetcher.take(session_id, next_question_number, session_info=session_info, wait=not stream)
+        
+        if stream:
+            # Sin pregunta pre-generada, se genera en background mientras se emite la respuesta
+            if not prefetched and question_prefetcher.pending(session_id) is None:
+                question_prefetcher.schedule(session_id, next_question_number, questions_asked, intro_session_info=session_info)
             try:
-                from services.chatbot import generate_completion_message
-                completion_message = generate_completion_message(
+                turn = yield from relay_text(stream_turn(
                     openai_client=openai_client,
-                    session_info={
-                        'correct_answers': session['correct_answers'],
-                        'total_questions': total_questions,
-                        'current_question': current_index + 1
-                    },
-                    rag_service=rag_service
-                )
+                    user_answer=user_message,
+                    is_correct=True,
+                    question_info=current_question,
+                    session_info=session_info,
+                    rag_service=rag_service,
+                    next_question=prefetched['question'] if prefetched else None,
+                    next_question_intro=prefetched.get('intro') if prefetched else None
+                ))
             except Exception as e:
-                print(f"❌ Error generando mensaje de completación: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": "No se pudo generar mensaje de completación personalizado.",
-                    "completed": True
-                }), 500
+                print(f"❌ Error generando respuesta conversacional: {e}")
+                yield turn_error_event()
+                return
+            print(f"⏱️ Turno: {turn['timings_ms']}" + (f" (fallbacks: {turn['fallbacks']})" if turn['fallbacks'] else ""))
             
-            return jsonify({
-                "success": True,
-                "message": completion_message,
-                "completed": True,
-                "is_correct": True,
-                "options": []
-            })
-        
-        # 🤖 GENERAR SIGUIENTE PREGUNTA
-        next_question_number = current_index + 2
-        print(f"🤖 Generando pregunta #{next_question_number}...")
-        
-        next_question = generate_single_question_with_openai(
-            session['messages'],
-            question_number=next_question_number,
-            previous_questions=questions_asked
-        )
+            if not prefetched:
+                prefetched = question_prefetcher.take(session_id, next_question_number, session_info=session_info)
+            next_question = prefetched['question'] if prefetched else draw_or_generate_question(
+                session['messages'],
+                question_number=next_question_number,
+                previous_questions=questions_asked
+            )
+            question_intro = turn['intro'] or (prefetched.get('intro') if prefetched else None)
+        elif prefetched:
+            print(f"⚡ Usando pregunta #{next_question_number} pre-generada")
+            next_question = prefetched['question']
+        else:
+            print(f"🤖 Generando pregunta #{next_question_number}...")
+            next_question = draw_or_generate_question(
+                session['messages'],
+                question_number=next_question_number,
+                previous_questions=questions_asked
+            )
         
         if not next_question or not next_question.get('question'):
-            # Sin fallbacks - finalizar quiz si no se puede generar siguiente pregunta
-            session['completed'] = True
-            save_quiz_sessions()  # Persistir cambios
-            return jsonify({
-                "success": False,
-                "error": "No se pudo generar la siguiente pregunta. Quiz finalizado.",
-                "completed": True,
-                "message": "El quiz ha terminado debido a problemas técnicos."
-            }), 500
+            yield question_failed_event(session)
+            return
         
-        session['questions_asked'].append(next_question)
-        session['current_question_index'] += 1
+        advance_question(session, next_question)
         
-        # 🤖 Generar respuesta conversacional para respuesta correcta
-        try:
-            conversational_response = generate_conversational_response(
-                openai_client=openai_client,
-                context="",
-                user_answer=user_message,
-                is_correct=True,
-                question_info=current_question,
-                session_info={
-                    'current_question': current_index + 1,
-                    'total_questions': total_questions,
-                    'correct_answers': session['correct_answers']
-                },
-                rag_service=rag_service
-            )
-            
-            # Generar introducción para la siguiente pregunta
-            from services.chatbot import generate_next_question_intro
-            question_intro = generate_next_question_intro(
-                openai_client=openai_client,
-                next_question=next_question,
-                session_info={
-                    'current_question': current_index + 1,
-                    'total_questions': total_questions,
-                    'correct_answers': session['correct_answers']
-                }
+        if stream:
+            if not question_intro:
+                from services.chatbot import generate_next_question_intro
+                question_intro = generate_next_question_intro(
+                    openai_client=openai_client,
+                    next_question=next_question,
+                    session_info=session_info
+                )
+            tail = f"\n\n{question_intro}\n\n{next_question['question']}"
+            yield delta(tail)
+            response_message = turn['response'] + tail
+        else:
+            # 🤖 Respuesta conversacional + introducción de la siguiente pregunta en paralelo
+            # (la introducción normalmente ya viene pre-generada)
+            try:
+                turn = generate_turn(
+                    openai_client=openai_client,
+                    user_answer=user_message,
+                    is_correct=True,
+                    question_info=current_question,
+                    session_info=session_info,
+                    rag_service=rag_service,
+                    next_question=next_question,
+                    next_question_intro=prefetched.get('intro') if prefetched else None
+                )
+            except Exception as e:
+                print(f"❌ Error generando respuesta conversacional: {e}")
+                yield turn_error_event()
+                return
+            print(f"⏱️ Turno: {turn['timings_ms']}" + (f" (fallbacks: {turn['fallbacks']})" if turn['fallbacks'] else ""))
+            response_message = f"{turn['response']}\n\n{turn['intro']}\n\n{next_question['question']}"
+        
+        yield next_question_event(session_id, session, step, next_question, response_message)
+        return
+    
+    if step['outcome'] == 'exhausted':
+        if stream:
+            yield delta(EXHAUSTED_MESSAGE)
+        yield exhausted_event()
+        return
+    
+    if step['outcome'] == 'replace_question':
+        # 🤖 GENERAR NUEVA PREGUNTA (reemplazo)
+        next_question_number = step['next_question_number']
+        response_intro = replacement_intro(step, session)
+        if stream:
+            yield delta(response_intro)
+        
+        prefetched = question_prefetcher.take(session_id, next_question_number)
+        new_question = prefetched['question'] if prefetched else question_bank.draw(next_question_number, questions_asked)
+        if new_question:
+            print(f"⚡ Usando pregunta de reemplazo #{next_question_number} pre-generada")
+            if stream:
+                yield delta(new_question.get('question', ''))
+        elif stream:
+            new_question = yield from relay_text(stream_single_question_with_openai(
+                question_number=next_question_number,
+                previous_questions=questions_asked
+            ))
+        else:
+            new_question = generate_single_question_with_openai(
+                session['messages'],
+                question_number=next_question_number,
+                previous_questions=questions_asked
             )
-            
-            response_message = f"{conversational_response}\n\n{question_intro}\n\n{next_question['question']}"
-            
-        except Exception as e:
-            print(f"❌ Error generando respuesta conversacional: {e}")
-            return jsonify({
-                "success": False,
-                "error": "No se pudo generar respuesta conversacional personalizada.",
-                "completed": True
-            }), 500
         
-        # Guardar cambios de sesión
-        save_quiz_sessions()
-        
-        return jsonify({
-            "success": True,
-            "message": response_message,
-            "options": next_question.get('options', []),
-            "current_question": next_question_number,
-            "total_questions": total_questions,
-            "correct_answers": session['correct_answers'],
-            "is_correct": True,
-            "completed": False,
-            "attempts_left": 3
-        })
-    
+        if not new_question or not new_question.get('question'):
+            yield question_failed_event(session, replacement=True)
+            return
+        
+        yield replacement_event(session_id, session, step, new_question, response_intro)
+        return
+    
+    # 🤖 Respuesta conversacional para respuesta incorrecta + pista
+    # (sólo cuando se va a mostrar: al agotar los intentos se cambia de pregunta)
+    if stream:
+        turn = yield from relay_text(stream_turn(
+            openai_client=openai_client,
+            user_answer=user_message,
+            is_correct=False,
+            question_info=current_question,
+            session_info=session_info,
+            rag_service=rag_service
+        ))
+        conversational_response = turn['response']
     else:
-        # ❌ RESPUESTA INCORRECTA
-        session['attempts_current_question'] += 1
-        attempts = session['attempts_current_question']
-        max_attempts = session.get('max_attempts_per_question', 3)
-        attempts_left = max_attempts - attempts
-        
-        print(f"❌ Respuesta incorrecta. Intento {attempts}/{max_attempts}")
-        
-        # 🤖 Generar respuesta conversacional para respuesta incorrecta
         try:
             conversational_response = generate_conversational_response(
                 openai_client=openai_client,
@@ -1258,120 +1687,17 @@ def answer_question():
                 user_answer=user_message,
                 is_correct=False,
                 question_info=current_question,
-                session_info={
-                    'current_question': current_index + 1,
-                    'total_questions': total_questions,
-                    'correct_answers': session['correct_answers']
-                },
+                session_info=session_info,
                 rag_service=rag_service
             )
         except Exception as e:
             print(f"❌ Error generando respuesta conversacional: {e}")
-            correct_answer = current_question.get('correct_answers', ['la respuesta correcta'])[0]
-            conversational_response = f"No exactamente, mi amor. La respuesta correcta era: {correct_answer} 💕"
-        
-        # Obtener pista si hay disponible
-        hints = current_question.get('hints', [])
-        hint_text = ""
-        if attempts > 0 and attempts <= len(hints):
-            hint_text = f"\n\n💡 Pista: {hints[attempts - 1]}"
-        
-        # Verificar si agotó los 3 intentos
-        if attempts >= max_attempts:
-            # ⚠️ AGOTÓ LOS INTENTOS - Cambiar de pregunta
-            print(f"⚠️ Agotó los {max_attempts} intentos. Cambiando de pregunta...")
-            
-            session['questions_skipped'] += 1
-            session['attempts_current_question'] = 0
-            session['answers_history'].append({
-                'question': current_question.get('question', ''),
-                'answer': user_message,
-                'correct': False,
-                'attempts': attempts,
-                'skipped': True
-            })
-            
-            # Verificar si aún puede completar el quiz
-            questions_remaining = total_questions - (session['correct_answers'] + session['questions_skipped'])
-            
-            if questions_remaining <= 0:
-                # No puede completar el quiz
-                session['completed'] = True
-                return jsonify({
-                    "success": True,
-                    "message": "Has agotado los intentos disponibles.\n\nPuedes intentarlo de nuevo cuando gustes.",
-                    "completed": True,
-                    "is_correct": False,
-                    "options": []
-                })
-            
-            # 🤖 GENERAR NUEVA PREGUNTA (reemplazo)
-            next_question_number = len(questions_asked) + 1
-            print(f"🤖 Generando pregunta de reemplazo #{next_question_number}...")
-            
-            new_question = generate_single_question_with_openai(
-                session['messages'],
-                question_number=next_question_number,
-                previous_questions=questions_asked
-            )
-            
-            if not new_question or not new_question.get('question'):
-                # Sin fallbacks - finalizar quiz
-                session['completed'] = True
-                return jsonify({
-                    "success": False,
-                    "error": "No se pudo generar pregunta de reemplazo. Quiz finalizado.",
-                    "completed": True
-                }), 500
-            
-            session['questions_asked'].append(new_question)
-            session['current_question_index'] += 1
-            
-            response_message = (
-                f"Probemos con otra pregunta.\n\n"
-                f"Pregunta {next_question_number} de {total_questions}:\n\n"
-                f"{new_question['question']}"
-            )
-            
-            return jsonify({
-                "success": True,
-                "message": response_message,
-                "options": new_question.get('options', []),
-                "current_question": next_question_number,
-                "total_questions": total_questions,
-                "correct_answers": session['correct_answers'],
-                "is_correct": False,
-                "completed": False,
-                "attempts_left": 3,
-                "question_skipped": True
-            })
-        
-        # 💡 DAR PISTA (aún tiene intentos)
-        hints = current_question.get('hints', [])
-        
-        # Obtener la pista correcta según el intento
-        if hints and len(hints) >= attempts:
-            hint = hints[attempts - 1]  # Primera pista en intento 1, segunda en intento 2
-        else:
-            hint = "Piensa en nuestros momentos especiales... 💭"
-        
-        session['hints_used'] += 1
-        
-        response_message = f"{conversational_response}{hint_text}\n\n¡Te quedan {attempts_left} intentos!"
-        
-        # MANTENER LAS OPCIONES VISIBLES
-        return jsonify({
-            "success": True,
-            "message": response_message,
-            "options": current_question.get('options', []),  # ✅ Opciones siguen visibles
-            "current_question": current_index + 1,
-            "total_questions": total_questions,
-            "correct_answers": session['correct_answers'],
-            "is_correct": False,
-            "completed": False,
-            "attempts_left": attempts_left,
-            "hint_given": True
-        })
+            conversational_response = fallback_incorrect_response(current_question)
+    
+    tail = hint_tail(current_question, step['attempts'], step['attempts_left'])
+    if stream:
+        yield delta(tail)
+    yield hint_event(session, step, conversational_response, tail)
 
 
 @app.route('/api/get-location', methods=['POST'])
@@ -1387,14 +1713,13 @@ def get_location():
     data = request.get_json()
     session_id = data.get('session_id')
     
-    if not session_id or session_id not in quiz_sessions:
+    session = session_store.get(session_id) if session_id else None
+    if session is None:
         return jsonify({
             "success": False,
             "error": "Invalid session ID"
         }), 400
     
-    session = quiz_sessions[session_id]
-    
     if not session['completed']:
         return jsonify({
             "success": False,
@@ -1419,51 +1744,32 @@ def get_location():
     })
 
 
+# Warm-up del RAG al arrancar el proceso (p.ej. waitress-serve/gunicorn importan este módulo)
+if __name__ != '__main__' and os.getenv('RAG_EAGER_INIT', 'True') == 'True':
+    rag_initializer.start()
+
+
+if __name__ == '__main__' and '--prepare-cache' in sys.argv:
+    # Sólo construir/actualizar el cache del RAG (ingesta incremental, BM25) y salir:
+    # gunicorn.conf.py lo corre una vez antes de arrancar los workers de sólo lectura
+    build_rag_service()
+    print("✅ Cache del RAG preparado")
+    sys.exit(0)
+
+
 if __name__ == '__main__':
-    # 🚀 Inicializar RAG Service al inicio
     print("\n" + "="*60)
     print("🚀 Inicializando Romantic AI Proposal System v3.0 - Dashboard Edition")
     print("="*60)
     print(f"🏷️  Build: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    try:
-        # Cargar todos los mensajes
-        logger.info("📥 Cargando mensajes...")
-        all_messages = load_all_messages()
-        logger.info(f"✅ {len(all_messages)} mensajes cargados")
-        
-        # Inicializar RAG
-        logger.info("📡 Inicializando RAG Service...")
-        print("\n📡 Inicializando RAG Service...")
-        rag_service = get_rag_service(os.getenv('OPENAI_API_KEY'))
-        logger.info("✅ RAG Service creado")
-        
-        # Construir índice (o cargar desde cache)
-        logger.info("🔨 Construyendo índice RAG...")
-        rag_service.build_index(all_messages, force_rebuild=False)
-        logger.info("✅ Índice RAG construido")
-        
-        # Mostrar estadísticas
-        stats = rag_service.get_statistics()
-        logger.info(f"📊 RAG Stats - Chunks: {stats.get('total_chunks', 0):,}")
-        print("\n📊 Estadísticas del RAG:")
-        print(f"  - Total chunks: {stats.get('total_chunks', 0):,}")
-        print(f"  - Total mensajes: {stats.get('total_messages', 0):,}")
-        print(f"  - Total vectores: {stats.get('total_vectors', 0):,}")
-        print(f"  - Modelo embeddings: {stats.get('embedding_model', 'N/A')}")
-        print(f"  - Dimensión: {stats.get('embedding_dimension', 0)}")
-        print(f"  - Tamaño índice: {stats.get('index_size_mb', 0):.2f} MB")
-        print(f"  - Cache existe: {'✅' if stats.get('cache_exists', False) else '❌'}")
-        
-        print("\n" + "="*60)
-        print("✅ Sistema inicializado correctamente")
-        print("="*60 + "\n")
-        
-    except Exception as e:
-        print(f"\n❌ Error inicializando sistema: {e}")
-        import traceback
-        traceback.print_exc()
-        print("\n⚠️  El sistema continuará sin RAG, usando método básico.")
+    # 🚀 Inicializar RAG Service en background: el servidor empieza a aceptar
+    # requests de inmediato y /api/health/ready indica cuándo está listo.
+    # Con el reloader de Flask, sólo el proceso hijo (el que atiende) lo inicializa.
+    if not app.config['DEBUG'] or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        logger.info("📡 Inicializando RAG Service en background...")
+        print("\n📡 Inicializando RAG Service en background...")
+        rag_initializer.start()
     
     # Iniciar servidor
     # DigitalOcean usa puerto 8080 por defecto para health checks
@@ -0,0 +1,520 @@
+"""
+Servidor ASGI - Variante async de la API de app.py
+Mismas rutas y mismas respuestas, pero los endpoints que esperan a OpenAI
+(/api/start, /api/start-quiz, /api/answer, /api/chat) son corutinas que usan
+el cliente AsyncOpenAI: mientras una llamada está en vuelo el proceso sigue
+atendiendo otras sesiones, en lugar de ocupar uno de los 4 threads de
+waitress durante segundos.
+
+    cd backend && uvicorn asgi:app --host 0.0.0.0 --port 8080
+
+- El resto de rutas (health, estadísticas, cache, /api/get-location) las
+  atiende la app Flask de siempre a través de un adaptador WSGI.
+- Sesiones, banco de preguntas, contexto por tema y warm-up del RAG son los
+  mismos objetos de app.py.
+- El prefetch de la siguiente pregunta es una task del event loop
+  (AsyncQuestionPrefetcher) y el lock de cada sesión un asyncio.Lock
+  (más un flock con SESSION_STORE_SHARED).
+"""
+
+import os
+import json
+import uuid
+import asyncio
+from openai import AsyncOpenAI
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, Mount
+from asgiref.wsgi import WsgiToAsgi
+
+import app as flask_api
+from services.async_chatbot import (
+    agenerate_conversational_response, agenerate_next_question_intro, agenerate_turn, astream_turn,
+    agenerate_completion_message
+)
+from services.question_prefetcher import AsyncQuestionPrefetcher
+from services.streaming import (
+    STREAM_MIMETYPES, JsonStringFieldStreamer, StreamResult, stream_mode, delta, final, format_event,
+    arelay_text, afinal_event
+)
+
+logger = flask_api.logger
+
+session_store = flask_api.session_store
+question_bank = flask_api.question_bank
+
+# Cliente async de OpenAI (las llamadas se esperan sin bloquear el event loop)
+openai_api_key = os.getenv('OPENAI_API_KEY')
+async_openai_client = AsyncOpenAI(api_key=openai_api_key) if openai_api_key else None
+
+
+def current_rag_service():
+    """El RAG service de app.py (lo asigna el warm-up cuando termina)."""
+    return flask_api.rag_service
+
+
+async def generate_single_question(question_number: int, previous_questions: list = None) -> dict:
+    """Versión async de generate_single_question_with_openai."""
+    current_rag = flask_api.ensure_rag_initialized()
+    if not current_rag:
+        print("❌ RAG service no disponible - no se pueden generar preguntas sin datos reales")
+        return None
+
+    print(f"🤖 Generando pregunta #{question_number} con OpenAI + RAG...")
+
+    try:
+        # El contexto del tema sale del cache (o de una búsqueda híbrida si venció): en un thread
+        messages = await asyncio.to_thread(flask_api.build_question_messages, current_rag, question_number, previous_questions)
+        response = await async_openai_client.chat.completions.create(
+            messages=messages,
+            **flask_api.QUESTION_GENERATION_PARAMS
+        )
+
+        result = json.loads(response.choices[0].message.content)
+        tokens_used = response.usage.total_tokens
+
+        print(f"✅ Pregunta generada ({tokens_used} tokens, ~${tokens_used * 0.000005:.4f})")
+
+        return flask_api.question_from_result(result, previous_questions)
+
+    except Exception as e:
+        print(f"❌ Error generando pregunta con OpenAI: {e}")
+        return None
+
+
+async def stream_single_question(question_number: int, previous_questions: list, result: StreamResult):
+    """
+    Versión async de stream_single_question_with_openai: emite el texto de
+    la pregunta y deja la pregunta completa (o None) en `result.value`.
+    """
+    current_rag = flask_api.ensure_rag_initialized()
+    if not current_rag:
+        print("❌ RAG service no disponible - no se pueden generar preguntas sin datos reales")
+        return
+
+    print(f"🤖 Generando pregunta #{question_number} con OpenAI + RAG (streaming)...")
+
+    try:
+        messages = await asyncio.to_thread(flask_api.build_question_messages, current_rag, question_number, previous_questions)
+        stream = await async_openai_client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            **flask_api.QUESTION_GENERATION_PARAMS
+        )
+
+        question_text = JsonStringFieldStreamer('question')
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content or ""
+            parts.append(text)
+            fragment = question_text.feed(text)
+            if fragment:
+                yield fragment
+
+        question = json.loads("".join(parts))
+        print("✅ Pregunta generada (streaming)")
+        result.value = flask_api.question_from_result(question, previous_questions)
+
+    except Exception as e:
+        print(f"❌ Error generando pregunta con OpenAI: {e}")
+
+
+async def draw_or_generate_question(question_number: int, previous_questions: list = None) -> dict:
+    """Versión async de draw_or_generate_question (el banco es una lectura SQLite local)."""
+    question = question_bank.draw(question_number, previous_questions)
+    if question:
+        return question
+    return await generate_single_question(question_number, previous_questions)
+
+
+async def _prefetch_question(question_number: int, previous_questions: list):
+    # Del banco primero: si el prefetch se descarta, la variante vuelve al banco (return_question)
+    return await draw_or_generate_question(question_number, previous_questions)
+
+
+async def _prefetch_intro(next_question: dict, session_info: dict) -> str:
+    return await agenerate_next_question_intro(async_openai_client, next_question, session_info)
+
+
+question_prefetcher = AsyncQuestionPrefetcher(_prefetch_question, _prefetch_intro, return_question=question_bank.put_back)
+
+
+def schedule_question_prefetch(session_id: str, session: dict):
+    flask_api.schedule_question_prefetch(session_id, session, prefetcher=question_prefetcher)
+
+
+def cors_headers(request: Request) -> dict:
+    """Los mismos headers CORS que flask-cors para las rutas async (los preflight los responde Flask)."""
+    origin = request.headers.get('origin')
+    return {'Access-Control-Allow-Origin': origin, 'Vary': 'Origin'} if origin else {}
+
+
+def json_error(request: Request, data: dict, status: int) -> JSONResponse:
+    return JSONResponse(data, status_code=status, headers=cors_headers(request))
+
+
+def rag_not_ready_response(request: Request) -> JSONResponse:
+    """Respuesta 503 mientras el RAG se inicializa (como en app.py)."""
+    status = flask_api.rag_initializer.status()
+    response = json_error(request, {
+        "success": False,
+        "error": "El sistema se está preparando, intenta de nuevo en unos segundos.",
+        "rag_status": status
+    }, 503)
+    response.headers['Retry-After'] = str(int(status.get('retry_in_seconds') or 5))
+    return response
+
+
+async def read_json(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def wants_stream(request: Request) -> bool:
+    return stream_mode(request.query_params.get('stream'), request.headers.get('accept')) is not None
+
+
+async def quiz_response(request: Request, events):
+    """Como quiz_response de app.py: JSON completo o streaming SSE/NDJSON."""
+    mode = stream_mode(request.query_params.get('stream'), request.headers.get('accept'))
+    if mode is None:
+        result = await afinal_event(events)
+        return JSONResponse(result['data'], status_code=result['status'], headers=cors_headers(request))
+
+    async def generate():
+        try:
+            async for event in events:
+                yield format_event(event, mode)
+        except Exception as e:
+            print(f"❌ Error en respuesta streaming: {e}")
+            yield format_event(final({"success": False, "error": "Error generando la respuesta."}, 500), mode)
+
+    headers = {
+        **cors_headers(request),
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Sin buffering en proxies (nginx)
+    }
+    return StreamingResponse(generate(), media_type=STREAM_MIMETYPES[mode], headers=headers)
+
+
+async def persist_session_events(session_id: str, session: dict, events, idempotency_key: str = None):
+    """Versión async de persist_session_events."""
+    saved = False
+    try:
+        async for event in events:
+            if event['type'] == 'final':
+                if idempotency_key:
+                    flask_api.remember_response(session, idempotency_key, event)
+                flask_api.save_quiz_session(session_id, session)
+                saved = True
+            yield event
+    finally:
+        if not saved:
+            flask_api.save_quiz_session(session_id, session)
+
+
+async def replay_events(cached: dict, stream: bool = False):
+    for event in flask_api.replay_events(cached, stream):
+        yield event
+
+
+async def start_quiz(request: Request):
+    """Versión async de start_quiz (ver app.py)."""
+    data = await read_json(request)
+    if data is None:
+        return json_error(request, {"success": False, "error": "Invalid JSON body"}, 400)
+    user_name = data.get('user_name', 'Mi Amor')
+    total_questions = data.get('total_questions', 7)
+
+    session_id = str(uuid.uuid4())
+
+    print(f"\n{'='*60}")
+    print(f"🎯 Nueva sesión iniciada: {session_id}")
+    print(f"{'='*60}")
+
+    current_rag = flask_api.ensure_rag_initialized()
+    if not current_rag:
+        return rag_not_ready_response(request)
+
+    return await quiz_response(request, _start_quiz_events(session_id, user_name, total_questions, stream=wants_stream(request)))
+
+
+async def _start_quiz_events(session_id: str, user_name: str, total_questions: int, stream: bool = False):
+    print(f"🤖 Generando pregunta #1 para {user_name}...")
+
+    greeting_intro = flask_api.quiz_greeting(user_name, total_questions)
+
+    if stream:
+        yield {'type': 'start', 'session_id': session_id, 'total_questions': total_questions}
+        yield delta(greeting_intro)
+        first_question = question_bank.draw(1)
+        if first_question:
+            yield delta(first_question['question'])
+        else:
+            result = StreamResult()
+            async for event in arelay_text(stream_single_question(1, None, result)):
+                yield event
+            first_question = result.value
+    else:
+        first_question = await draw_or_generate_question(1)
+
+    if not first_question or not first_question.get('question'):
+        yield final({
+            "success": False,
+            "error": "No se pudo generar la primera pregunta. Sistema RAG requerido para preguntas personalizadas."
+        }, 500)
+        return
+
+    session = flask_api.new_quiz_session(user_name, total_questions, first_question, [])
+    flask_api.save_quiz_session(session_id, session)
+
+    # ⚡ Pre-generar la pregunta 2 mientras se responde la 1
+    schedule_question_prefetch(session_id, session)
+
+    yield final(flask_api.start_quiz_result(session_id, greeting_intro, first_question, total_questions))
+
+
+async def answer_question(request: Request):
+    """Versión async de answer_question (ver app.py)."""
+    data = await read_json(request)
+    if data is None:
+        return json_error(request, {"success": False, "error": "Invalid JSON body"}, 400)
+    session_id = data.get('session_id')
+    user_message = data.get('message', '').strip().lower()
+    idempotency_key = flask_api.get_idempotency_key(data, request.headers)
+
+    session = session_store.get(session_id) if session_id else None
+    if session is None:
+        return json_error(request, {"success": False, "error": "Invalid session ID"}, 400)
+
+    cached = flask_api.cached_response(session, idempotency_key)
+    if cached:
+        print(f"♻️ Respuesta repetida (Idempotency-Key {idempotency_key}), se devuelve la anterior")
+        return await quiz_response(request, replay_events(cached, stream=wants_stream(request)))
+
+    error = flask_api.answer_precondition_error(session)
+    if error:
+        return json_error(request, {"success": False, "error": error}, 400)
+
+    return await quiz_response(request, _locked_answer_events(session_id, user_message, idempotency_key, stream=wants_stream(request)))
+
+
+async def _locked_answer_events(session_id: str, user_message: str, idempotency_key: str = None, stream: bool = False):
+    """Como _locked_answer_events de app.py, esperando el lock sin bloquear el event loop."""
+    async with session_store.async_lock(session_id):
+        session = session_store.get(session_id)
+        if session is None:
+            yield final({"success": False, "error": "Invalid session ID"}, 400)
+            return
+
+        cached = flask_api.cached_response(session, idempotency_key)
+        if cached:
+            print(f"♻️ Respuesta repetida (Idempotency-Key {idempotency_key}), se devuelve la anterior")
+            async for event in replay_events(cached, stream):
+                yield event
+            return
+
+        error = flask_api.answer_precondition_error(session)
+        if error:
+            yield final({"success": False, "error": error}, 400)
+            return
+
+        events = _answer_events(session_id, session, user_message, stream=stream)
+        async for event in persist_session_events(session_id, session, events, idempotency_key=idempotency_key):
+            yield event
+
+
+async def _answer_events(session_id: str, session: dict, user_message: str, stream: bool = False):
+    """
+    Eventos de answer_question: las ramas y los cambios de sesión son los de
+    flask_api.apply_answer; aquí sólo se esperan las llamadas a OpenAI.
+    """
+    step = flask_api.apply_answer(session_id, session, user_message, prefetcher=question_prefetcher)
+    current_question = step['current_question']
+    session_info = step['session_info']
+    questions_asked = session['questions_asked']
+    rag_service = current_rag_service()
+
+    if step['outcome'] == 'completed':
+        try:
+            completion_message = await agenerate_completion_message(
+                openai_client=async_openai_client,
+                session_info=session_info,
+                rag_service=rag_service
+            )
+        except Exception as e:
+            print(f"❌ Error generando mensaje de completación: {e}")
+            yield flask_api.completion_error_event()
+            return
+
+        if stream:
+            yield delta(completion_message)
+        yield flask_api.completion_event(completion_message)
+        return
+
+    if step['outcome'] == 'next_question':
+        # 🤖 SIGUIENTE PREGUNTA: pre-generada en background si está disponible
+        next_question_number = step['next_question_number']
+        prefetched = await question_prefetcher.take(session_id, next_question_number, session_info=session_info, wait=not stream)
+
+        if stream:
+            if not prefetched and question_prefetcher.pending(session_id) is None:
+                question_prefetcher.schedule(session_id, next_question_number, questions_asked, intro_session_info=session_info)
+            result = StreamResult()
+            try:
+                async for event in arelay_text(astream_turn(
+                    openai_client=async_openai_client,
+                    user_answer=user_message,
+                    is_correct=True,
+                    question_info=current_question,
+                    session_info=session_info,
+                    result=result,
+                    rag_service=rag_service,
+                    next_question=prefetched['question'] if prefetched else None,
+                    next_question_intro=prefetched.get('intro') if prefetched else None
+                )):
+                    yield event
+            except Exception as e:
+                print(f"❌ Error generando respuesta conversacional: {e}")
+                yield flask_api.turn_error_event()
+                return
+            turn = result.value
+            print(f"⏱️ Turno: {turn['timings_ms']}" + (f" (fallbacks: {turn['fallbacks']})" if turn['fallbacks'] else ""))
+
+            if not prefetched:
+                prefetched = await question_prefetcher.take(session_id, next_question_number, session_info=session_info)
+            next_question = prefetched['question'] if prefetched else await draw_or_generate_question(
+                next_question_number, questions_asked
+            )
+            question_intro = turn['intro'] or (prefetched.get('intro') if prefetched else None)
+        elif prefetched:
+            print(f"⚡ Usando pregunta #{next_question_number} pre-generada")
+            next_question = prefetched['question']
+        else:
+            print(f"🤖 Generando pregunta #{next_question_number}...")
+            next_question = await draw_or_generate_question(next_question_number, questions_asked)
+
+        if not next_question or not next_question.get('question'):
+            yield flask_api.question_failed_event(session)
+            return
+
+        flask_api.advance_question(session, next_question)
+
+        if stream:
+            if not question_intro:
+                question_intro = await agenerate_next_question_intro(async_openai_client, next_question, session_info)
+            tail = f"\n\n{question_intro}\n\n{next_question['question']}"
+            yield delta(tail)
+            response_message = turn['response'] + tail
+        else:
+            # 🤖 Respuesta conversacional + introducción de la siguiente pregunta en paralelo
+            try:
+                turn = await agenerate_turn(
+                    openai_client=async_openai_client,
+                    user_answer=user_message,
+                    is_correct=True,
+                    question_info=current_question,
+                    session_info=session_info,
+                    rag_service=rag_service,
+                    next_question=next_question,
+                    next_question_intro=prefetched.get('intro') if prefetched else None
+                )
+            except Exception as e:
+                print(f"❌ Error generando respuesta conversacional: {e}")
+                yield flask_api.turn_error_event()
+                return
+            print(f"⏱️ Turno: {turn['timings_ms']}" + (f" (fallbacks: {turn['fallbacks']})" if turn['fallbacks'] else ""))
+            response_message = f"{turn['response']}\n\n{turn['intro']}\n\n{next_question['question']}"
+
+        yield flask_api.next_question_event(
+            session_id, session, step, next_question, response_message, prefetcher=question_prefetcher
+        )
+        return
+
+    if step['outcome'] == 'exhausted':
+        if stream:
+            yield delta(flask_api.EXHAUSTED_MESSAGE)
+        yield flask_api.exhausted_event()
+        return
+
+    if step['outcome'] == 'replace_question':
+        # 🤖 GENERAR NUEVA PREGUNTA (reemplazo)
+        next_question_number = step['next_question_number']
+        response_intro = flask_api.replacement_intro(step, session)
+        if stream:
+            yield delta(response_intro)
+
+        prefetched = await question_prefetcher.take(session_id, next_question_number)
+        new_question = prefetched['question'] if prefetched else question_bank.draw(next_question_number, questions_asked)
+        if new_question:
+            print(f"⚡ Usando pregunta de reemplazo #{next_question_number} pre-generada")
+            if stream:
+                yield delta(new_question.get('question', ''))
+        elif stream:
+            result = StreamResult()
+            async for event in arelay_text(stream_single_question(next_question_number, questions_asked, result)):
+                yield event
+            new_question = result.value
+        else:
+            new_question = await generate_single_question(next_question_number, questions_asked)
+
+        if not new_question or not new_question.get('question'):
+            yield flask_api.question_failed_event(session, replacement=True)
+            return
+
+        yield flask_api.replacement_event(
+            session_id, session, step, new_question, response_intro, prefetcher=question_prefetcher
+        )
+        return
+
+    # 🤖 Respuesta conversacional para respuesta incorrecta + pista
+    if stream:
+        result = StreamResult()
+        async for event in arelay_text(astream_turn(
+            openai_client=async_openai_client,
+            user_answer=user_message,
+            is_correct=False,
+            question_info=current_question,
+            session_info=session_info,
+            result=result,
+            rag_service=rag_service
+        )):
+            yield event
+        conversational_response = result.value['response']
+    else:
+        try:
+            conversational_response = await agenerate_conversational_response(
+                openai_client=async_openai_client,
+                context="",
+                user_answer=user_message,
+                is_correct=False,
+                question_info=current_question,
+                session_info=session_info,
+                rag_service=rag_service
+            )
+        except Exception as e:
+            print(f"❌ Error generando respuesta conversacional: {e}")
+            conversational_response = flask_api.fallback_incorrect_response(current_question)
+
+    tail = flask_api.hint_tail(current_question, step['attempts'], step['attempts_left'])
+    if stream:
+        yield delta(tail)
+    yield flask_api.hint_event(session, step, conversational_response, tail)
+
+
+app = Starlette(routes=[
+    Route('/api/start', start_quiz, methods=['POST']),
+    Route('/api/start-quiz', start_quiz, methods=['POST']),
+    Route('/api/answer', answer_question, methods=['POST']),
+    Route('/api/chat', answer_question, methods=['POST']),
+    # Todo lo demás (y los preflight CORS) lo responde la app Flask
+    Mount('/', app=WsgiToAsgi(flask_api.app))
+])
+
+logger.info("✅ App ASGI configurada (rutas del quiz async + Flask para el resto)")
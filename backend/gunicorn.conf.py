@@ -0,0 +1,53 @@
+"""
+Configuración de gunicorn - Modo multi-proceso (pre-fork)
+
+    cd backend && gunicorn -c gunicorn.conf.py app:app
+
+- Antes de crear los workers, un único proceso construye o actualiza el
+  cache del RAG (`python app.py --prepare-cache`): ingesta incremental,
+  índice BM25, etc. Es el único que escribe en cache/.
+- Cada worker carga ese cache en modo sólo lectura (RAG_READ_ONLY): el índice
+  FAISS, el chunk store y el índice BM25 quedan memory-mapped, así que todos
+  los workers comparten las mismas páginas y la RSS no se multiplica por el
+  número de workers.
+- Las sesiones viven en el session store SQLite compartido
+  (SESSION_STORE_SHARED): cualquier worker puede atender cualquier request.
+
+No se usa preload_app: los threads de warm-up no sobreviven al fork, y con
+mmap los workers ya comparten la memoria del índice sin él.
+"""
+
+import os
+import sys
+import subprocess
+import multiprocessing
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', os.getenv('BACKEND_PORT', 8080))}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Los turnos del chat (OpenAI + streaming) pueden tardar bastante más que un request normal
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+preload_app = False
+chdir = BACKEND_DIR
+accesslog = '-'
+
+# Los workers heredan estas variables del proceso maestro
+os.environ['RAG_READ_ONLY'] = 'True'
+os.environ['SESSION_STORE_SHARED'] = 'True'
+if os.getenv('SESSION_STORE_BACKEND', 'sqlite').lower() != 'sqlite':
+    print("⚠️ Con varios workers las sesiones necesitan el backend sqlite: se ignora SESSION_STORE_BACKEND")
+    os.environ['SESSION_STORE_BACKEND'] = 'sqlite'
+
+
+def on_starting(server):
+    """Prepara el cache del RAG una sola vez, antes de arrancar los workers."""
+    server.log.info("📡 Preparando cache del RAG para los workers...")
+    env = {**os.environ, 'RAG_READ_ONLY': 'False', 'RAG_EAGER_INIT': 'False'}
+    result = subprocess.run([sys.executable, 'app.py', '--prepare-cache'], cwd=server.cfg.chdir, env=env)
+    if result.returncode != 0:
+        # Los workers reintentan cargarlo (y /api/health/ready responde 503 mientras tanto)
+        server.log.warning("⚠️ No se pudo preparar el cache del RAG")
@@ -0,0 +1,291 @@
+"""
+Async Chatbot Service - Variante async de services/chatbot.py
+Las mismas respuestas (prompts, parámetros y fallbacks de chatbot.py), pero
+con el cliente AsyncOpenAI: mientras OpenAI responde, el event loop del
+servidor ASGI (asgi.py) sigue atendiendo otras sesiones en vez de tener un
+thread bloqueado por llamada.
+
+Los streams no pueden devolver un valor al terminar (son async generators):
+lo dejan en un StreamResult que pasa quien los consume.
+"""
+
+import time
+import asyncio
+from openai import AsyncOpenAI
+from typing import AsyncIterator, Dict, List, Optional
+
+from services.chatbot import (
+    CONVERSATIONAL_PARAMS, COMPLETION_RAG_QUERY, _TurnRunner, _conversational_messages, _correct_answer_suffix,
+    _conversational_fallback, _next_question_intro_fallback, _next_question_intro_request, _completion_request,
+    _completion_fallback, _request_options, related_memories_text, romantic_context_text
+)
+from services.streaming import StreamResult
+
+
+async def _rag_search(rag_service, query: str, k: int) -> List[Dict]:
+    """Búsqueda RAG sin bloquear el event loop (asearch si existe; si no, en un thread)."""
+    if hasattr(rag_service, 'asearch'):
+        return await rag_service.asearch(query, k=k)
+    return await asyncio.to_thread(rag_service.search, query, k=k)
+
+
+async def afind_related_memories(rag_service, user_answer: str) -> str:
+    """Versión async de find_related_memories."""
+    if rag_service and hasattr(rag_service, 'search'):
+        return related_memories_text(await _rag_search(rag_service, user_answer, k=3))
+    return ""
+
+
+async def agenerate_conversational_response(
+    openai_client: AsyncOpenAI,
+    context: str,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    rag_service = None
+) -> str:
+    """Versión async de generate_conversational_response."""
+    try:
+        try:
+            additional_context = await afind_related_memories(rag_service, user_answer)
+        except Exception:
+            additional_context = ""  # Si falla RAG, continuar sin contexto adicional
+
+        return await _aconversational_completion(
+            openai_client, user_answer, is_correct, question_info, session_info, additional_context
+        )
+
+    except Exception as e:
+        print(f"❌ Error generando respuesta conversacional: {e}")
+        return _conversational_fallback(is_correct, question_info)
+
+
+async def _aconversational_completion(
+    openai_client: AsyncOpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    additional_context: str = "",
+    timeout: Optional[float] = None
+) -> str:
+    response = await openai_client.chat.completions.create(
+        messages=_conversational_messages(user_answer, is_correct, question_info, session_info, additional_context),
+        **CONVERSATIONAL_PARAMS,
+        **_request_options(timeout)
+    )
+
+    conversational_response = response.choices[0].message.content.strip()
+    return conversational_response + _correct_answer_suffix(conversational_response, is_correct, question_info)
+
+
+async def _astream_conversational_completion(
+    openai_client: AsyncOpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    additional_context: str = "",
+    timeout: Optional[float] = None
+) -> AsyncIterator[str]:
+    stream = await openai_client.chat.completions.create(
+        messages=_conversational_messages(user_answer, is_correct, question_info, session_info, additional_context),
+        stream=True,
+        **CONVERSATIONAL_PARAMS,
+        **_request_options(timeout)
+    )
+
+    parts = []
+    started = False
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content or ""
+        if not started:
+            text = text.lstrip()
+            started = bool(text)
+        if text:
+            parts.append(text)
+            yield text
+
+    suffix = _correct_answer_suffix("".join(parts).rstrip(), is_correct, question_info)
+    if suffix:
+        yield suffix
+
+
+async def agenerate_next_question_intro(
+    openai_client: AsyncOpenAI,
+    next_question: Dict,
+    session_info: Dict
+) -> str:
+    """Versión async de generate_next_question_intro."""
+    try:
+        return await _anext_question_intro_completion(openai_client, next_question, session_info)
+    except Exception as e:
+        print(f"❌ Error generando introducción: {e}")
+        return _next_question_intro_fallback(session_info)
+
+
+async def _anext_question_intro_completion(
+    openai_client: AsyncOpenAI,
+    next_question: Dict,
+    session_info: Dict,
+    timeout: Optional[float] = None
+) -> str:
+    response = await openai_client.chat.completions.create(
+        **_next_question_intro_request(next_question, session_info),
+        **_request_options(timeout)
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+class _AsyncTurnRunner(_TurnRunner):
+    """Como _TurnRunner, con tasks del event loop en lugar del pool de threads."""
+
+    async def _timed(self, name, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def submit(self, name, coro):
+        return asyncio.ensure_future(self._timed(name, coro))
+
+    async def join(self, task, name, wait: Optional[float] = None):
+        """Resultado de la llamada, o None (registrando el fallback) si falla o vence."""
+        try:
+            return await asyncio.wait_for(task, timeout=self.remaining() if wait is None else min(wait, self.remaining()))
+        except asyncio.TimeoutError:
+            print(f"⏱️ Turno: '{name}' superó el timeout, usando fallback")
+        except Exception as e:
+            print(f"❌ Turno: error en '{name}': {e}")
+        self.fallbacks.append(name)
+        return None
+
+    def start(self, openai_client, rag_service, user_answer, session_info, next_question, next_question_intro):
+        rag_task = self.submit('rag', afind_related_memories(rag_service, user_answer)) if rag_service else None
+        intro_task = None
+        if next_question and not next_question_intro:
+            intro_task = self.submit('intro', _anext_question_intro_completion(
+                openai_client, next_question, session_info, timeout=self.timeout
+            ))
+        return rag_task, intro_task
+
+    async def related_memories(self, rag_task) -> str:
+        if rag_task is None:
+            return ""
+        return await self.join(rag_task, 'rag', self.rag_timeout) or ""
+
+
+async def agenerate_turn(
+    openai_client: AsyncOpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    rag_service = None,
+    next_question: Optional[Dict] = None,
+    next_question_intro: Optional[str] = None,
+    timeout: Optional[float] = None,
+    rag_timeout: Optional[float] = None
+) -> Dict:
+    """Versión async de generate_turn (mismos argumentos y resultado)."""
+    turn = _AsyncTurnRunner(timeout, rag_timeout)
+    rag_task, intro_task = turn.start(
+        openai_client, rag_service, user_answer, session_info, next_question, next_question_intro
+    )
+
+    additional_context = await turn.related_memories(rag_task)
+    response_task = turn.submit('response', _aconversational_completion(
+        openai_client, user_answer, is_correct, question_info, session_info,
+        additional_context, timeout=max(0.1, turn.remaining())
+    ))
+
+    response = await turn.join(response_task, 'response')
+    if response is None:
+        response = _conversational_fallback(is_correct, question_info)
+
+    intro = next_question_intro
+    if intro_task is not None:
+        intro = await turn.join(intro_task, 'intro') or _next_question_intro_fallback(session_info)
+
+    return turn.result(response, intro)
+
+
+async def astream_turn(
+    openai_client: AsyncOpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    result: StreamResult,
+    rag_service = None,
+    next_question: Optional[Dict] = None,
+    next_question_intro: Optional[str] = None,
+    timeout: Optional[float] = None,
+    rag_timeout: Optional[float] = None
+) -> AsyncIterator[str]:
+    """
+    Versión async de stream_turn: emite los fragmentos de la respuesta y deja
+    en `result.value` el dict de generate_turn.
+    """
+    turn = _AsyncTurnRunner(timeout, rag_timeout)
+    start = time.perf_counter()
+    rag_task, intro_task = turn.start(
+        openai_client, rag_service, user_answer, session_info, next_question, next_question_intro
+    )
+    additional_context = await turn.related_memories(rag_task)
+
+    parts: List[str] = []
+    try:
+        stream = _astream_conversational_completion(
+            openai_client, user_answer, is_correct, question_info, session_info,
+            additional_context, timeout=max(0.1, turn.remaining())
+        )
+        async for text in stream:
+            if not parts:
+                turn.timings['first_token_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            parts.append(text)
+            yield text
+            if time.monotonic() > turn.deadline:
+                raise TimeoutError("el turno superó el timeout")
+        turn.timings['response'] = round((time.perf_counter() - start) * 1000, 1)
+    except Exception as e:
+        print(f"❌ Turno: error en 'response' (streaming): {e}")
+        turn.fallbacks.append('response')
+        if not parts:
+            fallback = _conversational_fallback(is_correct, question_info)
+            parts.append(fallback)
+            yield fallback
+
+    intro = next_question_intro
+    if intro_task is not None:
+        intro = await turn.join(intro_task, 'intro') or _next_question_intro_fallback(session_info)
+
+    result.value = turn.result("".join(parts), intro)
+
+
+async def agenerate_completion_message(
+    openai_client: AsyncOpenAI,
+    session_info: Dict,
+    rag_service = None
+) -> str:
+    """Versión async de generate_completion_message."""
+    try:
+        romantic_context = ""
+        if rag_service and hasattr(rag_service, 'search'):
+            try:
+                romantic_context = romantic_context_text(await _rag_search(rag_service, COMPLETION_RAG_QUERY, k=3))
+            except Exception:
+                pass
+
+        response = await openai_client.chat.completions.create(**_completion_request(session_info, romantic_context))
+
+        return response.choices[0].message.content.strip()
+
+    except Exception as e:
+        print(f"❌ Error generando mensaje de completación: {e}")
+        return _completion_fallback(session_info)
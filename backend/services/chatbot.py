@@ -1,12 +1,85 @@
 """
 Conversational Chatbot Service
 Genera respuestas naturales y conversacionales usando OpenAI
+
+generate_turn() arma un turno completo del quiz (búsqueda RAG, respuesta
+conversacional e introducción de la siguiente pregunta) lanzando las llamadas
+en paralelo, con timeout por llamada y fallbacks parciales.
 """
 
+import os
 import json
+import time
 import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from openai import OpenAI
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Generator
+
+# Timeout total de un turno y máximo que la respuesta espera a la búsqueda RAG
+TURN_TIMEOUT_SECONDS = float(os.getenv('CHATBOT_TURN_TIMEOUT_SECONDS', 15))
+RAG_LOOKUP_TIMEOUT_SECONDS = float(os.getenv('CHATBOT_RAG_TIMEOUT_SECONDS', 2))
+
+_turn_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_turn_executor() -> ThreadPoolExecutor:
+    global _turn_executor
+    if _turn_executor is None:
+        _turn_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('CHATBOT_TURN_WORKERS', 8)),
+            thread_name_prefix="chat-turn"
+        )
+    return _turn_executor
+
+
+def _request_options(timeout: Optional[float]) -> Dict:
+    """Timeout por request para el cliente de OpenAI (sin él aplica el del cliente)."""
+    return {'timeout': timeout} if timeout else {}
+
+
+def find_related_memories(rag_service, user_answer: str) -> str:
+    """Contexto adicional del RAG con mensajes relacionados a la respuesta del usuario."""
+    if rag_service and hasattr(rag_service, 'search'):
+        return related_memories_text(rag_service.search(user_answer, k=3))
+    return ""
+
+
+def related_memories_text(related_chunks: List[Dict]) -> str:
+    """Formatea los chunks relacionados como contexto para el prompt."""
+    additional_context = ""
+    if related_chunks:
+        additional_context = "\\n\\nRecuerdos relacionados:\\n"
+        for chunk in related_chunks[:2]:  # Solo los 2 más relevantes
+            messages_preview = chunk['messages_in_chunk'][:2]
+            for msg in messages_preview:
+                if msg.get('content'):
+                    additional_context += f"- {msg['content'][:100]}...\\n"
+    return additional_context
+
+
+def _conversational_fallback(is_correct: bool, question_info: Dict) -> str:
+    """Respuestas básicas pero naturales si OpenAI no responde."""
+    if is_correct:
+        fallbacks = [
+            "¡Exacto! Sabía que te acordarías.",
+            "¡Sí! Bien recordado, amor.",
+            "¡Correcto! Ese momento también me gusta recordar.",
+            "¡Perfecto! Me alegra que lo tengas presente."
+        ]
+    else:
+        correct_answer = question_info.get('correct_answers', ['la respuesta correcta'])[0]
+        fallbacks = [
+            f"No exactamente, la respuesta era: {correct_answer}",
+            f"Casi, en realidad era: {correct_answer}",
+            f"No amor, pero no te preocupes. Era: {correct_answer}"
+        ]
+    return random.choice(fallbacks)
+
+
+def _next_question_intro_fallback(session_info: Dict) -> str:
+    question_number = session_info.get('current_question', 1) + 1
+    total_questions = session_info.get('total_questions', 7)
+    return f"¡Perfecto! Vamos con la pregunta {question_number} de {total_questions}: 💕"
 
 
 def generate_conversational_response(
@@ -36,23 +109,30 @@ def generate_conversational_response(
     
     try:
         # Obtener contexto adicional usando RAG si está disponible
-        additional_context = ""
-        if rag_service and hasattr(rag_service, 'search'):
-            try:
-                # Buscar mensajes relacionados con la respuesta del usuario
-                related_chunks = rag_service.search(user_answer, k=3)
-                if related_chunks:
-                    additional_context = "\\n\\nRecuerdos relacionados:\\n"
-                    for chunk in related_chunks[:2]:  # Solo los 2 más relevantes
-                        messages_preview = chunk['messages_in_chunk'][:2]
-                        for msg in messages_preview:
-                            if msg.get('content'):
-                                additional_context += f"- {msg['content'][:100]}...\\n"
-            except:
-                pass  # Si falla RAG, continuar sin contexto adicional
+        try:
+            additional_context = find_related_memories(rag_service, user_answer)
+        except Exception:
+            additional_context = ""  # Si falla RAG, continuar sin contexto adicional
         
-        # Construir el prompt para OpenAI
-        system_prompt = f"""Eres Juan Diego hablándole a Karem en un quiz sobre su historia juntos. Este es tu regalo para ella.
+        return _conversational_completion(
+            openai_client, user_answer, is_correct, question_info, session_info, additional_context
+        )
+            
+    except Exception as e:
+        print(f"❌ Error generando respuesta conversacional: {e}")
+        return _conversational_fallback(is_correct, question_info)
+
+
+def _conversational_messages(
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    additional_context: str = ""
+) -> List[Dict]:
+    """Mensajes (system + user) para la respuesta conversacional."""
+    # Construir el prompt para OpenAI
+    system_prompt = f"""Eres Juan Diego hablándole a Karem en un quiz sobre su historia juntos. Este es tu regalo para ella.
 
 PERSONALIDAD:
 - Eres Juan Diego, habla normal y relajado
@@ -85,55 +165,90 @@ INSTRUCCIONES:
 
 Responde de forma natural y relajada:"""
 
-        user_prompt = f"Karem respondió: '{user_answer}'. {'Estuvo correcto' if is_correct else 'No estuvo correcto'}. Responde de manera natural como su novio."
-
-        # Llamar a OpenAI para generar respuesta conversacional
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=200,
-            temperature=0.7,
-            presence_penalty=0.1,
-            frequency_penalty=0.1
-        )
-        
-        conversational_response = response.choices[0].message.content.strip()
-        
-        # Agregar información técnica solo si es necesario
-        if is_correct:
-            # Para respuestas correctas, solo la respuesta conversacional
-            return conversational_response
-        else:
-            # Para respuestas incorrectas, agregar la respuesta correcta si no la mencionó
-            correct_answers = question_info.get('correct_answers', [])
-            if correct_answers and not any(ans.lower() in conversational_response.lower() for ans in correct_answers):
-                correct_answer = correct_answers[0]
-                return f"{conversational_response}\\n\\nLa respuesta era: {correct_answer}"
-            return conversational_response
-            
-    except Exception as e:
-        print(f"❌ Error generando respuesta conversacional: {e}")
-        
-        # Fallback a respuestas básicas pero más naturales
-        if is_correct:
-            fallbacks = [
-                "¡Exacto! Sabía que te acordarías.",
-                "¡Sí! Bien recordado, amor.",
-                "¡Correcto! Ese momento también me gusta recordar.",
-                "¡Perfecto! Me alegra que lo tengas presente."
-            ]
-        else:
-            correct_answer = question_info.get('correct_answers', ['la respuesta correcta'])[0]
-            fallbacks = [
-                f"No exactamente, la respuesta era: {correct_answer}",
-                f"Casi, en realidad era: {correct_answer}",
-                f"No amor, pero no te preocupes. Era: {correct_answer}"
-            ]
-        
-        return random.choice(fallbacks)
+    user_prompt = f"Karem respondió: '{user_answer}'. {'Estuvo correcto' if is_correct else 'No estuvo correcto'}. Responde de manera natural como su novio."
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+# Parámetros de la llamada de la respuesta conversacional
+CONVERSATIONAL_PARAMS = {
+    'model': "gpt-4o-mini",
+    'max_tokens': 200,
+    'temperature': 0.7,
+    'presence_penalty': 0.1,
+    'frequency_penalty': 0.1
+}
+
+
+def _correct_answer_suffix(conversational_response: str, is_correct: bool, question_info: Dict) -> str:
+    """Para respuestas incorrectas, la respuesta correcta si la respuesta no la mencionó."""
+    if is_correct:
+        return ""
+    correct_answers = question_info.get('correct_answers', [])
+    if correct_answers and not any(ans.lower() in conversational_response.lower() for ans in correct_answers):
+        return f"\\n\\nLa respuesta era: {correct_answers[0]}"
+    return ""
+
+
+def _conversational_completion(
+    openai_client: OpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    additional_context: str = "",
+    timeout: Optional[float] = None
+) -> str:
+    """Llamada a OpenAI de la respuesta conversacional (lanza excepción si falla)."""
+    response = openai_client.chat.completions.create(
+        messages=_conversational_messages(user_answer, is_correct, question_info, session_info, additional_context),
+        **CONVERSATIONAL_PARAMS,
+        **_request_options(timeout)
+    )
+    
+    conversational_response = response.choices[0].message.content.strip()
+    return conversational_response + _correct_answer_suffix(conversational_response, is_correct, question_info)
+
+
+def _stream_conversational_completion(
+    openai_client: OpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    additional_context: str = "",
+    timeout: Optional[float] = None
+) -> Generator[str, None, str]:
+    """Como _conversational_completion pero emitiendo los tokens a medida que llegan."""
+    stream = openai_client.chat.completions.create(
+        messages=_conversational_messages(user_answer, is_correct, question_info, session_info, additional_context),
+        stream=True,
+        **CONVERSATIONAL_PARAMS,
+        **_request_options(timeout)
+    )
+    
+    parts = []
+    started = False
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content or ""
+        if not started:
+            # Igual que el .strip() de la versión sin streaming
+            text = text.lstrip()
+            started = bool(text)
+        if text:
+            parts.append(text)
+            yield text
+    
+    conversational_response = "".join(parts).rstrip()
+    suffix = _correct_answer_suffix(conversational_response, is_correct, question_info)
+    if suffix:
+        yield suffix
+    return conversational_response + suffix
 
 
 def generate_next_question_intro(
@@ -154,10 +269,33 @@ def generate_next_question_intro(
     """
     
     try:
-        question_number = session_info.get('current_question', 1) + 1
-        total_questions = session_info.get('total_questions', 7)
-        
-        system_prompt = f"""Eres Juan Diego hablándole a Karem en un quiz especial sobre su historia juntos.
+        return _next_question_intro_completion(openai_client, next_question, session_info)
+    except Exception as e:
+        print(f"❌ Error generando introducción: {e}")
+        return _next_question_intro_fallback(session_info)
+
+
+def _next_question_intro_completion(
+    openai_client: OpenAI,
+    next_question: Dict,
+    session_info: Dict,
+    timeout: Optional[float] = None
+) -> str:
+    """Llamada a OpenAI de la introducción de la siguiente pregunta (lanza excepción si falla)."""
+    response = openai_client.chat.completions.create(
+        **_next_question_intro_request(next_question, session_info),
+        **_request_options(timeout)
+    )
+    
+    return response.choices[0].message.content.strip()
+
+
+def _next_question_intro_request(next_question: Dict, session_info: Dict) -> Dict:
+    """Parámetros de la llamada de la introducción de la siguiente pregunta."""
+    question_number = session_info.get('current_question', 1) + 1
+    total_questions = session_info.get('total_questions', 7)
+    
+    system_prompt = f"""Eres Juan Diego hablándole a Karem en un quiz especial sobre su historia juntos.
 
 CONTEXTO:
 - Van en la pregunta #{question_number} de {total_questions}
@@ -175,25 +313,190 @@ INSTRUCCIONES:
 
 SIGUIENTE PREGUNTA: {next_question.get('question', '')}"""
 
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Introduce la pregunta #{question_number}: {next_question.get('question', '')}"}
-            ],
-            max_tokens=80,
-            temperature=0.6
+    return {
+        'model': "gpt-4o-mini",
+        'messages': [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Introduce la pregunta #{question_number}: {next_question.get('question', '')}"}
+        ],
+        'max_tokens': 80,
+        'temperature': 0.6
+    }
+
+
+class _TurnRunner:
+    """Lanza las llamadas de un turno en el pool compartido y las une con un deadline común."""
+    
+    def __init__(self, timeout: Optional[float] = None, rag_timeout: Optional[float] = None):
+        self.timeout = timeout or TURN_TIMEOUT_SECONDS
+        self.rag_timeout = min(rag_timeout or RAG_LOOKUP_TIMEOUT_SECONDS, self.timeout)
+        self.deadline = time.monotonic() + self.timeout
+        self.timings: Dict[str, float] = {}
+        self.fallbacks: List[str] = []
+    
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+    
+    def timed(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    
+    def submit(self, name, fn, *args, **kwargs):
+        return _get_turn_executor().submit(self.timed, name, fn, *args, **kwargs)
+    
+    def join(self, future, name, wait: Optional[float] = None):
+        """Resultado de la llamada, o None (registrando el fallback) si falla o vence."""
+        try:
+            return future.result(timeout=self.remaining() if wait is None else min(wait, self.remaining()))
+        except FutureTimeout:
+            future.cancel()
+            print(f"⏱️ Turno: '{name}' superó el timeout, usando fallback")
+        except Exception as e:
+            print(f"❌ Turno: error en '{name}': {e}")
+        self.fallbacks.append(name)
+        return None
+    
+    def start(self, openai_client, rag_service, user_answer, session_info, next_question, next_question_intro):
+        """Fan-out: la búsqueda RAG y la introducción no dependen de nada."""
+        rag_future = self.submit('rag', find_related_memories, rag_service, user_answer) if rag_service else None
+        intro_future = None
+        if next_question and not next_question_intro:
+            intro_future = self.submit(
+                'intro', _next_question_intro_completion,
+                openai_client, next_question, session_info, timeout=self.timeout
+            )
+        return rag_future, intro_future
+    
+    def related_memories(self, rag_future) -> str:
+        """La respuesta usa el contexto RAG si llega a tiempo; si no, sale sin él."""
+        if rag_future is None:
+            return ""
+        return self.join(rag_future, 'rag', self.rag_timeout) or ""
+    
+    def result(self, response: str, intro: Optional[str]) -> Dict:
+        return {
+            'response': response,
+            'intro': intro,
+            'fallbacks': self.fallbacks,
+            'timings_ms': dict(self.timings)
+        }
+
+
+def generate_turn(
+    openai_client: OpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    rag_service = None,
+    next_question: Optional[Dict] = None,
+    next_question_intro: Optional[str] = None,
+    timeout: Optional[float] = None,
+    rag_timeout: Optional[float] = None
+) -> Dict:
+    """
+    Genera un turno completo del quiz en paralelo: la búsqueda RAG y la
+    introducción de la siguiente pregunta arrancan a la vez, y la respuesta
+    conversacional sale en cuanto llega el contexto RAG (o vence rag_timeout).
+    La latencia del turno es la de la llamada más lenta, no la suma.
+    
+    Args:
+        openai_client: Cliente de OpenAI
+        user_answer, is_correct, question_info, session_info: Como en generate_conversational_response
+        rag_service: Servicio RAG para recuerdos relacionados (opcional)
+        next_question: Siguiente pregunta a introducir (None si no hay)
+        next_question_intro: Introducción ya generada (p.ej. pre-generada); evita la llamada
+        timeout: Segundos máximos del turno completo (env CHATBOT_TURN_TIMEOUT_SECONDS)
+        rag_timeout: Segundos máximos que la respuesta espera al RAG (env CHATBOT_RAG_TIMEOUT_SECONDS)
+    
+    Returns:
+        {'response', 'intro' (None sin next_question), 'fallbacks': partes que usaron
+        fallback, 'timings_ms': duración de cada llamada}
+    """
+    turn = _TurnRunner(timeout, rag_timeout)
+    rag_future, intro_future = turn.start(
+        openai_client, rag_service, user_answer, session_info, next_question, next_question_intro
+    )
+    
+    additional_context = turn.related_memories(rag_future)
+    response_future = turn.submit(
+        'response', _conversational_completion,
+        openai_client, user_answer, is_correct, question_info, session_info,
+        additional_context, timeout=max(0.1, turn.remaining())
+    )
+    
+    response = turn.join(response_future, 'response')
+    if response is None:
+        response = _conversational_fallback(is_correct, question_info)
+    
+    intro = next_question_intro
+    if intro_future is not None:
+        intro = turn.join(intro_future, 'intro') or _next_question_intro_fallback(session_info)
+    
+    return turn.result(response, intro)
+
+
+def stream_turn(
+    openai_client: OpenAI,
+    user_answer: str,
+    is_correct: bool,
+    question_info: Dict,
+    session_info: Dict,
+    rag_service = None,
+    next_question: Optional[Dict] = None,
+    next_question_intro: Optional[str] = None,
+    timeout: Optional[float] = None,
+    rag_timeout: Optional[float] = None
+) -> Generator[str, None, Dict]:
+    """
+    Versión en streaming de generate_turn: emite los tokens de la respuesta
+    conversacional a medida que llegan (la introducción se genera en paralelo
+    y se devuelve al final).
+    
+    Yields:
+        Fragmentos de la respuesta conversacional
+    
+    Returns:
+        El mismo dict que generate_turn, con 'first_token_ms' en timings_ms
+    """
+    turn = _TurnRunner(timeout, rag_timeout)
+    start = time.perf_counter()
+    rag_future, intro_future = turn.start(
+        openai_client, rag_service, user_answer, session_info, next_question, next_question_intro
+    )
+    additional_context = turn.related_memories(rag_future)
+    
+    parts: List[str] = []
+    try:
+        stream = _stream_conversational_completion(
+            openai_client, user_answer, is_correct, question_info, session_info,
+            additional_context, timeout=max(0.1, turn.remaining())
         )
-        
-        return response.choices[0].message.content.strip()
-        
+        for text in stream:
+            if not parts:
+                turn.timings['first_token_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            parts.append(text)
+            yield text
+            if time.monotonic() > turn.deadline:
+                raise TimeoutError("el turno superó el timeout")
+        turn.timings['response'] = round((time.perf_counter() - start) * 1000, 1)
     except Exception as e:
-        print(f"❌ Error generando introducción: {e}")
-        
-        # Fallback simple
-        question_number = session_info.get('current_question', 1) + 1
-        total_questions = session_info.get('total_questions', 7)
-        return f"¡Perfecto! Vamos con la pregunta {question_number} de {total_questions}: 💕"
+        print(f"❌ Turno: error en 'response' (streaming): {e}")
+        turn.fallbacks.append('response')
+        if not parts:
+            # Nada enviado todavía: respuesta de fallback completa
+            fallback = _conversational_fallback(is_correct, question_info)
+            parts.append(fallback)
+            yield fallback
+    
+    intro = next_question_intro
+    if intro_future is not None:
+        intro = turn.join(intro_future, 'intro') or _next_question_intro_fallback(session_info)
+    
+    return turn.result("".join(parts), intro)
 
 
 def generate_completion_message(
@@ -214,25 +517,46 @@ def generate_completion_message(
     """
     
     try:
-        correct_answers = session_info.get('correct_answers', 0)
-        total_questions = session_info.get('total_questions', 7)
-        
         # Obtener momentos románticos usando RAG
         romantic_context = ""
         if rag_service and hasattr(rag_service, 'search'):
             try:
-                romantic_chunks = rag_service.search("te amo amor siempre juntos futuro", k=3)
-                if romantic_chunks:
-                    romantic_context = "\\n\\nRecuerdos especiales de nosotros:\\n"
-                    for chunk in romantic_chunks[:2]:
-                        messages = chunk['messages_in_chunk'][:2]
-                        for msg in messages:
-                            if msg.get('content') and len(msg['content']) > 20:
-                                romantic_context += f"- {msg['content'][:80]}...\\n"
+                romantic_context = romantic_context_text(rag_service.search(COMPLETION_RAG_QUERY, k=3))
             except:
                 pass
         
-        system_prompt = f"""Eres Juan Diego hablándole a Karem después de completar el quiz sobre su historia juntos.
+        response = openai_client.chat.completions.create(**_completion_request(session_info, romantic_context))
+        
+        return response.choices[0].message.content.strip()
+        
+    except Exception as e:
+        print(f"❌ Error generando mensaje de completación: {e}")
+        return _completion_fallback(session_info)
+
+
+# Búsqueda RAG de los recuerdos del mensaje final
+COMPLETION_RAG_QUERY = "te amo amor siempre juntos futuro"
+
+
+def romantic_context_text(romantic_chunks: List[Dict]) -> str:
+    """Formatea los recuerdos del mensaje final como contexto para el prompt."""
+    romantic_context = ""
+    if romantic_chunks:
+        romantic_context = "\\n\\nRecuerdos especiales de nosotros:\\n"
+        for chunk in romantic_chunks[:2]:
+            messages = chunk['messages_in_chunk'][:2]
+            for msg in messages:
+                if msg.get('content') and len(msg['content']) > 20:
+                    romantic_context += f"- {msg['content'][:80]}...\\n"
+    return romantic_context
+
+
+def _completion_request(session_info: Dict, romantic_context: str = "") -> Dict:
+    """Parámetros de la llamada del mensaje de completación."""
+    correct_answers = session_info.get('correct_answers', 0)
+    total_questions = session_info.get('total_questions', 7)
+    
+    system_prompt = f"""Eres Juan Diego hablándole a Karem después de completar el quiz sobre su historia juntos.
 
 RESULTADOS DEL QUIZ:
 - Respondió {correct_answers} de {total_questions} preguntas correctamente
@@ -254,26 +578,23 @@ INSTRUCCIONES:
 
 Genera un mensaje que la emocione y prepare para la sorpresa final:"""
 
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Karem completó el quiz con {correct_answers}/{total_questions} respuestas correctas. Genera el mensaje final antes de revelar la ubicación especial."}
-            ],
-            max_tokens=250,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content.strip()
-        
-    except Exception as e:
-        print(f"❌ Error generando mensaje de completación: {e}")
-        
-        # Fallback emotivo
-        correct_answers = session_info.get('correct_answers', 0)
-        total_questions = session_info.get('total_questions', 7)
-        
-        if correct_answers == total_questions:
-            return f"¡Increíble, mi amor! Respondiste perfectamente las {total_questions} preguntas. 💕\\n\\nRealmente conoces nuestra historia y eso me llena de felicidad. Cada respuesta me recordó por qué te amo tanto.\\n\\nAhora... hay algo muy especial que quiero mostrarte. Un lugar que significa mucho para nosotros. ❤️"
-        else:
-            return f"¡Excelente, mi vida! {correct_answers} de {total_questions} respuestas correctas. 💕\\n\\nMe encanta ver cuánto recuerdas de nosotros. Cada momento que hemos vivido juntos ha sido especial.\\n\\nTengo algo importante que mostrarte... un lugar especial donde quiero estar contigo. ❤️"
\ No newline at end of file
+    return {
+        'model': "gpt-4o-mini",
+        'messages': [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Karem completó el quiz con {correct_answers}/{total_questions} respuestas correctas. Genera el mensaje final antes de revelar la ubicación especial."}
+        ],
+        'max_tokens': 250,
+        'temperature': 0.7
+    }
+
+
+def _completion_fallback(session_info: Dict) -> str:
+    """Fallback emotivo si OpenAI no responde."""
+    correct_answers = session_info.get('correct_answers', 0)
+    total_questions = session_info.get('total_questions', 7)
+    
+    if correct_answers == total_questions:
+        return f"¡Increíble, mi amor! Respondiste perfectamente las {total_questions} preguntas. 💕\\n\\nRealmente conoces nuestra historia y eso me llena de felicidad. Cada respuesta me recordó por qué te amo tanto.\\n\\nAhora... hay algo muy especial que quiero mostrarte. Un lugar que significa mucho para nosotros. ❤️"
+    else:
+        return f"¡Excelente, mi vida! {correct_answers} de {total_questions} respuestas correctas. 💕\\n\\nMe encanta ver cuánto recuerdas de nosotros. Cada momento que hemos vivido juntos ha sido especial.\\n\\nTengo algo importante que mostrarte... un lugar especial donde quiero estar contigo. ❤️"
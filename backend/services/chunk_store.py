@@ -0,0 +1,518 @@
+"""
+Chunk Store - Metadata del índice RAG en arrays memory-mapped
+Reemplaza a rag_embeddings.pkl: en vez de una lista de dicts con copias de
+cada mensaje, guarda por chunk un rango de ids dentro de una tabla de mensajes
+propia, y arma el texto y los mensajes de un chunk sólo cuando se pide (p.ej.
+los k resultados de una búsqueda).
+
+La tabla de mensajes es una copia de los mensajes indexados y no una
+referencia al .message_store de la conversación: los chunks también guardan
+mensajes que no están ahí (historia, timeline, chunks prioritarios de la
+transcripción, pickles migrados de Spaces), y el message store se
+reconstruye y reordena con cada exportación, así que sus ids no sirven como
+referencia estable.
+
+Todas las columnas son binarios crudos de sólo agregar: la
+ingesta incremental escribe únicamente la cola nueva de cada archivo, y el
+manifest (que se reemplaza al final) fija cuántas entradas son válidas. Si un
+append se corta, la cola sobrante se ignora al leer y se trunca en el
+siguiente append.
+
+Formato en disco (cache/chunk_store):
+    manifest.json        versión, conteos, remitentes, info del índice y extras de chunks prioritarios
+    chunk_offsets.bin    int64  - n + 1 offsets: el chunk i son los mensajes [off[i], off[i+1])
+    chunk_start_ts.bin   int64  - timestamp_ms mínimo de cada chunk  } filtros de búsqueda
+    chunk_end_ts.bin     int64  - timestamp_ms máximo de cada chunk  } sin decodificar
+    chunk_senders.bin    uint64 - bitmap de remitentes presentes en cada chunk
+    fingerprints.bin     uint64 - hash de la huella de cada mensaje (ingesta incremental)
+    timestamps.bin       int64  - timestamp_ms de cada mensaje, en orden de índice
+    sender_ids.bin       int16  - índice en manifest['senders']
+    content_offsets.bin  int64  - m + 1 offsets dentro de content.bin
+    content.bin          blob UTF-8 con el contenido concatenado
+"""
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from collections.abc import Sequence
+from typing import List, Dict, Optional, Tuple
+
+from services.message_store import MessageStore
+
+FORMAT_VERSION = 2
+
+# Columnas del store: (archivo, dtype, por chunk o por mensaje, con offset inicial 0)
+_COLUMNS = (
+    ('chunk_offsets.bin', np.int64, 'chunks', True),
+    ('chunk_start_ts.bin', np.int64, 'chunks', False),
+    ('chunk_end_ts.bin', np.int64, 'chunks', False),
+    ('chunk_senders.bin', np.uint64, 'chunks', False),
+    ('fingerprints.bin', np.uint64, 'messages', False),
+    ('timestamps.bin', np.int64, 'messages', False),
+    ('sender_ids.bin', np.int16, 'messages', False),
+    ('content_offsets.bin', np.int64, 'messages', True),
+    ('content.bin', np.uint8, 'content', False),
+)
+
+# Remitentes con id >= SENDER_BITS comparten el último bit y se verifican contra la tabla
+SENDER_BITS = 64
+
+
+def message_fingerprint(msg: Dict) -> str:
+    """
+    Huella estable de un mensaje: (sender_name, timestamp_ms, hash del contenido).
+    Permite saber qué mensajes ya están indexados sin comparar textos completos.
+    """
+    content_hash = hashlib.sha1((msg.get('content') or '').encode('utf-8')).hexdigest()[:16]
+    return f"{msg.get('sender_name', 'Unknown')}|{msg.get('timestamp_ms', 0)}|{content_hash}"
+
+
+def fingerprint_hashes(messages: List[Dict]) -> np.ndarray:
+    """Huellas de varios mensajes como uint64 (comparables con np.isin)."""
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.sha1(message_fingerprint(msg).encode('utf-8')).digest()[:8], 'little')
+            for msg in messages
+        ),
+        dtype=np.uint64,
+        count=len(messages)
+    )
+
+
+def _format_date(timestamp_ms: int) -> str:
+    return datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d')
+
+
+def _date_to_ms(date: str, end_of_day: bool = False) -> int:
+    """'YYYY-MM-DD' (hora local, igual que date_range) a timestamp_ms."""
+    start = int(datetime.strptime(date, '%Y-%m-%d').timestamp() * 1000)
+    return start + 86400000 - 1 if end_of_day else start
+
+
+def _chunk_columns(chunk_offsets: np.ndarray, timestamps: np.ndarray, sender_ids: np.ndarray):
+    """Timestamps mínimo/máximo y bitmap de remitentes por chunk."""
+    starts = np.asarray(chunk_offsets[:-1], dtype=np.int64)
+    if len(starts) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty.copy(), np.zeros(0, dtype=np.uint64)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    bits = np.left_shift(np.uint64(1), np.minimum(np.asarray(sender_ids), SENDER_BITS - 1).astype(np.uint64))
+    return (
+        np.minimum.reduceat(timestamps, starts),
+        np.maximum.reduceat(timestamps, starts),
+        np.bitwise_or.reduceat(bits, starts)
+    )
+
+
+def _read_column(path: Path, dtype, count: int) -> np.ndarray:
+    """Primeras `count` entradas de una columna (lo que haya después es una cola sin confirmar)."""
+    if count == 0:
+        # np.memmap no acepta largo cero
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def _column_bytes(values, dtype) -> bytes:
+    if isinstance(values, bytes):
+        return values
+    return np.asarray(values, dtype=dtype).tobytes()
+
+
+class _MessageTable(MessageStore):
+    """Las lecturas de MessageStore sobre las columnas de mensajes del chunk store."""
+
+    def __init__(self, store_dir: Path, manifest: Dict):
+        self.store_dir = store_dir
+        self.manifest = manifest
+        self.senders: List[str] = manifest.get('senders', [])
+        count = manifest.get('message_count', 0)
+        if count:
+            self.timestamps = _read_column(store_dir / "timestamps.bin", np.int64, count)
+            self.sender_ids = _read_column(store_dir / "sender_ids.bin", np.int16, count)
+            self.content_offsets = _read_column(store_dir / "content_offsets.bin", np.int64, count + 1)
+        else:
+            self.timestamps = np.zeros(0, dtype=np.int64)
+            self.sender_ids = np.zeros(0, dtype=np.int16)
+            self.content_offsets = np.zeros(1, dtype=np.int64)
+        self.content_blob = _read_column(store_dir / "content.bin", np.uint8, int(self.content_offsets[-1]))
+
+
+class ChunkTexts(Sequence):
+    """Vista perezosa de los textos de los chunks (compatibilidad con chunk_texts)."""
+
+    def __init__(self, store: 'ChunkStore'):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._store.text(i) for i in range(*index.indices(len(self)))]
+        return self._store.text(index)
+
+
+class ChunkStore(Sequence):
+    """
+    Chunks del índice RAG. `store[i]` devuelve el dict del chunk i con el
+    mismo formato que antes (text, chunk_id, messages_in_chunk, date_range,
+    message_count), decodificado en el momento.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self._open()
+
+    def _open(self):
+        manifest_path = self.store_dir / "manifest.json"
+        self.manifest = None
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get('version') != FORMAT_VERSION:
+                # P.ej. la versión 1 (tabla messages/ reescrita en cada append): el RAG la
+                # ve vacía y la reconstruye desde el cache de embeddings
+                print(f"⚠️ Chunk store con versión {self.manifest.get('version')} no soportada, se reconstruirá")
+                self.manifest = None
+        self._on_disk = self.manifest is not None
+        if self.manifest is None:
+            self.manifest = {'version': FORMAT_VERSION, 'count': 0, 'message_count': 0, 'senders': [],
+                             'info': {}, 'priority': {}}
+        count = self.manifest.get('count', 0)
+        if count:
+            self.chunk_offsets: np.ndarray = _read_column(self.store_dir / "chunk_offsets.bin", np.int64, count + 1)
+        else:
+            self.chunk_offsets = np.zeros(1, dtype=np.int64)
+        self.chunk_start_ts: np.ndarray = _read_column(self.store_dir / "chunk_start_ts.bin", np.int64, count)
+        self.chunk_end_ts: np.ndarray = _read_column(self.store_dir / "chunk_end_ts.bin", np.int64, count)
+        self.chunk_senders: np.ndarray = _read_column(self.store_dir / "chunk_senders.bin", np.uint64, count)
+        self.fingerprints: np.ndarray = _read_column(
+            self.store_dir / "fingerprints.bin", np.uint64, self.manifest.get('message_count', 0)
+        )
+        self.messages = _MessageTable(self.store_dir, self.manifest)
+        # Extras de los chunks prioritarios (metadata, priority_score, type), por chunk_id
+        self._priority: Dict[int, Dict] = {int(k): v for k, v in self.manifest.get('priority', {}).items()}
+
+    def exists(self) -> bool:
+        return self._on_disk and (self.store_dir / "manifest.json").exists()
+
+    def __len__(self) -> int:
+        return int(self.chunk_offsets.shape[0]) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.chunk(i) for i in range(*index.indices(len(self)))]
+        return self.chunk(index)
+
+    @property
+    def info(self) -> Dict:
+        """Info del índice guardada junto a los chunks (tipo, fecha, origen)."""
+        return self.manifest.get('info', {})
+
+    @property
+    def message_count(self) -> int:
+        return int(self.chunk_offsets[-1])
+
+    def texts(self) -> ChunkTexts:
+        return ChunkTexts(self)
+
+    def _resolve(self, index: int) -> int:
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"chunk {index} fuera de rango ({len(self)} chunks)")
+        return index
+
+    def message_range(self, index: int) -> Tuple[int, int]:
+        index = self._resolve(index)
+        return int(self.chunk_offsets[index]), int(self.chunk_offsets[index + 1])
+
+    def is_priority(self, index: int) -> bool:
+        return self._resolve(index) in self._priority
+
+    def messages_in_chunk(self, index: int) -> List[Dict]:
+        index = self._resolve(index)
+        start, stop = self.message_range(index)
+        messages = self.messages.to_messages(start, stop)
+        if index in self._priority:
+            messages = [{**msg, **self._priority[index]} for msg in messages]
+        return messages
+
+    def text(self, index: int) -> str:
+        """Texto embebido del chunk, reconstruido desde la tabla de mensajes."""
+        index = self._resolve(index)
+        start, stop = self.message_range(index)
+        contents = self.messages.contents(start, stop)
+        if index in self._priority:
+            return contents[0]
+        lines = []
+        for i, content in zip(range(start, stop), contents):
+            timestamp = int(self.messages.timestamps[i])
+            date = _format_date(timestamp) if timestamp else 'unknown'
+            lines.append(f"[{date}] {self.messages.sender_name(i)}: {content}")
+        return '\n'.join(lines)
+
+    def searchable_text(self, index: int) -> str:
+        """Sólo el contenido de los mensajes (sin fechas ni remitentes), para el índice léxico."""
+        start, stop = self.message_range(index)
+        return '\n'.join(self.messages.contents(start, stop))
+
+    def date_range(self, index: int):
+        index = self._resolve(index)
+        if index in self._priority:
+            return self._priority[index].get('metadata', {}).get('period', 'priority')
+        start, stop = self.message_range(index)
+        return (
+            _format_date(int(self.messages.timestamps[start])),
+            _format_date(int(self.messages.timestamps[stop - 1]))
+        )
+
+    def filter_mask(
+        self,
+        date_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+        sender_name: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Máscara de chunks elegibles para una búsqueda filtrada, calculada sólo
+        sobre las columnas por chunk.
+
+        Args:
+            date_range: ('YYYY-MM-DD', 'YYYY-MM-DD') inclusivo; cualquiera de los dos puede ser None.
+                Un chunk es elegible si se solapa con el rango.
+            sender_name: El chunk debe tener al menos un mensaje de este remitente
+
+        Returns:
+            Array booleano (un valor por chunk) o None si no hay filtros
+        """
+        if not date_range and not sender_name:
+            return None
+
+        mask = np.ones(len(self), dtype=bool)
+        if date_range:
+            # Chunks sin fecha (timestamp 0, p.ej. los prioritarios) nunca cumplen un filtro de fechas
+            mask &= np.asarray(self.chunk_end_ts) > 0
+            start, end = date_range
+            if start:
+                mask &= np.asarray(self.chunk_end_ts) >= _date_to_ms(start)
+            if end:
+                mask &= np.asarray(self.chunk_start_ts) <= _date_to_ms(end, end_of_day=True)
+
+        if sender_name:
+            sender_id = self.messages.sender_id(sender_name)
+            if sender_id < 0:
+                return np.zeros(len(self), dtype=bool)
+            bit = np.uint64(1) << np.uint64(min(sender_id, SENDER_BITS - 1))
+            mask &= (np.asarray(self.chunk_senders) & bit) != 0
+            if sender_id >= SENDER_BITS - 1:
+                # Bit compartido: confirmar contra los ids reales de los candidatos
+                hits = np.asarray(self.messages.sender_ids) == sender_id
+                mask &= np.logical_or.reduceat(hits, np.asarray(self.chunk_offsets[:-1], dtype=np.int64))
+        return mask
+
+    def chunk(self, index: int) -> Dict:
+        index = self._resolve(index)
+        start, stop = self.message_range(index)
+        chunk = {
+            'text': self.text(index),
+            'chunk_id': index,
+            'messages_in_chunk': self.messages_in_chunk(index),
+            'date_range': self.date_range(index),
+            'message_count': stop - start
+        }
+        if index in self._priority:
+            chunk['priority_score'] = self._priority[index].get('priority_score', 10)
+            chunk['type'] = 'priority_transcription'
+        return chunk
+
+    def contains_fingerprints(self, messages: List[Dict]) -> np.ndarray:
+        """Máscara booleana: qué mensajes ya están en el store."""
+        if not messages:
+            return np.zeros(0, dtype=bool)
+        return np.isin(fingerprint_hashes(messages), self.fingerprints)
+
+    def append(self, chunks: List[Dict], info: Optional[Dict] = None):
+        """
+        Agrega chunks (con sus messages_in_chunk) al final del store.
+        El chunk_id de cada chunk es su posición (la del vector en el índice).
+        """
+        self._write(chunks, info, keep_existing=True)
+
+    def replace(self, chunks: List[Dict], info: Optional[Dict] = None):
+        """Reemplaza todo el contenido del store (build desde cero)."""
+        self._write(chunks, info, keep_existing=False)
+
+    def remove(self, chunk_ids):
+        """
+        Elimina chunks (p.ej. la versión anterior de un documento). Reescribe
+        el store: los chunks siguientes se corren y conservan su orden.
+        """
+        drop = {int(i) for i in chunk_ids}
+        kept = [self.chunk(i) for i in range(len(self)) if i not in drop]
+        self._write(kept, dict(self.info), keep_existing=False)
+
+    def update_info(self, **info):
+        """Actualiza sólo la info del índice en el manifest."""
+        self.manifest['info'] = {**self.info, **info}
+        if self.exists():
+            self._write_manifest()
+
+    def _column_lengths(self) -> Dict[str, int]:
+        """Entradas confirmadas (según el manifest) de cada columna."""
+        sizes = {'chunks': len(self), 'messages': self.message_count, 'content': int(self.messages.content_offsets[-1])}
+        return {name: sizes[per] + (1 if leading_zero else 0) for name, _, per, leading_zero in _COLUMNS}
+
+    def _write(self, chunks: List[Dict], info: Optional[Dict], keep_existing: bool):
+        keep_existing = keep_existing and self.exists()
+        base_chunks = len(self) if keep_existing else 0
+
+        senders = list(self.messages.senders) if keep_existing else []
+        sender_index = {name: i for i, name in enumerate(senders)}
+        timestamps: List[int] = []
+        sender_ids: List[int] = []
+        encoded: List[bytes] = []
+        counts: List[int] = []
+        priority = dict(self._priority) if keep_existing else {}
+        new_messages: List[Dict] = []
+
+        for offset, chunk in enumerate(chunks):
+            messages = chunk['messages_in_chunk']
+            counts.append(len(messages))
+            if chunk.get('type') == 'priority_transcription':
+                msg = messages[0]
+                priority[base_chunks + offset] = {
+                    key: value for key, value in msg.items()
+                    if key not in ('content', 'sender_name', 'timestamp_ms')
+                }
+            for msg in messages:
+                sender = msg.get('sender_name', 'Unknown')
+                sid = sender_index.get(sender)
+                if sid is None:
+                    sid = sender_index[sender] = len(senders)
+                    senders.append(sender)
+                timestamps.append(int(msg.get('timestamp_ms', 0)))
+                sender_ids.append(sid)
+                encoded.append((msg.get('content') or '').encode('utf-8'))
+                new_messages.append(msg)
+
+        # Sólo las entradas nuevas de cada columna (offsets corridos por lo ya guardado)
+        new_timestamps = np.asarray(timestamps, dtype=np.int64)
+        new_sender_ids = np.asarray(sender_ids, dtype=np.int16)
+        local_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(np.asarray(counts, dtype=np.int64), out=local_offsets[1:])
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        base_messages = self.message_count if keep_existing else 0
+        base_content = int(self.messages.content_offsets[-1]) if keep_existing else 0
+        chunk_start_ts, chunk_end_ts, chunk_senders = _chunk_columns(local_offsets, new_timestamps, new_sender_ids)
+        tails = {
+            'chunk_offsets.bin': base_messages + local_offsets[1:],
+            'chunk_start_ts.bin': chunk_start_ts,
+            'chunk_end_ts.bin': chunk_end_ts,
+            'chunk_senders.bin': chunk_senders,
+            'fingerprints.bin': fingerprint_hashes(new_messages),
+            'timestamps.bin': new_timestamps,
+            'sender_ids.bin': new_sender_ids,
+            'content_offsets.bin': base_content + np.cumsum(lengths),
+            'content.bin': b''.join(encoded),
+        }
+
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        if keep_existing:
+            committed = self._column_lengths()
+            for name, dtype, _, _ in _COLUMNS:
+                with open(self.store_dir / name, 'r+b') as f:
+                    # Descarta la cola de un append anterior que no llegó al manifest
+                    f.truncate(committed[name] * np.dtype(dtype).itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(_column_bytes(tails[name], dtype))
+        else:
+            # Restos del formato v1 (columnas .npy y tabla messages/)
+            shutil.rmtree(self.store_dir / "messages", ignore_errors=True)
+            for path in self.store_dir.glob("*.npy"):
+                path.unlink()
+            suffix = f".tmp-{os.getpid()}"
+            for name, dtype, _, leading_zero in _COLUMNS:
+                tmp_path = self.store_dir / (name + suffix)
+                with open(tmp_path, 'wb') as f:
+                    if leading_zero:
+                        f.write(_column_bytes(np.zeros(1), dtype))
+                    f.write(_column_bytes(tails[name], dtype))
+                os.replace(tmp_path, self.store_dir / name)
+
+        self.manifest = {
+            'version': FORMAT_VERSION,
+            'created_at': self.manifest.get('created_at') if keep_existing else datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat(),
+            'count': base_chunks + len(counts),
+            'message_count': base_messages + len(new_messages),
+            'senders': senders,
+            # legacy_source se conserva siempre: evita re-migrar un pickle viejo sobre un build nuevo
+            'info': {
+                **(self.info if keep_existing else {k: v for k, v in self.info.items() if k == 'legacy_source'}),
+                **(info or {})
+            },
+            'priority': {str(k): v for k, v in priority.items()}
+        }
+        self._write_manifest()
+        self._open()
+
+    def _write_manifest(self):
+        self.manifest['updated_at'] = datetime.now().isoformat()
+        tmp_path = self.store_dir / f"manifest.json.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.store_dir / "manifest.json")
+
+    @property
+    def signature(self) -> Dict:
+        """Identifica el contenido actual (cambia con cada build o append)."""
+        return {'created_at': self.manifest.get('created_at'), 'count': len(self)}
+
+    def get_statistics(self) -> Dict:
+        size_bytes = sum(p.stat().st_size for p in self.store_dir.rglob('*') if p.is_file()) if self.exists() else 0
+        return {
+            'chunks': len(self),
+            'messages': self.message_count,
+            'priority_chunks': len(self._priority),
+            'size_mb': size_bytes / 1024 / 1024
+        }
+
+
+def legacy_signature(pickle_path) -> Optional[Dict]:
+    """Firma (tamaño, mtime) de un rag_embeddings.pkl, o None si no existe."""
+    path = Path(pickle_path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return {'name': path.name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def migrate_legacy_pickle(pickle_path, store: ChunkStore) -> bool:
+    """
+    Convierte un rag_embeddings.pkl (formato anterior, p.ej. descargado de
+    Spaces) al chunk store. Sólo actúa si el pickle cambió desde la última
+    migración.
+
+    Returns:
+        True si se migró
+    """
+    signature = legacy_signature(pickle_path)
+    if signature is None or store.info.get('legacy_source') == signature:
+        return False
+
+    print(f"🔄 Migrando {Path(pickle_path).name} al chunk store...")
+    with open(pickle_path, 'rb') as f:
+        cache_data = pickle.load(f)
+    info = {
+        'legacy_source': signature,
+        'index_type': cache_data.get('index_type'),
+        'requested_index_type': cache_data.get('requested_index_type', cache_data.get('index_type'))
+    }
+    store.replace(cache_data['metadata'], {k: v for k, v in info.items() if v is not None})
+    print(f"✅ {len(store)} chunks migrados ({store.message_count} mensajes)")
+    return True
@@ -0,0 +1,151 @@
+"""
+Conversation Stats - Primitivas vectorizadas para las estadísticas de la conversación
+Trabaja sobre columnas (timestamps, ids de remitente y contenido) en vez de
+recorrer los mensajes uno por uno: hora local sin un datetime por mensaje,
+emojis sobre todo el texto unido de una vez y palabras románticas con el
+léxico compartido (services/lexicon.py). Los agregados parciales por día de
+services/stats_partials.py se arman con estas primitivas.
+
+Las columnas salen directo del MessageStore (sin reconstruir dicts) o de una
+lista de mensajes con el formato de la exportación de Instagram.
+"""
+
+import numpy as np
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from services.lexicon import Lexicon
+
+ROMANTIC_WORDS = ['amor', 'te amo', 'mi vida', 'corazón', 'besitos', 'hermosa', 'princesa', 'mi amor', 'baby', 'cariño']
+
+# Rangos de emojis (los mismos del patrón que se usaba por mensaje)
+EMOJI_RANGES = [
+    (0x1F600, 0x1F64F),  # emoticons
+    (0x1F300, 0x1F5FF),  # symbols & pictographs
+    (0x1F680, 0x1F6FF),  # transport & map symbols
+    (0x1F1E0, 0x1F1FF),  # flags (iOS)
+    (0x2702, 0x27B0),
+    (0x24C2, 0x1F251)
+]
+_EMOJI_MIN = min(low for low, _ in EMOJI_RANGES)
+
+# Separador entre mensajes al unir el contenido: no está en el rango de emojis
+SEPARATOR = '\n'
+
+MS_PER_DAY = 86_400_000
+
+
+romantic_lexicon = Lexicon(ROMANTIC_WORDS)
+
+
+class ConversationColumns:
+    """Mensajes en formato columnar: lo único que necesita el cálculo de estadísticas."""
+
+    def __init__(self, timestamps_ms: np.ndarray, sender_ids: np.ndarray, senders: List[str], contents: List[str]):
+        self.timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        self.sender_ids = np.asarray(sender_ids, dtype=np.int64)
+        self.senders = list(senders)
+        self.contents = contents
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    @classmethod
+    def from_store(cls, store, start: int = 0) -> 'ConversationColumns':
+        """
+        Columnas de un MessageStore desde el mensaje `start` (arrays
+        memory-mapped y contenido decodificado de una vez).
+        """
+        return cls(
+            np.asarray(store.timestamps[start:]), np.asarray(store.sender_ids[start:]),
+            store.senders, store.contents(start)
+        )
+
+    @classmethod
+    def from_messages(cls, messages: List[Dict]) -> 'ConversationColumns':
+        """Columnas de una lista de mensajes; los que no traen timestamp_ms quedan con -1."""
+        senders: List[str] = []
+        sender_index: Dict[str, int] = {}
+        sender_ids = np.empty(len(messages), dtype=np.int64)
+        timestamps = np.empty(len(messages), dtype=np.int64)
+        contents: List[str] = []
+        for i, msg in enumerate(messages):
+            sender = msg.get('sender_name', 'Unknown')
+            sid = sender_index.get(sender)
+            if sid is None:
+                sid = sender_index[sender] = len(senders)
+                senders.append(sender)
+            sender_ids[i] = sid
+            timestamps[i] = msg.get('timestamp_ms', -1)
+            content = msg.get('content')
+            contents.append(content if isinstance(content, str) else '')
+        return cls(timestamps, sender_ids, senders, contents)
+
+    def slice(self, start: int, stop: Optional[int] = None) -> 'ConversationColumns':
+        return ConversationColumns(
+            self.timestamps_ms[start:stop], self.sender_ids[start:stop], self.senders, self.contents[start:stop]
+        )
+
+    def chronological(self) -> 'ConversationColumns':
+        """Las mismas columnas en orden cronológico (estable); sin copiar si ya lo están."""
+        if len(self) < 2 or bool(np.all(np.diff(self.timestamps_ms) >= 0)):
+            return self
+        order = np.argsort(self.timestamps_ms, kind='stable')
+        return ConversationColumns(
+            self.timestamps_ms[order], self.sender_ids[order], self.senders,
+            [self.contents[i] for i in order.tolist()]
+        )
+
+
+def local_time_ms(timestamps_ms: np.ndarray) -> np.ndarray:
+    """
+    Timestamps en hora local (como datetime.fromtimestamp) sin crear un
+    datetime por mensaje: el offset de la zona horaria se calcula una vez por
+    hora distinta, que es donde pueden caer los cambios de horario.
+    """
+    if len(timestamps_ms) == 0:
+        return timestamps_ms
+    hours, inverse = np.unique(timestamps_ms // 3_600_000, return_inverse=True)
+    offsets = np.fromiter(
+        (datetime.fromtimestamp(int(h) * 3600, timezone.utc).astimezone().utcoffset().total_seconds() * 1000
+         for h in hours),
+        dtype=np.int64, count=len(hours)
+    )
+    return timestamps_ms + offsets[inverse]
+
+
+def emoji_spans(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Inicio y fin (en code points) de cada secuencia de emojis de `text`,
+    marcando los code points en rango con NumPy en vez de recorrer el texto
+    con regex.
+    """
+    codepoints = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    candidates = np.flatnonzero(codepoints >= _EMOJI_MIN)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(candidates) == 0:
+        return empty, empty
+    values = codepoints[candidates]
+    in_range = np.zeros(len(candidates), dtype=bool)
+    for low, high in EMOJI_RANGES:
+        in_range |= (values >= low) & (values <= high)
+    positions = candidates[in_range]
+    if len(positions) == 0:
+        return empty, empty
+    # Emojis contiguos forman una sola secuencia (como el "+" del patrón)
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = positions[np.concatenate(([0], breaks))]
+    ends = positions[np.concatenate((breaks - 1, [len(positions) - 1]))] + 1
+    return starts, ends
+
+
+def count_emojis(text: str) -> Counter:
+    """Secuencias de emojis de `text` y cuántas veces aparece cada una."""
+    starts, ends = emoji_spans(text)
+    return Counter(text[start:end] for start, end in zip(starts.tolist(), ends.tolist()))
+
+
+def format_local_date(local_ms: int) -> str:
+    """'YYYY-MM-DD' de un timestamp ya en hora local."""
+    return str(np.datetime64(local_ms, 'ms').astype('datetime64[D]'))
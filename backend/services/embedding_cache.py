@@ -0,0 +1,184 @@
+"""
+Embedding Cache - Cache persistente de embeddings direccionado por contenido
+Clave: (modelo, sha256(texto)). Sobrevive a reconstrucciones del índice, cambios
+de chunk_size y queries repetidas, así que ningún texto se embebe dos veces.
+
+Formato en disco (un directorio por modelo):
+    keys.bin       digests sha256 de 32 bytes, uno por fila
+    vectors.f32    matriz float32 (n, dim) append-only, abierta con memmap
+"""
+
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """
+    Cache append-only de embeddings.
+
+    Las filas se leen desde un memmap de solo lectura; las nuevas se agregan al
+    final de ambos archivos (primero el vector, luego la clave), de modo que
+    una escritura interrumpida nunca deja una clave apuntando a basura.
+
+    Con read_only=True (workers pre-fork) los archivos no se tocan: los
+    embeddings nuevos (queries) quedan sólo en memoria del proceso, en un LRU
+    de `memory_size` entradas (env EMBEDDING_QUERY_CACHE_SIZE).
+    """
+
+    def __init__(self, cache_dir: str, model: str, dim: int, read_only: bool = False, memory_size: Optional[int] = None):
+        self.model = model
+        self.dim = dim
+        self.read_only = read_only
+        self.memory_size = (
+            memory_size if memory_size is not None
+            else int(os.getenv('EMBEDDING_QUERY_CACHE_SIZE', 2000))
+        )
+        self.cache_dir = Path(cache_dir) / "embedding_cache" / model.replace('/', '_')
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.keys_file = self.cache_dir / "keys.bin"
+        self.vectors_file = self.cache_dir / "vectors.f32"
+
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._count = 0  # Filas en disco (puede superar len(_rows) si hay duplicados)
+        self._vectors: np.ndarray = np.zeros((0, dim), dtype=np.float32)
+        self._memory: 'OrderedDict[bytes, np.ndarray]' = OrderedDict()  # LRU, sólo en modo read_only
+        self._load()
+
+    def _load(self):
+        keys = self.keys_file.read_bytes() if self.keys_file.exists() else b''
+        vector_bytes = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        row_bytes = self.dim * 4
+
+        # Sólo son válidas las filas completas presentes en ambos archivos
+        count = min(len(keys) // DIGEST_SIZE, vector_bytes // row_bytes)
+        self._count = count
+        self._rows = {
+            keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]: i
+            for i in range(count)
+        }
+        if count:
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(count, self.dim))
+        else:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+        # Truncar restos de una escritura interrumpida (en modo read_only podría
+        # ser una escritura en curso de otro proceso: no se toca)
+        if self.read_only:
+            return
+        if len(keys) != count * DIGEST_SIZE:
+            with open(self.keys_file, 'r+b') as f:
+                f.truncate(count * DIGEST_SIZE)
+        if vector_bytes != count * row_bytes:
+            with open(self.vectors_file, 'r+b') as f:
+                f.truncate(count * row_bytes)
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._memory)
+
+    def __contains__(self, text: str) -> bool:
+        digest = text_digest(text)
+        return digest in self._rows or digest in self._memory
+
+    def _memory_get(self, digest: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(digest)
+            if vector is not None:
+                self._memory.move_to_end(digest)
+            return vector
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        digest = text_digest(text)
+        row = self._rows.get(digest)
+        if row is None:
+            vector = self._memory_get(digest)
+            return None if vector is None else vector.copy()
+        return np.array(self._vectors[row], dtype=np.float32)
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Busca varios textos de una vez.
+
+        Returns:
+            (matriz (len(texts), dim) con los aciertos rellenados,
+             índices de los textos que no están en cache)
+        """
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        hit_positions = []
+        hit_rows = []
+        for i, text in enumerate(texts):
+            digest = text_digest(text)
+            row = self._rows.get(digest)
+            if row is None:
+                vector = self._memory_get(digest)
+                if vector is None:
+                    missing.append(i)
+                else:
+                    result[i] = vector
+            else:
+                hit_positions.append(i)
+                hit_rows.append(row)
+        if hit_rows:
+            result[hit_positions] = self._vectors[hit_rows]
+        return result, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Agrega embeddings nuevos al cache (ignora los ya presentes y los vectores nulos)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+        with self._lock:
+            new_keys = []
+            new_rows = []
+            seen = set()
+            for text, vector in zip(texts, vectors):
+                digest = text_digest(text)
+                if digest in self._rows or digest in self._memory or digest in seen or not np.any(vector):
+                    continue
+                seen.add(digest)
+                new_keys.append(digest)
+                new_rows.append(vector)
+
+            if not new_keys:
+                return
+
+            if self.read_only:
+                for digest, vector in zip(new_keys, new_rows):
+                    self._memory[digest] = np.array(vector, dtype=np.float32)
+                # Un vector por respuesta distinta: sin límite la RSS de cada worker crecería sin fin
+                while len(self._memory) > self.memory_size:
+                    self._memory.popitem(last=False)
+                return
+
+            with open(self.vectors_file, 'ab') as f:
+                f.write(np.ascontiguousarray(new_rows, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_file, 'ab') as f:
+                f.write(b''.join(new_keys))
+
+            for digest in new_keys:
+                self._rows[digest] = self._count
+                self._count += 1
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(self._count, self.dim))
+
+    def put(self, text: str, vector: np.ndarray):
+        self.put_many([text], np.asarray(vector).reshape(1, -1))
+
+    def get_statistics(self) -> Dict:
+        size_bytes = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        return {
+            'entries': len(self),
+            'model': self.model,
+            'size_mb': size_bytes / 1024 / 1024
+        }
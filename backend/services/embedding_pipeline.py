@@ -0,0 +1,203 @@
+"""
+Embedding Pipeline - Generación concurrente de embeddings con control de rate limits
+Empaqueta textos por tokens, lanza batches en paralelo con un pool acotado de
+threads y reintenta con backoff exponencial ante 429/5xx.
+
+Cada batch completado se guarda de inmediato en el EmbeddingCache, que actúa
+como checkpoint: si el proceso muere en el batch 400, el siguiente build
+recupera los 399 anteriores desde cache y continúa desde ahí.
+"""
+
+import os
+import time
+import random
+import asyncio
+import numpy as np
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIStatusError, APIConnectionError, APITimeoutError
+
+from services.embedding_cache import EmbeddingCache
+
+try:
+    import tiktoken
+except ImportError:  # Opcional: sin tiktoken se estiman los tokens por caracteres
+    tiktoken = None
+
+MAX_INPUT_TOKENS = 8191       # Límite por input de text-embedding-3-*
+MAX_BATCH_INPUTS = 2048       # Límite de inputs por request
+CHARS_PER_TOKEN_ESTIMATE = 3  # Conservador para español cuando no hay tiktoken
+
+
+class EmbeddingError(Exception):
+    """Algún batch no pudo embeberse tras agotar los reintentos."""
+
+
+class EmbeddingPipeline:
+    """
+    Pipeline de embeddings para construir índices grandes.
+
+    Args:
+        client: Cliente de OpenAI
+        model: Modelo de embeddings
+        cache: EmbeddingCache donde se consultan y guardan los vectores
+        max_concurrency: Requests simultáneos (env RAG_EMBEDDING_CONCURRENCY)
+        max_batch_tokens: Tokens máximos por request (env RAG_EMBEDDING_BATCH_TOKENS)
+        max_retries: Reintentos por batch ante 429/5xx/errores de red
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str,
+        cache: EmbeddingCache,
+        max_concurrency: Optional[int] = None,
+        max_batch_tokens: Optional[int] = None,
+        max_retries: int = 6
+    ):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.max_concurrency = max_concurrency or int(os.getenv('RAG_EMBEDDING_CONCURRENCY', 4))
+        self.max_batch_tokens = max_batch_tokens or int(os.getenv('RAG_EMBEDDING_BATCH_TOKENS', 100000))
+        self.max_retries = max_retries
+        self.base_delay = 1.0
+        self.max_delay = 60.0
+
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def prepare(self, text: str) -> str:
+        """Trunca un texto al límite de tokens del modelo (es la clave del cache)."""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            if len(tokens) <= MAX_INPUT_TOKENS:
+                return text
+            return self._encoding.decode(tokens[:MAX_INPUT_TOKENS])
+        return text[:MAX_INPUT_TOKENS * CHARS_PER_TOKEN_ESTIMATE]
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // CHARS_PER_TOKEN_ESTIMATE + 1
+
+    def pack_batches(self, texts: List[str], positions: List[int]) -> List[List[int]]:
+        """Agrupa posiciones en batches que respetan tokens e inputs máximos por request."""
+        batches = []
+        current: List[int] = []
+        current_tokens = 0
+        for position in positions:
+            tokens = self.count_tokens(texts[position])
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= MAX_BATCH_INPUTS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(position)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+            return True
+        return isinstance(error, APIStatusError) and error.status_code >= 500
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _vectors(response, batch_texts: List[str]) -> np.ndarray:
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        if vectors.shape[0] != len(batch_texts) or not np.all(np.any(vectors, axis=1)):
+            raise EmbeddingError("Respuesta de embeddings incompleta")
+        return vectors
+
+    def embed_batch(self, batch_texts: List[str]) -> np.ndarray:
+        """
+        Embebe un batch en un único request (con reintentos), sin pasar por el
+        cache. Lanza la excepción del último intento si falla.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(model=self.model, input=batch_texts)
+                return self._vectors(response, batch_texts)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(f"  ⏳ {type(e).__name__}, reintentando en {delay:.1f}s (intento {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    async def aembed_batch(self, async_client: AsyncOpenAI, batch_texts: List[str]) -> np.ndarray:
+        """Como embed_batch con el cliente async: los reintentos esperan sin bloquear el event loop."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await async_client.embeddings.create(model=self.model, input=batch_texts)
+                return self._vectors(response, batch_texts)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(f"  ⏳ {type(e).__name__}, reintentando en {delay:.1f}s (intento {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Devuelve la matriz de embeddings de `texts`, usando el cache y llamando
+        a OpenAI sólo para los faltantes.
+
+        Raises:
+            EmbeddingError: si algún batch falla definitivamente. Los batches
+            completados ya quedaron en cache, así que reintentar continúa
+            desde donde se quedó. Nunca se devuelven vectores nulos.
+        """
+        texts = [self.prepare(t) for t in texts]
+        embeddings, missing = self.cache.get_many(texts)
+
+        if len(missing) < len(texts):
+            print(f"  💾 {len(texts) - len(missing)}/{len(texts)} embeddings desde cache")
+        if not missing:
+            return embeddings
+
+        batches = self.pack_batches(texts, missing)
+        print(f"  🚀 {len(missing)} embeddings en {len(batches)} batches ({self.max_concurrency} en paralelo)")
+
+        done = 0
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            future_to_batch = {
+                executor.submit(self.embed_batch, [texts[p] for p in batch]): batch
+                for batch in batches
+            }
+            for future in as_completed(future_to_batch):
+                batch = future_to_batch[future]
+                try:
+                    vectors = future.result()
+                except Exception as e:
+                    failures.append(e)
+                    print(f"❌ Error en batch de {len(batch)} textos: {e}")
+                    continue
+                embeddings[batch] = vectors
+                self.cache.put_many([texts[p] for p in batch], vectors)
+                done += len(batch)
+                print(f"  📊 Procesados {done}/{len(missing)} embeddings...")
+
+        if failures:
+            raise EmbeddingError(
+                f"{len(failures)}/{len(batches)} batches fallaron; "
+                f"los {done} embeddings completados quedaron en cache"
+            )
+        return embeddings
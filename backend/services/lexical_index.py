@@ -0,0 +1,241 @@
+"""
+Lexical Index - Índice invertido BM25 en proceso para el RAG
+Tokeniza el texto de los chunks en español sin acentos (y reparando el
+mojibake de la exportación de Instagram), y responde queries de palabras
+clave localmente en microsegundos, sin llamadas a OpenAI.
+
+Formato en disco (cache/lexical_index):
+    manifest.json       versión, parámetros BM25, conteos y vocabulario
+    term_offsets.npy    int64  - n_terms + 1 offsets dentro de las postings
+    postings_docs.npy   int32  - chunk de cada posting, agrupadas por término
+    postings_tf.npy     uint16 - frecuencia del término en ese chunk
+    doc_lengths.npy     int32  - tokens por chunk
+"""
+
+import os
+import re
+import json
+import unicodedata
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Iterable
+
+FORMAT_VERSION = 1
+
+# Parámetros BM25 clásicos
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Secuencias UTF-8 leídas como latin-1 ("Ã©" en vez de "é")
+_MOJIBAKE_RE = re.compile('[Â-ô][\u0080-¿]+')
+_COMBINING_RE = re.compile('[\u0300-\u036f]')
+
+STOPWORDS = frozenset("""
+a al algo ante antes aqui asi con como cual cuando de del desde donde el ella ellas ellos en entre era es esa ese eso
+esta estaba estan estas este esto estoy fue ha hay la las le les lo los mas me mi mis muy nada ni no nos o para pero
+por porque que se sea ser si sin sobre solo su sus te ti tu tus un una uno unos y ya yo
+""".split())
+
+
+def repair_mojibake(text: str) -> str:
+    # Camino rápido: texto que es mojibake de punta a punta (la exportación completa)
+    try:
+        return text.encode('latin-1').decode('utf-8')
+    except UnicodeError:
+        pass
+
+    def repair(match):
+        try:
+            return match.group(0).encode('latin-1').decode('utf-8')
+        except UnicodeError:
+            return match.group(0)
+    return _MOJIBAKE_RE.sub(repair, text)
+
+
+def fold(text: str) -> str:
+    """
+    Minúsculas, sin acentos ni diacríticos (ñ -> n), con el mojibake reparado.
+    Es el único plegado del backend: lo usan el BM25 y el léxico de los
+    analizadores (services/lexicon.py), así ambos ven los mismos términos.
+    """
+    return _COMBINING_RE.sub('', unicodedata.normalize('NFKD', repair_mojibake(text).lower()))
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens indexables: alfanuméricos plegados, sin stopwords ni letras sueltas."""
+    return [
+        token for token in _TOKEN_RE.findall(fold(text))
+        if (len(token) > 1 or token.isdigit()) and token not in STOPWORDS
+    ]
+
+
+class LexicalIndex:
+    """
+    BM25 sobre postings en arrays NumPy (CSR por término).
+
+    Los documentos son los chunks del RAG, con el mismo id que su vector en
+    FAISS, así que las máscaras de filtro del chunk store aplican tal cual.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        self._open()
+
+    def _open(self):
+        manifest_path = self.index_dir / "manifest.json"
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Versión de índice léxico no soportada: {self.manifest.get('version')}")
+            self.term_offsets: np.ndarray = np.load(self.index_dir / "term_offsets.npy", mmap_mode='r')
+            self.postings_docs: np.ndarray = np.load(self.index_dir / "postings_docs.npy", mmap_mode='r')
+            self.postings_tf: np.ndarray = np.load(self.index_dir / "postings_tf.npy", mmap_mode='r')
+            self.doc_lengths: np.ndarray = np.load(self.index_dir / "doc_lengths.npy", mmap_mode='r')
+        else:
+            self.manifest = {'version': FORMAT_VERSION, 'doc_count': 0, 'terms': []}
+            self.term_offsets = np.zeros(1, dtype=np.int64)
+            self.postings_docs = np.zeros(0, dtype=np.int32)
+            self.postings_tf = np.zeros(0, dtype=np.uint16)
+            self.doc_lengths = np.zeros(0, dtype=np.int32)
+
+        self.k1 = self.manifest.get('k1', BM25_K1)
+        self.b = self.manifest.get('b', BM25_B)
+        self.terms: Dict[str, int] = {term: i for i, term in enumerate(self.manifest.get('terms', []))}
+
+        # Precalculados por consulta: idf por término y normalización de longitud por documento
+        doc_count = len(self.doc_lengths)
+        document_frequency = np.diff(np.asarray(self.term_offsets))
+        self.idf = np.log1p((doc_count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        avgdl = float(np.mean(self.doc_lengths)) if doc_count else 0.0
+        self._length_norm = (
+            self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lengths, dtype=np.float32) / avgdl)
+            if avgdl else np.full(doc_count, self.k1, dtype=np.float32)
+        ).astype(np.float32)
+
+    def exists(self) -> bool:
+        return (self.index_dir / "manifest.json").exists()
+
+    def __len__(self) -> int:
+        return int(self.doc_lengths.shape[0])
+
+    @property
+    def source(self) -> Optional[Dict]:
+        """Firma del chunk store desde el que se construyó."""
+        return self.manifest.get('source')
+
+    def build(self, texts: Iterable[str], source: Optional[Dict] = None):
+        """Construye el índice desde los textos de los chunks (en orden de chunk_id)."""
+        terms: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        doc_lengths: List[int] = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for token in tokens:
+                term_id = terms.get(token)
+                if term_id is None:
+                    term_id = terms[token] = len(terms)
+                term_ids.append(term_id)
+                doc_ids.append(doc_id)
+
+        doc_count = len(doc_lengths)
+        # Un posting por (término, documento) con su frecuencia, agrupados por término
+        keys = np.asarray(term_ids, dtype=np.int64) * max(doc_count, 1) + np.asarray(doc_ids, dtype=np.int64)
+        unique_keys, tf = np.unique(keys, return_counts=True)
+        posting_terms = unique_keys // max(doc_count, 1)
+        postings_docs = (unique_keys % max(doc_count, 1)).astype(np.int32)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(terms)), out=term_offsets[1:])
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f".tmp-{os.getpid()}"
+        arrays = (
+            ('term_offsets.npy', term_offsets),
+            ('postings_docs.npy', postings_docs),
+            ('postings_tf.npy', np.minimum(tf, np.iinfo(np.uint16).max).astype(np.uint16)),
+            ('doc_lengths.npy', np.asarray(doc_lengths, dtype=np.int32))
+        )
+        for name, array in arrays:
+            tmp_path = self.index_dir / (name + suffix)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, self.index_dir / name)
+
+        manifest = {
+            'version': FORMAT_VERSION,
+            'created_at': datetime.now().isoformat(),
+            'doc_count': doc_count,
+            'postings': int(len(postings_docs)),
+            'k1': BM25_K1,
+            'b': BM25_B,
+            'source': source,
+            'terms': sorted(terms, key=terms.get)
+        }
+        tmp_path = self.index_dir / ("manifest.json" + suffix)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_dir / "manifest.json")
+        self._open()
+
+    def query_terms(self, query: str) -> List[int]:
+        """Ids de los términos de la query presentes en el índice (sin repetir)."""
+        return list(dict.fromkeys(
+            self.terms[token] for token in tokenize(query) if token in self.terms
+        ))
+
+    def scores(self, query: str, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score BM25 de cada documento para la query (0 si no comparte términos o no pasa la máscara)."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term_id in self.query_terms(query):
+            start, stop = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+            docs = self.postings_docs[start:stop]
+            tf = self.postings_tf[start:stop].astype(np.float32)
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._length_norm[docs])
+        if mask is not None:
+            scores[~mask] = 0
+        return scores
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k documentos por BM25.
+
+        Returns:
+            (scores, ids) ordenados de mayor a menor; sólo documentos con score > 0
+        """
+        scores = self.scores(query, mask)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return scores[order], order
+
+    def get_statistics(self) -> Dict:
+        return {
+            'documents': len(self),
+            'terms': len(self.terms),
+            'postings': int(len(self.postings_docs))
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 10, rrf_k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fusiona varios rankings (arrays de ids, mejor primero) con RRF:
+    score(d) = sum(1 / (rrf_k + rank)).
+
+    Returns:
+        (scores, ids) de los k mejores
+    """
+    rankings = [np.asarray(r, dtype=np.int64) for r in rankings if len(r)]
+    if not rankings:
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64)
+    ids = np.concatenate(rankings)
+    contributions = np.concatenate([1.0 / (rrf_k + np.arange(1, len(r) + 1)) for r in rankings])
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    top = np.argsort(-fused, kind='stable')[:k]
+    return fused[top], unique_ids[top]
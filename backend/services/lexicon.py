@@ -0,0 +1,163 @@
+"""
+Lexicon - Listas de palabras clave buscadas con un autómata Aho–Corasick
+Reemplaza los `for word in keywords: if word in content_lower` repartidos
+por el análisis: el texto se pliega una vez con el mismo `fold` del índice
+BM25 (services/lexical_index.py: minúsculas, sin acentos y con el mojibake de
+la exportación de Instagram reparado) y se recorre token por token, así que el
+costo es lineal en el largo del texto sin importar cuántos términos tenga el
+léxico.
+
+El autómata trabaja sobre tokens (palabras) y no sobre caracteres: sólo
+encuentra palabras o frases completas ('u' no aparece dentro de 'tu', 'amor'
+sí aparece en 'mi amor' pero no en 'amorcito'), y 'corazón', 'corazon' y
+'corazÃ³n' son el mismo término.
+"""
+
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from services.lexical_index import fold
+
+# Separador entre textos al buscar en muchos de una vez: queda como un token propio
+SEPARATOR = '\x1e'
+_SEPARATOR_TOKEN = SEPARATOR.encode('ascii')
+
+# Tokens = corridas de [a-z0-9] del texto plegado. Se cortan en bytes con
+# translate + split (varias veces más rápido que un regex); cualquier otro
+# carácter, incluidos los no ASCII, separa palabras
+_TOKEN_TABLE = bytes(
+    c if (ord('a') <= c <= ord('z') or ord('0') <= c <= ord('9') or c == _SEPARATOR_TOKEN[0]) else ord(' ')
+    for c in range(256)
+)
+
+# Apodos cariñosos (los comparten el análisis por chunks y process_messages.py)
+AFFECTION_TERMS = [
+    'amor', 'amorcito', 'mi amor', 'bb', 'bebe', 'nena', 'nene', 'cielo', 'vida', 'corazón',
+    'hermosa', 'hermoso', 'linda', 'lindo', 'preciosa', 'precioso', 'reina', 'rey',
+    'mi vida', 'mi cielo', 'mi todo', 'gordita', 'gordito', 'flaca', 'flaco', 'chiquita', 'chiquito'
+]
+
+
+def tokenize(text: str) -> List[bytes]:
+    """Palabras de `text` ya plegadas (en bytes ASCII)."""
+    return fold(text).encode('ascii', 'replace').translate(_TOKEN_TABLE).split()
+
+
+def tokenize_texts(texts: List[str]) -> List[bytes]:
+    """Tokens de varios textos unidos por SEPARATOR (la entrada de Lexicon.message_hits)."""
+    return tokenize(f" {SEPARATOR} ".join(texts))
+
+
+class Lexicon:
+    """
+    Autómata Aho–Corasick sobre tokens.
+
+    Args:
+        terms: Lista de términos (palabras o frases), o dict término -> etiqueta
+               para agrupar variantes bajo un mismo nombre. Los términos que
+               se pliegan igual ('bebé' y 'bebe') son uno solo.
+    """
+
+    def __init__(self, terms: Union[Iterable[str], Dict[str, str]]):
+        mapping = terms if isinstance(terms, dict) else {term: term for term in terms}
+
+        self.labels: List[str] = []
+        label_ids: Dict[str, int] = {}
+        self._goto: List[Dict[bytes, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Tuple[int, int], ...]] = [()]  # (etiqueta, largo en tokens)
+
+        for term, label in mapping.items():
+            tokens = tokenize(term)
+            if not tokens:
+                continue
+            if label not in label_ids:
+                label_ids[label] = len(self.labels)
+                self.labels.append(label)
+            state = 0
+            for token in tokens:
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = self._goto[state][token] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            if not self._out[state]:
+                self._out[state] = ((label_ids[label], len(tokens)),)
+
+        self._vocabulary = {token for transitions in self._goto for token in transitions}
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                # Los términos que terminan en el sufijo también terminan acá
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _scan(self, tokens: List[bytes], separators: bool = False) -> Iterator[Tuple[int, int, int, int]]:
+        """
+        (texto, índice del último token, etiqueta, largo en tokens) de cada
+        aparición; con `separators` cada SEPARATOR pasa al texto siguiente.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = self._vocabulary | {_SEPARATOR_TOKEN} if separators else self._vocabulary
+        state, previous, text_id = 0, -2, 0
+        # Sólo los tokens del léxico mueven el autómata: cualquier otro lo devuelve a la raíz
+        for i in [i for i, token in enumerate(tokens) if token in candidates]:
+            token = tokens[i]
+            if i != previous + 1:
+                state = 0
+            previous = i
+            if separators and token == _SEPARATOR_TOKEN:
+                text_id += 1
+                state = 0
+                continue
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for label_id, length in out[state]:
+                yield text_id, i, label_id, length
+
+    def find(self, text: str, longest: bool = False) -> List[str]:
+        """
+        Etiquetas de cada aparición en `text`, en orden. Con `longest` no se
+        cuentan los términos contenidos en otro más largo ('amor' dentro de
+        'mi amor').
+        """
+        matches = [(end - length + 1, end, label_id) for _, end, label_id, length in self._scan(tokenize(text))]
+        if longest and len(matches) > 1:
+            kept, covered_until = [], -1
+            for start, end, label_id in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+                if end > covered_until:
+                    kept.append((start, end, label_id))
+                    covered_until = end
+            matches = kept
+        return [self.labels[label_id] for _, _, label_id in matches]
+
+    def labels_in(self, text: str) -> List[str]:
+        """Etiquetas que aparecen al menos una vez en `text`, en el orden del léxico."""
+        found = {label_id for _, _, label_id, _ in self._scan(tokenize(text))}
+        return [self.labels[label_id] for label_id in sorted(found)]
+
+    def message_hits(self, texts: List[str], tokens: Optional[List[bytes]] = None) -> np.ndarray:
+        """
+        Matriz booleana (textos × etiquetas): qué etiquetas aparecen en cada
+        texto. Pliega y tokeniza todos los textos de una vez; con `tokens`
+        (de tokenize_texts) se reutiliza la tokenización entre léxicos.
+        """
+        hits = np.zeros((len(texts), len(self.labels)), dtype=bool)
+        if tokens is None:
+            tokens = tokenize_texts(texts)
+        matches = [(text_id, label_id) for text_id, _, label_id, _ in self._scan(tokens, separators=True)]
+        if matches:
+            text_ids, label_ids = zip(*matches)
+            hits[list(text_ids), list(label_ids)] = True
+        return hits
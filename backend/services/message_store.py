@@ -0,0 +1,279 @@
+"""
+Message Store - Almacenamiento columnar de los mensajes de Instagram
+Convierte los archivos message_*.json en arrays NumPy memory-mapped para que
+el backend y las herramientas de análisis no tengan que re-parsear el JSON.
+
+Formato en disco (directorio .message_store junto a los JSON):
+    manifest.json         versión, remitentes y firma de los archivos fuente
+    timestamps.npy        int64  - timestamp_ms de cada mensaje (orden ascendente)
+    sender_ids.npy        int16  - índice en manifest['senders']
+    content_offsets.npy   int64  - n + 1 offsets dentro de content.bin
+    content.bin           blob UTF-8 con el contenido concatenado
+"""
+
+import os
+import json
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Optional, Iterator
+
+STORE_DIRNAME = ".message_store"
+FORMAT_VERSION = 1
+
+_ARRAY_FILES = ("timestamps.npy", "sender_ids.npy", "content_offsets.npy")
+
+
+def _source_files(source_dir: Path) -> List[Path]:
+    return sorted(Path(source_dir).glob("message_*.json"))
+
+
+def source_signature(source_dir) -> List[Dict]:
+    """Firma barata (nombre, tamaño, mtime) de los archivos fuente."""
+    signature = []
+    for path in _source_files(source_dir):
+        stat = path.stat()
+        signature.append({
+            'name': path.name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        })
+    return signature
+
+
+class MessageStore:
+    """
+    Vista de solo lectura sobre un store columnar de mensajes.
+
+    Los arrays se abren con mmap_mode='r', así que abrir el store cuesta
+    milisegundos y la memoria se comparte entre procesos vía page cache.
+    El contenido sólo se decodifica cuando se pide un mensaje concreto.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+
+        with open(self.store_dir / "manifest.json", 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        if self.manifest.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Versión de message store no soportada: {self.manifest.get('version')}")
+
+        self.senders: List[str] = self.manifest['senders']
+        self.timestamps: np.ndarray = np.load(self.store_dir / "timestamps.npy", mmap_mode='r')
+        self.sender_ids: np.ndarray = np.load(self.store_dir / "sender_ids.npy", mmap_mode='r')
+        self.content_offsets: np.ndarray = np.load(self.store_dir / "content_offsets.npy", mmap_mode='r')
+
+        blob_path = self.store_dir / "content.bin"
+        if blob_path.stat().st_size > 0:
+            self.content_blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            # np.memmap no acepta archivos vacíos
+            self.content_blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return int(self.timestamps.shape[0])
+
+    @property
+    def sources(self) -> List[Dict]:
+        return self.manifest.get('sources', [])
+
+    def is_current(self, source_dir) -> bool:
+        """True si el store corresponde a los archivos JSON actuales."""
+        return self.sources == source_signature(source_dir)
+
+    def sender_name(self, index: int) -> str:
+        return self.senders[int(self.sender_ids[index])]
+
+    def sender_id(self, sender_name: str) -> int:
+        """Id numérico de un remitente, o -1 si no aparece en el store."""
+        try:
+            return self.senders.index(sender_name)
+        except ValueError:
+            return -1
+
+    def content(self, index: int) -> str:
+        start = int(self.content_offsets[index])
+        end = int(self.content_offsets[index + 1])
+        if start == end:
+            return ''
+        return self.content_blob[start:end].tobytes().decode('utf-8')
+
+    def content_lengths(self) -> np.ndarray:
+        """Longitud en bytes UTF-8 del contenido de cada mensaje."""
+        return np.diff(self.content_offsets)
+
+    def contents(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """Decodifica el contenido de un rango contiguo de mensajes de una vez."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return []
+        offsets = self.content_offsets[start:stop + 1] - self.content_offsets[start]
+        raw = self.content_blob[int(self.content_offsets[start]):int(self.content_offsets[stop])].tobytes()
+        return [
+            raw[int(offsets[i]):int(offsets[i + 1])].decode('utf-8')
+            for i in range(stop - start)
+        ]
+
+    def message(self, index: int) -> Dict:
+        """Reconstruye un mensaje en el formato de la exportación de Instagram."""
+        msg = {
+            'sender_name': self.sender_name(index),
+            'timestamp_ms': int(self.timestamps[index])
+        }
+        content = self.content(index)
+        if content:
+            msg['content'] = content
+        return msg
+
+    def to_messages(self, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+        """
+        Devuelve un rango de mensajes como lista de dicts.
+        Sólo para código que todavía necesita el formato original; el resto
+        debería trabajar directamente sobre los arrays.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        timestamps = self.timestamps[start:stop].tolist()
+        sender_ids = self.sender_ids[start:stop].tolist()
+        messages = []
+        for ts, sid, content in zip(timestamps, sender_ids, self.contents(start, stop)):
+            msg = {'sender_name': self.senders[sid], 'timestamp_ms': ts}
+            if content:
+                msg['content'] = content
+            messages.append(msg)
+        return messages
+
+    def iter_messages(self, batch_size: int = 5000) -> Iterator[Dict]:
+        for start in range(0, len(self), batch_size):
+            yield from self.to_messages(start, start + batch_size)
+
+    @classmethod
+    def build(cls, source_dir, store_dir=None) -> 'MessageStore':
+        """Parsea los message_*.json una única vez y escribe el store columnar."""
+        source_dir = Path(source_dir)
+        store_dir = Path(store_dir) if store_dir else source_dir / STORE_DIRNAME
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+        signature = source_signature(source_dir)
+        print(f"🏗️ Construyendo message store desde {source_dir} ({len(signature)} archivos)...")
+
+        senders: List[str] = []
+        sender_index: Dict[str, int] = {}
+        timestamps: List[int] = []
+        sender_ids: List[int] = []
+        encoded: List[bytes] = []
+
+        for msg_file in _source_files(source_dir):
+            with open(msg_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for msg in data.get('messages', []):
+                sender = msg.get('sender_name', 'Unknown')
+                sid = sender_index.get(sender)
+                if sid is None:
+                    sid = sender_index[sender] = len(senders)
+                    senders.append(sender)
+                timestamps.append(int(msg.get('timestamp_ms', 0)))
+                sender_ids.append(sid)
+                encoded.append((msg.get('content') or '').encode('utf-8'))
+
+        # Orden cronológico ascendente (estable para timestamps repetidos)
+        ts_array = np.asarray(timestamps, dtype=np.int64)
+        order = np.argsort(ts_array, kind='stable')
+        ts_array = ts_array[order]
+        sid_array = np.asarray(sender_ids, dtype=np.int16)[order]
+        encoded = [encoded[i] for i in order.tolist()]
+
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        write_columns(store_dir, ts_array, sid_array, offsets, b''.join(encoded), senders, signature)
+
+        print(f"✅ Message store listo: {len(ts_array):,} mensajes, {int(offsets[-1]) / 1024 / 1024:.1f}MB de contenido")
+        return cls(store_dir)
+
+
+def write_columns(
+    store_dir,
+    timestamps: np.ndarray,
+    sender_ids: np.ndarray,
+    content_offsets: np.ndarray,
+    content: bytes,
+    senders: List[str],
+    sources: Optional[List[Dict]] = None
+):
+    """
+    Escribe un store columnar ya armado.
+
+    Cada archivo se escribe a un temporal y se renombra; el manifest va al
+    final para que un lector nunca vea un store a medio escribir.
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    suffix = f".tmp-{os.getpid()}"
+    arrays = (
+        np.asarray(timestamps, dtype=np.int64),
+        np.asarray(sender_ids, dtype=np.int16),
+        np.asarray(content_offsets, dtype=np.int64)
+    )
+    for name, array in zip(_ARRAY_FILES, arrays):
+        tmp_path = store_dir / (name + suffix)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, store_dir / name)
+
+    tmp_path = store_dir / ("content.bin" + suffix)
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, store_dir / "content.bin")
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'count': int(len(arrays[0])),
+        'senders': list(senders),
+        'sources': sources or []
+    }
+    tmp_path = store_dir / ("manifest.json" + suffix)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, store_dir / "manifest.json")
+
+
+def open_message_store(source_dir, store_dir=None, rebuild: bool = False) -> Optional[MessageStore]:
+    """
+    Abre el store columnar de una carpeta de conversación, construyéndolo si
+    no existe o si los message_*.json cambiaron desde la última vez.
+
+    Returns:
+        MessageStore o None si la carpeta no tiene archivos message_*.json
+    """
+    source_dir = Path(source_dir)
+    store_dir = Path(store_dir) if store_dir else source_dir / STORE_DIRNAME
+
+    if not _source_files(source_dir):
+        if (store_dir / "manifest.json").exists():
+            # Sin JSON fuente (p.ej. despliegue sólo con el store): usarlo tal cual
+            return MessageStore(store_dir)
+        return None
+
+    if not rebuild and (store_dir / "manifest.json").exists():
+        try:
+            store = MessageStore(store_dir)
+            if store.is_current(source_dir):
+                return store
+            print("📊 Message store desactualizado, reconstruyendo...")
+        except Exception as e:
+            print(f"⚠️ Error abriendo message store: {e}. Reconstruyendo...")
+
+    return MessageStore.build(source_dir, store_dir)
+
+
+if __name__ == "__main__":
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else "karemramos_1184297046409691"
+    store = open_message_store(target, rebuild='--rebuild' in sys.argv)
+    if store is None:
+        print(f"❌ No se encontraron archivos message_*.json en {target}")
+    else:
+        print(f"📦 {len(store):,} mensajes de {len(store.senders)} remitentes en {store.store_dir}")
@@ -8,9 +8,10 @@ import json
 from typing import Dict, List, Optional
 from datetime import datetime
 from openai import OpenAI
-from pathlib import Path
 import time
 
+from services.message_store import open_message_store
+
 
 class OpenAIMessageAnalyzer:
     """Analizador que usa OpenAI para procesar mensajes y generar preguntas."""
@@ -38,18 +39,9 @@ class OpenAIMessageAnalyzer:
         """Carga todos los mensajes de la conversación."""
         print("\n📂 Cargando mensajes...")
         
-        path = Path(conversation_path)
-        all_messages = []
-        
-        for msg_file in sorted(path.glob("message_*.json")):
-            print(f"   Leyendo {msg_file.name}...")
-            with open(msg_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                messages = data.get('messages', [])
-                all_messages.extend(messages)
-        
-        # Ordenar por timestamp
-        all_messages.sort(key=lambda x: x.get('timestamp_ms', 0))
+        # Store columnar memory-mapped, ya ordenado por timestamp
+        store = open_message_store(conversation_path)
+        all_messages = store.to_messages() if store else []
         
         print(f"✅ Total: {len(all_messages):,} mensajes cargados\n")
         return all_messages
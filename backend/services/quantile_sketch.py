@@ -0,0 +1,161 @@
+"""
+Quantile Sketch - Cuantiles en streaming con memoria acotada (DDSketch)
+Resume una distribución de valores no negativos (tiempos de respuesta) sin
+guardar los valores: cada valor cae en un bin logarítmico
+ceil(log_gamma(x)), con gamma = (1 + α) / (1 - α), así que cualquier
+cuantil sale con error relativo ≤ α. Dos sketches con la misma precisión se
+combinan sumando bins, sin importar en qué orden, chunk o proceso se
+armaron.
+
+La cantidad de bins está acotada por el rango de los valores (con α = 1% y
+valores entre un milisegundo y un día son menos de mil) y además por
+`max_bins`: si se supera, los bins más bajos se colapsan en uno, perdiendo
+precisión sólo en la cola inferior.
+"""
+
+import math
+import numpy as np
+from typing import Dict, Iterable, Optional, Sequence
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class DDSketch:
+    """
+    Sketch de cuantiles con error relativo acotado.
+
+    Args:
+        relative_accuracy: Error relativo máximo de los cuantiles (α)
+        max_bins: Bins como máximo; al pasarse se colapsan los más bajos
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy debe estar entre 0 y 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key(self, value: float) -> int:
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, key: int) -> float:
+        # Punto del bin con el mismo error relativo hacia ambos bordes
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float):
+        if value < 0:
+            raise ValueError(f"DDSketch sólo acepta valores no negativos: {value}")
+        if value == 0:
+            self.zero_count += 1
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + 1
+        self._track(1, float(value), float(value), float(value))
+        self._collapse()
+
+    def add_many(self, values: Iterable[float]):
+        """Agrega muchos valores de una vez (los bins se calculan con NumPy)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        if values.min() < 0:
+            raise ValueError("DDSketch sólo acepta valores no negativos")
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.bins[key] = self.bins.get(key, 0) + count
+        self._track(len(values), float(values.sum()), float(values.min()), float(values.max()))
+        self._collapse()
+
+    def _track(self, count: int, total: float, low: float, high: float):
+        self.count += count
+        self.sum += total
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def _collapse(self):
+        if len(self.bins) <= self.max_bins:
+            return
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        self.bins[excess[-1]] = sum(self.bins.pop(key) for key in excess[:-1]) + self.bins[excess[-1]]
+
+    def merge(self, other: 'DDSketch') -> 'DDSketch':
+        """Suma `other` a este sketch (en el lugar) y lo devuelve."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sólo se pueden combinar sketches con la misma precisión")
+        if not other.count:
+            return self
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self._track(other.count, other.sum, other.min, other.max)
+        self._collapse()
+        return self
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Valor del cuantil `q` (entre 0 y 1), o None si el sketch está vacío."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def summary(self, quantiles: Sequence[float] = SUMMARY_QUANTILES, digits: int = 1) -> Dict:
+        """count, media, cuantiles ('p50', 'p90', ...) y máximo, redondeados a `digits`."""
+        if not self.count:
+            return {'count': 0}
+        result = {'count': self.count, 'mean': round(self.mean, digits)}
+        for q in quantiles:
+            result[f"p{q * 100:g}"] = round(self.quantile(q), digits)
+        result['max'] = round(self.max, digits)
+        return result
+
+    def to_dict(self) -> Dict:
+        keys = sorted(self.bins)
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'keys': keys,
+            'counts': [self.bins[key] for key in keys],
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, max_bins: int = DEFAULT_MAX_BINS) -> 'DDSketch':
+        sketch = cls(data['relative_accuracy'], max_bins)
+        sketch.bins = dict(zip(data['keys'], data['counts']))
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
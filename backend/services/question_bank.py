@@ -0,0 +1,370 @@
+"""
+Question Bank - Banco de preguntas pre-generadas por tema
+Por cada índice de tema (ver QUESTION_TOPICS) se guardan varias variantes
+ya generadas y validadas. start_quiz y answer_question sacan una en O(1);
+un worker en background repone las consumidas. Si el banco de un tema está
+vacío se genera en vivo como siempre.
+
+El banco vive en SQLite (cache/question_bank/bank.db): sobrevive a los
+reinicios y lo comparten los workers de un despliegue multi-proceso. Cada
+variante se entrega una sola vez (se borra al sacarla) y un solo proceso
+(el que toma el lock de reposición) la repone.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos (un solo proceso repone)
+    fcntl = None
+
+from services.question_context import QUESTION_TOPICS
+
+MIN_OPTIONS = 2
+REQUIRED_TEXT_FIELDS = ('question',)
+REQUIRED_LIST_FIELDS = ('options', 'correct_answers')
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+def options_overlap(options: List[str], other_options: List[str]) -> List[str]:
+    """Opciones de `options` que también están en `other_options` (sin distinguir mayúsculas)."""
+    others = {_normalize(option) for option in other_options if isinstance(option, str)}
+    return [option for option in options if _normalize(option) in others]
+
+
+def validate_question(question: Dict, previous_questions: Optional[List[Dict]] = None) -> Optional[str]:
+    """
+    Valida una pregunta generada.
+
+    - Forma del JSON: "question" texto no vacío; "options" y "correct_answers"
+      listas de textos; "hints" (si viene) lista de textos
+    - Opciones que no se solapan: ninguna repetida ni contenida en otra (las
+      respuestas se comparan por substring, así que "París" y "París, Francia"
+      serían ambiguas)
+    - correct_answers contenidas en options
+    - Sin opciones repetidas respecto a `previous_questions`
+
+    Returns:
+        None si es válida, o el motivo del rechazo
+    """
+    if not isinstance(question, dict):
+        return "no es un objeto JSON"
+    for field in REQUIRED_TEXT_FIELDS:
+        value = question.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return f"'{field}' vacío o ausente"
+    for field in REQUIRED_LIST_FIELDS:
+        value = question.get(field)
+        if not isinstance(value, list) or not value:
+            return f"'{field}' debe ser una lista no vacía"
+        if not all(isinstance(item, str) and item.strip() for item in value):
+            return f"'{field}' debe contener sólo textos no vacíos"
+    hints = question.get('hints', [])
+    if not isinstance(hints, list) or not all(isinstance(hint, str) for hint in hints):
+        return "'hints' debe ser una lista de textos"
+
+    options = [_normalize(option) for option in question['options']]
+    if len(options) < MIN_OPTIONS:
+        return f"se necesitan al menos {MIN_OPTIONS} opciones"
+    for i, option in enumerate(options):
+        for other in options[i + 1:]:
+            if option == other:
+                return f"opción repetida: '{option}'"
+            if option in other or other in option:
+                return f"opciones solapadas: '{option}' / '{other}'"
+
+    missing = [answer for answer in question['correct_answers'] if _normalize(answer) not in options]
+    if missing:
+        return f"respuestas correctas fuera de las opciones: {missing}"
+
+    for previous in previous_questions or []:
+        repeated = options_overlap(question['options'], previous.get('options', []))
+        if repeated:
+            return f"opciones repetidas con preguntas anteriores: {repeated}"
+    return None
+
+
+class QuestionBank:
+    """
+    Variantes pre-generadas por índice de tema, con reposición en background.
+
+    Args:
+        cache_dir: Directorio del banco en disco
+        variants_per_topic: Variantes objetivo por tema (env QUESTION_BANK_VARIANTS, 0 = desactivado)
+        topics: Un tema por número de pregunta (el último se repite)
+        retry_seconds: Espera máxima tras generaciones fallidas (env QUESTION_BANK_RETRY_SECONDS)
+        poll_seconds: Cada cuánto revisa el worker lo consumido por otros procesos
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "cache/question_bank",
+        variants_per_topic: Optional[int] = None,
+        topics: Optional[List[str]] = None,
+        retry_seconds: Optional[float] = None,
+        poll_seconds: float = 30
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / "bank.db"
+        self.variants_per_topic = (
+            variants_per_topic if variants_per_topic is not None
+            else int(os.getenv('QUESTION_BANK_VARIANTS', 3))
+        )
+        self.topics = list(topics or QUESTION_TOPICS)
+        self.retry_seconds = (
+            retry_seconds if retry_seconds is not None
+            else float(os.getenv('QUESTION_BANK_RETRY_SECONDS', 60))
+        )
+        self.poll_seconds = poll_seconds
+        self._local = threading.local()
+        self._generate: Optional[Callable[[int, List[Dict]], Optional[Dict]]] = None
+        self._worker: Optional[threading.Thread] = None
+        self._refill_lock_file = None
+        self._next_leader_attempt = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.stats = {'hits': 0, 'misses': 0, 'skipped': 0, 'returned': 0, 'generated': 0, 'rejected': 0, 'failed': 0}
+
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS variants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_variants_topic ON variants (topic, id)")
+        self._migrate_json(self.cache_dir / "bank.json")
+
+    @property
+    def enabled(self) -> bool:
+        return self.variants_per_topic > 0
+
+    def topic_index(self, question_number: int) -> int:
+        """Mismo criterio que QuestionContextCache: las preguntas extra usan el último tema."""
+        return max(0, min(question_number - 1, len(self.topics) - 1))
+
+    def _conn(self) -> sqlite3.Connection:
+        """Una conexión por thread (sqlite3 no comparte conexiones entre threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def _migrate_json(self, json_path: Path):
+        """Importa una vez el banco en JSON de versiones anteriores (luego se renombra a .migrated)."""
+        if not json_path.exists():
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            rows = [
+                (int(key), json.dumps(variant['question'], ensure_ascii=False), variant.get('created_at', time.time()))
+                for key, variants in data.get('variants', {}).items()
+                if data.get('topics_count') == len(self.topics)
+                for variant in variants
+                if validate_question(variant.get('question')) is None
+            ]
+            self._conn().executemany("INSERT INTO variants (topic, question, created_at) VALUES (?, ?, ?)", rows)
+            json_path.rename(json_path.with_suffix('.json.migrated'))
+            print(f"📦 {len(rows)} variantes migradas desde {json_path.name}")
+        except Exception as e:
+            print(f"⚠️ Error migrando banco de preguntas desde {json_path}: {e}")
+
+    def _counts(self) -> Dict[int, int]:
+        counts = {index: 0 for index in range(len(self.topics))}
+        for topic, count in self._conn().execute("SELECT topic, COUNT(*) FROM variants GROUP BY topic"):
+            if topic in counts:
+                counts[topic] = count
+        return counts
+
+    def draw(self, question_number: int, previous_questions: Optional[List[Dict]] = None) -> Optional[Dict]:
+        """
+        Saca (y borra) la variante más antigua del tema de `question_number`
+        que no repita opciones de `previous_questions`. Las que chocan quedan
+        en el banco para otras sesiones.
+
+        Returns:
+            La pregunta (formato de sesión) o None si no hay ninguna utilizable
+        """
+        if not self.enabled:
+            return None
+        index = self.topic_index(question_number)
+        conn = self._conn()
+        question = None
+        candidates = conn.execute(
+            "SELECT id, question FROM variants WHERE topic = ? ORDER BY id LIMIT ?",
+            (index, max(self.variants_per_topic, 1) * 4)
+        ).fetchall()
+        for variant_id, data in candidates:
+            candidate = json.loads(data)
+            if previous_questions and validate_question(candidate, previous_questions) is not None:
+                self.stats['skipped'] += 1
+                continue
+            # Otro thread/proceso pudo sacarla primero: sólo vale si el DELETE la borró
+            if conn.execute("DELETE FROM variants WHERE id = ?", (variant_id,)).rowcount == 1:
+                question = candidate
+                break
+
+        self.stats['misses' if question is None else 'hits'] += 1
+        self._wake.set()  # Reponer en background
+        if self._worker is None and self._generate is not None and time.time() >= self._next_leader_attempt:
+            self.start(self._generate)  # El proceso que reponía pudo haber terminado
+        if question is not None:
+            print(f"🏦 Pregunta #{question_number} servida desde el banco")
+        return question
+
+    def put_back(self, question_number: int, question: Dict) -> bool:
+        """
+        Devuelve al banco una pregunta que nunca llegó a mostrarse (un prefetch
+        descartado), sea una variante sacada con draw() o una generada en vivo.
+
+        Returns:
+            True si quedó en el banco
+        """
+        if not self.enabled or validate_question(question) is not None:
+            return False
+        self._conn().execute(
+            "INSERT INTO variants (topic, question, created_at) VALUES (?, ?, ?)",
+            (self.topic_index(question_number), json.dumps(question, ensure_ascii=False), time.time())
+        )
+        self.stats['returned'] += 1
+        return True
+
+    def _next_deficit(self) -> Optional[int]:
+        for index, count in self._counts().items():
+            if count < self.variants_per_topic:
+                return index
+        return None
+
+    def _fill_one(self, index: int) -> bool:
+        existing = [
+            json.loads(data) for (data,) in
+            self._conn().execute("SELECT question FROM variants WHERE topic = ? ORDER BY id", (index,))
+        ]
+        # Las variantes existentes se pasan como "preguntas previas" para que no se repitan
+        question = self._generate(index + 1, existing)
+        if question is None:
+            self.stats['failed'] += 1
+            return False
+        reason = validate_question(question, existing)
+        if reason is not None:
+            self.stats['rejected'] += 1
+            print(f"⚠️ Banco: variante del tema {index + 1} rechazada ({reason})")
+            return False
+
+        self._conn().execute(
+            "INSERT INTO variants (topic, question, created_at) VALUES (?, ?, ?)",
+            (index, json.dumps(question, ensure_ascii=False), time.time())
+        )
+        self.stats['generated'] += 1
+        return True
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            index = self._next_deficit()
+            if index is None:
+                # Las variantes que consumen otros procesos se ven al despertar por timeout
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            try:
+                filled = self._fill_one(index)
+            except Exception as e:
+                print(f"⚠️ Banco: error generando variante del tema {index + 1}: {e}")
+                self.stats['failed'] += 1
+                filled = False
+            if filled:
+                failures = 0
+                continue
+            # Backoff exponencial acotado (RAG no listo, OpenAI caído, respuestas inválidas)
+            failures += 1
+            self._wake.clear()
+            self._stop.wait(min(self.retry_seconds, 2 ** failures))
+
+    def _acquire_refill_lock(self) -> bool:
+        """Sólo un proceso repone el banco (lock no bloqueante sobre refill.lock)."""
+        if fcntl is None:
+            return True
+        lock_file = open(self.cache_dir / "refill.lock", 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._refill_lock_file = lock_file
+        return True
+
+    def start(self, generate: Callable[[int, List[Dict]], Optional[Dict]]) -> bool:
+        """
+        Arranca el worker de reposición (idempotente). Si otro proceso ya
+        repone el banco no arranca nada: se reintenta más tarde desde draw().
+
+        Args:
+            generate: fn(question_number, previous_questions) -> dict o None
+        """
+        if not self.enabled:
+            return False
+        self._generate = generate
+        if self._worker is not None and self._worker.is_alive():
+            self._wake.set()
+            return True
+        if not self._acquire_refill_lock():
+            self._next_leader_attempt = time.time() + self.poll_seconds
+            return False
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name="question-bank-refill", daemon=True)
+        self._worker.start()
+        print(f"🏦 Reponiendo banco de preguntas en background ({self.variants_per_topic} variantes por tema)")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def clear(self, question_number: Optional[int] = None):
+        """Descarta las variantes de un tema (o de todos) y las vuelve a generar."""
+        if question_number:
+            self._conn().execute("DELETE FROM variants WHERE topic = ?", (self.topic_index(question_number),))
+        else:
+            self._conn().execute("DELETE FROM variants")
+        self._wake.set()
+
+    def info(self) -> Dict:
+        available = {index + 1: count for index, count in self._counts().items()}
+        return {
+            'enabled': self.enabled,
+            'variants_per_topic': self.variants_per_topic,
+            'refilling': self._worker is not None and self._worker.is_alive(),
+            'available': sum(available.values()),
+            'capacity': self.variants_per_topic * len(self.topics),
+            'by_topic': available,
+            'db_path': str(self.db_path),
+            **self.stats
+        }
+
+
+# Instancia global
+_question_bank: Optional[QuestionBank] = None
+
+
+def get_question_bank() -> QuestionBank:
+    """Obtiene la instancia singleton del banco de preguntas."""
+    global _question_bank
+    if _question_bank is None:
+        _question_bank = QuestionBank()
+    return _question_bank
@@ -0,0 +1,426 @@
+"""
+Question Context - Cache del contexto para generar preguntas
+La transcripción completa y el contexto de cada tema (chunks del RAG y
+estadísticas de palabras/frases) son iguales para todas las sesiones, así
+que se calculan una vez y se reutilizan. Con esto la latencia de generar una
+pregunta queda dominada por la llamada al LLM.
+
+- TranscriptionCache: copia en memoria y en data_cache, revalidada contra
+  Spaces con ETag / If-Modified-Since (stale-while-revalidate).
+- QuestionContextCache: contexto por tema, invalidado por TTL, cuando cambia
+  el chunk store del RAG o de forma explícita.
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Optional
+
+TRANSCRIPTION_FILE = 'historia_completa_transcripcion.txt'
+
+# CADA TEMA se enfoca en HITOS REALES de su historia juntos (uno por número de pregunta)
+QUESTION_TOPICS = [
+    "primer beso viernes reunión amigos trabajo besábamos fiestas",  # Primer beso
+    "flores tulipanes amarillos julio Rosatel Cusco entrega confundieron",  # Primer regalo de flores
+    "anticuchos lomo agosto 23 conversando vida bonito propuesta",  # Primer encuentro romántico
+    "página web flores especial enamorada innovar única manera",  # La propuesta especial
+    "Chimbote viaje planeado almorzar casa trabajo lindo pasaron",  # Viaje a Chimbote
+    "playa primer beso romántico viernes tarde abrazados besaron",  # Primer beso en la playa
+    "cine Lima septiembre primera vez juntos películas abrazados japonesa",  # Primera cita en Lima
+    "Trujillo hotel playa mar hermano conoció copas comer besaron",  # Segundo viaje
+    "papás familia septiembre acercó compartió familias conocer",  # Acercamiento familias
+    "Lima octubre trabajo mudó primeros días conseguir empleo",  # Karem se muda a Lima
+    "te amo domingo 5 octubre madrugada hablaron día siguiente",  # Declaración de amor
+    "restaurante especial primer invitó importante momento relación",  # Restaurante especial
+    "marzo 2025 empezamos amigos juntábamos amiga físicamente atraído",  # Inicio de la relación
+    "química conexión especial miércoles conocimos reuniones fiestas",  # Conexión inicial
+    "cocinar Chimbote primera vez preparó rico encantó comida"  # Primera vez cocinando
+]
+
+IGNORED_WORDS = {
+    'que', 'para', 'con', 'por', 'una', 'del', 'las', 'los', 'pero', 'como',
+    'más', 'ser', 'hay', 'muy', 'fue', 'sus', 'son', 'ese', 'esa'
+}
+LOCATION_HINTS = ['casa', 'parque', 'cine', 'restaurante', 'lugar', 'café', 'playa']
+
+
+class TranscriptionCache:
+    """
+    Transcripción completa de la historia con revalidación condicional.
+
+    Args:
+        spaces_loader: SpacesDataLoader para los GET condicionales
+        cache_dir: Dónde se guarda la copia local y su ETag / Last-Modified
+        fallback_path: Archivo del repo si Spaces nunca respondió
+        revalidate_seconds: Antigüedad tras la que se revalida en background
+            (env TRANSCRIPTION_REVALIDATE_SECONDS)
+    """
+
+    def __init__(
+        self,
+        spaces_loader=None,
+        cache_dir: str = 'data_cache',
+        fallback_path: Optional[Path] = None,
+        revalidate_seconds: Optional[float] = None
+    ):
+        self.spaces_loader = spaces_loader
+        self.cache_dir = Path(cache_dir)
+        self.content_path = self.cache_dir / TRANSCRIPTION_FILE
+        self.meta_path = self.cache_dir / (TRANSCRIPTION_FILE + '.meta.json')
+        self.fallback_path = fallback_path or Path(__file__).parent.parent / 'data' / TRANSCRIPTION_FILE
+        self.revalidate_seconds = (
+            revalidate_seconds if revalidate_seconds is not None
+            else float(os.getenv('TRANSCRIPTION_REVALIDATE_SECONDS', 300))
+        )
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._content: Optional[str] = None
+        self._meta: Dict = {}
+        self._validated_at: Optional[float] = None
+        self._source: Optional[str] = None
+        self._load_local()
+
+    def _load_local(self):
+        """Copia de data_cache de un arranque anterior (se revalida antes de confiar en ella)."""
+        try:
+            if self.content_path.exists():
+                self._content = self.content_path.read_text(encoding='utf-8')
+                self._source = 'disk'
+                if self.meta_path.exists():
+                    with open(self.meta_path, 'r', encoding='utf-8') as f:
+                        self._meta = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Error leyendo transcripción cacheada: {e}")
+            self._content, self._meta = None, {}
+
+    def _loader(self):
+        if self.spaces_loader is None:
+            from services.spaces_loader import SpacesDataLoader
+            self.spaces_loader = SpacesDataLoader()
+        return self.spaces_loader
+
+    def _write_local(self, content: str, meta: Dict):
+        self.cache_dir.mkdir(exist_ok=True)
+        suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        for path, data in ((self.content_path, content), (self.meta_path, json.dumps(meta))):
+            tmp_path = path.with_name(path.name + suffix)
+            tmp_path.write_text(data, encoding='utf-8')
+            os.replace(tmp_path, path)
+
+    def refresh(self, blocking: bool = True) -> bool:
+        """
+        GET condicional contra Spaces. Single-flight: si ya hay una
+        revalidación en curso, con blocking=False se retorna sin esperar.
+
+        Returns:
+            True si el contenido cambió
+        """
+        if not self._refresh_lock.acquire(blocking=blocking):
+            return False
+        return self._refresh_held()
+
+    def _refresh_held(self) -> bool:
+        """Cuerpo de refresh() con _refresh_lock ya tomado (lo libera al terminar)."""
+        try:
+            with self._lock:
+                have_content = self._content is not None
+                etag = self._meta.get('etag') if have_content else None
+                last_modified = self._meta.get('last_modified') if have_content else None
+
+            try:
+                status, body, headers = self._loader().fetch_if_modified(
+                    TRANSCRIPTION_FILE, etag=etag, last_modified=last_modified
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudo revalidar la transcripción ({e}), usando copia local")
+                with self._lock:
+                    # Se reintenta en el próximo intervalo en vez de en cada request
+                    self._validated_at = time.time()
+                return False
+
+            with self._lock:
+                self._validated_at = time.time()
+                if status == 304:
+                    self._source = 'spaces'
+                    return False
+
+                content = body.decode('utf-8', errors='replace')
+                meta = {
+                    'etag': headers.get('ETag'),
+                    'last_modified': headers.get('Last-Modified'),
+                    'downloaded_at': datetime.now().isoformat()
+                }
+                changed = content != self._content
+                self._content, self._meta, self._source = content, meta, 'spaces'
+
+            try:
+                self._write_local(content, meta)
+            except Exception as e:
+                print(f"⚠️ Error guardando transcripción en cache: {e}")
+            print(f"✅ Transcripción {'actualizada' if changed else 'revalidada'} desde Spaces: {len(content)} caracteres")
+            return changed
+        finally:
+            self._refresh_lock.release()
+
+    def get(self) -> str:
+        """
+        Transcripción completa. Sólo bloquea la primera vez sin copia
+        validada; después, si está vieja, revalida en background y devuelve
+        la copia actual.
+        """
+        if self._validated_at is None and self._content is None:
+            self.refresh(blocking=True)
+        elif (
+            (self._validated_at is None or time.time() - self._validated_at >= self.revalidate_seconds)
+            and self._refresh_lock.acquire(blocking=False)
+        ):
+            # El lock se toma aquí y lo libera el thread: una ráfaga de requests lanza una sola revalidación
+            try:
+                threading.Thread(
+                    target=self._refresh_held,
+                    name="transcription-revalidate", daemon=True
+                ).start()
+            except Exception:
+                self._refresh_lock.release()
+                raise
+
+        if self._content is not None:
+            return self._content
+
+        # Spaces nunca respondió: archivo del repo
+        if self.fallback_path.exists():
+            with self._lock:
+                if self._content is None:
+                    self._content = self.fallback_path.read_text(encoding='utf-8')
+                    self._source = 'local_file'
+                    print(f"✅ TRANSCRIPCIÓN desde archivo local: {len(self._content)} caracteres")
+            return self._content
+        return ""
+
+    def invalidate(self):
+        """Olvida la copia en memoria y su ETag: el próximo get() hace un GET completo."""
+        with self._lock:
+            self._content, self._meta, self._validated_at, self._source = None, {}, None, None
+        if self.meta_path.exists():
+            self.meta_path.unlink()
+
+    def info(self) -> Dict:
+        return {
+            'loaded': self._content is not None,
+            'characters': len(self._content) if self._content is not None else 0,
+            'source': self._source,
+            'etag': self._meta.get('etag'),
+            'last_modified': self._meta.get('last_modified'),
+            'validated_seconds_ago': round(time.time() - self._validated_at, 1) if self._validated_at else None,
+            'revalidate_seconds': self.revalidate_seconds
+        }
+
+
+def build_topic_context(rag, search_query: str, k: int = 8) -> Dict:
+    """
+    Contexto de un tema: mensajes de los chunks recuperados y estadísticas
+    dinámicas (palabras y frases frecuentes, lugares) para el prompt.
+    """
+    # Los temas son bolsas de palabras clave: BM25 local + RRF, sin llamada de embeddings
+    relevant_chunks = rag.hybrid_search(search_query, k=k)
+
+    relevant_messages = []
+    for chunk in relevant_chunks:
+        relevant_messages.extend(chunk['messages_in_chunk'])
+
+    # Filtrar mensajes por calidad, relevancia Y fecha (solo 2025)
+    high_quality_count = 0
+    for msg in relevant_messages:
+        content = msg.get('content', '').strip()
+        timestamp = msg.get('timestamp', 0)
+        if timestamp > 0 and datetime.fromtimestamp(timestamp).year != 2025:
+            continue
+        if 10 < len(content) < 300:
+            high_quality_count += 1
+
+    detailed_messages = []
+    word_frequency: Dict[str, int] = {}
+    phrase_patterns: Dict[str, int] = {}
+
+    for msg in relevant_messages:
+        content = msg.get('content', '')
+        timestamp = msg.get('timestamp_ms', 0)
+        if not content.strip():
+            continue
+
+        date_str = datetime.fromtimestamp(timestamp / 1000).strftime('%d/%m/%Y %H:%M') if timestamp else 'fecha desconocida'
+        detailed_messages.append({
+            'sender': msg.get('sender_name', 'Unknown'),
+            'content': content,
+            'date': date_str,
+            'timestamp': timestamp,
+            'length': len(content)
+        })
+
+        # Frecuencia de palabras y de bigramas/trigramas
+        words = content.lower().split()
+        for word in words:
+            if len(word) > 2:
+                word_frequency[word] = word_frequency.get(word, 0) + 1
+        for size in (2, 3):
+            for i in range(len(words) - size + 1):
+                phrase = ' '.join(words[i:i + size])
+                phrase_patterns[phrase] = phrase_patterns.get(phrase, 0) + 1
+
+    significant_words = {
+        word: count for word, count in word_frequency.items()
+        if count >= 2 and word not in IGNORED_WORDS
+    }
+    significant_phrases = {phrase: count for phrase, count in phrase_patterns.items() if count >= 2}
+
+    top_words = sorted(significant_words.items(), key=lambda x: x[1], reverse=True)[:10]
+    top_phrases = sorted(significant_phrases.items(), key=lambda x: x[1], reverse=True)[:10]
+    top_locations = [(word, count) for word, count in top_words if any(loc in word for loc in LOCATION_HINTS)]
+
+    # Fechas extremas de los mensajes recuperados
+    timestamps = sorted(detailed_messages, key=lambda x: x.get('timestamp', 0), reverse=True)
+    first_date = timestamps[-1]['date'] if timestamps else "fecha no disponible"
+    last_date = timestamps[0]['date'] if timestamps else "fecha no disponible"
+
+    return {
+        'search_query': search_query,
+        'relevant_message_count': len(relevant_messages),
+        'high_quality_count': high_quality_count,
+        'example_messages': detailed_messages[:8],
+        'top_words': top_words,
+        'top_phrases': top_phrases,
+        'top_locations': top_locations,
+        'first_date': first_date,
+        'last_date': last_date
+    }
+
+
+class QuestionContextCache:
+    """
+    Contexto por tema de pregunta, compartido entre sesiones.
+
+    Una entrada vale mientras no supere el TTL y el chunk store del RAG no
+    haya cambiado (rebuild o ingest). El cálculo es single-flight por tema.
+
+    Args:
+        topics: Un tema por número de pregunta (el último se repite)
+        ttl_seconds: Vida máxima de una entrada (env QUESTION_CONTEXT_TTL_SECONDS, 0 = sin vencimiento)
+        k: Chunks recuperados por tema
+    """
+
+    def __init__(self, topics: Optional[List[str]] = None, ttl_seconds: Optional[float] = None, k: int = 8):
+        self.topics = list(topics or QUESTION_TOPICS)
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None
+            else float(os.getenv('QUESTION_CONTEXT_TTL_SECONDS', 3600))
+        )
+        self.k = k
+        self._lock = threading.Lock()
+        self._topic_locks: Dict[int, threading.Lock] = {}
+        self._entries: Dict[int, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def topic_index(self, question_number: int) -> int:
+        """Índice exacto de la pregunta (sin rotar); las preguntas extra usan el último tema."""
+        return max(0, min(question_number - 1, len(self.topics) - 1))
+
+    def topic_for(self, question_number: int) -> str:
+        return self.topics[self.topic_index(question_number)]
+
+    @staticmethod
+    def _signature(rag) -> Optional[Dict]:
+        store = getattr(rag, 'chunk_store', None)
+        return store.signature if store is not None else None
+
+    def _valid(self, entry: Optional[Dict], signature: Optional[Dict]) -> bool:
+        if entry is None or entry['signature'] != signature:
+            return False
+        return not self.ttl_seconds or time.time() - entry['computed_at'] < self.ttl_seconds
+
+    def get(self, rag, question_number: int) -> Dict:
+        """Contexto del tema de `question_number`, calculándolo si falta o venció."""
+        index = self.topic_index(question_number)
+        signature = self._signature(rag)
+        entry = self._entries.get(index)
+        if self._valid(entry, signature):
+            self.hits += 1
+            return entry['context']
+
+        with self._lock:
+            topic_lock = self._topic_locks.setdefault(index, threading.Lock())
+        with topic_lock:
+            # Otro hilo pudo calcularlo mientras esperábamos
+            entry = self._entries.get(index)
+            if self._valid(entry, signature):
+                self.hits += 1
+                return entry['context']
+
+            self.misses += 1
+            start = time.perf_counter()
+            context = build_topic_context(rag, self.topics[index], k=self.k)
+            self._entries[index] = {
+                'context': context,
+                'signature': signature,
+                'computed_at': time.time(),
+                'build_ms': round((time.perf_counter() - start) * 1000, 2)
+            }
+            return context
+
+    def precompute(self, rag) -> int:
+        """Calcula el contexto de todos los temas (al arrancar, tras inicializar el RAG)."""
+        start = time.perf_counter()
+        for question_number in range(1, len(self.topics) + 1):
+            self.get(rag, question_number)
+        print(f"🧠 Contexto de {len(self.topics)} temas precalculado en {time.perf_counter() - start:.2f}s")
+        return len(self.topics)
+
+    def invalidate(self, question_number: Optional[int] = None):
+        """Descarta el contexto de un tema, o de todos."""
+        with self._lock:
+            if question_number is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self.topic_index(question_number), None)
+
+    def info(self) -> Dict:
+        now = time.time()
+        return {
+            'topics': len(self.topics),
+            'cached_topics': len(self._entries),
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': {
+                index + 1: {
+                    'age_seconds': round(now - entry['computed_at'], 1),
+                    'build_ms': entry['build_ms'],
+                    'messages': entry['context']['relevant_message_count']
+                }
+                for index, entry in sorted(self._entries.items())
+            }
+        }
+
+
+# Instancias globales
+_transcription_cache: Optional[TranscriptionCache] = None
+_question_context_cache: Optional[QuestionContextCache] = None
+
+
+def get_transcription_cache() -> TranscriptionCache:
+    """Obtiene la instancia singleton del cache de la transcripción."""
+    global _transcription_cache
+    if _transcription_cache is None:
+        _transcription_cache = TranscriptionCache()
+    return _transcription_cache
+
+
+def get_question_context_cache() -> QuestionContextCache:
+    """Obtiene la instancia singleton del cache de contexto por tema."""
+    global _question_context_cache
+    if _question_context_cache is None:
+        _question_context_cache = QuestionContextCache()
+    return _question_context_cache
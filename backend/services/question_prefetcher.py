@@ -0,0 +1,323 @@
+"""
+Question Prefetcher - Generación especulativa de la siguiente pregunta
+En cuanto se muestra la pregunta N, un worker en background prepara la
+pregunta N+1 (del banco de preguntas o, si el tema está vacío, con gpt-4o)
+y su introducción para el caso de respuesta correcta. Así, al responder
+bien, sólo queda la respuesta conversacional en el camino del request.
+Las preguntas de prefetches descartados se devuelven con return_question
+(al banco), así que descartar un prefetch no cuesta una variante.
+
+La pregunta N+1 sirve tanto como siguiente pregunta (respuesta correcta)
+como de reemplazo (intentos agotados): en ambos casos se pide el mismo
+número de pregunta con las mismas preguntas previas.
+
+AsyncQuestionPrefetcher es la variante del servidor ASGI: cada prefetch es
+una task del event loop en vez de ocupar un thread del pool.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Campos de session_info de los que depende la introducción
+INTRO_KEYS = ('current_question', 'total_questions', 'correct_answers')
+
+
+class QuestionPrefetcher:
+    """
+    Un slot de prefetch por sesión (como mucho una pregunta en vuelo).
+
+    Args:
+        generate_question: fn(question_number, previous_questions) -> dict o None
+        generate_intro: fn(next_question, session_info) -> str (opcional)
+        max_workers: Generaciones simultáneas entre todas las sesiones
+            (env QUESTION_PREFETCH_WORKERS)
+        wait_timeout: Segundos máximos que take() espera una generación en curso
+            (env QUESTION_PREFETCH_WAIT_SECONDS)
+        enabled: env QUESTION_PREFETCH_ENABLED
+        return_question: fn(question_number, question) que recibe las preguntas
+            de prefetches descartados (QuestionBank.put_back)
+    """
+
+    def __init__(
+        self,
+        generate_question: Callable[[int, List[Dict]], Optional[Dict]],
+        generate_intro: Optional[Callable[[Dict, Dict], str]] = None,
+        max_workers: Optional[int] = None,
+        wait_timeout: Optional[float] = None,
+        enabled: Optional[bool] = None,
+        return_question: Optional[Callable[[int, Dict], None]] = None
+    ):
+        self.generate_question = generate_question
+        self.generate_intro = generate_intro
+        self.max_workers = max_workers or int(os.getenv('QUESTION_PREFETCH_WORKERS', 4))
+        self.wait_timeout = (
+            wait_timeout if wait_timeout is not None
+            else float(os.getenv('QUESTION_PREFETCH_WAIT_SECONDS', 60))
+        )
+        self.enabled = enabled if enabled is not None else os.getenv('QUESTION_PREFETCH_ENABLED', 'True') == 'True'
+        self.return_question = return_question
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._slots: Dict[str, Dict] = {}
+        self.stats = {'scheduled': 0, 'hits': 0, 'misses': 0, 'discarded': 0, 'returned': 0, 'failed': 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="question-prefetch")
+        return self._executor
+
+    def _run(self, question_number: int, previous_questions: List[Dict], intro_session_info: Optional[Dict]) -> Optional[Dict]:
+        start = time.perf_counter()
+        question = self.generate_question(question_number, previous_questions)
+        if not question or not question.get('question'):
+            return None
+
+        intro = None
+        if self.generate_intro is not None and intro_session_info is not None:
+            try:
+                intro = self.generate_intro(question, intro_session_info)
+            except Exception as e:
+                print(f"⚠️ Prefetch: error generando introducción: {e}")
+        print(f"⚡ Pregunta #{question_number} pre-generada en {time.perf_counter() - start:.1f}s")
+        return {'question': question, 'intro': intro}
+
+    def _submit(self, question_number: int, previous_questions: List[Dict], intro_session_info: Optional[Dict]):
+        return self._get_executor().submit(self._run, question_number, previous_questions, intro_session_info)
+
+    def schedule(
+        self,
+        session_id: str,
+        question_number: int,
+        previous_questions: List[Dict],
+        intro_session_info: Optional[Dict] = None
+    ) -> bool:
+        """
+        Lanza la generación de `question_number` para la sesión, reemplazando
+        (y descartando) cualquier prefetch anterior.
+
+        Args:
+            previous_questions: Preguntas ya hechas (se copia la lista)
+            intro_session_info: session_info que tendrá la introducción si la
+                respuesta actual es correcta; None para no pre-generarla
+        """
+        if not self.enabled:
+            return False
+        self.discard(session_id)
+
+        future = self._submit(
+            question_number, list(previous_questions), dict(intro_session_info) if intro_session_info else None
+        )
+        with self._lock:
+            self._slots[session_id] = {
+                'future': future,
+                'question_number': question_number,
+                'intro_session_info': intro_session_info,
+                'scheduled_at': time.time()
+            }
+            self.stats['scheduled'] += 1
+        return True
+
+    def take(
+        self,
+        session_id: str,
+        question_number: int,
+        session_info: Optional[Dict] = None,
+        wait: bool = True
+    ) -> Optional[Dict]:
+        """
+        Consume el prefetch de la sesión si corresponde a `question_number`.
+        Si todavía se está generando espera (hasta wait_timeout): ya lleva
+        ventaja sobre empezar de cero.
+
+        Args:
+            session_info: session_info real de la introducción; si no coincide
+                con la prevista la introducción se descarta (intro=None)
+            wait: Con False, si aún se está generando devuelve None y deja el
+                prefetch en su slot para consumirlo más tarde
+
+        Returns:
+            {'question': dict, 'intro': str o None} o None si no hay prefetch útil
+        """
+        slot = self._claim(session_id, question_number, wait)
+        if slot is None:
+            return None
+
+        try:
+            result = slot['future'].result(timeout=self.wait_timeout)
+        except FutureTimeout:
+            print(f"⚠️ Prefetch de la pregunta #{question_number} no terminó en {self.wait_timeout:.0f}s")
+            self._release(slot)
+            result = None
+        except Exception as e:
+            print(f"⚠️ Prefetch de la pregunta #{question_number} falló: {e}")
+            result = None
+        return self._taken(slot, result, session_info)
+
+    def _claim(self, session_id: str, question_number: int, wait: bool) -> Optional[Dict]:
+        """Saca el slot de la sesión si corresponde a `question_number` (ver take)."""
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is not None and not wait and not slot['future'].done() and slot['question_number'] == question_number:
+                return None
+            self._slots.pop(session_id, None)
+            if slot is None:
+                self.stats['misses'] += 1
+                return None
+            if slot['question_number'] != question_number:
+                self.stats['discarded'] += 1
+                self.stats['misses'] += 1
+        if slot['question_number'] != question_number:
+            self._release(slot)
+            return None
+        return slot
+
+    def _taken(self, slot: Dict, result: Optional[Dict], session_info: Optional[Dict]) -> Optional[Dict]:
+        with self._lock:
+            if result is None:
+                self.stats['failed'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+
+        intro = result['intro']
+        expected = slot['intro_session_info']
+        if intro is not None and (
+            session_info is None or expected is None
+            or any(session_info.get(key) != expected.get(key) for key in INTRO_KEYS)
+        ):
+            intro = None
+        return {'question': result['question'], 'intro': intro}
+
+    def discard(self, session_id: str):
+        """Cancela (si no empezó) o descarta el prefetch de la sesión."""
+        with self._lock:
+            slot = self._slots.pop(session_id, None)
+            if slot is not None:
+                self.stats['discarded'] += 1
+        if slot is not None:
+            self._release(slot)
+
+    def _release(self, slot: Dict):
+        """
+        Cancela el prefetch de un slot descartado; si ya no se puede cancelar,
+        su pregunta (cuando termine) se devuelve con return_question.
+        """
+        future = slot['future']
+        if future.cancel() or self.return_question is None:
+            return
+        future.add_done_callback(lambda done: self._return_result(slot['question_number'], done))
+
+    def _return_result(self, question_number: int, future):
+        if future.cancelled() or future.exception() is not None or not future.result():
+            return
+        self._return_question(question_number, future.result()['question'])
+
+    def _return_question(self, question_number: int, question: Dict):
+        try:
+            self.return_question(question_number, question)
+        except Exception as e:
+            print(f"⚠️ Prefetch: error devolviendo la pregunta #{question_number}: {e}")
+            return
+        with self._lock:
+            self.stats['returned'] += 1
+
+    def pending(self, session_id: str) -> Optional[Future]:
+        slot = self._slots.get(session_id)
+        return slot['future'] if slot else None
+
+    def info(self) -> Dict:
+        with self._lock:
+            in_flight = sum(1 for slot in self._slots.values() if not slot['future'].done())
+            slots = len(self._slots)
+            stats = dict(self.stats)
+        return {
+            'enabled': self.enabled,
+            'workers': self.max_workers,
+            'sessions': slots,
+            'in_flight': in_flight,
+            **stats
+        }
+
+
+class AsyncQuestionPrefetcher(QuestionPrefetcher):
+    """
+    QuestionPrefetcher para el servidor ASGI: los generadores son corutinas y
+    cada prefetch es una task del event loop (max_workers limita cuántas
+    generan a la vez). schedule/discard/pending/info se usan igual; take es
+    una corutina.
+
+    Args:
+        generate_question: async fn(question_number, previous_questions) -> dict o None
+        generate_intro: async fn(next_question, session_info) -> str (opcional)
+        max_workers: Generaciones simultáneas (env QUESTION_PREFETCH_ASYNC_WORKERS):
+            una task no ocupa un thread, así que el límite es el de OpenAI
+    """
+
+    def __init__(
+        self,
+        generate_question: Callable[[int, List[Dict]], Awaitable[Optional[Dict]]],
+        generate_intro: Optional[Callable[[Dict, Dict], Awaitable[str]]] = None,
+        max_workers: Optional[int] = None,
+        **kwargs
+    ):
+        max_workers = max_workers or int(os.getenv('QUESTION_PREFETCH_ASYNC_WORKERS', 128))
+        super().__init__(generate_question, generate_intro, max_workers=max_workers, **kwargs)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _arun(self, question_number: int, previous_questions: List[Dict], intro_session_info: Optional[Dict]) -> Optional[Dict]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                question = await self.generate_question(question_number, previous_questions)
+            except Exception as e:
+                # Nadie espera las tasks descartadas: el error se registra aquí
+                print(f"⚠️ Prefetch de la pregunta #{question_number} falló: {e}")
+                return None
+            if not question or not question.get('question'):
+                return None
+
+            intro = None
+            if self.generate_intro is not None and intro_session_info is not None:
+                try:
+                    intro = await self.generate_intro(question, intro_session_info)
+                except asyncio.CancelledError:
+                    # Descartado mientras generaba la introducción: la pregunta no se pierde
+                    if self.return_question is not None:
+                        self._return_question(question_number, question)
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Prefetch: error generando introducción: {e}")
+            print(f"⚡ Pregunta #{question_number} pre-generada en {time.perf_counter() - start:.1f}s")
+            return {'question': question, 'intro': intro}
+
+    def _submit(self, question_number: int, previous_questions: List[Dict], intro_session_info: Optional[Dict]):
+        return asyncio.ensure_future(self._arun(question_number, previous_questions, intro_session_info))
+
+    async def take(
+        self,
+        session_id: str,
+        question_number: int,
+        session_info: Optional[Dict] = None,
+        wait: bool = True
+    ) -> Optional[Dict]:
+        """Como QuestionPrefetcher.take, esperando la task sin bloquear el event loop."""
+        slot = self._claim(session_id, question_number, wait)
+        if slot is None:
+            return None
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(slot['future']), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Prefetch de la pregunta #{question_number} no terminó en {self.wait_timeout:.0f}s")
+            self._release(slot)
+            result = None
+        except Exception as e:
+            print(f"⚠️ Prefetch de la pregunta #{question_number} falló: {e}")
+            result = None
+        return self._taken(slot, result, session_info)
@@ -0,0 +1,121 @@
+"""
+RAG Lifecycle - Inicialización del RAG fuera del camino de los requests
+Un único hilo en background (single-flight, con lock) carga mensajes y
+construye/carga el índice al arrancar el proceso. Los handlers consultan el
+estado sin bloquear y el endpoint de readiness lo expone.
+"""
+
+import os
+import time
+import threading
+import traceback
+from datetime import datetime
+from typing import Callable, Dict, Optional, Any
+
+PENDING = 'pending'
+INITIALIZING = 'initializing'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class RAGInitializer:
+    """
+    Inicializador single-flight del RAG.
+
+    Args:
+        init_fn: Función que construye y devuelve el servicio (puede tardar minutos)
+        retry_interval: Segundos tras un fallo antes de que get() relance la inicialización
+            (env RAG_INIT_RETRY_SECONDS)
+    """
+
+    def __init__(self, init_fn: Callable[[], Any], retry_interval: Optional[float] = None):
+        self.init_fn = init_fn
+        self.retry_interval = retry_interval if retry_interval is not None else float(os.getenv('RAG_INIT_RETRY_SECONDS', 30))
+        self._lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._service = None
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self) -> bool:
+        """
+        Lanza la inicialización en background si no está en curso ni terminada.
+
+        Returns:
+            True si esta llamada lanzó el hilo
+        """
+        with self._lock:
+            if self.state in (INITIALIZING, READY):
+                return False
+            self.state = INITIALIZING
+            self.error = None
+            self.attempts += 1
+            self.started_at = time.time()
+            self.finished_at = None
+            self._thread = threading.Thread(target=self._run, name="rag-initializer", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self):
+        try:
+            service = self.init_fn()
+            if service is None:
+                raise RuntimeError("la inicialización no devolvió un servicio")
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                self.state = FAILED
+                self.error = str(e)
+                self.finished_at = time.time()
+            print(f"❌ Error inicializando RAG (intento {self.attempts}): {e}")
+            return
+
+        with self._lock:
+            self._service = service
+            self.state = READY
+            self.finished_at = time.time()
+        self._ready_event.set()
+        print(f"✅ RAG listo en {self.finished_at - self.started_at:.1f}s")
+
+    def get(self):
+        """
+        Devuelve el servicio si ya está listo, o None sin bloquear.
+        Si nunca se lanzó, o falló hace más de retry_interval, relanza la inicialización.
+        """
+        if self.state == READY:
+            return self._service
+        if self.state == PENDING or (
+            self.state == FAILED and time.time() - (self.finished_at or 0) >= self.retry_interval
+        ):
+            self.start()
+        return None
+
+    def wait(self, timeout: Optional[float] = None):
+        """Bloquea hasta que el servicio esté listo (para scripts y tests, no para handlers)."""
+        self.get()
+        self._ready_event.wait(timeout)
+        return self._service if self.state == READY else None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == READY
+
+    def status(self) -> Dict:
+        """Estado para los endpoints de health/readiness."""
+        now = time.time()
+        status = {
+            'state': self.state,
+            'ready': self.state == READY,
+            'attempts': self.attempts,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            'elapsed_seconds': round((self.finished_at or now) - self.started_at, 2) if self.started_at else None
+        }
+        if self.error:
+            status['error'] = self.error
+        if self.state == FAILED:
+            status['retry_in_seconds'] = max(0, round(self.retry_interval - (now - (self.finished_at or now)), 1))
+        return status
@@ -4,44 +4,84 @@ Usa OpenAI Embeddings + FAISS para búsqueda vectorial eficiente
 """
 
 import os
-import json
-import pickle
 import numpy as np
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import faiss
 
+from services.embedding_cache import EmbeddingCache
+from services.embedding_pipeline import EmbeddingPipeline, EmbeddingError
+from services import vector_index
+from services.chunk_store import ChunkStore, ChunkTexts, migrate_legacy_pickle
+from services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+# Queries con al menos estos términos indexados se consideran "de palabras clave"
+LEXICAL_ONLY_MIN_TERMS = int(os.getenv('RAG_LEXICAL_ONLY_MIN_TERMS', 4))
+
+
 class RAGService:
     """
     Sistema RAG robusto para búsqueda semántica en mensajes de Instagram.
     
     Features:
     - Embeddings con OpenAI text-embedding-3-small (rápido y barato)
-    - Vector store con FAISS (búsqueda eficiente en millones de vectores)
-    - Cache persistente de embeddings (evita recálculo)
-    - Búsqueda híbrida: semántica + filtros temporales/autor
+    - Vector store con FAISS configurable: flat_l2, flat_ip, ivf_flat, ivf_pq, hnsw (RAG_INDEX_TYPE)
+    - Cache persistente de embeddings por contenido (evita recálculo entre rebuilds y queries)
+    - Metadata de chunks memory-mapped (chunk_store): sólo se decodifican los resultados
+    - Búsqueda híbrida: BM25 local + semántica (RRF) con filtros temporales/autor
+    - Modo sólo lectura (RAG_READ_ONLY) para workers pre-fork: índice y
+      chunk store memory-mapped y compartidos entre procesos, sin escrituras
+    - asearch/asearch_many para el servidor ASGI: el embedding de la query se
+      espera con el cliente async sin ocupar un thread
     """
     
-    def __init__(self, openai_api_key: str, cache_dir: str = "./cache"):
+    def __init__(self, openai_api_key: str, cache_dir: str = "./cache", embedding_concurrency: Optional[int] = None,
+                 index_type: Optional[str] = None, index_params: Optional[Dict] = None, read_only: Optional[bool] = None):
         self.client = OpenAI(api_key=openai_api_key)
+        self._openai_api_key = openai_api_key
+        self._async_client: Optional[AsyncOpenAI] = None
         self.cache_dir = cache_dir
+        self.read_only = read_only if read_only is not None else os.getenv('RAG_READ_ONLY', 'False') == 'True'
         self.embedding_model = "text-embedding-3-small"
         self.embedding_dim = 1536  # Dimensión de text-embedding-3-small
         
         # Vector store
-        self.index: Optional[faiss.IndexFlatL2] = None
-        self.messages_metadata: List[Dict] = []
-        self.chunk_texts: List[str] = []  # Propiedad para compatibilidad con app.py
+        self.index: Optional[faiss.Index] = None
+        self.index_type = index_type or os.getenv('RAG_INDEX_TYPE', vector_index.DEFAULT_INDEX_TYPE)
+        self.index_params = {**vector_index.search_params_from_env(), **(index_params or {})}
         
         # Cache
         os.makedirs(cache_dir, exist_ok=True)
-        self.cache_file = os.path.join(cache_dir, "rag_embeddings.pkl")
+        self.cache_file = os.path.join(cache_dir, "rag_embeddings.pkl")  # Formato anterior, sólo se migra
         self.index_file = os.path.join(cache_dir, "faiss_index.bin")
+        self.chunk_store = ChunkStore(os.path.join(cache_dir, "chunk_store"))
+        self.lexical_index = LexicalIndex(os.path.join(cache_dir, "lexical_index"))
+        self.embedding_cache = EmbeddingCache(cache_dir, self.embedding_model, self.embedding_dim, read_only=self.read_only)
+        self.embedding_pipeline = EmbeddingPipeline(
+            self.client, self.embedding_model, self.embedding_cache, max_concurrency=embedding_concurrency
+        )
         
         print(f"🚀 RAG Service inicializado (modelo: {self.embedding_model})")
     
-    def _create_message_chunks(self, messages: List[Dict], chunk_size: int = 5) -> List[Dict]:
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Cliente async de OpenAI (se crea al primer uso, dentro del event loop)."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self._openai_api_key)
+        return self._async_client
+    
+    @property
+    def messages_metadata(self) -> ChunkStore:
+        """Chunks indexados (secuencia perezosa de dicts, compatible con la lista anterior)."""
+        return self.chunk_store
+    
+    @property
+    def chunk_texts(self) -> ChunkTexts:
+        """Textos de los chunks, decodificados bajo demanda (compatibilidad con app.py)."""
+        return self.chunk_store.texts()
+    
+    def _create_message_chunks(self, messages: List[Dict], chunk_size: int = 5, start_chunk_id: int = 0) -> List[Dict]:
         """
         Agrupa mensajes en chunks para mejor contexto.
         En vez de 1 embedding por mensaje, agrupa N mensajes consecutivos.
@@ -66,7 +106,7 @@ class RAGService:
             
             chunk_data = {
                 'text': '\n'.join(combined_text),
-                'chunk_id': i // chunk_size,
+                'chunk_id': start_chunk_id + i // chunk_size,
                 'messages_in_chunk': chunk_msgs,
                 'date_range': (
                     datetime.fromtimestamp(first_msg.get('timestamp_ms', 0) / 1000).strftime('%Y-%m-%d'),
@@ -80,62 +120,250 @@ class RAGService:
         return chunks
     
     def _get_embedding(self, text: str) -> np.ndarray:
-        """Obtiene embedding de OpenAI para un texto."""
+        """Obtiene embedding de OpenAI para un texto (consultando antes el cache)."""
+        return self._get_query_embeddings([text])[0]
+    
+    def _get_query_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeddings de varias queries: las que no están en cache se piden en un
+        único request. Si falla, esas filas quedan en cero y la búsqueda no
+        devuelve resultados para ellas (ver _search_embeddings).
+        """
+        texts = [self.embedding_pipeline.prepare(text) for text in texts]  # Límite de tokens
+        embeddings, missing = self.embedding_cache.get_many(texts)
+        if not missing:
+            return embeddings
+        
+        unique_missing = list(dict.fromkeys(texts[i] for i in missing))
         try:
-            response = self.client.embeddings.create(
-                model=self.embedding_model,
-                input=text[:8000]  # Límite de tokens
-            )
-            embedding = np.array(response.data[0].embedding, dtype=np.float32)
-            return embedding
+            vectors = self.embedding_pipeline.embed_batch(unique_missing)
+            self._fill_query_embeddings(texts, embeddings, missing, unique_missing, vectors)
         except Exception as e:
             print(f"❌ Error obteniendo embedding: {e}")
-            return np.zeros(self.embedding_dim, dtype=np.float32)
+        return embeddings
     
-    def _get_embeddings_batch(self, texts: List[str], batch_size: int = 100) -> np.ndarray:
-        """Obtiene embeddings en batch (más eficiente)."""
-        all_embeddings = []
+    async def _aget_query_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Como _get_query_embeddings, pidiendo las faltantes con el cliente async."""
+        texts = [self.embedding_pipeline.prepare(text) for text in texts]
+        embeddings, missing = self.embedding_cache.get_many(texts)
+        if not missing:
+            return embeddings
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_texts = [t[:8000] for t in batch]  # Truncar
-            
-            try:
-                response = self.client.embeddings.create(
-                    model=self.embedding_model,
-                    input=batch_texts
-                )
-                batch_embeddings = [np.array(item.embedding, dtype=np.float32) for item in response.data]
-                all_embeddings.extend(batch_embeddings)
-                
-                print(f"  📊 Procesados {i + len(batch)}/{len(texts)} embeddings...")
-            except Exception as e:
-                print(f"❌ Error en batch {i}: {e}")
-                # Fallback: embeddings vacíos
-                all_embeddings.extend([np.zeros(self.embedding_dim, dtype=np.float32)] * len(batch))
+        unique_missing = list(dict.fromkeys(texts[i] for i in missing))
+        try:
+            vectors = await self.embedding_pipeline.aembed_batch(self.async_client, unique_missing)
+            self._fill_query_embeddings(texts, embeddings, missing, unique_missing, vectors)
+        except Exception as e:
+            print(f"❌ Error obteniendo embedding: {e}")
+        return embeddings
+    
+    def _fill_query_embeddings(self, texts: List[str], embeddings: np.ndarray, missing: List[int],
+                               unique_missing: List[str], vectors: np.ndarray):
+        self.embedding_cache.put_many(unique_missing, vectors)
+        by_text = dict(zip(unique_missing, vectors))
+        for i in missing:
+            embeddings[i] = by_text[texts[i]]
+    
+    def _get_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Obtiene embeddings en batch con el pipeline concurrente (cache + backoff).
+        Lanza EmbeddingError si algún batch falla: nunca devuelve vectores nulos.
+        """
+        return self.embedding_pipeline.embed(texts)
+    
+    def _create_priority_chunks(self, priority_messages: List[Dict], start_chunk_id: int = 0) -> List[Dict]:
+        """Convierte los chunks prioritarios de la transcripción en chunks del índice."""
+        priority_chunks = []
+        for offset, priority_msg in enumerate(priority_messages):
+            priority_chunks.append({
+                'text': priority_msg['content'],
+                'chunk_id': start_chunk_id + offset,
+                'messages_in_chunk': [priority_msg],
+                'date_range': priority_msg['metadata'].get('period', 'priority'),
+                'message_count': 1,
+                'priority_score': priority_msg.get('priority_score', 10),
+                'type': 'priority_transcription'
+            })
+        return priority_chunks
+    
+    def _add_to_index(self, embeddings: np.ndarray):
+        """Agrega vectores (normalizados) al índice."""
+        self.index.add(vector_index.normalize(embeddings))
+    
+    def _index_vectors(self) -> np.ndarray:
+        """Vectores de todos los chunks: reconstruidos si el índice es flat, si no desde el cache."""
+        if isinstance(self.index, faiss.IndexFlat) and self.index.ntotal == len(self.chunk_texts):
+            return self.index.reconstruct_n(0, self.index.ntotal)
+        return self._get_embeddings_batch(self.chunk_texts)
+    
+    def rebuild_index(self, index_type: Optional[str] = None, index_params: Optional[Dict] = None):
+        """
+        Reconstruye el índice FAISS con otro tipo/parámetros sin volver a
+        embeber (los vectores salen del índice flat o del cache de embeddings).
+        """
+        if self.read_only:
+            raise RuntimeError("RAG en modo sólo lectura: el índice se reconstruye desde el proceso que prepara el cache")
+        self.index_type = index_type or self.index_type
+        self.index_params = {**self.index_params, **(index_params or {})}
+        print(f"🔨 Reconstruyendo índice como {self.index_type}...")
+        self.index = vector_index.build_index(self.index_type, self._index_vectors(), self.index_params)
+        self._save_cache()
+    
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Ajusta nprobe (IVF) o efSearch (HNSW) en caliente."""
+        if nprobe:
+            self.index_params['nprobe'] = nprobe
+        if ef_search:
+            self.index_params['ef_search'] = ef_search
+        if self.index is not None:
+            vector_index.set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+    
+    def _index_info(self) -> Dict:
+        return {
+            'index_type': vector_index.index_type_of(self.index),
+            'requested_index_type': self.index_type,  # Puede diferir si se usó el fallback flat_ip
+            'created_at': datetime.now().isoformat()
+        }
+    
+    def _save_cache(self):
+        """Persiste el índice FAISS y su info en el chunk store (los chunks ya se escribieron)."""
+        print(f"💾 Guardando cache...")
+        vector_index.write_index_atomic(self.index, self.index_file)
+        self.chunk_store.update_info(**self._index_info())
+        self._sync_lexical_index()
+    
+    def _sync_lexical_index(self):
+        """Reconstruye el índice BM25 si no corresponde al chunk store actual."""
+        if self.lexical_index.exists() and self.lexical_index.source == self.chunk_store.signature:
+            return
+        print(f"🔤 Construyendo índice léxico BM25 ({len(self.chunk_store)} chunks)...")
+        self.lexical_index.build(
+            (self.chunk_store.searchable_text(i) for i in range(len(self.chunk_store))),
+            source=self.chunk_store.signature
+        )
+        stats = self.lexical_index.get_statistics()
+        print(f"✅ Índice léxico listo: {stats['terms']:,} términos, {stats['postings']:,} postings")
+    
+    def ingest_messages(self, messages: List[Dict], priority_messages: List[Dict] = None) -> int:
+        """
+        Ingesta incremental: embebe y agrega al índice sólo los mensajes cuya
+        huella (sender_name, timestamp_ms, hash de contenido) no está indexada.
+        Un documento modificado reemplaza los chunks de su versión anterior.
+        
+        Returns:
+            Número de chunks nuevos agregados al índice
+        """
+        if self.index is None:
+            raise ValueError("Índice no construido. Llama a build_index() primero.")
+        if self.read_only:
+            raise RuntimeError("RAG en modo sólo lectura: la ingesta se hace desde el proceso que prepara el cache")
+        
+        priority_messages = priority_messages or []
+        self._remove_superseded_documents(messages)
+        known_priority = self.chunk_store.contains_fingerprints(priority_messages)
+        known_messages = self.chunk_store.contains_fingerprints(messages)
+        new_priority = [msg for msg, known in zip(priority_messages, known_priority) if not known]
+        new_messages = [msg for msg, known in zip(messages, known_messages) if not known]
+        
+        if not new_priority and not new_messages:
+            print("✅ Índice al día, no hay mensajes nuevos")
+            return 0
+        
+        print(f"➕ Ingesta incremental: {len(new_messages)} mensajes nuevos, {len(new_priority)} chunks prioritarios nuevos")
+        
+        # Los nuevos mensajes se agrupan entre sí, en orden cronológico; cada documento va solo
+        new_documents = [msg for msg in new_messages if msg.get('document')]
+        new_messages = [msg for msg in new_messages if not msg.get('document')]
+        new_messages.sort(key=lambda x: x.get('timestamp_ms', 0))
+        next_chunk_id = len(self.chunk_store)
+        new_chunks = self._create_priority_chunks(new_priority, start_chunk_id=next_chunk_id)
+        new_chunks += self._create_message_chunks(
+            new_documents, chunk_size=1, start_chunk_id=next_chunk_id + len(new_chunks)
+        )
+        new_chunks += self._create_message_chunks(
+            new_messages, chunk_size=5, start_chunk_id=next_chunk_id + len(new_chunks)
+        )
         
-        return np.array(all_embeddings, dtype=np.float32)
+        new_texts = [chunk['text'] for chunk in new_chunks]
+        print(f"🧮 Generando {len(new_texts)} embeddings nuevos...")
+        embeddings = self._get_embeddings_batch(new_texts)
+        
+        self._add_to_index(embeddings)
+        self.chunk_store.append(new_chunks)
+        self._save_cache()
+        print(f"✅ {len(new_chunks)} chunks agregados: {self.index.ntotal} vectores en total")
+        return len(new_chunks)
+    
+    def _remove_superseded_documents(self, messages: List[Dict]):
+        """
+        Los documentos (mensajes con 'document', p.ej. la historia y el
+        timeline) se identifican por sender_name: si el contenido de uno
+        cambió, los chunks de la versión anterior se eliminan del chunk store,
+        de FAISS y del BM25 antes de ingerir la nueva.
+        """
+        documents = [msg for msg in messages if msg.get('document')]
+        changed = [doc for doc, known in zip(documents, self.chunk_store.contains_fingerprints(documents)) if not known]
+        stale = np.zeros(len(self.chunk_store), dtype=bool)
+        for doc in changed:
+            stale |= self.chunk_store.filter_mask(sender_name=doc.get('sender_name', 'Unknown'))
+        if not stale.any():
+            return
+        
+        print(f"♻️ {int(stale.sum())} chunks de documentos modificados se reemplazan")
+        vectors = self._index_vectors()
+        self.chunk_store.remove(np.flatnonzero(stale))
+        self.index = vector_index.build_index(self.index_type, vectors[~stale], self.index_params)
+        self._save_cache()
     
-    def build_index(self, messages: List[Dict], force_rebuild: bool = False, priority_messages: List[Dict] = None):
+    def build_index(self, messages: List[Dict], force_rebuild: bool = False, priority_messages: List[Dict] = None,
+                    incremental: bool = True):
         """
         Construye el índice FAISS con todos los mensajes, incluyendo chunks prioritarios.
-        Si existe cache, lo carga. Si no, genera embeddings nuevos.
+        Si existe cache, lo carga y (con incremental=True) agrega sólo los mensajes nuevos.
+        Si no, genera embeddings nuevos.
         """
+        if self.read_only:
+            self.load_shared_index()
+            return
+        
         # Intentar cargar cache
-        if not force_rebuild and os.path.exists(self.cache_file) and os.path.exists(self.index_file):
+        if not force_rebuild and os.path.exists(self.index_file):
             print("📂 Cargando índice desde cache...")
             try:
-                with open(self.cache_file, 'rb') as f:
-                    cache_data = pickle.load(f)
-                    self.messages_metadata = cache_data['metadata']
-                    # Regenerar chunk_texts desde metadata para compatibilidad
-                    self.chunk_texts = [chunk['text'] for chunk in self.messages_metadata]
+                # Un rag_embeddings.pkl nuevo (formato anterior, p.ej. de Spaces) se convierte una vez
+                migrate_legacy_pickle(self.cache_file, self.chunk_store)
+                if not self.chunk_store.exists():
+                    raise FileNotFoundError("chunk store no encontrado")
                 
                 self.index = faiss.read_index(self.index_file)
-                print(f"✅ Cache cargado: {len(self.messages_metadata)} chunks, {self.index.ntotal} vectores")
-                return
+                vector_index.enable_reconstruct(self.index)
+                if self.index.ntotal != len(self.chunk_store):
+                    raise ValueError(f"índice ({self.index.ntotal}) y chunk store ({len(self.chunk_store)}) no coinciden")
+                vector_index.set_search_params(self.index, **self.index_params)
+                cached_index_type = self.chunk_store.info.get(
+                    'requested_index_type', vector_index.index_type_of(self.index)
+                )
+                print(f"✅ Cache cargado: {len(self.chunk_store)} chunks, {self.index.ntotal} vectores")
+                cache_loaded = True
             except Exception as e:
                 print(f"⚠️ Error cargando cache: {e}. Reconstruyendo...")
+                cache_loaded = False
+            
+            if cache_loaded:
+                if cached_index_type != self.index_type:
+                    try:
+                        self.rebuild_index()
+                    except EmbeddingError as e:
+                        print(f"⚠️ No se pudo convertir el índice a {self.index_type}: {e}")
+                if incremental:
+                    try:
+                        self.ingest_messages(messages, priority_messages)
+                    except EmbeddingError as e:
+                        # El índice cargado sigue siendo válido; los embeddings ya
+                        # obtenidos quedaron en cache para el próximo intento
+                        print(f"⚠️ Ingesta incremental incompleta: {e}")
+                self._sync_lexical_index()
+                return
         
         # Construir índice desde cero
         total_messages = len(messages) + (len(priority_messages) if priority_messages else 0)
@@ -145,57 +373,120 @@ class RAGService:
         priority_chunks = []
         if priority_messages:
             print(f"🎯 Procesando {len(priority_messages)} chunks prioritarios...")
-            for priority_msg in priority_messages:
-                priority_chunk = {
-                    'text': priority_msg['content'],
-                    'messages_in_chunk': [priority_msg],
-                    'date_range': priority_msg['metadata'].get('period', 'priority'),
-                    'message_count': 1,
-                    'priority_score': priority_msg.get('priority_score', 10),
-                    'type': 'priority_transcription'
-                }
-                priority_chunks.append(priority_chunk)
-        
-        # 2. Crear chunks de mensajes regulares
-        regular_chunks = self._create_message_chunks(messages, chunk_size=5)
+            priority_chunks = self._create_priority_chunks(priority_messages)
+        
+        # 2. Crear chunks de documentos (uno por documento) y de mensajes regulares
+        documents = [msg for msg in messages if msg.get('document')]
+        regular_chunks = self._create_message_chunks(documents, chunk_size=1, start_chunk_id=len(priority_chunks))
+        regular_chunks += self._create_message_chunks(
+            [msg for msg in messages if not msg.get('document')], chunk_size=5,
+            start_chunk_id=len(priority_chunks) + len(regular_chunks)
+        )
         
         # 3. Combinar chunks (prioritarios primero)
         all_chunks = priority_chunks + regular_chunks
-        self.messages_metadata = all_chunks
         
         # 4. Extraer textos para embeddings
         chunk_texts = [chunk['text'] for chunk in all_chunks]
-        self.chunk_texts = chunk_texts  # Guardar para compatibilidad con app.py
         
         # 3. Generar embeddings en batch
         if not chunk_texts:
             print("⚠️ No hay textos para generar embeddings")
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
+            self.index = vector_index.create_index(self.index_type, self.embedding_dim, 0, self.index_params)
+            self.chunk_store.replace([])
+            self._sync_lexical_index()
             return
             
         print(f"🧮 Generando {len(chunk_texts)} embeddings...")
-        embeddings = self._get_embeddings_batch(chunk_texts, batch_size=50)
+        embeddings = self._get_embeddings_batch(chunk_texts)
         
-        # 4. Crear índice FAISS
-        print(f"🔨 Creando índice FAISS...")
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
+        # 4. Crear (y entrenar) índice FAISS
+        print(f"🔨 Creando índice FAISS ({self.index_type})...")
+        self.index = vector_index.build_index(self.index_type, embeddings, self.index_params)
         
-        if embeddings.size > 0:
-            self.index.add(embeddings)
-        else:
-            print("⚠️ No hay embeddings para agregar al índice")
+        # 5. Guardar cache: chunks al store (sin el texto, que se reconstruye) y luego el índice
+        self.chunk_store.replace(all_chunks)
+        self._save_cache()
         
-        # 5. Guardar cache
-        print(f"💾 Guardando cache...")
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump({
-                'metadata': self.messages_metadata,
-                'created_at': datetime.now().isoformat()
-            }, f)
+        print(f"✅ Índice construido: {self.index.ntotal} vectores, {len(self.chunk_store)} chunks")
+    
+    def load_shared_index(self):
+        """
+        Carga el cache ya construido en modo sólo lectura (workers pre-fork).
+        
+        Los vectores del índice FAISS, el chunk store y el índice BM25 quedan
+        memory-mapped: todos los workers comparten las mismas páginas, así que
+        la memoria no se multiplica por el número de procesos. No ingiere ni
+        escribe nada; el cache lo prepara antes un único proceso (ver
+        gunicorn.conf.py).
+        """
+        if not os.path.exists(self.index_file) or not self.chunk_store.exists():
+            raise FileNotFoundError("Cache del RAG no encontrado: hay que construirlo antes de arrancar los workers")
+        
+        self.index = vector_index.read_index_mmap(self.index_file)
+        vector_index.enable_reconstruct(self.index)
+        if self.index.ntotal != len(self.chunk_store):
+            raise ValueError(f"índice ({self.index.ntotal}) y chunk store ({len(self.chunk_store)}) no coinciden")
+        if not self.lexical_index.exists() or self.lexical_index.source != self.chunk_store.signature:
+            raise ValueError("índice léxico ausente o desactualizado respecto al chunk store")
+        vector_index.set_search_params(self.index, **self.index_params)
+        print(f"✅ Cache compartido cargado (mmap): {len(self.chunk_store)} chunks, {self.index.ntotal} vectores")
+    
+    def _search_vectors(
+        self,
+        queries: List[str],
+        k: int,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Embebe todas las queries (un request) y hace una sola búsqueda batch.
+        
+        Returns:
+            (distancias, ids) de forma (len(queries), <=k); ids -1 = sin resultado
+        """
+        if self.index is None:
+            raise ValueError("Índice no construido. Llama a build_index() primero.")
         
-        faiss.write_index(self.index, self.index_file)
+        # 1. Generar embeddings de las queries
+        return self._search_embeddings(self._get_query_embeddings(queries), k, date_range, sender_filter)
+    
+    def _search_embeddings(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Filas en cero = embedding fallido: sin resultados en vez de chunks arbitrarios
+        failed = ~np.any(query_embeddings, axis=1)
+        query_embeddings = vector_index.normalize(query_embeddings)
         
-        print(f"✅ Índice construido: {self.index.ntotal} vectores, {len(self.messages_metadata)} chunks")
+        # 2. Buscar los k vecinos más cercanos; con filtros, FAISS sólo puntúa los chunks elegibles
+        mask = self.chunk_store.filter_mask(date_range, sender_filter)
+        if mask is None:
+            distances, indices = self.index.search(query_embeddings, k)
+            distances = vector_index.to_l2_distances(self.index, distances)
+        else:
+            distances, indices = vector_index.filtered_search(self.index, query_embeddings, k, mask, **self.index_params)
+        if failed.any():
+            indices[failed] = -1
+        return distances, indices
+    
+    def _decode_results(self, distances: np.ndarray, indices: np.ndarray, decoded: Dict[int, Dict]) -> List[Dict]:
+        """Arma los resultados de una fila; cada chunk se decodifica una sola vez por llamada."""
+        results = []
+        for idx, distance in zip(indices.tolist(), distances.tolist()):
+            if idx < 0 or idx >= len(self.chunk_store):
+                continue
+            if idx not in decoded:
+                decoded[idx] = self.chunk_store.chunk(idx)
+            results.append({
+                **decoded[idx],
+                'similarity_score': float(distance),
+                'rank': len(results) + 1
+            })
+        return results
     
     def search(
         self, 
@@ -210,54 +501,142 @@ class RAGService:
         Args:
             query: Texto de búsqueda (ej: "momentos románticos", "apodos cariñosos")
             k: Número de resultados a devolver
-            date_range: Tupla (fecha_inicio, fecha_fin) para filtrar por fechas
+            date_range: Tupla ('YYYY-MM-DD', 'YYYY-MM-DD') inclusiva para filtrar por fechas
             sender_filter: Nombre del remitente para filtrar
         
         Returns:
             Lista de chunks relevantes con sus mensajes
         """
+        return self.search_many([query], k=k, date_range=date_range, sender_filter=sender_filter)[0]
+    
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 10,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """
+        Varias búsquedas semánticas con un solo request de embeddings y una
+        sola búsqueda FAISS sobre la matriz de queries.
+        
+        Args:
+            queries: Textos de búsqueda
+            k: Resultados por query
+            date_range / sender_filter: Filtros comunes a todas las queries (ver search)
+        
+        Returns:
+            Una lista de resultados (como los de search) por query, en el mismo orden
+        """
+        if not queries:
+            return []
+        distances, indices = self._search_vectors(queries, k, date_range, sender_filter)
+        decoded: Dict[int, Dict] = {}
+        return [self._decode_results(distances[row], indices[row], decoded) for row in range(len(queries))]
+    
+    async def asearch(
+        self,
+        query: str,
+        k: int = 10,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None
+    ) -> List[Dict]:
+        """Versión async de search (ver asearch_many)."""
+        return (await self.asearch_many([query], k=k, date_range=date_range, sender_filter=sender_filter))[0]
+    
+    async def asearch_many(
+        self,
+        queries: List[str],
+        k: int = 10,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """
+        Versión async de search_many: sólo el request de embeddings se espera
+        con el cliente async; la búsqueda FAISS (milisegundos) corre en el
+        event loop.
+        """
+        if not queries:
+            return []
         if self.index is None:
             raise ValueError("Índice no construido. Llama a build_index() primero.")
+        query_embeddings = await self._aget_query_embeddings(queries)
+        distances, indices = self._search_embeddings(query_embeddings, k, date_range, sender_filter)
+        decoded: Dict[int, Dict] = {}
+        return [self._decode_results(distances[row], indices[row], decoded) for row in range(len(queries))]
+    
+    def lexical_search(
+        self,
+        query: str,
+        k: int = 10,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Búsqueda por palabras clave (BM25) sin llamadas a OpenAI.
+        Mismos filtros y formato que search, con 'bm25_score' en vez de 'similarity_score'.
+        """
+        mask = self.chunk_store.filter_mask(date_range, sender_filter)
+        scores, ids = self.lexical_index.search(query, k, mask)
+        return [
+            {**self.chunk_store.chunk(idx), 'bm25_score': float(score), 'rank': rank}
+            for rank, (idx, score) in enumerate(zip(ids.tolist(), scores.tolist()), start=1)
+        ]
+    
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 10,
+        date_range: Optional[Tuple[str, str]] = None,
+        sender_filter: Optional[str] = None,
+        use_vector: Optional[bool] = None,
+        candidates: Optional[int] = None,
+        rrf_k: int = 60
+    ) -> List[Dict]:
+        """
+        Búsqueda híbrida: ranking BM25 + ranking semántico fusionados con
+        reciprocal rank fusion.
         
-        # 1. Generar embedding de la query
-        query_embedding = self._get_embedding(query).reshape(1, -1)
+        Args:
+            query, k, date_range, sender_filter: Como en search
+            use_vector: True/False fuerza la pata vectorial; None (auto) la omite
+                para queries de palabras clave (>= LEXICAL_ONLY_MIN_TERMS términos
+                conocidos y k resultados léxicos), que se resuelven sin red
+            candidates: Resultados por pata antes de fusionar (default max(4k, 50))
+            rrf_k: Constante de RRF
         
-        # 2. Buscar k vecinos más cercanos
-        distances, indices = self.index.search(query_embedding, k * 2)  # Buscar más para filtrar
+        Returns:
+            Chunks con 'rrf_score', 'bm25_score' y 'similarity_score' (None si
+            la pata correspondiente no lo encontró)
+        """
+        candidates = candidates or max(4 * k, 50)
+        mask = self.chunk_store.filter_mask(date_range, sender_filter)
+        bm25_scores, bm25_ids = self.lexical_index.search(query, candidates, mask)
         
-        # 3. Recuperar chunks y aplicar filtros
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if idx >= len(self.messages_metadata):
-                continue
-            
-            chunk = self.messages_metadata[int(idx)]
-            
-            # Aplicar filtros
-            if date_range:
-                chunk_start, chunk_end = chunk['date_range']
-                if chunk_end < date_range[0] or chunk_start > date_range[1]:
-                    continue
-            
-            if sender_filter:
-                # Verificar si algún mensaje del chunk es del sender
-                has_sender = any(
-                    msg.get('sender_name') == sender_filter 
-                    for msg in chunk['messages_in_chunk']
-                )
-                if not has_sender:
-                    continue
-            
-            results.append({
-                **chunk,
-                'similarity_score': float(distance),
-                'rank': len(results) + 1
-            })
-            
-            if len(results) >= k:
-                break
+        if use_vector is None:
+            keyword_query = len(self.lexical_index.query_terms(query)) >= LEXICAL_ONLY_MIN_TERMS
+            use_vector = not (keyword_query and len(bm25_ids) >= k)
         
-        return results
+        rankings = [bm25_ids]
+        vector_scores: Dict[int, float] = {}
+        if use_vector and self.index is not None:
+            distances, ids = self._search_vectors([query], candidates, date_range, sender_filter)
+            valid = ids[0] >= 0
+            rankings.append(ids[0][valid])
+            vector_scores = dict(zip(ids[0][valid].tolist(), distances[0][valid].tolist()))
+        
+        fused_scores, fused_ids = reciprocal_rank_fusion(rankings, k=k, rrf_k=rrf_k)
+        bm25_by_id = dict(zip(bm25_ids.tolist(), bm25_scores.tolist()))
+        return [
+            {
+                **self.chunk_store.chunk(idx),
+                'rrf_score': float(score),
+                'bm25_score': bm25_by_id.get(idx),
+                'similarity_score': vector_scores.get(idx),
+                'rank': rank
+            }
+            for rank, (idx, score) in enumerate(zip(fused_ids.tolist(), fused_scores.tolist()), start=1)
+        ]
     
     def search_romantic_moments(self, k: int = 10) -> List[Dict]:
         """Búsqueda especializada de momentos románticos."""
@@ -268,51 +647,80 @@ class RAGService:
             "siempre juntos para siempre futuro"
         ]
         
-        all_results = []
-        for query in queries:
-            results = self.search(query, k=k // len(queries) + 1)
-            all_results.extend(results)
-        
-        # Eliminar duplicados y ordenar por score
-        seen_ids = set()
-        unique_results = []
-        for r in all_results:
-            if r['chunk_id'] not in seen_ids:
-                seen_ids.add(r['chunk_id'])
-                unique_results.append(r)
+        distances, indices = self._search_vectors(queries, k // len(queries) + 1)
+        distances, indices = distances.ravel(), indices.ravel()
+        valid = indices >= 0
+        distances, indices = distances[valid], indices[valid]
         
-        unique_results.sort(key=lambda x: x['similarity_score'])
-        return unique_results[:k]
+        # Eliminar duplicados quedándose con el mejor score de cada chunk, y ordenar
+        order = np.argsort(distances, kind='stable')
+        _, first = np.unique(indices[order], return_index=True)
+        best = order[first]
+        best = best[np.argsort(distances[best], kind='stable')][:k]
+        return self._decode_results(distances[best], indices[best], {})
     
     def get_statistics(self) -> Dict:
         """Obtiene estadísticas del RAG."""
-        if not self.messages_metadata:
+        if not len(self.chunk_store):
             return {}
         
-        total_messages = sum(chunk['message_count'] for chunk in self.messages_metadata)
-        
         return {
-            'total_chunks': len(self.messages_metadata),
-            'total_messages': total_messages,
+            'total_chunks': len(self.chunk_store),
+            'total_messages': self.chunk_store.message_count,
             'total_vectors': self.index.ntotal if self.index else 0,
             'embedding_model': self.embedding_model,
             'embedding_dimension': self.embedding_dim,
-            'cache_exists': os.path.exists(self.cache_file),
+            'index_type': vector_index.index_type_of(self.index) if self.index else self.index_type,
+            'cache_exists': self.chunk_store.exists(),
+            'chunk_store_size_mb': self.chunk_store.get_statistics()['size_mb'],
+            'embedding_cache_entries': len(self.embedding_cache),
+            'lexical_terms': len(self.lexical_index.terms),
             'index_size_mb': os.path.getsize(self.index_file) / 1024 / 1024 if os.path.exists(self.index_file) else 0
         }
     
+    def evaluate_index(self, k: int = 10, n_queries: int = 200, queries: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Reporte de recall@k vs latencia del índice actual contra búsqueda exacta
+        (flat inner product) para varios valores de nprobe/efSearch.
+        
+        Args:
+            k: Vecinos a comparar
+            n_queries: Chunks indexados usados como queries si no se pasan `queries`
+            queries: Textos de consulta opcionales (se embeben con cache)
+        """
+        if self.index is None:
+            raise ValueError("Índice no construido. Llama a build_index() primero.")
+        
+        vectors = vector_index.normalize(self._index_vectors())
+        exact_index = faiss.IndexFlatIP(self.embedding_dim)
+        exact_index.add(vectors)
+        
+        if queries:
+            query_vectors = vector_index.normalize(self._get_embeddings_batch(queries))
+        else:
+            rng = np.random.default_rng(0)
+            sample = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+            query_vectors = vectors[sample]
+        
+        report = vector_index.recall_latency_report(self.index, exact_index, query_vectors, k=k)
+        # Dejar el índice con los parámetros configurados
+        vector_index.set_search_params(self.index, **self.index_params)
+        return report
+    
     def extract_romantic_patterns(self) -> Dict:
         """
         Extrae patrones románticos de los mensajes indexados.
         Usa búsqueda semántica para encontrar los más relevantes.
         """
-        patterns = {
-            'apodos': self.search("apodos cariñosos amor bebé mi vida", k=5),
-            'frases_amor': self.search("te amo te quiero te extraño", k=5),
-            'lugares_especiales': self.search("parque playa cine restaurante nuestro lugar", k=5),
-            'momentos_especiales': self.search("primera vez primer beso aniversario recuerdo especial", k=5),
-            'planes_futuro': self.search("futuro juntos siempre casarnos vivir juntos", k=5)
+        pattern_queries = {
+            'apodos': "apodos cariñosos amor bebé mi vida",
+            'frases_amor': "te amo te quiero te extraño",
+            'lugares_especiales': "parque playa cine restaurante nuestro lugar",
+            'momentos_especiales': "primera vez primer beso aniversario recuerdo especial",
+            'planes_futuro': "futuro juntos siempre casarnos vivir juntos"
         }
+        results = self.search_many(list(pattern_queries.values()), k=5)
+        patterns = dict(zip(pattern_queries.keys(), results))
         
         return patterns
 
@@ -0,0 +1,452 @@
+"""
+Session Store - Persistencia de las sesiones del quiz
+Reemplaza el volcado completo de quiz_sessions a JSON en cada cambio:
+
+- SQLiteSessionStore: una fila por sesión en SQLite (modo WAL), con un LRU
+  en memoria delante. Cada escritura es O(1) (sólo la sesión que cambió) y
+  atómica; varios threads (o procesos) pueden escribir a la vez.
+- MemorySessionStore: sólo en memoria (tests / desarrollo).
+
+Las sesiones completadas o abandonadas vencen por TTL. Cada sesión tiene su
+propio lock para serializar lectura-modificación-escritura. get() devuelve
+una copia: los cambios de un request sólo llegan al store con put().
+
+Con varios workers (SESSION_STORE_SHARED=True, ver gunicorn.conf.py) el LRU
+se revalida contra la versión en SQLite y el lock de sesión es además un
+flock entre procesos.
+
+El servidor ASGI (asgi.py) usa async_lock: espera el lock de la sesión en el
+event loop en lugar de bloquear un thread.
+"""
+
+import os
+import re
+import copy
+import json
+import time
+import hashlib
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo locks dentro del proceso
+    fcntl = None
+
+
+class SessionStore:
+    """
+    Interfaz común de los backends.
+
+    Args:
+        ttl_seconds: Vida de una sesión sin actividad (env SESSION_TTL_SECONDS)
+        completed_ttl_seconds: Vida de una sesión completada, que aún sirve
+            para revelar la ubicación (env SESSION_COMPLETED_TTL_SECONDS)
+        purge_interval: Cada cuántos segundos (como mucho) se purgan las vencidas
+    """
+
+    backend = 'base'
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        completed_ttl_seconds: Optional[float] = None,
+        purge_interval: float = 300
+    ):
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None
+            else float(os.getenv('SESSION_TTL_SECONDS', 86400))
+        )
+        self.completed_ttl_seconds = (
+            completed_ttl_seconds if completed_ttl_seconds is not None
+            else float(os.getenv('SESSION_COMPLETED_TTL_SECONDS', 604800))
+        )
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.RLock] = {}
+        self._async_locks: Dict[str, asyncio.Lock] = {}
+        self._last_purge = time.time()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'expired': 0}
+
+    def _expired(self, completed: bool, updated_at: float, now: Optional[float] = None) -> bool:
+        ttl = self.completed_ttl_seconds if completed else self.ttl_seconds
+        return bool(ttl) and (now or time.time()) - updated_at > ttl
+
+    @contextmanager
+    def lock(self, session_id: str) -> Iterator[None]:
+        """Exclusión mutua sobre una sesión (reentrante)."""
+        with self._lock:
+            session_lock = self._session_locks.get(session_id)
+            if session_lock is None:
+                session_lock = self._session_locks[session_id] = threading.RLock()
+        with session_lock:
+            yield
+
+    @asynccontextmanager
+    async def async_lock(self, session_id: str) -> AsyncIterator[None]:
+        """Exclusión mutua sobre una sesión entre corutinas (no reentrante)."""
+        with self._lock:
+            session_lock = self._async_locks.get(session_id)
+            if session_lock is None:
+                session_lock = self._async_locks[session_id] = asyncio.Lock()
+        async with session_lock:
+            yield
+
+    def _forget_locks(self, session_ids):
+        with self._lock:
+            for session_id in session_ids:
+                self._session_locks.pop(session_id, None)
+                self._async_locks.pop(session_id, None)
+
+    def _maybe_purge(self):
+        if time.time() - self._last_purge >= self.purge_interval:
+            self._last_purge = time.time()
+            self.purge_expired()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, session: Dict):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        return bool(session_id) and self.get(session_id) is not None
+
+    def info(self) -> Dict:
+        return {
+            'backend': self.backend,
+            'sessions': self.count(),
+            'ttl_seconds': self.ttl_seconds,
+            'completed_ttl_seconds': self.completed_ttl_seconds,
+            **self.stats
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """Sesiones sólo en memoria (se pierden al reiniciar)."""
+
+    backend = 'memory'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: Dict[str, Dict] = {}
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and self._expired(entry['session'].get('completed', False), entry['updated_at']):
+                del self._sessions[session_id]
+                self.stats['expired'] += 1
+                entry = None
+            self.stats['hits' if entry is not None else 'misses'] += 1
+        return copy.deepcopy(entry['session']) if entry is not None else None
+
+    def put(self, session_id: str, session: Dict):
+        session = copy.deepcopy(session)
+        with self._lock:
+            self._sessions[session_id] = {'session': session, 'updated_at': time.time()}
+            self.stats['writes'] += 1
+        self._maybe_purge()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self._forget_locks([session_id])
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [
+                session_id for session_id, entry in self._sessions.items()
+                if self._expired(entry['session'].get('completed', False), entry['updated_at'], now)
+            ]
+            for session_id in expired:
+                del self._sessions[session_id]
+            self.stats['expired'] += len(expired)
+        self._forget_locks(expired)
+        return len(expired)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Una fila JSON por sesión en SQLite (WAL) con un LRU en memoria delante.
+
+    Args:
+        db_path: Archivo de la base (env SESSION_DB_PATH)
+        cache_size: Sesiones que se mantienen en memoria (env SESSION_CACHE_SIZE)
+        shared: Varios procesos usan la misma base (env SESSION_STORE_SHARED)
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path: str = "cache/quiz_sessions.db", cache_size: Optional[int] = None,
+                 shared: Optional[bool] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_size = cache_size or int(os.getenv('SESSION_CACHE_SIZE', 512))
+        self.shared = shared if shared is not None else os.getenv('SESSION_STORE_SHARED', 'False') == 'True'
+        self.locks_dir = self.db_path.parent / "session_locks"
+        if self.shared:
+            if fcntl is None:
+                print("⚠️ fcntl no disponible: los locks de sesión sólo valen dentro de cada proceso")
+            self.locks_dir.mkdir(exist_ok=True)
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock_files: Dict[str, object] = {}
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 1,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (completed, updated_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Una conexión por thread (sqlite3 no comparte conexiones entre threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def _lock_path(self, session_id: str) -> Path:
+        name = session_id if re.fullmatch(r'[\w-]{1,128}', session_id) else hashlib.sha256(session_id.encode()).hexdigest()
+        return self.locks_dir / f"{name}.lock"
+
+    @contextmanager
+    def lock(self, session_id: str) -> Iterator[None]:
+        """
+        Exclusión mutua sobre una sesión (reentrante). En modo compartido el
+        thread que entra primero toma además un flock sobre el archivo de la
+        sesión, que el sistema libera aunque el worker muera.
+        """
+        with super().lock(session_id):
+            if not self.shared or fcntl is None or session_id in self._lock_files:
+                yield
+                return
+            lock_file = open(self._lock_path(session_id), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_files[session_id] = lock_file
+                yield
+            finally:
+                self._lock_files.pop(session_id, None)
+                lock_file.close()  # Cerrar libera el flock
+
+    @asynccontextmanager
+    async def async_lock(self, session_id: str) -> AsyncIterator[None]:
+        """
+        Como lock para corutinas. El flock entre procesos se pide sin bloquear
+        y se reintenta con asyncio.sleep, así el event loop sigue atendiendo.
+        """
+        async with super().async_lock(session_id):
+            if not self.shared or fcntl is None:
+                yield
+                return
+            lock_file = open(self._lock_path(session_id), 'a')
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        await asyncio.sleep(0.05)
+                yield
+            finally:
+                lock_file.close()
+
+    def _remember(self, session_id: str, entry: Dict):
+        self._cache[session_id] = entry
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _current_version(self, session_id: str) -> Optional[int]:
+        row = self._conn().execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        Sesión leída del LRU o de SQLite. El LRU guarda el JSON persistido (no
+        el dict de un request), así que cada llamada devuelve una copia nueva.
+        """
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                self._cache.move_to_end(session_id)
+        if entry is not None and self.shared and self._current_version(session_id) != entry['version']:
+            entry = None  # Otro worker la modificó (o la borró): releer
+        if entry is None:
+            row = self._conn().execute(
+                "SELECT data, completed, updated_at, version FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self.stats['misses'] += 1
+            if row is None:
+                with self._lock:
+                    self._cache.pop(session_id, None)
+                return None
+            entry = {'data': row[0], 'completed': bool(row[1]), 'updated_at': row[2], 'version': row[3]}
+            with self._lock:
+                # Otro thread pudo cargar la misma versión mientras tanto: quedarse con la que ya está en memoria
+                cached = self._cache.get(session_id)
+                if cached is not None and cached['version'] == entry['version']:
+                    entry = cached
+                self._remember(session_id, entry)
+        else:
+            self.stats['hits'] += 1
+
+        if self._expired(entry['completed'], entry['updated_at']):
+            self.delete(session_id)
+            self.stats['expired'] += 1
+            return None
+        return json.loads(entry['data'])
+
+    def put(self, session_id: str, session: Dict):
+        now = time.time()
+        data = json.dumps(session, ensure_ascii=False, separators=(',', ':'))
+        completed = bool(session.get('completed'))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """
+                INSERT INTO sessions (session_id, data, completed, version, updated_at)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    data = excluded.data,
+                    completed = excluded.completed,
+                    version = sessions.version + 1,
+                    updated_at = excluded.updated_at
+                """,
+                (session_id, data, int(completed), now)
+            )
+            version = self._current_version(session_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            # Sólo lo confirmado entra al LRU (si el COMMIT falla, la sesión en memoria sigue siendo la anterior)
+            self._remember(session_id, {'data': data, 'completed': completed, 'updated_at': now, 'version': version})
+            self.stats['writes'] += 1
+        self._maybe_purge()
+
+    def delete(self, session_id: str):
+        self._conn().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        with self._lock:
+            self._cache.pop(session_id, None)
+        self._forget_locks([session_id])
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        conn = self._conn()
+        expired = [
+            row[0] for row in conn.execute(
+                """
+                SELECT session_id FROM sessions
+                WHERE (completed = 1 AND ? > 0 AND updated_at < ?)
+                   OR (completed = 0 AND ? > 0 AND updated_at < ?)
+                """,
+                (self.completed_ttl_seconds, now - self.completed_ttl_seconds,
+                 self.ttl_seconds, now - self.ttl_seconds)
+            )
+        ]
+        if expired:
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(session_id,) for session_id in expired])
+            with self._lock:
+                for session_id in expired:
+                    self._cache.pop(session_id, None)
+            self._forget_locks(expired)
+            if self.shared:
+                for session_id in expired:
+                    self._lock_path(session_id).unlink(missing_ok=True)
+            self.stats['expired'] += len(expired)
+            print(f"🧹 {len(expired)} sesiones vencidas eliminadas")
+        return len(expired)
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def migrate_json(self, json_path: str) -> int:
+        """
+        Importa el antiguo cache/quiz_sessions.json (una sola vez: luego se
+        renombra a .migrated). Las sesiones que ya existen no se pisan.
+        """
+        path = Path(json_path)
+        if not path.exists():
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                sessions = json.load(f)
+            now = time.time()
+            self._conn().executemany(
+                "INSERT OR IGNORE INTO sessions (session_id, data, completed, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                [
+                    (session_id, json.dumps(session, ensure_ascii=False, separators=(',', ':')),
+                     int(bool(session.get('completed'))), now)
+                    for session_id, session in sessions.items()
+                ]
+            )
+            path.rename(path.with_suffix('.json.migrated'))
+            print(f"📦 {len(sessions)} sesiones migradas desde {path.name}")
+            return len(sessions)
+        except Exception as e:
+            print(f"⚠️ Error migrando sesiones desde {path}: {e}")
+            return 0
+
+    def info(self) -> Dict:
+        return {
+            **super().info(),
+            'db_path': str(self.db_path),
+            'shared': self.shared,
+            'cached': len(self._cache),
+            'cache_size': self.cache_size
+        }
+
+
+# Instancia global
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """
+    Obtiene la instancia singleton del session store según
+    SESSION_STORE_BACKEND (sqlite | memory).
+    """
+    global _session_store
+    if _session_store is None:
+        backend = os.getenv('SESSION_STORE_BACKEND', 'sqlite').lower()
+        if backend == 'memory':
+            _session_store = MemorySessionStore()
+        else:
+            store = SQLiteSessionStore(os.getenv('SESSION_DB_PATH', 'cache/quiz_sessions.db'))
+            store.migrate_json('cache/quiz_sessions.json')
+            _session_store = store
+        print(f"💾 Session store: {_session_store.backend} ({_session_store.count()} sesiones)")
+    return _session_store
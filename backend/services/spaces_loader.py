@@ -161,6 +161,25 @@ class SpacesDataLoader:
             print(f"❌ Error descargando transcripción: {e}")
             return ""
     
+    def fetch_if_modified(self, filename, etag=None, last_modified=None, timeout=30):
+        """
+        GET condicional de un archivo del Space (If-None-Match / If-Modified-Since).
+
+        Returns:
+            (status_code, content_bytes o None, headers): 304 sin contenido si no cambió
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        response = requests.get(f"{self.spaces_url}/{filename}", headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return 304, None, response.headers
+        response.raise_for_status()
+        return response.status_code, response.content, response.headers
+
     def test_connection(self):
         """Prueba la conexión a Spaces"""
         try:
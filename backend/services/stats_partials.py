@@ -0,0 +1,466 @@
+"""
+Stats Partials - Estadísticas como agregados parciales combinables por día
+En vez de recalcular todo el historial cada vez que vence el cache de 24h o
+se pide /api/relationship-stats/regenerate, cada día de la conversación
+guarda un StatsPartial (contadores, histograma de horas, tiempos de
+respuesta, primer/último timestamp...) que se combina con `merge`.
+
+El StatsLedger persiste los parciales en disco y recuerda hasta qué mensaje
+procesó: los mensajes nuevos sólo tocan los días a los que pertenecen, y los
+números del dashboard salen de combinar los parciales en O(días).
+
+Las cuentas que dependen del mensaje anterior (tiempo de respuesta, ráfagas)
+se arrastran entre actualizaciones en `tail` y se asignan al día del mensaje
+que las cierra. Los tiempos de respuesta se guardan como un DDSketch por
+remitente (services/quantile_sketch.py): memoria acotada y combinable, con
+media y p50/p90/p99 por remitente, por mes o de todo el historial.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.conversation_stats import (
+    ConversationColumns, MS_PER_DAY, SEPARATOR, emoji_spans, local_time_ms, romantic_lexicon
+)
+from services.lexicon import Lexicon, tokenize_texts
+from services.quantile_sketch import DDSketch
+
+PARTIALS_VERSION = 2
+
+# Bucket de los mensajes sin timestamp_ms
+UNDATED_BUCKET = 'sin-fecha'
+
+LONG_MESSAGE_CHARS = 200    # Mensaje largo
+LOVE_LETTER_CHARS = 300     # Mensaje largo que cuenta como momento especial
+MAX_RESPONSE_MINUTES = 1440  # Tiempos de respuesta válidos: entre 0 y 24 horas
+BURST_MIN_REPEATS = 3       # Mensajes seguidos del mismo remitente para contar una ráfaga
+
+# Saludos de buenos días / buenas noches (palabras completas, con o sin acentos)
+GREETINGS_LEXICON = Lexicon({
+    'buenos días': 'good_morning',
+    'buen día': 'good_morning',
+    'buenas mañanas': 'good_morning',
+    'buenas noches': 'goodnight',
+    'que descanses': 'goodnight'
+})
+_GOOD_MORNING = GREETINGS_LEXICON.labels.index('good_morning')
+_GOODNIGHT = GREETINGS_LEXICON.labels.index('goodnight')
+
+
+class StatsPartial:
+    """
+    Agregado combinable de un conjunto de mensajes (un día, un mes o todo el
+    historial). Todos los campos se combinan sumando, con min/max o sumando
+    contadores, así que el orden en que se combinan no importa.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.first_ms: Optional[int] = None  # Hora local
+        self.last_ms: Optional[int] = None
+        self.hours: List[int] = [0] * 24
+        self.senders: Dict[str, int] = {}
+        self.keywords: Dict[str, int] = {}   # Mensajes con cada palabra romántica
+        self.emojis: Dict[str, int] = {}
+        self.emoji_messages = 0
+        self.chars = 0
+        self.longest = 0
+        self.long_messages = 0
+        self.love_letters = 0
+        self.good_morning = 0
+        self.goodnight = 0
+        # Minutos hasta cada respuesta (cambio de remitente, de 0 a 24 horas) por quien responde
+        self.response_times: Dict[str, DDSketch] = {}
+        self.bursts = 0
+
+    def merge(self, other: 'StatsPartial') -> 'StatsPartial':
+        """Suma `other` a este parcial (en el lugar) y lo devuelve."""
+        self.messages += other.messages
+        if other.first_ms is not None:
+            self.first_ms = other.first_ms if self.first_ms is None else min(self.first_ms, other.first_ms)
+            self.last_ms = other.last_ms if self.last_ms is None else max(self.last_ms, other.last_ms)
+        self.hours = [a + b for a, b in zip(self.hours, other.hours)]
+        for field in ('senders', 'keywords', 'emojis'):
+            counts = getattr(self, field)
+            for key, value in getattr(other, field).items():
+                counts[key] = counts.get(key, 0) + value
+        for sender, sketch in other.response_times.items():
+            if sender in self.response_times:
+                self.response_times[sender].merge(sketch)
+            else:
+                self.response_times[sender] = DDSketch.from_dict(sketch.to_dict())
+        self.longest = max(self.longest, other.longest)
+        for field in ('emoji_messages', 'chars', 'long_messages', 'love_letters', 'good_morning',
+                      'goodnight', 'bursts'):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def response_sketch(self) -> DDSketch:
+        """Tiempos de respuesta de todos los remitentes en un solo sketch."""
+        merged = DDSketch()
+        for sketch in self.response_times.values():
+            merged.merge(sketch)
+        return merged
+
+    def to_dict(self) -> Dict:
+        data = dict(self.__dict__)
+        data['response_times'] = {sender: sketch.to_dict() for sender, sketch in self.response_times.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'StatsPartial':
+        partial = cls()
+        partial.__dict__.update(data)
+        partial.response_times = {
+            sender: DDSketch.from_dict(sketch) for sender, sketch in data.get('response_times', {}).items()
+        }
+        return partial
+
+
+def merge_partials(partials: Iterable[StatsPartial]) -> StatsPartial:
+    """Un parcial nuevo con la suma de `partials`."""
+    merged = StatsPartial()
+    for partial in partials:
+        merged.merge(partial)
+    return merged
+
+
+def merge_by_month(buckets: Dict[str, StatsPartial]) -> Dict[str, StatsPartial]:
+    """Parciales por día -> parciales por mes ('YYYY-MM'), sin el bucket sin fecha."""
+    months: Dict[str, StatsPartial] = {}
+    for day, partial in sorted(buckets.items()):
+        if day == UNDATED_BUCKET:
+            continue
+        months.setdefault(day[:7], StatsPartial()).merge(partial)
+    return months
+
+
+def day_partials(columns: ConversationColumns, tail: Optional[Dict] = None) -> Tuple[Dict[str, StatsPartial], Dict]:
+    """
+    Parciales por día ('YYYY-MM-DD' en hora local) de columnas en orden
+    cronológico, en una pasada vectorizada.
+
+    Args:
+        columns: Mensajes a agregar
+        tail: Estado del último mensaje ya agregado (timestamp_ms, sender y
+              largo de la ráfaga en curso), para seguir los tiempos de
+              respuesta y las ráfagas a través de actualizaciones
+
+    Returns:
+        (parciales por día, tail actualizado)
+    """
+    tail = dict(tail or {})
+    n = len(columns)
+    if n == 0:
+        return {}, tail
+
+    timestamps = columns.timestamps_ms
+    sender_ids = columns.sender_ids
+    dated = timestamps >= 0
+    local_ms = np.full(n, -1, dtype=np.int64)
+    local_ms[dated] = local_time_ms(timestamps[dated])
+    days = np.where(dated, local_ms // MS_PER_DAY, -1)
+    day_values, bucket_ids = np.unique(days, return_inverse=True)
+    n_buckets = len(day_values)
+    hours = (local_ms // 3_600_000) % 24
+
+    def per_bucket(mask: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.bincount(bucket_ids[mask], weights=None if weights is None else weights[mask], minlength=n_buckets)
+
+    everything = np.ones(n, dtype=bool)
+    messages = per_bucket(everything)
+    hour_counts = np.bincount(bucket_ids[dated] * 24 + hours[dated], minlength=n_buckets * 24).reshape(n_buckets, 24)
+    n_senders = len(columns.senders)
+    sender_counts = np.bincount(bucket_ids * n_senders + sender_ids, minlength=n_buckets * n_senders)
+    sender_counts = sender_counts.reshape(n_buckets, n_senders)
+
+    lengths = np.fromiter(map(len, columns.contents), dtype=np.int64, count=n)
+    chars = per_bucket(everything, lengths)
+    long_messages = per_bucket(lengths > LONG_MESSAGE_CHARS)
+    love_letters = per_bucket(lengths > LOVE_LETTER_CHARS)
+
+    tokens = tokenize_texts(columns.contents)
+    romantic_hits = romantic_lexicon.message_hits(columns.contents, tokens)
+    greetings = GREETINGS_LEXICON.message_hits(columns.contents, tokens)
+    good_morning = per_bucket(greetings[:, _GOOD_MORNING] & dated & (hours < 12))
+    goodnight = per_bucket(greetings[:, _GOODNIGHT] & dated & (hours > 20))
+
+    # Mínimos, máximos y sumas por bucket con reduceat sobre los mensajes agrupados por día
+    order = np.argsort(bucket_ids, kind='stable')
+    group_starts = np.searchsorted(bucket_ids[order], np.arange(n_buckets))
+    first_ms = np.minimum.reduceat(local_ms[order], group_starts)
+    last_ms = np.maximum.reduceat(local_ms[order], group_starts)
+    longest = np.maximum.reduceat(lengths[order], group_starts)
+    keyword_hits = np.add.reduceat(romantic_hits[order].astype(np.int64), group_starts, axis=0)
+
+    # Emojis sobre el texto unido; cada secuencia se asigna a su mensaje por offset
+    text = SEPARATOR.join(columns.contents)
+    starts, ends = emoji_spans(text)
+    message_starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(lengths[:-1] + len(SEPARATOR), out=message_starts[1:])
+    emoji_owner = np.searchsorted(message_starts, starts, side='right') - 1
+    emoji_messages = np.bincount(bucket_ids[np.unique(emoji_owner)], minlength=n_buckets)
+    emoji_counts: List[Counter] = [Counter() for _ in range(n_buckets)]
+    for owner, start, end in zip(emoji_owner.tolist(), starts.tolist(), ends.tolist()):
+        emoji_counts[bucket_ids[owner]][text[start:end]] += 1
+
+    # Mensaje anterior de cada mensaje (el primero viene del tail)
+    previous_ids = np.empty(n, dtype=np.int64)
+    previous_ids[1:] = sender_ids[:-1]
+    previous_sender = tail.get('sender')
+    previous_ids[0] = columns.senders.index(previous_sender) if previous_sender in columns.senders else -1
+    previous_ts = np.empty(n, dtype=np.int64)
+    previous_ts[1:] = timestamps[:-1]
+    previous_ts[0] = tail.get('timestamp_ms', -1)
+
+    changed = sender_ids != previous_ids
+    minutes = (timestamps - previous_ts) / 60_000
+    responses = changed & dated & (previous_ts >= 0) & (minutes >= 0) & (minutes <= MAX_RESPONSE_MINUTES)
+    # Un sketch por (día, remitente que responde): se agrupan las respuestas y se agregan de a grupo
+    response_groups = bucket_ids[responses] * n_senders + sender_ids[responses]
+    response_order = np.argsort(response_groups, kind='stable')
+    response_groups = response_groups[response_order]
+    response_values = minutes[responses][response_order]
+    group_bounds = np.flatnonzero(np.diff(response_groups)) + 1
+    response_sketches: List[Dict[str, DDSketch]] = [{} for _ in range(n_buckets)]
+    for start, values in zip(np.concatenate(([0], group_bounds)).tolist(), np.split(response_values, group_bounds)):
+        if not len(values):
+            continue
+        group = int(response_groups[start])
+        sketch = DDSketch()
+        sketch.add_many(values)
+        response_sketches[group // n_senders][columns.senders[group % n_senders]] = sketch
+
+    # Ráfagas: al cambiar de remitente se cierra la racha de mensajes del anterior
+    change_at = np.flatnonzero(changed)
+    run_lengths = np.diff(change_at, prepend=-1) - 1
+    if len(change_at):
+        run_lengths[0] = tail.get('burst', 0) + change_at[0]
+        tail['burst'] = int(n - 1 - change_at[-1])
+    else:
+        tail['burst'] = int(tail.get('burst', 0) + n)
+    bursts = np.bincount(bucket_ids[change_at[run_lengths >= BURST_MIN_REPEATS]], minlength=n_buckets)
+
+    if dated[-1]:
+        tail['timestamp_ms'] = int(timestamps[-1])
+    tail['sender'] = columns.senders[int(sender_ids[-1])]
+
+    labels = romantic_lexicon.labels
+    buckets: Dict[str, StatsPartial] = {}
+    for b, day in enumerate(day_values.tolist()):
+        partial = StatsPartial()
+        partial.messages = int(messages[b])
+        if day >= 0:
+            partial.first_ms, partial.last_ms = int(first_ms[b]), int(last_ms[b])
+        partial.hours = hour_counts[b].tolist()
+        partial.senders = {
+            sender: int(count) for sender, count in zip(columns.senders, sender_counts[b].tolist()) if count
+        }
+        partial.keywords = {label: count for label, count in zip(labels, keyword_hits[b].tolist()) if count}
+        partial.emojis = dict(emoji_counts[b])
+        partial.emoji_messages = int(emoji_messages[b])
+        partial.chars = int(chars[b])
+        partial.longest = int(longest[b])
+        partial.long_messages = int(long_messages[b])
+        partial.love_letters = int(love_letters[b])
+        partial.good_morning = int(good_morning[b])
+        partial.goodnight = int(goodnight[b])
+        partial.response_times = response_sketches[b]
+        partial.bursts = int(bursts[b])
+        buckets[UNDATED_BUCKET if day < 0 else str(np.datetime64(day, 'D'))] = partial
+    return buckets, tail
+
+
+def conversation_stats(buckets: Dict[str, StatsPartial], top_emojis: int = 5) -> Optional[Dict]:
+    """
+    Estadísticas de toda la conversación combinando los parciales por día.
+
+    Returns:
+        Dict con total_messages, first_ms/last_ms (hora local), total_days,
+        hour_histogram (24), monthly_counts {'YYYY-MM': n}, sender_counts,
+        keyword_hits (mensajes por palabra romántica), romantic_keywords,
+        emoji_counts (top), total_chars y longest_message; None si ningún
+        mensaje tiene timestamp.
+    """
+    totals = merge_partials(buckets.values())
+    if totals.first_ms is None:
+        return None
+    keyword_hits = {label: totals.keywords.get(label, 0) for label in romantic_lexicon.labels}
+    return {
+        'total_messages': totals.messages,
+        'first_ms': totals.first_ms,
+        'last_ms': totals.last_ms,
+        'total_days': (totals.last_ms - totals.first_ms) // MS_PER_DAY + 1,
+        'hour_histogram': totals.hours,
+        'monthly_counts': {month: partial.messages for month, partial in merge_by_month(buckets).items()},
+        'sender_counts': totals.senders,
+        'keyword_hits': keyword_hits,
+        'romantic_keywords': sum(keyword_hits.values()),
+        'emoji_counts': dict(Counter(totals.emojis).most_common(top_emojis)),
+        'total_chars': totals.chars,
+        'longest_message': totals.longest
+    }
+
+
+def _prefix_digest(timestamps: np.ndarray, sender_ids: np.ndarray, senders: List[str], count: int) -> str:
+    """Huella de los primeros `count` mensajes (timestamps y remitentes)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(timestamps[:count], dtype=np.int64).tobytes())
+    ids = np.ascontiguousarray(sender_ids[:count], dtype=np.int16)
+    digest.update(ids.tobytes())
+    used_senders = senders[:int(ids.max()) + 1] if count else []
+    digest.update(json.dumps(used_senders, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class StatsLedger:
+    """
+    Parciales por día de una conversación, persistidos en
+    <cache_dir>/stats_partials_<name>.json y actualizados sólo con los
+    mensajes nuevos.
+
+    La conversación se trata como append-only: si los mensajes ya agregados
+    cambian (la huella de ese prefijo no coincide, p.ej. porque se importó
+    un mensaje más viejo que el último) los parciales se reconstruyen desde
+    cero. Calcular la huella lee los timestamps del prefijo, que es mucho más
+    barato que volver a agregar el contenido.
+    """
+
+    def __init__(self, cache_dir: str = "./cache", name: str = "local"):
+        self.path = Path(cache_dir) / f"stats_partials_{name}.json"
+        self.buckets: Dict[str, StatsPartial] = {}
+        self.count = 0
+        self.digest: Optional[str] = None
+        self.tail: Dict = {}
+        self.updated_at: Optional[str] = None
+        self._loaded_mtime_ns: Optional[int] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _reset(self):
+        self.buckets, self.count, self.digest, self.tail = {}, 0, None, {}
+
+    def _load(self):
+        """Lee los parciales del disco (si otro proceso los actualizó, se recargan)."""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._loaded_mtime_ns:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != PARTIALS_VERSION:
+                print(f"📊 Parciales con versión {data.get('version')}: se reconstruyen")
+                self._reset()
+                return
+            self.buckets = {key: StatsPartial.from_dict(value) for key, value in data['buckets'].items()}
+            self.count = data['count']
+            self.digest = data['digest']
+            self.tail = data.get('tail', {})
+            self.updated_at = data.get('updated_at')
+            self._loaded_mtime_ns = mtime_ns
+        except Exception as e:
+            print(f"⚠️ Error leyendo parciales de estadísticas: {e}")
+            self._reset()
+
+    def _save(self):
+        """Escribe a un temporal y renombra, para que ningún lector vea el archivo a medias."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.updated_at = datetime.now().isoformat()
+        data = {
+            'version': PARTIALS_VERSION,
+            'count': self.count,
+            'digest': self.digest,
+            'tail': self.tail,
+            'updated_at': self.updated_at,
+            'buckets': {key: partial.to_dict() for key, partial in sorted(self.buckets.items())}
+        }
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self._loaded_mtime_ns = self.path.stat().st_mtime_ns
+
+    def update_from_store(self, store) -> int:
+        """Agrega los mensajes del MessageStore que todavía no están en los parciales."""
+        return self._update(
+            store.timestamps, store.sender_ids, store.senders,
+            lambda start: ConversationColumns.from_store(store, start)
+        )
+
+    def update_from_columns(self, columns: ConversationColumns) -> int:
+        """Agrega los mensajes de `columns` (p.ej. los de Spaces) que todavía no están en los parciales."""
+        columns = columns.chronological()
+        return self._update(columns.timestamps_ms, columns.sender_ids, columns.senders, columns.slice)
+
+    def _update(self, timestamps, sender_ids, senders: List[str], load_columns) -> int:
+        """
+        Returns:
+            Cantidad de mensajes nuevos agregados
+        """
+        with self._lock:
+            self._load()
+            total = len(timestamps)
+            if self.count and (self.count > total or
+                               _prefix_digest(timestamps, sender_ids, senders, self.count) != self.digest):
+                print("📊 Los mensajes ya agregados cambiaron: reconstruyendo parciales de estadísticas")
+                self._reset()
+            if self.count == total and self.digest is not None:
+                return 0
+
+            new_columns = load_columns(self.count)
+            buckets, self.tail = day_partials(new_columns, self.tail)
+            for key, partial in buckets.items():
+                if key in self.buckets:
+                    self.buckets[key].merge(partial)
+                else:
+                    self.buckets[key] = partial
+            self.count = total
+            self.digest = _prefix_digest(timestamps, sender_ids, senders, total)
+            self._save()
+            print(f"📊 Parciales de estadísticas: {len(new_columns):,} mensajes nuevos en {len(buckets)} días")
+            return len(new_columns)
+
+    def totals(self) -> StatsPartial:
+        """Toda la conversación combinando los parciales por día."""
+        return merge_partials(self.buckets.values())
+
+    def conversation_stats(self, top_emojis: int = 5) -> Optional[Dict]:
+        return conversation_stats(self.buckets, top_emojis)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self._loaded_mtime_ns = None
+            if self.path.exists():
+                self.path.unlink()
+
+    def info(self) -> Dict:
+        return {
+            'path': str(self.path),
+            'messages': self.count,
+            'buckets': len(self.buckets),
+            'updated_at': self.updated_at
+        }
+
+
+# Un ledger por fuente de mensajes ('local' = message store, 'spaces' = DigitalOcean Spaces)
+_ledgers: Dict[str, StatsLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_stats_ledger(name: str = "local", cache_dir: str = "./cache") -> StatsLedger:
+    """Obtiene el ledger singleton de una fuente de mensajes."""
+    with _ledgers_lock:
+        if name not in _ledgers:
+            _ledgers[name] = StatsLedger(cache_dir, name)
+        return _ledgers[name]
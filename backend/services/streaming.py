@@ -0,0 +1,188 @@
+"""
+Streaming - Utilidades para respuestas en streaming (SSE / NDJSON)
+Los endpoints del quiz producen una secuencia de eventos:
+
+    {"type": "start", ...}                       metadatos iniciales (opcional)
+    {"type": "delta", "field": "message", "text": "..."}   fragmentos de texto
+    {"type": "final", "status": 200, "data": {...}}        el JSON de siempre
+
+Con SSE cada evento sale como `event: <type>` + `data: <json>`; con NDJSON
+como una línea JSON. Sin streaming sólo se usa el evento final.
+
+El servidor ASGI (asgi.py) usa las variantes async: arelay_text,
+afinal_event y StreamResult.
+"""
+
+import json
+from typing import Dict, Iterator, Generator, AsyncIterator, Optional, Any
+
+STREAM_MIMETYPES = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def stream_mode(query_value: Optional[str], accept_header: Optional[str]) -> Optional[str]:
+    """
+    Modo de streaming pedido por el cliente: ?stream=sse|ndjson|1 o por el
+    header Accept. None si se espera el JSON completo.
+    """
+    value = (query_value or '').strip().lower()
+    if value in STREAM_MIMETYPES:
+        return value
+    if value in ('1', 'true', 'yes'):
+        return 'sse'
+    accept = (accept_header or '').lower()
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+
+def delta(text: str, field: str = 'message') -> Dict:
+    return {'type': 'delta', 'field': field, 'text': text}
+
+
+def final(data: Dict, status: int = 200) -> Dict:
+    return {'type': 'final', 'status': status, 'data': data}
+
+
+def format_event(event: Dict, mode: str) -> str:
+    payload = json.dumps(event, ensure_ascii=False)
+    if mode == 'sse':
+        return f"event: {event.get('type', 'message')}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def relay_text(generator: Generator[str, None, Any], field: str = 'message') -> Generator[Dict, None, Any]:
+    """
+    Reemite cada fragmento de texto de `generator` como evento delta y
+    devuelve su valor de retorno (para usar con `yield from`).
+    """
+    while True:
+        try:
+            text = next(generator)
+        except StopIteration as stop:
+            return stop.value
+        if text:
+            yield delta(text, field)
+
+
+class StreamResult:
+    """
+    Valor final de un stream async: un async generator no puede hacer
+    `return valor` (lo que relay_text devuelve con `yield from`), así que lo
+    deja en `value`.
+    """
+
+    def __init__(self):
+        self.value: Any = None
+
+
+async def arelay_text(chunks: AsyncIterator[str], field: str = 'message') -> AsyncIterator[Dict]:
+    """Como relay_text para un async generator de texto (su valor final queda en su StreamResult)."""
+    async for text in chunks:
+        if text:
+            yield delta(text, field)
+
+
+def final_event(events: Iterator[Dict]) -> Dict:
+    """Consume los eventos y devuelve el final (modo sin streaming)."""
+    result = None
+    for event in events:
+        if event['type'] == 'final':
+            result = event
+    if result is None:
+        raise RuntimeError("El flujo de eventos terminó sin evento final")
+    return result
+
+
+async def afinal_event(events: AsyncIterator[Dict]) -> Dict:
+    """Como final_event para un async generator de eventos."""
+    result = None
+    async for event in events:
+        if event['type'] == 'final':
+            result = event
+    if result is None:
+        raise RuntimeError("El flujo de eventos terminó sin evento final")
+    return result
+
+
+class JsonStringFieldStreamer:
+    """
+    Extrae de forma incremental el valor string de un campo de un objeto JSON
+    que llega en fragmentos (p.ej. "question" en la salida json_object de
+    OpenAI), para mostrarlo mientras se genera.
+    """
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field: str):
+        self.key = f'"{field}"'
+        self.buffer = ''
+        self.position: Optional[int] = None  # Siguiente carácter del valor por decodificar
+        self.done = False
+
+    def _find_value_start(self) -> Optional[int]:
+        start = self.buffer.find(self.key)
+        while start != -1:
+            i = start + len(self.key)
+            while i < len(self.buffer) and self.buffer[i] in ' \t\r\n':
+                i += 1
+            if i >= len(self.buffer):
+                return None
+            if self.buffer[i] == ':':
+                i += 1
+                while i < len(self.buffer) and self.buffer[i] in ' \t\r\n':
+                    i += 1
+                if i >= len(self.buffer):
+                    return None
+                return i + 1 if self.buffer[i] == '"' else None
+            start = self.buffer.find(self.key, start + 1)
+        return None
+
+    def feed(self, chunk: str) -> str:
+        """Agrega un fragmento y devuelve el texto nuevo del valor (ya decodificado)."""
+        if self.done:
+            return ''
+        self.buffer += chunk
+        if self.position is None:
+            self.position = self._find_value_start()
+            if self.position is None:
+                return ''
+
+        out = []
+        i = self.position
+        while i < len(self.buffer):
+            ch = self.buffer[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch == '\\':
+                if i + 1 >= len(self.buffer):
+                    break  # Escape incompleto: esperar el siguiente fragmento
+                code = self.buffer[i + 1]
+                if code == 'u':
+                    if i + 6 > len(self.buffer):
+                        break
+                    codepoint = int(self.buffer[i + 2:i + 6], 16)
+                    if 0xD800 <= codepoint < 0xDC00:
+                        # Par sustituto (emojis): esperar la segunda mitad
+                        if i + 12 > len(self.buffer):
+                            break
+                        low = int(self.buffer[i + 8:i + 12], 16)
+                        out.append(chr(0x10000 + ((codepoint - 0xD800) << 10) + (low - 0xDC00)))
+                        i += 12
+                        continue
+                    out.append(chr(codepoint))
+                    i += 6
+                    continue
+                out.append(self._ESCAPES.get(code, code))
+                i += 2
+                continue
+            out.append(ch)
+            i += 1
+        self.position = i
+        return ''.join(out)
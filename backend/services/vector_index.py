@@ -0,0 +1,287 @@
+"""
+Vector Index - Fábrica de índices FAISS configurables para el RAG
+Soporta Flat (L2 / producto interno sobre vectores normalizados), IVF-Flat,
+IVF-PQ y HNSW, con entrenamiento al construir, parámetros de búsqueda
+ajustables (nprobe / efSearch) y un reporte de recall vs latencia contra el
+índice exacto. Las búsquedas con filtro usan un IDSelector para que FAISS
+sólo puntúe los vectores elegibles.
+"""
+
+import os
+import time
+import math
+import numpy as np
+import faiss
+from typing import List, Dict, Optional
+
+INDEX_TYPES = ('flat_l2', 'flat_ip', 'ivf_flat', 'ivf_pq', 'hnsw')
+DEFAULT_INDEX_TYPE = 'flat_ip'
+
+# FAISS recomienda ~39 puntos de entrenamiento por centroide
+MIN_POINTS_PER_CENTROID = 39
+
+# Con filtros que dejan pocos candidatos se puntúan directamente (exacto y de costo acotado)
+FILTER_EXACT_MAX = int(os.getenv('RAG_FILTER_EXACT_MAX', 4096))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Copia float32 con normas L2 unitarias (producto interno == coseno)."""
+    vectors = np.array(vectors, dtype=np.float32, copy=True).reshape(-1, vectors.shape[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Identifica el tipo de un índice ya construido (p.ej. leído desde disco)."""
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivf_flat'
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return 'flat_ip'
+    return 'flat_l2'
+
+
+def create_index(index_type: str, dim: int, n_vectors: int, params: Optional[Dict] = None) -> faiss.Index:
+    """
+    Crea un índice vacío (sin entrenar) del tipo pedido.
+
+    Args:
+        index_type: Uno de INDEX_TYPES
+        dim: Dimensión de los vectores
+        n_vectors: Vectores que se van a indexar (dimensiona nlist)
+        params: nlist, pq_m, pq_nbits, hnsw_m, ef_construction
+
+    Si no hay suficientes vectores para entrenar IVF/PQ se usa flat_ip.
+    """
+    params = params or {}
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconocido: {index_type}. Opciones: {', '.join(INDEX_TYPES)}")
+
+    if index_type == 'flat_l2':
+        return faiss.IndexFlatL2(dim)
+    if index_type == 'flat_ip':
+        return faiss.IndexFlatIP(dim)
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, int(params.get('hnsw_m', 32)), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = int(params.get('ef_construction', 200))
+        return index
+
+    nlist = int(params.get('nlist') or max(1, int(4 * math.sqrt(max(n_vectors, 1)))))
+    nlist = min(nlist, max(1, n_vectors // MIN_POINTS_PER_CENTROID))
+    # Bits por subcuantizador: 8 por defecto, menos si no hay datos para entrenar 256 centroides
+    pq_nbits = int(params.get('pq_nbits') or min(8, int(math.log2(max(n_vectors // MIN_POINTS_PER_CENTROID, 1)))))
+    if n_vectors < MIN_POINTS_PER_CENTROID or (index_type == 'ivf_pq' and pq_nbits < 4):
+        print(f"⚠️ {n_vectors} vectores no alcanzan para entrenar {index_type}, usando flat_ip")
+        return faiss.IndexFlatIP(dim)
+
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == 'ivf_flat':
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+
+    pq_m = int(params.get('pq_m', 64))
+    if dim % pq_m != 0:
+        raise ValueError(f"pq_m={pq_m} debe dividir la dimensión {dim}")
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+
+
+def build_index(index_type: str, vectors: np.ndarray, params: Optional[Dict] = None) -> faiss.Index:
+    """Crea, entrena (si hace falta) y llena un índice con `vectors`."""
+    dim = vectors.shape[1]
+    index = create_index(index_type, dim, len(vectors), params)
+    # Siempre normalizados: con L2 y producto interno el ranking es el del coseno
+    vectors = normalize(vectors)
+    if not index.is_trained:
+        print(f"🎓 Entrenando índice {index_type_of(index)} con {len(vectors)} vectores...")
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    set_search_params(index, **(params or {}))
+    enable_reconstruct(index)
+    return index
+
+
+def enable_reconstruct(index: faiss.Index):
+    """Los IVF necesitan un direct map para reconstruir vectores por id (búsqueda filtrada exacta)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+# Lectura memory-mapped de los vectores (faiss >= 1.8); con versiones anteriores sólo aplica a IVF
+MMAP_READ_FLAG = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+
+
+def read_index_mmap(path: str) -> faiss.Index:
+    """
+    Lee un índice sin copiar sus vectores a memoria del proceso: quedan
+    mapeados desde el archivo y varios procesos comparten las mismas páginas
+    (page cache). El índice resultante es de sólo lectura (no admite add).
+    """
+    return faiss.read_index(path, MMAP_READ_FLAG)
+
+
+def write_index_atomic(index: faiss.Index, path: str):
+    """
+    Escribe el índice en un temporal y lo reemplaza de forma atómica: los
+    procesos que tienen mapeado el archivo anterior siguen leyéndolo intacto
+    (reescribirlo en el lugar les provocaría SIGBUS).
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None, **_):
+    """Ajusta los parámetros de búsqueda (ignora los que no aplican al índice)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(int(nprobe), ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = int(ef_search)
+
+
+def search_params_from_env() -> Dict:
+    """Parámetros del índice configurables por variables de entorno."""
+    params = {
+        'nprobe': int(os.getenv('RAG_INDEX_NPROBE', 16)),
+        'ef_search': int(os.getenv('RAG_INDEX_EF_SEARCH', 64))
+    }
+    for key, env in (('nlist', 'RAG_INDEX_NLIST'), ('pq_m', 'RAG_INDEX_PQ_M'), ('hnsw_m', 'RAG_INDEX_HNSW_M')):
+        if os.getenv(env):
+            params[key] = int(os.getenv(env))
+    return params
+
+
+def to_l2_distances(index: faiss.Index, scores: np.ndarray) -> np.ndarray:
+    """
+    Convierte los scores del índice a distancia L2 al cuadrado entre vectores
+    unitarios (2 - 2·coseno), para que similarity_score signifique lo mismo
+    (menor = más parecido) sea cual sea la métrica del índice.
+    """
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return 2.0 - 2.0 * scores
+    return scores
+
+
+def _exact_subset_search(index: faiss.Index, queries: np.ndarray, k: int, ids: np.ndarray):
+    """Puntúa exactamente sólo los vectores `ids` (reconstruidos desde el índice)."""
+    vectors = index.reconstruct_batch(ids.astype(np.int64))
+    scores = queries @ vectors.T  # (nq, elegibles)
+    top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    # Vectores unitarios: distancia L2 al cuadrado = 2 - 2·coseno
+    return 2.0 - 2.0 * np.take_along_axis(scores, top, axis=1), ids[top]
+
+
+def filtered_search(
+    index: faiss.Index,
+    queries: np.ndarray,
+    k: int,
+    mask: np.ndarray,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    exact_max: Optional[int] = None,
+    **_
+):
+    """
+    Búsqueda (de una o varias queries) restringida a los ids con mask[id] == True.
+
+    - Flat: IDSelector sobre el índice completo (exacto).
+    - IVF/HNSW con pocos elegibles (<= exact_max): puntuación exacta del subconjunto.
+    - IVF/HNSW en general: IDSelector con nprobe/efSearch escalados por la
+      selectividad del filtro; si aun así faltan resultados se agranda el
+      over-fetch y, como último recurso, se puntúa el subconjunto.
+
+    Returns:
+        (distancias L2 entre vectores unitarios, ids), matrices (nq, min(k, elegibles))
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, index.d)
+    eligible = np.flatnonzero(mask)
+    k = min(k, len(eligible))
+    if k == 0:
+        return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+
+    exact_max = FILTER_EXACT_MAX if exact_max is None else exact_max
+    approximate = not isinstance(index, faiss.IndexFlat)
+    if approximate and len(eligible) <= exact_max:
+        return _exact_subset_search(index, queries, k, eligible)
+
+    packed = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+    selector = faiss.IDSelectorBitmap(len(packed), faiss.swig_ptr(packed))
+    selectivity = len(eligible) / max(index.ntotal, 1)
+    ivf = faiss.try_extract_index_ivf(index)
+    boost = 1.0 / selectivity
+
+    while True:
+        if ivf is not None:
+            probes = min(ivf.nlist, math.ceil((nprobe or ivf.nprobe) * boost))
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=probes)
+            exhausted = probes >= ivf.nlist
+        elif isinstance(index, faiss.IndexHNSW):
+            ef = min(index.ntotal, math.ceil(max(ef_search or index.hnsw.efSearch, k) * boost))
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef)
+            exhausted = ef >= index.ntotal
+        else:
+            params = faiss.SearchParameters(sel=selector)
+            exhausted = True
+
+        distances, ids = index.search(queries, k, params=params)
+        if not approximate or np.all(ids >= 0):
+            return to_l2_distances(index, distances), ids
+        if exhausted:
+            break
+        boost *= 4
+
+    # El grafo/las listas no alcanzaron k elegibles: puntuar el subconjunto
+    return _exact_subset_search(index, queries, k, eligible)
+
+
+def recall_latency_report(
+    index: faiss.Index,
+    exact_index: faiss.Index,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobe_values: Optional[List[int]] = None,
+    ef_search_values: Optional[List[int]] = None
+) -> List[Dict]:
+    """
+    Mide recall@k y latencia por query del índice aproximado contra el exacto
+    para cada valor de nprobe (IVF) o efSearch (HNSW).
+
+    Returns:
+        Lista de dicts {param, value, recall_at_k, latency_ms_p50, latency_ms_p95}
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    _, exact_ids = exact_index.search(queries, k)
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        param = 'nprobe'
+        values = nprobe_values or [1, 4, 8, 16, 32, 64]
+    elif isinstance(index, faiss.IndexHNSW):
+        param = 'ef_search'
+        values = ef_search_values or [16, 32, 64, 128, 256]
+    else:
+        param, values = None, [None]
+
+    report = []
+    for value in values:
+        if param:
+            set_search_params(index, **{param: value})
+        latencies = []
+        hits = 0
+        for i in range(len(queries)):
+            start = time.perf_counter()
+            _, ids = index.search(queries[i:i + 1], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(ids[0].tolist()) & set(exact_ids[i].tolist()) - {-1})
+        report.append({
+            'index_type': index_type_of(index),
+            'param': param,
+            'value': value,
+            'recall_at_k': round(hits / (len(queries) * k), 4) if len(queries) else 0.0,
+            'latency_ms_p50': round(float(np.percentile(latencies, 50)), 4) if latencies else 0.0,
+            'latency_ms_p95': round(float(np.percentile(latencies, 95)), 4) if latencies else 0.0
+        })
+    return report
@@ -15,6 +15,80 @@ interface Message {
   enableStreaming?: boolean;
 }
 
+type QuizData = Record<string, any>;
+
+interface QuizFinal {
+  status: number;
+  data: QuizData;
+}
+
+// Error de un endpoint del quiz; status null = sin respuesta completa (red caída o stream cortado)
+class QuizRequestError extends Error {
+  constructor(public status: number | null, public data?: QuizData) {
+    super(status === null ? 'Sin respuesta del servidor' : `HTTP ${status}`);
+  }
+}
+
+/**
+ * POST a un endpoint del quiz pidiendo la respuesta en streaming (NDJSON):
+ * cada delta del mensaje llega a onDelta en cuanto se genera y se devuelve
+ * el JSON del evento final. Si el backend responde JSON (p.ej. un 400 o el
+ * 503 del RAG antes de empezar el stream) se usa tal cual.
+ */
+async function postQuiz(
+  path: string,
+  body: QuizData,
+  onDelta: (text: string) => void,
+  headers: Record<string, string> = {}
+): Promise<QuizData> {
+  let response: Response;
+  try {
+    response = await fetch(`${API_URL}${path}?stream=ndjson`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', Accept: 'application/x-ndjson', ...headers },
+      body: JSON.stringify(body),
+    });
+  } catch {
+    throw new QuizRequestError(null);
+  }
+
+  let result: QuizFinal | null = null;
+  if (response.body && (response.headers.get('Content-Type') || '').includes('application/x-ndjson')) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    const handleLine = (line: string): QuizFinal | null => {
+      if (!line.trim()) return null;
+      const event = JSON.parse(line);
+      if (event.type === 'delta' && event.field === 'message') onDelta(event.text);
+      return event.type === 'final' ? { status: event.status, data: event.data } : null;
+    };
+    for (;;) {
+      let chunk: ReadableStreamReadResult<Uint8Array>;
+      try {
+        chunk = await reader.read();
+      } catch {
+        throw new QuizRequestError(null);
+      }
+      if (chunk.done) break;
+      buffer += decoder.decode(chunk.value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() ?? '';
+      for (const line of lines) result = handleLine(line) ?? result;
+    }
+    result = handleLine(buffer + decoder.decode()) ?? result;
+  } else {
+    // Respuesta sin cuerpo JSON (p.ej. un 502 del proxy): cuenta igual como respuesta del servidor
+    result = { status: response.status, data: await response.json().catch(() => ({})) };
+  }
+
+  // Stream cortado antes del evento final: como si no hubiera llegado respuesta
+  if (!result) throw new QuizRequestError(null);
+  const { status, data } = result;
+  if (status >= 400) throw new QuizRequestError(status, data);
+  return data;
+}
+
 interface QuizState {
   sessionId: string | null;
   currentQuestion: number;
@@ -45,6 +119,11 @@ export default function ChatContainer() {
   const [isLoading, setIsLoading] = useState(false);
   const [waitingForStart, setWaitingForStart] = useState(true);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // Respuesta pendiente de confirmar: reenviarla (doble envío o reintento) reutiliza su Idempotency-Key
+  const pendingAnswerRef = useRef<{ sessionId: string | null; question: number; content: string; key: string } | null>(null);
+  // El mensaje del bot que se está recibiendo en streaming ya está en la lista
+  const replyStartedRef = useRef(false);
+  const [streamingReply, setStreamingReply] = useState(false);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -54,14 +133,44 @@ export default function ChatContainer() {
     scrollToBottom();
   }, [messages]);
 
+  // Agrega un delta al mensaje del bot en curso (lo crea con el primer delta)
+  const appendReply = (text: string) => {
+    if (!replyStartedRef.current) {
+      replyStartedRef.current = true;
+      setStreamingReply(true);
+      setMessages((prev) => [...prev, { role: 'bot', content: text, timestamp: new Date() }]);
+      return;
+    }
+    setMessages((prev) => {
+      const last = prev[prev.length - 1];
+      return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+    });
+  };
+
+  // Deja el mensaje final: reemplaza el recibido en streaming o, si no hubo deltas (respuesta JSON), lo agrega
+  const finishReply = (content: string) => {
+    if (replyStartedRef.current) {
+      setMessages((prev) => [...prev.slice(0, -1), { ...prev[prev.length - 1], content }]);
+    } else {
+      setMessages((prev) => [...prev, { role: 'bot', content, timestamp: new Date(), enableStreaming: true }]);
+    }
+    replyStartedRef.current = false;
+    setStreamingReply(false);
+  };
+
+  // Quita un mensaje recibido a medias (error o reintento)
+  const discardReply = () => {
+    if (replyStartedRef.current) setMessages((prev) => prev.slice(0, -1));
+    replyStartedRef.current = false;
+    setStreamingReply(false);
+  };
+
   const startQuiz = async () => {
     setIsLoading(true);
     try {
-      const response = await axios.post(`${API_URL}/api/start-quiz`, {
-        user_name: 'Karem',
-      });
+      const data = await postQuiz('/api/start-quiz', { user_name: 'Karem' }, appendReply);
 
-      const { session_id, question, options, current_question, total_questions, attempts_left } = response.data;
+      const { session_id, message, question, options, current_question, total_questions, attempts_left } = data;
 
       setQuizState({
         sessionId: session_id,
@@ -73,19 +182,17 @@ export default function ChatContainer() {
         attemptsLeft: attempts_left || 3,
       });
 
-      setMessages((prev) => [
-        ...prev,
-        {
-          role: 'bot',
-          content: `¡Perfecto! Tengo ${total_questions} preguntas especiales para ti. ✨\n\nPregunta ${current_question}/${total_questions}:\n${question}`,
-          timestamp: new Date(),
-          enableStreaming: true,
-        },
-      ]);
+      // En streaming ya se mostró el mensaje del backend (saludo + pregunta)
+      finishReply(
+        replyStartedRef.current
+          ? message
+          : `¡Perfecto! Tengo ${total_questions} preguntas especiales para ti. ✨\n\nPregunta ${current_question}/${total_questions}:\n${question}`
+      );
 
       setWaitingForStart(false);
     } catch (error) {
       console.error('Error starting quiz:', error);
+      discardReply();
       setMessages((prev) => [
         ...prev,
         {
@@ -100,6 +207,27 @@ export default function ChatContainer() {
     }
   };
 
+  const newIdempotencyKey = () =>
+    typeof crypto !== 'undefined' && 'randomUUID' in crypto
+      ? crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+  // Una clave por respuesta: la misma respuesta a la misma pregunta reusa la clave hasta que el backend la confirma
+  const idempotencyKeyFor = (content: string) => {
+    const pending = pendingAnswerRef.current;
+    if (
+      pending &&
+      pending.sessionId === quizState.sessionId &&
+      pending.question === quizState.currentQuestion &&
+      pending.content === content
+    ) {
+      return pending.key;
+    }
+    const key = newIdempotencyKey();
+    pendingAnswerRef.current = { sessionId: quizState.sessionId, question: quizState.currentQuestion, content, key };
+    return key;
+  };
+
   const sendMessage = async (content: string) => {
     if (!content.trim() || isLoading) return;
 
@@ -128,10 +256,28 @@ export default function ChatContainer() {
     setIsLoading(true);
 
     try {
-      const response = await axios.post(`${API_URL}/api/chat`, {
-        session_id: quizState.sessionId,
-        message: content,
-      });
+      // Misma clave en reintentos: el backend devuelve la respuesta ya procesada
+      const idempotencyKey = idempotencyKeyFor(content);
+      const postAnswer = () =>
+        postQuiz(
+          '/api/chat',
+          {
+            session_id: quizState.sessionId,
+            message: content,
+          },
+          appendReply,
+          { 'Idempotency-Key': idempotencyKey }
+        );
+      let data: QuizData;
+      try {
+        data = await postAnswer();
+      } catch (error) {
+        // Sin respuesta (red caída o stream cortado): un reintento con la misma clave no cuenta doble
+        if (!(error instanceof QuizRequestError) || error.status !== null) throw error;
+        discardReply();
+        data = await postAnswer();
+      }
+      pendingAnswerRef.current = null;
 
       const {
         message: botResponse,
@@ -141,7 +287,7 @@ export default function ChatContainer() {
         completed,
         options,
         attempts_left,
-      } = response.data;
+      } = data;
 
       // Actualizar estado del quiz
       setQuizState((prev) => ({
@@ -179,17 +325,12 @@ export default function ChatContainer() {
         }
       }
 
-      setMessages((prev) => [
-        ...prev,
-        {
-          role: 'bot',
-          content: botMessage,
-          timestamp: new Date(),
-          enableStreaming: true,
-        },
-      ]);
+      finishReply(botMessage);
     } catch (error) {
       console.error('Error sending message:', error);
+      discardReply();
+      // Si el backend respondió (aunque sea con error), reenviar es un intento nuevo
+      if (error instanceof QuizRequestError && error.status !== null) pendingAnswerRef.current = null;
       setMessages((prev) => [
         ...prev,
         {
@@ -239,7 +380,7 @@ export default function ChatContainer() {
               enableStreaming={message.enableStreaming}
             />
           ))}
-          {isLoading && (
+          {isLoading && !streamingReply && (
             <div className="flex justify-start animate-fadeIn">
               <div className="bg-gradient-to-br from-white to-pastel-50 border-2 border-pastel-400 rounded-3xl p-5 shadow-xl max-w-md backdrop-blur-sm">
                 <div className="flex gap-2 items-center">
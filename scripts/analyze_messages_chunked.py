@@ -1,18 +1,153 @@
 """
 Analizador OPTIMIZADO de mensajes con procesamiento en CHUNKS.
 Procesa mensajes en paralelo para máxima velocidad.
+
+Cada worker lee su propio rango [start, stop) del message store columnar
+(memory-mapped, compartido entre procesos vía page cache) y devuelve
+parciales compactos: contadores de palabras, apodos y lugares, histograma
+de mensajes por mes y primer/último timestamp, en vez de listas crudas. En
+modo 'process' los chunks corren en un ProcessPoolExecutor y el análisis
+escala con los cores; 'thread' los corre en threads del mismo proceso.
 """
 
 import json
 import os
+import sys
 from datetime import datetime
-from collections import Counter, defaultdict
-from typing import Dict, List, Tuple
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 import re
+import numpy as np
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+from services.message_store import MessageStore, open_message_store
+from services.lexicon import Lexicon, AFFECTION_TERMS
+from services.conversation_stats import local_time_ms
+
+# Léxicos precompilados una vez (Aho–Corasick sobre texto sin acentos, palabras completas)
+LOCATION_LEXICON = Lexicon([
+    'café', 'cafetería', 'restaurante', 'parque', 'plaza',
+    'cine', 'centro', 'mall', 'casa', 'depa', 'departamento',
+    'bar', 'playa', 'montaña', 'universidad', 'u', 'trabajo',
+    'gimnasio', 'hospital', 'aeropuerto', 'terminal', 'hotel',
+    'museo', 'teatro', 'concierto', 'estadio'
+])
+AFFECTION_LEXICON = Lexicon(AFFECTION_TERMS)
+
+DATE_PATTERN = re.compile(
+    r'\b\d{1,2}\s+de\s+(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\b',
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+STOP_WORDS = {
+    'que', 'de', 'la', 'el', 'en', 'y', 'a', 'los', 'del', 'se', 'las', 
+    'por', 'un', 'para', 'con', 'no', 'una', 'su', 'al', 'es', 'lo', 
+    'como', 'más', 'pero', 'sus', 'le', 'ya', 'o', 'fue', 'este', 'ha',
+    'si', 'me', 'te', 'mi', 'tu', 'yo', 'ti', 'eso', 'bien', 'muy',
+    'todo', 'cuando', 'hasta', 'sin', 'sobre', 'también', 'donde'
+}
+
+# Detalle que se conserva para el reporte (el resto sólo se cuenta)
+MAX_LOCATION_DETAILS = 100
+MAX_DATE_DETAILS = 50
+
+EXECUTOR_MODES = ('process', 'thread')
+
+# Message store de cada worker: se abre una vez por proceso en _init_worker
+_worker_store: Optional[MessageStore] = None
+
+
+def _init_worker(store_dir: str):
+    global _worker_store
+    _worker_store = MessageStore(store_dir)
+
+
+def _local_date(timestamp: int) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d') if timestamp else None
+
+
+def analyze_slice(start: int, stop: int, chunk_id: int, your_name: str, her_name: str) -> Dict:
+    """
+    Analiza los mensajes [start, stop) del message store del worker.
+    Es una función de módulo para que el ProcessPoolExecutor pueda enviarla.
+
+    Returns:
+        Parciales compactos del chunk (contadores, histograma por mes,
+        primer/último timestamp y hasta MAX_*_DETAILS menciones con detalle)
+    """
+    store = _worker_store
+    timestamps = np.asarray(store.timestamps[start:stop])
+    sender_ids = np.asarray(store.sender_ids[start:stop])
+    has_content = np.diff(store.content_offsets[start:stop + 1]) > 0
+    contents = store.contents(start, stop)
+
+    # Mensajes por persona (un remitente que coincide con ambos nombres cuenta como el primero)
+    your_ids = [i for i, sender in enumerate(store.senders) if your_name in sender]
+    her_ids = [i for i, sender in enumerate(store.senders) if her_name in sender and i not in your_ids]
+
+    result = {
+        'chunk_id': chunk_id,
+        'size': stop - start,
+        'juan_messages': int(np.isin(sender_ids, your_ids).sum()),
+        'karem_messages': int(np.isin(sender_ids, her_ids).sum()),
+        'location_frequency': Counter(),
+        'location_mentions': [],
+        'date_mention_count': 0,
+        'date_mentions': [],
+        'word_frequency': Counter(),
+        'nickname_frequency': Counter(),
+        'messages_by_month': Counter(),
+        'first_ts': None,
+        'last_ts': None
+    }
+
+    # Línea de tiempo: sólo mensajes con contenido y timestamp, vectorizado
+    dated = timestamps[has_content & (timestamps != 0)]
+    if len(dated):
+        result['first_ts'], result['last_ts'] = int(dated.min()), int(dated.max())
+        months = (local_time_ms(dated) // 1000).astype('datetime64[s]').astype('datetime64[M]')
+        values, counts = np.unique(months, return_counts=True)
+        result['messages_by_month'] = Counter({str(month): int(count) for month, count in zip(values, counts)})
+
+    # Lugares: qué etiquetas aparecen en cada mensaje, con el texto plegado una vez para todo el chunk
+    location_hits = LOCATION_LEXICON.message_hits(contents)
+    for i, label_id in zip(*np.nonzero(location_hits)):
+        keyword = LOCATION_LEXICON.labels[label_id]
+        result['location_frequency'][keyword] += 1
+        if len(result['location_mentions']) < MAX_LOCATION_DETAILS:
+            result['location_mentions'].append({
+                'date': _local_date(int(timestamps[i])),
+                'sender': store.senders[int(sender_ids[i])],
+                'keyword': keyword,
+                'context': contents[i][:150]
+            })
+
+    for i in np.flatnonzero(has_content).tolist():
+        content = contents[i]
+
+        # Buscar fechas
+        if DATE_PATTERN.search(content):
+            result['date_mention_count'] += 1
+            if len(result['date_mentions']) < MAX_DATE_DETAILS:
+                result['date_mentions'].append({
+                    'date': _local_date(int(timestamps[i])),
+                    'sender': store.senders[int(sender_ids[i])],
+                    'mention': content[:200]
+                })
+
+        # Buscar apodos ('mi amor' cuenta como 'mi amor', no también como 'amor')
+        result['nickname_frequency'].update(AFFECTION_LEXICON.find(content, longest=True))
+
+    # Palabras: una sola pasada del regex sobre el chunk unido ('\n' nunca es parte de una palabra)
+    words = WORD_PATTERN.findall('\n'.join(contents).lower())
+    result['word_frequency'] = Counter(w for w in words if len(w) > 3 and w not in STOP_WORDS)
+
+    return result
+
 
 class ChunkedMessageAnalyzer:
     """Analizador optimizado que procesa mensajes en chunks paralelos."""
@@ -30,167 +165,61 @@ class ChunkedMessageAnalyzer:
         self.your_name = "Juan Diego Gutierrez"
         self.her_name = "Karem Ramos"
         
-    def load_all_messages(self) -> List[Dict]:
-        """Carga TODOS los mensajes de todos los archivos."""
+    def open_store(self) -> Optional[MessageStore]:
+        """Abre (o construye) el message store; los workers lo abren por su cuenta desde el disco."""
         print("\n" + "="*70)
         print("📂 CARGANDO MENSAJES DE INSTAGRAM")
         print("="*70)
         
-        all_messages = []
-        message_files = sorted(self.conversation_path.glob("message_*.json"))
-        
-        for msg_file in message_files:
-            print(f"   📄 Cargando {msg_file.name}...")
-            try:
-                with open(msg_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    messages = data.get('messages', [])
-                    all_messages.extend(messages)
-                    print(f"      ✓ {len(messages):,} mensajes")
-            except Exception as e:
-                print(f"      ✗ Error: {e}")
+        # El store columnar ya viene ordenado por timestamp (más antiguo primero)
+        store = open_message_store(self.conversation_path)
         
-        # Ordenar por timestamp (más antiguo primero)
-        all_messages.sort(key=lambda x: x.get('timestamp_ms', 0))
-        
-        print(f"\n✅ Total mensajes cargados: {len(all_messages):,}")
+        print(f"\n✅ Total mensajes en el store: {len(store) if store else 0:,}")
         print(f"📦 Se dividirán en chunks de {self.chunk_size:,} mensajes\n")
         
-        return all_messages
-    
-    def split_into_chunks(self, messages: List[Dict]) -> List[List[Dict]]:
-        """Divide mensajes en chunks para procesamiento paralelo."""
-        chunks = []
-        for i in range(0, len(messages), self.chunk_size):
-            chunk = messages[i:i + self.chunk_size]
-            chunks.append(chunk)
-        
-        print(f"📦 Mensajes divididos en {len(chunks)} chunks")
-        return chunks
+        return store
     
-    def analyze_chunk(self, chunk: List[Dict], chunk_id: int) -> Dict:
-        """
-        Analiza un chunk individual de mensajes.
-        Esta función puede ejecutarse en paralelo.
-        """
-        result = {
-            'chunk_id': chunk_id,
-            'size': len(chunk),
-            'juan_messages': 0,
-            'karem_messages': 0,
-            'location_mentions': [],
-            'date_mentions': [],
-            'words': [],
-            'nicknames': [],
-            'timestamps': []
-        }
-        
-        # Patrones para búsqueda
-        location_keywords = [
-            'café', 'cafetería', 'restaurante', 'parque', 'plaza',
-            'cine', 'centro', 'mall', 'casa', 'depa', 'departamento',
-            'bar', 'playa', 'montaña', 'universidad', 'u', 'trabajo',
-            'gimnasio', 'hospital', 'aeropuerto', 'terminal', 'hotel',
-            'museo', 'teatro', 'concierto', 'estadio'
-        ]
-        
-        date_pattern = r'\b\d{1,2}\s+de\s+(enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\b'
-        
-        affection_patterns = [
-            r'\b(amor|amorcito|mi amor|bb|bebe|bebé|nena|nene|cielo|vida|corazón)\b',
-            r'\b(hermosa|hermoso|linda|lindo|preciosa|precioso|reina|rey)\b',
-            r'\b(mi vida|mi cielo|mi todo|gordita|gordito|flaca|flaco|chiquita|chiquito)\b'
-        ]
-        
-        stop_words = {
-            'que', 'de', 'la', 'el', 'en', 'y', 'a', 'los', 'del', 'se', 'las', 
-            'por', 'un', 'para', 'con', 'no', 'una', 'su', 'al', 'es', 'lo', 
-            'como', 'más', 'pero', 'sus', 'le', 'ya', 'o', 'fue', 'este', 'ha',
-            'si', 'me', 'te', 'mi', 'tu', 'yo', 'ti', 'eso', 'bien', 'muy',
-            'todo', 'cuando', 'hasta', 'sin', 'sobre', 'también', 'donde'
-        }
-        
-        # Procesar cada mensaje del chunk
-        for msg in chunk:
-            sender = msg.get('sender_name', '')
-            content = msg.get('content', '')
-            timestamp = msg.get('timestamp_ms', 0)
-            
-            # Contar mensajes por persona
-            if self.your_name in sender:
-                result['juan_messages'] += 1
-            elif self.her_name in sender:
-                result['karem_messages'] += 1
-            
-            # Solo procesar mensajes con contenido
-            if not content:
-                continue
-            
-            # Guardar timestamp
-            if timestamp:
-                result['timestamps'].append(timestamp)
-            
-            content_lower = content.lower()
-            
-            # Buscar ubicaciones
-            for keyword in location_keywords:
-                if keyword in content_lower:
-                    result['location_mentions'].append({
-                        'date': datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d') if timestamp else None,
-                        'sender': sender,
-                        'keyword': keyword,
-                        'context': content[:150]
-                    })
-            
-            # Buscar fechas
-            date_matches = re.findall(date_pattern, content, re.IGNORECASE)
-            if date_matches:
-                result['date_mentions'].append({
-                    'date': datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d') if timestamp else None,
-                    'sender': sender,
-                    'mention': content[:200]
-                })
-            
-            # Buscar apodos
-            for pattern in affection_patterns:
-                nickname_matches = re.findall(pattern, content_lower, re.IGNORECASE)
-                result['nicknames'].extend(nickname_matches)
-            
-            # Extraer palabras
-            words = re.findall(r'\b\w+\b', content_lower)
-            filtered_words = [w for w in words if len(w) > 3 and w not in stop_words]
-            result['words'].extend(filtered_words)
+    def chunk_ranges(self, total: int) -> List[Tuple[int, int]]:
+        """Rangos [start, stop) de cada chunk para procesamiento paralelo."""
+        ranges = [(start, min(start + self.chunk_size, total)) for start in range(0, total, self.chunk_size)]
         
-        return result
+        print(f"📦 Mensajes divididos en {len(ranges)} chunks")
+        return ranges
     
     def merge_chunk_results(self, chunk_results: List[Dict]) -> Dict:
-        """Combina resultados de todos los chunks."""
+        """Combina los parciales de todos los chunks (contadores e histogramas se suman)."""
         print("\n🔄 Combinando resultados de todos los chunks...")
         
         merged = {
             'total_messages': sum(r['size'] for r in chunk_results),
             'juan_messages': sum(r['juan_messages'] for r in chunk_results),
             'karem_messages': sum(r['karem_messages'] for r in chunk_results),
+            'location_frequency': Counter(),
             'location_mentions': [],
+            'date_mention_count': sum(r['date_mention_count'] for r in chunk_results),
             'date_mentions': [],
             'word_frequency': Counter(),
             'nickname_frequency': Counter(),
-            'all_timestamps': []
+            'messages_by_month': Counter()
         }
         
-        # Combinar todas las listas
-        for result in chunk_results:
+        # Combinar en orden de chunk (as_completed los entrega en cualquier orden)
+        for result in sorted(chunk_results, key=lambda r: r['chunk_id']):
+            merged['location_frequency'].update(result['location_frequency'])
             merged['location_mentions'].extend(result['location_mentions'])
             merged['date_mentions'].extend(result['date_mentions'])
-            merged['word_frequency'].update(result['words'])
-            merged['nickname_frequency'].update(result['nicknames'])
-            merged['all_timestamps'].extend(result['timestamps'])
+            merged['word_frequency'].update(result['word_frequency'])
+            merged['nickname_frequency'].update(result['nickname_frequency'])
+            merged['messages_by_month'].update(result['messages_by_month'])
+        merged['location_mentions'] = merged['location_mentions'][:MAX_LOCATION_DETAILS]
+        merged['date_mentions'] = merged['date_mentions'][:MAX_DATE_DETAILS]
         
         # Calcular estadísticas temporales
-        if merged['all_timestamps']:
-            merged['all_timestamps'].sort()
-            first_ts = merged['all_timestamps'][0]
-            last_ts = merged['all_timestamps'][-1]
+        first_values = [r['first_ts'] for r in chunk_results if r['first_ts'] is not None]
+        last_values = [r['last_ts'] for r in chunk_results if r['last_ts'] is not None]
+        if first_values:
+            first_ts = min(first_values)
+            last_ts = max(last_values)
             
             merged['first_message'] = {
                 'date': datetime.fromtimestamp(first_ts / 1000).strftime('%Y-%m-%d %H:%M:%S'),
@@ -222,17 +251,10 @@ class ChunkedMessageAnalyzer:
         top_nicknames = merged_data['nickname_frequency'].most_common(20)
         
         # Top ubicaciones mencionadas
-        location_counter = Counter(
-            loc['keyword'] for loc in merged_data['location_mentions']
-        )
-        top_locations = location_counter.most_common(15)
-        
-        # Análisis por mes
-        messages_by_month = defaultdict(int)
-        for ts in merged_data['all_timestamps']:
-            date = datetime.fromtimestamp(ts / 1000)
-            month_key = date.strftime('%Y-%m')
-            messages_by_month[month_key] += 1
+        top_locations = merged_data['location_frequency'].most_common(15)
+        
+        # Análisis por mes (histograma ya combinado de los chunks)
+        messages_by_month = merged_data['messages_by_month']
         
         # Crear reporte
         report = {
@@ -240,7 +262,8 @@ class ChunkedMessageAnalyzer:
                 'analyzed_at': datetime.now().isoformat(),
                 'total_messages': merged_data['total_messages'],
                 'chunk_size_used': self.chunk_size,
-                'processing_method': 'parallel_chunks'
+                'processing_method': 'parallel_chunks',
+                'executor': merged_data.get('executor')
             },
             'timeline': {
                 'first_message': merged_data.get('first_message'),
@@ -265,11 +288,11 @@ class ChunkedMessageAnalyzer:
                 'top_nicknames': [{'nickname': n, 'count': c} for n, c in top_nicknames],
                 'top_locations': [{'location': l, 'count': c} for l, c in top_locations],
                 'total_unique_words': len(merged_data['word_frequency']),
-                'total_location_mentions': len(merged_data['location_mentions']),
-                'total_date_mentions': len(merged_data['date_mentions'])
+                'total_location_mentions': sum(merged_data['location_frequency'].values()),
+                'total_date_mentions': merged_data['date_mention_count']
             },
-            'location_details': merged_data['location_mentions'][:100],  # Top 100
-            'date_mentions': merged_data['date_mentions'][:50],  # Top 50
+            'location_details': merged_data['location_mentions'],  # Primeras MAX_LOCATION_DETAILS
+            'date_mentions': merged_data['date_mentions'],  # Primeras MAX_DATE_DETAILS
             'question_suggestions': []
         }
         
@@ -394,37 +417,46 @@ class ChunkedMessageAnalyzer:
         
         return suggestions
     
-    def analyze_with_chunks(self, max_workers: int = 4) -> Dict:
+    def analyze_with_chunks(self, max_workers: int = 4, mode: str = 'process') -> Dict:
         """
         Ejecuta análisis completo usando procesamiento paralelo.
         
         Args:
-            max_workers: Número de threads paralelos (default: 4)
+            max_workers: Número de workers paralelos (default: 4)
+            mode: 'process' (un proceso por worker, escala con los cores) o
+                  'thread' (threads del mismo proceso, limitados por el GIL)
         """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Modo desconocido: {mode} (usa {' o '.join(EXECUTOR_MODES)})")
+        
         print("\n" + "="*70)
         print("🚀 ANÁLISIS DE MENSAJES CON PROCESAMIENTO EN CHUNKS")
         print("="*70)
-        print(f"⚡ Usando {max_workers} workers paralelos\n")
+        print(f"⚡ Usando {max_workers} workers paralelos (modo {mode})\n")
         
-        # 1. Cargar mensajes
-        all_messages = self.load_all_messages()
+        # 1. Abrir el message store (los workers leen sus rangos directo del disco)
+        store = self.open_store()
+        if store is None:
+            raise FileNotFoundError(f"No se encontraron mensajes en {self.conversation_path}")
         
         # 2. Dividir en chunks
-        chunks = self.split_into_chunks(all_messages)
+        ranges = self.chunk_ranges(len(store))
         
         # 3. Procesar chunks en paralelo
-        print(f"\n⚙️  Procesando {len(chunks)} chunks en paralelo...")
+        print(f"\n⚙️  Procesando {len(ranges)} chunks en paralelo...")
         chunk_results = []
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Enviar todos los chunks a procesar
+        executor_class = ProcessPoolExecutor if mode == 'process' else ThreadPoolExecutor
+        with executor_class(max_workers=max_workers, initializer=_init_worker,
+                            initargs=(str(store.store_dir),)) as executor:
+            # Enviar sólo el rango de cada chunk: nada de mensajes serializados
             future_to_chunk = {
-                executor.submit(self.analyze_chunk, chunk, i): i 
-                for i, chunk in enumerate(chunks)
+                executor.submit(analyze_slice, start, stop, i, self.your_name, self.her_name): i
+                for i, (start, stop) in enumerate(ranges)
             }
             
             # Procesar resultados conforme se completan (con barra de progreso)
-            with tqdm(total=len(chunks), desc="Analizando chunks") as pbar:
+            with tqdm(total=len(ranges), desc="Analizando chunks") as pbar:
                 for future in as_completed(future_to_chunk):
                     chunk_id = future_to_chunk[future]
                     try:
@@ -438,6 +470,7 @@ class ChunkedMessageAnalyzer:
         
         # 4. Combinar resultados
         merged_data = self.merge_chunk_results(chunk_results)
+        merged_data['executor'] = mode
         
         # 5. Generar reporte final
         report = self.generate_analysis_report(merged_data)
@@ -532,14 +565,19 @@ def main():
     except ValueError:
         chunk_size = 5000
     
+    default_workers = os.cpu_count() or 4
     try:
-        workers_input = input("   ⚡ Workers paralelos (default: 4, presiona ENTER): ").strip()
-        max_workers = int(workers_input) if workers_input else 4
+        workers_input = input(f"   ⚡ Workers paralelos (default: {default_workers}, presiona ENTER): ").strip()
+        max_workers = int(workers_input) if workers_input else default_workers
     except ValueError:
-        max_workers = 4
+        max_workers = default_workers
+    
+    mode_input = input("   🧵 Modo process/thread (default: process, presiona ENTER): ").strip().lower()
+    mode = mode_input if mode_input in EXECUTOR_MODES else 'process'
     
     print(f"\n   ✓ Chunk size: {chunk_size:,} mensajes")
     print(f"   ✓ Workers: {max_workers}")
+    print(f"   ✓ Modo: {mode}")
     
     input("\n🚀 Presiona ENTER para comenzar el análisis...")
     
@@ -550,7 +588,7 @@ def main():
     import time
     start_time = time.time()
     
-    report = analyzer.analyze_with_chunks(max_workers=max_workers)
+    report = analyzer.analyze_with_chunks(max_workers=max_workers, mode=mode)
     
     end_time = time.time()
     elapsed = end_time - start_time
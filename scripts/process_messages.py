@@ -10,10 +10,22 @@ INSTRUCCIONES DE USO:
 
 import json
 import re
+import sys
+from pathlib import Path
 from datetime import datetime
 from collections import Counter
 from typing import Dict, List, Tuple
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+from services.lexicon import Lexicon, AFFECTION_TERMS
+
+LOCATION_LEXICON = Lexicon([
+    'café', 'cafetería', 'restaurante', 'parque', 'plaza',
+    'cine', 'centro', 'mall', 'universidad', 'casa',
+    'bar', 'playa', 'montaña', 'ciudad', 'pueblo'
+])
+AFFECTION_LEXICON = Lexicon(AFFECTION_TERMS)
+
 
 def parse_whatsapp_export(file_path: str) -> List[Dict]:
     """
@@ -83,24 +95,16 @@ def extract_locations(messages: List[Dict]) -> List[Dict]:
     """
     Extract mentions of places and locations.
     """
-    location_keywords = [
-        'café', 'cafetería', 'restaurante', 'parque', 'plaza',
-        'cine', 'centro', 'mall', 'universidad', 'casa',
-        'bar', 'playa', 'montaña', 'ciudad', 'pueblo'
-    ]
-    
     locations = []
     
     for msg in messages:
-        text = msg['message'].lower()
-        for keyword in location_keywords:
-            if keyword in text:
-                locations.append({
-                    "date": msg['date'],
-                    "sender": msg['sender'],
-                    "location_type": keyword,
-                    "context": msg['message']
-                })
+        for keyword in LOCATION_LEXICON.labels_in(msg['message']):
+            locations.append({
+                "date": msg['date'],
+                "sender": msg['sender'],
+                "location_type": keyword,
+                "context": msg['message']
+            })
     
     print(f"✓ Found {len(locations)} location mentions")
     return locations
@@ -117,6 +121,11 @@ def extract_special_phrases(messages: List[Dict]) -> Dict:
     word_freq = Counter(words)
     common_words = word_freq.most_common(20)
     
+    # Apodos cariñosos (léxico compartido, sin importar acentos ni mayúsculas)
+    nickname_freq = Counter()
+    for msg in messages:
+        nickname_freq.update(AFFECTION_LEXICON.find(msg['message'], longest=True))
+    
     # Emoji usage
     emojis = re.findall(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]', all_text)
     emoji_freq = Counter(emojis)
@@ -125,6 +134,7 @@ def extract_special_phrases(messages: List[Dict]) -> Dict:
     
     return {
         "common_capitalized_words": common_words[:10],
+        "common_nicknames": nickname_freq.most_common(10),
         "most_used_emojis": emoji_freq.most_common(5),
         "total_words": len(all_text.split())
     }
@@ -19,7 +19,7 @@ def test_rag_question_generation():
     
     try:
         # Importar dependencias
-        from app import generate_single_question_with_openai, rag_service
+        from app import generate_single_question_with_openai, rag_initializer
         from services.rag_service import get_rag_service
         from openai import OpenAI
         import json
@@ -33,7 +33,9 @@ def test_rag_question_generation():
         openai_client = OpenAI(api_key=openai_api_key)
         print(f"✅ OpenAI client configurado")
         
-        # Verificar RAG service
+        # Verificar RAG service (se inicializa en background al importar app)
+        print("⏳ Esperando inicialización del RAG...")
+        rag_service = rag_initializer.wait(timeout=600)
         if not rag_service:
             print("❌ RAG service no inicializado")
             return False
@@ -123,7 +125,8 @@ def test_specific_rag_search():
     print("-" * 40)
     
     try:
-        from app import rag_service
+        from app import rag_initializer
+        rag_service = rag_initializer.wait(timeout=600)
         
         # Búsquedas específicas que deberían tener resultados
         specific_searches = [
@@ -5,15 +5,19 @@ Genera análisis más precisos y personalizados de la conversación
 """
 
 import os
+import sys
 import json
-import re
 from pathlib import Path
 from datetime import datetime, timedelta
-from collections import Counter, defaultdict
+from collections import Counter
 from typing import Dict, List, Tuple
 from dotenv import load_dotenv
 from openai import OpenAI
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / 'backend'))
+from services.message_store import open_message_store
+from services.stats_partials import StatsPartial, get_stats_ledger, merge_by_month
+
 # Cargar variables de entorno desde el archivo .env específico
 env_path = Path(__file__).parent / '.env'
 print(f"🔧 Cargando variables de entorno desde: {env_path}")
@@ -30,89 +34,70 @@ class EnhancedStatsAnalyzer:
         
         print(f"✅ API Key cargada: {api_key[:20]}...")
         self.client = OpenAI(api_key=api_key)
-        self.messages = []
-        self.emoji_pattern = re.compile("["
-            "\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            "\U00002702-\U000027B0"
-            "\U000024C2-\U0001F251"
-            "]+", flags=re.UNICODE)
+        self.store = None
+        self.buckets: Dict[str, StatsPartial] = {}
+        self.months: Dict[str, StatsPartial] = {}
+        self.totals = StatsPartial()
     
-    def load_messages(self) -> List[Dict]:
-        """Carga mensajes desde archivos JSON"""
-        messages = []
+    def load_partials(self) -> Dict[str, StatsPartial]:
+        """
+        Carga los agregados parciales por día del message store columnar,
+        agregando sólo los mensajes que llegaron desde la última vez
+        """
         conversation_dir = Path("karemramos_1184297046409691")
         
         print(f"📂 Cargando mensajes desde: {conversation_dir}")
         
         if not conversation_dir.exists():
             print(f"❌ Directorio no encontrado: {conversation_dir}")
-            return []
+            return {}
+        
+        self.store = open_message_store(conversation_dir)
+        if self.store is None:
+            return {}
+        
+        ledger = get_stats_ledger()
+        ledger.update_from_store(self.store)
+        self.buckets = ledger.buckets
+        self.months = merge_by_month(self.buckets)
+        self.totals = ledger.totals()
         
-        for msg_file in sorted(conversation_dir.glob('message_*.json')):
-            try:
-                print(f"📄 Procesando: {msg_file.name}")
-                with open(msg_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    file_messages = data.get('messages', [])
-                    messages.extend(file_messages)
-                    
-            except Exception as e:
-                print(f"❌ Error leyendo {msg_file}: {e}")
-        
-        print(f"📊 Total mensajes cargados: {len(messages):,}")
-        self.messages = messages
-        return messages
+        print(f"📊 Total mensajes: {self.totals.messages:,} en {len(self.buckets)} días")
+        return self.buckets
     
     def analyze_emoji_usage(self) -> Dict:
         """Analiza el uso real de emojis en la conversación"""
         print("😊 Analizando uso real de emojis...")
         
-        emoji_counter = Counter()
-        emoji_by_sender = defaultdict(Counter)
-        emoji_contexts = defaultdict(list)
-        total_emoji_messages = 0
-        
-        for msg in self.messages:
-            content = msg.get('content', '')
-            sender = msg.get('sender_name', 'Unknown')
-            
-            if content:
-                # Solo buscar emojis unicode reales
-                emojis = self.emoji_pattern.findall(content)
-                if emojis:
-                    total_emoji_messages += 1
-                    for emoji in emojis:
-                        emoji_counter[emoji] += 1
-                        emoji_by_sender[sender][emoji] += 1
+        emoji_counter = Counter(self.totals.emojis)
         
         # Solo reportar si no se encontraron emojis reales
         if not emoji_counter:
             print("ℹ️ No se detectaron emojis unicode en los mensajes")
         
         print(f"🔍 Total emojis encontrados: {sum(emoji_counter.values())}")
-        print(f"📊 Mensajes con emojis: {total_emoji_messages}")
+        print(f"📊 Mensajes con emojis: {self.totals.emoji_messages}")
         
         return {
             'most_used': dict(emoji_counter.most_common(10)),
-            'by_sender': dict(emoji_by_sender),
-            'contexts': dict(emoji_contexts),
-            'total_emoji_messages': total_emoji_messages
+            'total_emoji_messages': self.totals.emoji_messages
         }
     
     def analyze_conversation_patterns(self) -> Dict:
         """Analiza patrones de conversación específicos"""
         print("📈 Analizando patrones de conversación...")
         
+        totals = self.totals
         patterns = {
-            'response_times': [],
-            'conversation_starters': Counter(),
-            'goodnight_messages': 0,
-            'good_morning_messages': 0,
-            'long_messages': [],
-            'short_bursts': 0,
+            # Tiempos de respuesta (minutos) como sketches de cuantiles combinables
+            'response_times': totals.response_sketch(),
+            'response_times_by_sender': totals.response_times,
+            'response_times_by_month': {month: partial.response_sketch() for month, partial in self.months.items()},
+            'goodnight_messages': totals.goodnight,
+            'good_morning_messages': totals.good_morning,
+            'long_messages': totals.long_messages,
+            'love_letters': totals.love_letters,
+            'short_bursts': totals.bursts,
             'voice_messages': 0,
             'photos_shared': 0,
             'videos_shared': 0
@@ -143,67 +128,6 @@ class EnhancedStatsAnalyzer:
             patterns['videos_shared'] = len(video_files)
             print(f"🎬 Videos compartidos encontrados: {len(video_files)}")
         
-        # Análisis temporal y patrones
-        prev_timestamp = None
-        prev_sender = None
-        current_burst = 0
-        
-        for msg in self.messages:
-            content = msg.get('content', '').lower()
-            sender = msg.get('sender_name', 'Unknown')
-            
-            # Timestamp analysis
-            if 'timestamp_ms' in msg:
-                current_time = datetime.fromtimestamp(msg['timestamp_ms'] / 1000)
-                
-                # Response time analysis
-                if prev_timestamp and prev_sender != sender:
-                    response_time = (current_time - prev_timestamp).total_seconds() / 60
-                    patterns['response_times'].append(response_time)
-                
-                # Morning/night messages
-                hour = current_time.hour
-                if 'buen' in content and ('día' in content or 'mañana' in content) and hour < 12:
-                    patterns['good_morning_messages'] += 1
-                elif ('buenas noches' in content or 'que descanses' in content) and hour > 20:
-                    patterns['goodnight_messages'] += 1
-                
-                prev_timestamp = current_time
-            
-            # Content analysis
-            if content:
-                # Conversation starters
-                if prev_sender != sender:
-                    first_words = ' '.join(content.split()[:3])
-                    patterns['conversation_starters'][first_words] += 1
-                
-                # Message length analysis
-                if len(content) > 200:
-                    patterns['long_messages'].append({
-                        'length': len(content),
-                        'sender': sender,
-                        'preview': content[:100] + '...'
-                    })
-            
-            # Message type analysis
-            if msg.get('type') == 'Generic':
-                if msg.get('audio_files'):
-                    patterns['voice_messages'] += 1
-                elif msg.get('photos'):
-                    patterns['photos_shared'] += len(msg['photos'])
-                elif msg.get('videos'):
-                    patterns['videos_shared'] += len(msg['videos'])
-            
-            # Burst detection (multiple messages in quick succession)
-            if prev_sender == sender:
-                current_burst += 1
-            else:
-                if current_burst >= 3:
-                    patterns['short_bursts'] += 1
-                current_burst = 0
-            
-            prev_sender = sender
-        
         return patterns
     
     def analyze_with_ai(self, sample_messages: List[str]) -> Dict:
@@ -277,28 +201,20 @@ Responde en formato JSON:
         """Calcula métricas mejoradas y más precisas"""
         print("📊 Calculando métricas mejoradas...")
         
-        if not self.messages:
+        totals = self.totals
+        if not totals.messages or totals.first_ms is None:
             return {}
         
-        # Datos básicos
-        total_messages = len(self.messages)
-        senders = Counter(msg.get('sender_name', 'Unknown') for msg in self.messages)
-        
-        # Análisis temporal
-        dates = []
-        for msg in self.messages:
-            if 'timestamp_ms' in msg:
-                dates.append(datetime.fromtimestamp(msg['timestamp_ms'] / 1000))
+        # Datos básicos (combinando los parciales por día)
+        total_messages = totals.messages
+        senders = totals.senders
         
-        dates.sort()
-        first_date, last_date = dates[0], dates[-1]
-        total_days = (last_date - first_date).days + 1
+        # Análisis temporal (first_ms/last_ms ya están en hora local)
+        total_days = (totals.last_ms - totals.first_ms) // 86_400_000 + 1
         
-        # Métricas mejoradas
-        response_times = patterns.get('response_times', [])
-        # Filtrar tiempos de respuesta negativos y muy grandes
-        valid_response_times = [t for t in response_times if 0 <= t <= 1440]  # Entre 0 y 24 horas
-        avg_response_time = sum(valid_response_times) / len(valid_response_times) if valid_response_times else 15
+        # Métricas mejoradas: los sketches sólo tienen respuestas de 0 a 24 horas
+        response_times = patterns.get('response_times')
+        avg_response_time = response_times.mean if response_times is not None and response_times.count else 15
         
         # Score de conexión basado en múltiples factores (optimizado para relaciones muy activas)
         
@@ -326,7 +242,7 @@ Responde en formato JSON:
             # Si no hay muchos emojis, evaluar expresividad por otros medios
             # Short bursts (ráfagas de mensajes) indican intensidad emocional
             burst_ratio = patterns.get('short_bursts', 0) / total_days  # Bursts por día
-            long_msg_ratio = len(patterns.get('long_messages', [])) / (total_messages / 1000)  # Mensajes largos por 1000
+            long_msg_ratio = patterns.get('long_messages', 0) / (total_messages / 1000)  # Mensajes largos por 1000
             
             # Usar el análisis de IA como indicador principal si disponible
             if ai_insights.get('emotional_tone', {}).get('affection_level') == 'alto':
@@ -347,7 +263,7 @@ Responde en formato JSON:
             balance_score = 5  # Neutral si solo hay un sender
         
         # Factor de intensidad: conversaciones largas e intensas
-        long_msg_ratio = len(patterns.get('long_messages', [])) / (total_messages / 1000)  # Por cada 1000 mensajes
+        long_msg_ratio = patterns.get('long_messages', 0) / (total_messages / 1000)  # Por cada 1000 mensajes
         burst_intensity = patterns.get('short_bursts', 0) / total_days  # Bursts por día
         intensity_score = min(10, (long_msg_ratio * 2) + (burst_intensity / 5) + 5)  # Base 5
         
@@ -389,7 +305,8 @@ Responde en formato JSON:
         connection_score = round(connection_score, 1)
         
         # Fases de relación más inteligentes
-        phases = self.calculate_relationship_phases(dates)
+        monthly_counts = {month: partial.messages for month, partial in self.months.items()}
+        phases = self.calculate_relationship_phases(monthly_counts)
         
         return {
             "totalMessages": total_messages,
@@ -397,6 +314,7 @@ Responde en formato JSON:
             "avgMessagesPerDay": round(total_messages / total_days, 1),
             "connectionScore": min(10.0, connection_score),
             "avgResponseTime": f"{int(avg_response_time)}min" if avg_response_time < 60 else f"{int(avg_response_time/60)}h",
+            "responseTimes": self.summarize_response_times(patterns),
             "relationshipPhases": phases,
             "topEmojis": list(emoji_data.get('most_used', {}).keys())[:5],
             "specialMoments": self.calculate_special_moments(patterns, emoji_data, total_messages),
@@ -405,7 +323,7 @@ Responde en formato JSON:
                 "voiceMessages": patterns.get('voice_messages', 0),
                 "photosShared": patterns.get('photos_shared', 0),
                 "videosShared": patterns.get('videos_shared', 0),
-                "longMessages": len(patterns.get('long_messages', [])),
+                "longMessages": patterns.get('long_messages', 0),
                 "shortBursts": patterns.get('short_bursts', 0)
             },
             "aiInsights": ai_insights,
@@ -413,6 +331,20 @@ Responde en formato JSON:
             "analysis_type": "enhanced_ai_analysis"
         }
     
+    def summarize_response_times(self, patterns: Dict) -> Dict:
+        """Media y p50/p90/p99 (minutos) de los tiempos de respuesta: total, por remitente y por mes"""
+        if patterns.get('response_times') is None:
+            return {}
+        return {
+            "overall": patterns['response_times'].summary(),
+            "bySender": {
+                sender: sketch.summary() for sender, sketch in patterns.get('response_times_by_sender', {}).items()
+            },
+            "byMonth": {
+                month: sketch.summary() for month, sketch in patterns.get('response_times_by_month', {}).items()
+            }
+        }
+    
     def calculate_special_moments(self, patterns: Dict, emoji_data: Dict, total_messages: int) -> int:
         """Calcula momentos especiales basado en varios indicadores"""
         special_count = 0
@@ -422,8 +354,7 @@ Responde en formato JSON:
         special_count += patterns.get('goodnight_messages', 0)
         
         # Mensajes largos (pueden ser cartas de amor)
-        long_messages = patterns.get('long_messages', [])
-        special_count += len([msg for msg in long_messages if msg.get('length', 0) > 300])
+        special_count += patterns.get('love_letters', 0)
         
         # MULTIMEDIA (¡Los datos más importantes!)
         voice_messages = patterns.get('voice_messages', 0)
@@ -454,17 +385,11 @@ Responde en formato JSON:
         
         return special_count
     
-    def calculate_relationship_phases(self, dates: List[datetime]) -> List[Dict]:
-        """Calcula fases de relación basadas en actividad temporal"""
-        if len(dates) < 30:  # Muy pocos datos
+    def calculate_relationship_phases(self, monthly_counts: Dict[str, int]) -> List[Dict]:
+        """Calcula fases de relación basadas en actividad temporal (mensajes por mes 'YYYY-MM')"""
+        if sum(monthly_counts.values()) < 30:  # Muy pocos datos
             return []
         
-        # Agrupar por meses
-        monthly_counts = defaultdict(int)
-        for date in dates:
-            month_key = date.strftime('%Y-%m')
-            monthly_counts[month_key] += 1
-        
         sorted_months = sorted(monthly_counts.items())
         
         if len(sorted_months) < 3:
@@ -498,11 +423,11 @@ Responde en formato JSON:
         """Genera estadísticas completas mejoradas"""
         print("🚀 Iniciando análisis mejorado...")
         
-        # Cargar mensajes
-        if not self.messages:
-            self.load_messages()
+        # Cargar parciales (sólo se agregan los mensajes nuevos)
+        if not self.buckets:
+            self.load_partials()
         
-        if not self.messages:
+        if not self.totals.messages:
             print("❌ No se encontraron mensajes para analizar")
             return {}
         
@@ -512,9 +437,9 @@ Responde en formato JSON:
         
         # Preparar muestra para IA
         sample_messages = [
-            msg.get('content', '') for msg in self.messages[:100] 
-            if msg.get('content') and len(msg.get('content', '')) > 10
-        ]
+            content for content in self.store.contents(0, 100)
+            if len(content) > 10
+        ] if self.store is not None else []
         
         ai_insights = self.analyze_with_ai(sample_messages)
         
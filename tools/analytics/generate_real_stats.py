@@ -5,16 +5,19 @@ y crear cache para DigitalOcean Spaces
 """
 
 import os
+import sys
 import json
 import re
 from pathlib import Path
 from datetime import datetime
 from collections import Counter
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / 'backend'))
+from services.message_store import open_message_store
+
 def load_messages_from_json_files():
-    """Carga todos los mensajes desde los archivos JSON locales"""
+    """Carga todos los mensajes desde el message store (construido desde los JSON locales)"""
     
-    messages = []
     conversation_dir = Path("karemramos_1184297046409691")
     
     print(f"📂 Cargando mensajes desde: {conversation_dir}")
@@ -23,18 +26,8 @@ def load_messages_from_json_files():
         print(f"❌ Directorio no encontrado: {conversation_dir}")
         return []
     
-    # Cargar todos los archivos JSON
-    for msg_file in sorted(conversation_dir.glob('message_*.json')):
-        try:
-            print(f"📄 Procesando: {msg_file.name}")
-            with open(msg_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                file_messages = data.get('messages', [])
-                messages.extend(file_messages)
-                print(f"   ✅ {len(file_messages):,} mensajes cargados")
-                
-        except Exception as e:
-            print(f"   ❌ Error leyendo {msg_file}: {e}")
+    store = open_message_store(conversation_dir)
+    messages = store.to_messages() if store else []
     
     print(f"📊 Total mensajes cargados: {len(messages):,}")
     return messages
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Reporte de recall vs latencia de los tipos de índice FAISS del RAG.
+Reconstruye el índice con cada tipo usando los embeddings ya cacheados
+(sin llamadas a OpenAI) y lo compara contra la búsqueda exacta.
+
+Uso (desde la raíz del proyecto):
+    python tools/analytics/index_recall_report.py [k] [tipo1,tipo2,...]
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import faiss
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+from services.rag_service import RAGService
+from services import vector_index
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    index_types = sys.argv[2].split(',') if len(sys.argv) > 2 else list(vector_index.INDEX_TYPES)
+
+    rag = RAGService(os.getenv('OPENAI_API_KEY', 'sin-api-key'), cache_dir=str(BACKEND_DIR / 'cache'))
+    if not rag.chunk_store.exists() or not os.path.exists(rag.index_file):
+        print("❌ No hay índice en cache. Inicia el backend una vez para construirlo.")
+        return
+
+    # Cargar el índice existente tal cual (sin convertirlo ni reescribir el cache)
+    rag.index = faiss.read_index(rag.index_file)
+    vectors = rag._index_vectors()
+
+    print(f"\n📊 Recall@{k} vs latencia ({len(rag.chunk_texts):,} vectores)")
+    print("=" * 78)
+    print(f"{'tipo':10s} {'param':10s} {'valor':>6s} {'recall':>8s} {'p50 ms':>9s} {'p95 ms':>9s}")
+
+    for index_type in index_types:
+        rag.index_type = index_type
+        rag.index = vector_index.build_index(index_type, vectors, rag.index_params)
+        for row in rag.evaluate_index(k=k):
+            print(f"{row['index_type']:10s} {str(row['param'] or '-'):10s} {str(row['value'] or '-'):>6s} "
+                  f"{row['recall_at_k']:>8.3f} {row['latency_ms_p50']:>9.3f} {row['latency_ms_p95']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la API de OpenAI para benchmarks (sin gastar crédito).
+Implementa POST /v1/chat/completions (json_object y stream) y
+POST /v1/embeddings, con latencias y errores configurables.
+
+- Las preguntas del quiz (response_format json_object) son JSON válidos con
+  opciones únicas; la respuesta correcta es siempre la primera opción.
+- Los embeddings son pseudo-aleatorios pero deterministas por texto.
+- Latencias por distribución (ver Latency): fija, uniforme, normal,
+  lognormal (colas largas) o exponencial; en streaming la latencia es la
+  del primer token y cada chunk espera `token_delay`.
+- Errores: 429 con retry-after (tasa fija o al superar `max_concurrency`
+  requests en vuelo) y 500. El cliente de OpenAI los reintenta como lo
+  haría contra la API real.
+- Con la misma `seed` la secuencia de latencias y errores se repite.
+- GET /stats devuelve los requests por endpoint y status; POST /stats/reset
+  los reinicia.
+
+Uso (desde la raíz del proyecto):
+    python tools/benchmark/fake_openai.py [--port 8900] [--latency lognormal:0.8,0.5]
+        [--embedding-latency 0.3] [--rate-limit-rate 0.05] [--error-rate 0.01]
+
+y en el backend:
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=sk-fake ...
+"""
+
+import time
+import json
+import base64
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from typing import Dict, Optional
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+EMBEDDING_DIM = 1536
+STREAM_CHUNK_CHARS = 16
+WORDS = [
+    'playa', 'cine', 'parque', 'museo', 'cafe', 'concierto', 'pizza', 'sushi', 'lluvia', 'viaje',
+    'perro', 'gato', 'libro', 'cancion', 'pelicula', 'montana', 'lago', 'mercado', 'helado', 'tacos'
+]
+
+
+class Latency:
+    """
+    Distribución de latencias en segundos, a partir de un spec:
+
+        "1.0" o "fixed:1.0"     siempre 1.0
+        "uniform:0.5,2"         uniforme entre 0.5 y 2
+        "normal:1,0.3"          normal (media, desvío), truncada en 0
+        "lognormal:0.8,0.5"     lognormal (mediana, sigma): colas largas como la API real
+        "exp:1"                 exponencial de media 1
+    """
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal', 'exp')
+
+    def __init__(self, spec: str, rng: np.random.Generator):
+        kind, _, params = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+        if kind not in self.KINDS:
+            raise ValueError(f"distribución desconocida: {kind} (usa {', '.join(self.KINDS)})")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+        self.spec = spec
+        self.rng = rng
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == 'fixed':
+            value = p[0]
+        elif self.kind == 'uniform':
+            value = self.rng.uniform(p[0], p[1])
+        elif self.kind == 'normal':
+            value = self.rng.normal(p[0], p[1])
+        elif self.kind == 'lognormal':
+            value = p[0] * np.exp(self.rng.normal(0.0, p[1]))
+        else:
+            value = self.rng.exponential(p[0])
+        return max(0.0, float(value))
+
+
+def seed_for(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+
+
+def fake_embedding(text: str) -> np.ndarray:
+    """Vector unitario determinista para `text`."""
+    vector = np.random.default_rng(seed_for(text)).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_question(prompt: str) -> str:
+    """Pregunta del quiz en JSON; las opciones no se repiten entre prompts distintos."""
+    rng = np.random.default_rng(seed_for(prompt))
+    tag = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:6]
+    words = rng.choice(WORDS, size=4, replace=False)
+    options = [f"{word} {tag}{i}" for i, word in enumerate(words)]
+    return json.dumps({
+        'question': f"¿Qué recuerdas de {words[0]}? ({tag})",
+        'options': options,
+        'correct_answers': [options[0]],
+        'hints': [f"Empieza con {options[0][0]}", f"Tiene que ver con {words[0]}"],
+        'success_message': 'Correcto.',
+        'category': 'benchmark',
+        'difficulty': 'medium',
+        'data_source': 'fake_openai'
+    }, ensure_ascii=False)
+
+
+def fake_reply(prompt: str, max_tokens: Optional[int] = None) -> str:
+    rng = np.random.default_rng(seed_for(prompt))
+    words = min(30, max_tokens or 30)
+    return " ".join(rng.choice(WORDS, size=words)) + "."
+
+
+def usage(prompt: str, completion: str) -> Dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(completion) // 4)
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens}
+
+
+def error_response(status: int, message: str, error_type: str, code: str, retry_after: Optional[float] = None):
+    headers = {'retry-after-ms': str(int(retry_after * 1000))} if retry_after is not None else None
+    return JSONResponse(
+        {'error': {'message': message, 'type': error_type, 'param': None, 'code': code}},
+        status_code=status, headers=headers
+    )
+
+
+class FakeOpenAI:
+    """
+    Args:
+        latency: Spec de latencia de chat.completions (hasta el primer token en streaming)
+        embedding_latency: Spec de latencia de embeddings (por defecto la de chat)
+        token_delay: Spec de la espera entre chunks en streaming
+        rate_limit_rate: Probabilidad de responder 429 a un request
+        error_rate: Probabilidad de responder 500 (después de la latencia)
+        max_concurrency: Requests en vuelo a partir de los cuales se responde 429 (0 = sin límite)
+        retry_after: Segundos del header retry-after de los 429
+        seed: Semilla de latencias y errores
+    """
+
+    def __init__(
+        self,
+        latency: str = '1.0',
+        embedding_latency: Optional[str] = None,
+        token_delay: str = '0.01',
+        rate_limit_rate: float = 0.0,
+        error_rate: float = 0.0,
+        max_concurrency: int = 0,
+        retry_after: float = 0.5,
+        seed: int = 0
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.latency = Latency(latency, self.rng)
+        self.embedding_latency = Latency(embedding_latency or latency, self.rng)
+        self.token_delay = Latency(token_delay, self.rng)
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        self.requests: Counter = Counter()
+        self.embedded_texts = 0
+        self.max_in_flight = 0
+
+    def _count(self, endpoint: str, status: int):
+        self.requests[f"{endpoint} {status}"] += 1
+
+    def _injected_error(self, endpoint: str):
+        """429/500 a inyectar en este request, o None."""
+        if self.max_concurrency and self.in_flight > self.max_concurrency:
+            self._count(endpoint, 429)
+            return error_response(429, "Rate limit reached (concurrency)", 'requests', 'rate_limit_exceeded', self.retry_after)
+        if self.rate_limit_rate and self.rng.random() < self.rate_limit_rate:
+            self._count(endpoint, 429)
+            return error_response(429, "Rate limit reached", 'requests', 'rate_limit_exceeded', self.retry_after)
+        return None
+
+    async def _server_error(self, endpoint: str, latency: Latency):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            await asyncio.sleep(latency.sample())
+            self._count(endpoint, 500)
+            return error_response(500, "The server had an error while processing your request", 'server_error', 'internal_error')
+        return None
+
+    async def _tracked(self, endpoint: str, handler, request: Request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return self._injected_error(endpoint) or await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    async def chat_completions(self, request: Request):
+        return await self._tracked('chat', self._chat_completions, request)
+
+    async def _chat_completions(self, request: Request):
+        body = await request.json()
+        error = await self._server_error('chat', self.latency)
+        if error is not None:
+            return error
+
+        prompt = "\n".join(str(message.get('content', '')) for message in body.get('messages', []))
+        is_json = (body.get('response_format') or {}).get('type') == 'json_object'
+        content = fake_question(prompt) if is_json else fake_reply(prompt, body.get('max_tokens'))
+        model = body.get('model', 'gpt-4o-mini')
+        completion_id = f"chatcmpl-{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:24]}"
+
+        await asyncio.sleep(self.latency.sample())
+        if body.get('stream'):
+            self._count('chat_stream', 200)
+            return StreamingResponse(self._stream(completion_id, model, content), media_type='text/event-stream')
+
+        self._count('chat', 200)
+        return JSONResponse({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': usage(prompt, content)
+        })
+
+    async def _stream(self, completion_id: str, model: str, content: str):
+        def chunk(delta: Dict, finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }, ensure_ascii=False) + "\n\n"
+
+        yield chunk({'role': 'assistant', 'content': ''})
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            yield chunk({'content': content[start:start + STREAM_CHUNK_CHARS]})
+            await asyncio.sleep(self.token_delay.sample())
+        yield chunk({}, 'stop')
+        yield "data: [DONE]\n\n"
+
+    async def embeddings(self, request: Request):
+        return await self._tracked('embeddings', self._embeddings, request)
+
+    async def _embeddings(self, request: Request):
+        body = await request.json()
+        error = await self._server_error('embeddings', self.embedding_latency)
+        if error is not None:
+            return error
+
+        texts = body.get('input', [])
+        texts = [texts] if isinstance(texts, str) else texts
+        as_base64 = body.get('encoding_format') == 'base64'
+
+        await asyncio.sleep(self.embedding_latency.sample())
+        self._count('embeddings', 200)
+        self.embedded_texts += len(texts)
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(text)
+            embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii') if as_base64 else vector.tolist()
+            data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+        tokens = sum(max(1, len(text) // 4) for text in texts)
+        return JSONResponse({
+            'object': 'list',
+            'data': data,
+            'model': body.get('model', 'text-embedding-3-small'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    def info(self) -> Dict:
+        return {
+            'requests': dict(sorted(self.requests.items())),
+            'embedded_texts': self.embedded_texts,
+            'max_in_flight': self.max_in_flight,
+            'latency': self.latency.spec,
+            'embedding_latency': self.embedding_latency.spec,
+            'rate_limit_rate': self.rate_limit_rate,
+            'error_rate': self.error_rate,
+            'max_concurrency': self.max_concurrency
+        }
+
+    async def get_stats(self, request: Request):
+        return JSONResponse(self.info())
+
+    async def reset_stats(self, request: Request):
+        self.reset()
+        return JSONResponse(self.info())
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route('/v1/chat/completions', self.chat_completions, methods=['POST']),
+            Route('/v1/embeddings', self.embeddings, methods=['POST']),
+            Route('/stats', self.get_stats, methods=['GET']),
+            Route('/stats/reset', self.reset_stats, methods=['POST'])
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API falsa de OpenAI para benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default='1.0', help="spec de latencia de chat (p.ej. lognormal:0.8,0.5)")
+    parser.add_argument('--embedding-latency', help="spec de latencia de embeddings (default: la de chat)")
+    parser.add_argument('--token-delay', default='0.01', help="spec de espera entre chunks en streaming")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="probabilidad de 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probabilidad de 500")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="requests en vuelo antes de responder 429")
+    parser.add_argument('--retry-after', type=float, default=0.5, help="segundos del retry-after de los 429")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(
+        latency=args.latency,
+        embedding_latency=args.embedding_latency,
+        token_delay=args.token_delay,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+    print(f"🤖 OpenAI falso en http://{args.host}:{args.port}/v1 (latencia {fake.latency.spec}, "
+          f"429 {args.rate_limit_rate:.0%}, 500 {args.error_rate:.0%})")
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Utilidades compartidas por los benchmarks: levantar el OpenAI falso y los
+servidores del backend en un directorio de trabajo aparte (el cache del RAG
+con embeddings falsos nunca toca backend/cache) y resumir latencias.
+"""
+
+import os
+import sys
+import time
+import signal
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+BACKEND_DIR = ROOT_DIR / 'backend'
+FAKE_OPENAI = Path(__file__).resolve().parent / 'fake_openai.py'
+PERCENTILES = (50, 95, 99)
+
+
+def server_env(fake_port: int, **overrides) -> Dict[str, str]:
+    """Entorno del backend apuntando al OpenAI falso."""
+    return {
+        **os.environ,
+        'OPENAI_API_KEY': 'sk-fake',
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{fake_port}/v1",
+        'SPACES_DATA_URL': 'http://127.0.0.1:9',  # Sin Spaces: mensajes locales
+        'QUESTION_BANK_VARIANTS': '0',  # Sin banco: cada pregunta pasa por OpenAI
+        'FLASK_DEBUG': 'False',
+        'PYTHONUNBUFFERED': '1',
+        **overrides
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"el proceso terminó con código {process.returncode}")
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} no respondió en {timeout:.0f}s")
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def start_fake_openai(port: int, fake_args: List[str]) -> subprocess.Popen:
+    """Arranca fake_openai.py y espera a que responda."""
+    process = subprocess.Popen([sys.executable, str(FAKE_OPENAI), '--port', str(port), *fake_args])
+    wait_ready(f"http://127.0.0.1:{port}/stats", process, timeout=30)
+    return process
+
+
+def fake_stats(port: int, reset: bool = False) -> Dict:
+    """Contadores del OpenAI falso (y reiniciarlos si `reset`)."""
+    url = f"http://127.0.0.1:{port}/stats"
+    response = requests.post(f"{url}/reset", timeout=5) if reset else requests.get(url, timeout=5)
+    return response.json()
+
+
+def prepare_cache(workdir: Path, env: Dict[str, str], quiet: bool = True) -> float:
+    """Corre `app.py --prepare-cache` (RAGService.build_index) en `workdir`; devuelve los segundos."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(BACKEND_DIR / 'app.py'), '--prepare-cache'], cwd=workdir,
+        env={**env, 'RAG_EAGER_INIT': 'False'}, stdout=subprocess.DEVNULL if quiet else None, check=True
+    )
+    return time.perf_counter() - start
+
+
+def server_command(name: str, port: int) -> List[str]:
+    """Comando de cada variante del backend: sync (waitress) o asgi (uvicorn)."""
+    if name == 'sync':
+        return [sys.executable, str(BACKEND_DIR / 'app.py')]
+    if name == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--app-dir', str(BACKEND_DIR),
+                '--port', str(port), '--log-level', 'warning']
+    raise ValueError(f"servidor desconocido: {name} (usa sync o asgi)")
+
+
+def start_server(name: str, workdir: Path, env: Dict[str, str], port: int) -> subprocess.Popen:
+    """Arranca el backend en `workdir` (log en <workdir>/<name>.log) y espera a que esté listo."""
+    with open(workdir / f"{name}.log", 'w') as log:
+        process = subprocess.Popen(
+            server_command(name, port), cwd=workdir, env={**env, 'PORT': str(port)},
+            stdout=log, stderr=subprocess.STDOUT
+        )
+    try:
+        wait_ready(f"http://127.0.0.1:{port}/api/health/ready", process)
+    except Exception:
+        stop(process)
+        raise
+    return process
+
+
+def summarize(values: List[float]) -> Optional[Dict[str, float]]:
+    """n, p50/p95/p99, media y máximo de una lista de latencias (segundos)."""
+    if not values:
+        return None
+    array = np.asarray(values, dtype=np.float64)
+    summary = {'n': len(array), 'mean': float(array.mean()), 'max': float(array.max())}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = float(np.percentile(array, p))
+    return summary
+
+
+def print_latency_table(rows: Dict[str, Dict[str, List[float]]], errors: Dict[str, Dict[str, int]]):
+    """Tabla por servidor y endpoint con n, p50/p95/p99, max y errores."""
+    header = f"{'servidor':10s} {'endpoint':22s} {'n':>6s}"
+    header += "".join(f" {'p' + str(p) + ' s':>8s}" for p in PERCENTILES)
+    header += f" {'max s':>8s} {'errores':>8s}"
+    print(header)
+    print("-" * len(header))
+    for name, endpoints in rows.items():
+        for endpoint, values in endpoints.items():
+            summary = summarize(values)
+            failed = errors.get(name, {}).get(endpoint, 0)
+            if summary is None:
+                if failed:
+                    print(f"{name:10s} {endpoint:22s} {0:>6d}" + " " * (9 * (len(PERCENTILES) + 1)) + f" {failed:>8d}")
+                continue
+            line = f"{name:10s} {endpoint:22s} {summary['n']:>6d}"
+            line += "".join(f" {summary['p' + str(p)]:>8.3f}" for p in PERCENTILES)
+            line += f" {summary['max']:>8.3f} {failed:>8d}"
+            print(line)
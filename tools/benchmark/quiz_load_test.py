@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga del quiz contra el OpenAI falso (fake_openai.py).
+
+Cada sesión recorre el quiz completo: /api/start-quiz, /api/chat hasta
+terminar (la respuesta correcta del OpenAI falso es siempre la primera
+opción; con --wrong-rate se falla a propósito para pasar por pistas y
+cambios de pregunta) y /api/get-location. Se reportan p50/p95/p99 por
+endpoint; con --stream también el tiempo hasta el primer fragmento.
+
+Con --build-runs se mide además RAGService.build_index en frío
+(`app.py --prepare-cache` con el cache vacío) para cada valor de
+--build-concurrency, con los requests de embeddings y 429 que recibió el
+OpenAI falso.
+
+Los servidores corren en un directorio de trabajo aparte (--workdir se
+reutiliza entre corridas), así el cache del RAG con embeddings falsos nunca
+toca backend/cache.
+
+Uso (desde la raíz del proyecto; requiere starlette y uvicorn, y asgiref
+para --servers asgi):
+    python tools/benchmark/quiz_load_test.py [--servers sync,asgi] [--sessions 50] [--questions 3]
+        [--wrong-rate 0.2] [--stream ndjson] [--latency lognormal:0.8,0.5] [--rate-limit-rate 0.02]
+        [--build-runs 1 --build-concurrency 1,4,8]
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from harness import (
+    server_env, stop, start_fake_openai, fake_stats, prepare_cache, start_server, summarize, print_latency_table
+)
+
+
+class SessionRecorder:
+    """Latencias y errores por endpoint de todas las sesiones de un servidor."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: List[str] = []
+        self.completed_sessions = 0
+
+    def record(self, endpoint: str, seconds: float):
+        self.latencies[endpoint].append(seconds)
+
+    def fail(self, endpoint: str, message: str):
+        self.errors[endpoint] += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(f"{endpoint}: {message}")
+
+
+def read_stream(response: requests.Response, mode: str, start: float) -> Tuple[Optional[float], Dict, int]:
+    """Consume un stream SSE/NDJSON: segundos desde `start` hasta el primer delta, datos y status del evento final."""
+    first_delta = None
+    final = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        if mode == 'sse':
+            if not line.startswith('data: '):
+                continue
+            line = line[len('data: '):]
+        event = json.loads(line)
+        if event.get('type') == 'delta' and first_delta is None:
+            first_delta = time.perf_counter() - start
+        elif event.get('type') == 'final':
+            final = event
+    if final is None:
+        return first_delta, {'error': 'stream sin evento final'}, 502
+    return first_delta, final['data'], final['status']
+
+
+def post(http: requests.Session, url: str, body: Dict, stream: Optional[str], recorder: SessionRecorder,
+         endpoint: str) -> Optional[Dict]:
+    """POST cronometrado y registrado como `endpoint`; devuelve los datos, o None si falló."""
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    start = time.perf_counter()
+    if stream:
+        response = http.post(f"{url}?stream={stream}", json=body, headers=headers, stream=True, timeout=600)
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            ttfb, data, status = None, response.json(), response.status_code
+        else:
+            ttfb, data, status = read_stream(response, stream, start)
+        response.close()
+    else:
+        response = http.post(url, json=body, headers=headers, timeout=600)
+        ttfb, data, status = None, response.json(), response.status_code
+    elapsed = time.perf_counter() - start
+
+    if status != 200 or not data.get('success'):
+        recorder.fail(endpoint, f"{status} {data.get('error')}")
+        return None
+    recorder.record(endpoint, elapsed)
+    if ttfb is not None:
+        recorder.record(f"{endpoint} ttfb", ttfb)
+    return data
+
+
+def run_session(base_url: str, args, seed: int, recorder: SessionRecorder):
+    """Una sesión completa del quiz."""
+    rng = random.Random(seed)
+    http = requests.Session()
+    try:
+        data = post(http, f"{base_url}/api/start-quiz",
+                    {'user_name': 'Bench', 'total_questions': args.questions}, args.stream, recorder, 'start-quiz')
+        if data is None:
+            return
+        session_id = data['session_id']
+
+        for _ in range(args.questions * 5):
+            options = data.get('options') or []
+            if not options:
+                recorder.fail('chat', 'pregunta sin opciones')
+                return
+            wrong = len(options) > 1 and rng.random() < args.wrong_rate
+            endpoint = 'chat incorrecta' if wrong else 'chat correcta'
+            answer = options[-1] if wrong else options[0]
+            data = post(http, f"{base_url}/api/chat", {'session_id': session_id, 'message': answer},
+                        args.stream, recorder, endpoint)
+            if data is None:
+                return
+            if data.get('completed'):
+                break
+        else:
+            recorder.fail('chat', 'el quiz no terminó')
+            return
+
+        start = time.perf_counter()
+        response = http.post(f"{base_url}/api/get-location", json={'session_id': session_id}, timeout=60)
+        if response.status_code != 200:
+            recorder.fail('get-location', f"{response.status_code} {response.json().get('error')}")
+            return
+        recorder.record('get-location', time.perf_counter() - start)
+        recorder.completed_sessions += 1
+    except Exception as e:
+        recorder.fail('sesión', f"{type(e).__name__}: {e}")
+
+
+def run_load(base_url: str, args) -> Tuple[SessionRecorder, float]:
+    recorder = SessionRecorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency or args.sessions) as executor:
+        for i in range(args.sessions):
+            executor.submit(run_session, base_url, args, args.seed + i, recorder)
+    return recorder, time.perf_counter() - start
+
+
+def print_fake_stats(stats: Dict):
+    requests_by_status = ", ".join(f"{key}: {count}" for key, count in stats['requests'].items())
+    print(f"   🤖 OpenAI falso: {requests_by_status or 'sin requests'} (máx. en vuelo {stats['max_in_flight']})")
+
+
+def benchmark_servers(workdir: Path, env: Dict[str, str], args):
+    print("📡 Preparando cache del RAG (embeddings falsos)...")
+    prepare_cache(workdir, env)
+
+    rows, errors = {}, {}
+    for name in args.servers.split(','):
+        process = start_server(name, workdir, env, args.port)
+        try:
+            fake_stats(args.fake_port, reset=True)
+            print(f"\n⏱️ {name}: {args.sessions} sesiones × {args.questions} preguntas "
+                  f"(concurrencia {args.concurrency or args.sessions}, stream {args.stream or 'no'})")
+            recorder, wall_seconds = run_load(f"http://127.0.0.1:{args.port}", args)
+        finally:
+            stop(process)
+
+        total_requests = sum(len(v) for k, v in recorder.latencies.items() if not k.endswith('ttfb'))
+        print(f"   ✅ {recorder.completed_sessions}/{args.sessions} sesiones completas, "
+              f"{total_requests / wall_seconds:.1f} req/s en {wall_seconds:.1f}s")
+        print_fake_stats(fake_stats(args.fake_port))
+        for sample in recorder.error_samples:
+            print(f"   ⚠️ {sample}")
+        rows[name] = dict(sorted(recorder.latencies.items()))
+        errors[name] = dict(recorder.errors)
+        for endpoint in recorder.errors:
+            rows[name].setdefault(endpoint, [])
+
+    print("\n📊 Latencias por endpoint")
+    print_latency_table(rows, errors)
+
+
+def benchmark_build_index(workdir: Path, env: Dict[str, str], args):
+    """RAGService.build_index en frío para cada concurrencia de embeddings."""
+    print(f"\n🏗️ build_index en frío ({args.build_runs} corridas por concurrencia)")
+    print(f"{'concurrencia':>12s} {'p50 s':>8s} {'max s':>8s} {'requests':>9s} {'429':>6s} {'500':>6s} {'textos':>8s}")
+    for concurrency in [int(value) for value in args.build_concurrency.split(',')]:
+        seconds, stats = [], []
+        for run in range(args.build_runs):
+            build_dir = Path(tempfile.mkdtemp(prefix=f"build-c{concurrency}-", dir=workdir))
+            fake_stats(args.fake_port, reset=True)
+            seconds.append(prepare_cache(build_dir, {**env, 'RAG_EMBEDDING_CONCURRENCY': str(concurrency)}))
+            stats.append(fake_stats(args.fake_port))
+        summary = summarize(seconds)
+
+        def count(status: int) -> float:
+            return sum(s['requests'].get(f"embeddings {status}", 0) for s in stats) / len(stats)
+
+        print(f"{concurrency:>12d} {summary['p50']:>8.2f} {summary['max']:>8.2f} {count(200) + count(429) + count(500):>9.0f} "
+              f"{count(429):>6.0f} {count(500):>6.0f} {sum(s['embedded_texts'] for s in stats) / len(stats):>8.0f}")
+
+
+def fake_openai_args(args) -> List[str]:
+    fake_args = ['--latency', args.latency, '--token-delay', args.token_delay,
+                 '--rate-limit-rate', str(args.rate_limit_rate), '--error-rate', str(args.error_rate),
+                 '--max-concurrency', str(args.max_concurrency), '--seed', str(args.seed)]
+    if args.embedding_latency:
+        fake_args += ['--embedding-latency', args.embedding_latency]
+    return fake_args
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de sesiones completas del quiz contra el OpenAI falso")
+    parser.add_argument('--servers', default='sync', help="variantes separadas por coma: sync (waitress), asgi (uvicorn)")
+    parser.add_argument('--sessions', type=int, default=20, help="sesiones de quiz")
+    parser.add_argument('--concurrency', type=int, default=0, help="sesiones simultáneas (default: todas)")
+    parser.add_argument('--questions', type=int, default=3, help="preguntas por sesión")
+    parser.add_argument('--wrong-rate', type=float, default=0.2, help="probabilidad de responder mal")
+    parser.add_argument('--stream', choices=['ndjson', 'sse'], help="pedir las respuestas en streaming")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', default='lognormal:0.8,0.5', help="spec de latencia de chat del OpenAI falso")
+    parser.add_argument('--embedding-latency', default='lognormal:0.2,0.3', help="spec de latencia de embeddings")
+    parser.add_argument('--token-delay', default='0.01', help="spec de espera entre chunks en streaming")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="probabilidad de 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probabilidad de 500")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="requests en vuelo antes de responder 429")
+    parser.add_argument('--build-runs', type=int, default=0, help="corridas de build_index en frío (0 = no medir)")
+    parser.add_argument('--build-concurrency', default='4', help="RAG_EMBEDDING_CONCURRENCY a comparar (p.ej. 1,4,8)")
+    parser.add_argument('--skip-servers', action='store_true', help="sólo medir build_index")
+    parser.add_argument('--workdir', help="directorio de trabajo (se reutiliza su cache del RAG)")
+    parser.add_argument('--port', type=int, default=8810)
+    parser.add_argument('--fake-port', type=int, default=8900)
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='rag-bench-')).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    env = server_env(args.fake_port)
+    print(f"📂 Directorio de trabajo: {workdir}")
+
+    fake = start_fake_openai(args.fake_port, fake_openai_args(args))
+    try:
+        if not args.skip_servers:
+            benchmark_servers(workdir, env, args)
+        if args.build_runs:
+            benchmark_build_index(workdir, env, args)
+    finally:
+        stop(fake)
+
+
+if __name__ == "__main__":
+    main()
@@ -50,8 +50,20 @@ def get_cache_info():
                     print(f"   • Datos: {list(data.keys())}")
         except Exception as e:
             print(f"   ⚠️  Error leyendo archivo: {e}")
-    else:
-        print("❌ rag_embeddings.pkl no encontrado")
+    
+    # Chunk store (reemplaza a rag_embeddings.pkl)
+    manifest_file = cache_dir / 'chunk_store' / 'manifest.json'
+    if manifest_file.exists():
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        size_mb = sum(p.stat().st_size for p in manifest_file.parent.rglob('*') if p.is_file()) / 1024 / 1024
+        print(f"📄 chunk_store/: {size_mb:.1f} MB (actualizado: {manifest.get('updated_at', 'Desconocido')})")
+        print(f"   • Chunks almacenados: {manifest.get('count', 0):,}")
+        print(f"   • Mensajes referenciados: {manifest.get('message_count', 0):,}")
+        print(f"   • Chunks prioritarios: {len(manifest.get('priority', {}))}")
+        print(f"   • Tipo de índice: {manifest.get('info', {}).get('index_type', 'Desconocido')}")
+    elif not embeddings_file.exists():
+        print("❌ chunk_store/ no encontrado")
     
     if index_file.exists():
         size_mb = index_file.stat().st_size / 1024 / 1024
@@ -60,9 +72,19 @@ def get_cache_info():
     else:
         print("❌ faiss_index.bin no encontrado")
     
+    # Cache de embeddings por contenido (se conserva al limpiar el índice)
+    embedding_cache_dir = cache_dir / 'embedding_cache'
+    if embedding_cache_dir.exists():
+        for model_dir in sorted(p for p in embedding_cache_dir.iterdir() if p.is_dir()):
+            keys_file = model_dir / 'keys.bin'
+            entries = keys_file.stat().st_size // 32 if keys_file.exists() else 0
+            vectors_file = model_dir / 'vectors.f32'
+            size_mb = vectors_file.stat().st_size / 1024 / 1024 if vectors_file.exists() else 0
+            print(f"📄 embedding_cache/{model_dir.name}: {entries:,} embeddings, {size_mb:.1f} MB")
+    
     # Espacio total
     total_size = 0
-    for file in cache_dir.glob('*'):
+    for file in cache_dir.rglob('*'):
         if file.is_file():
             total_size += file.stat().st_size
     
@@ -116,6 +138,13 @@ def clear_cache():
             except Exception as e:
                 print(f"   ❌ Error eliminando {file.name}: {e}")
     
+    chunk_store_dir = cache_dir / 'chunk_store'
+    if chunk_store_dir.exists():
+        import shutil
+        shutil.rmtree(chunk_store_dir)
+        print("   ✅ Eliminado: chunk_store/")
+        files_removed += 1
+    
     if files_removed > 0:
         print(f"\n✅ Cache limpiado ({files_removed} archivos eliminados)")
         print("💡 El cache se regenerará automáticamente en el próximo inicio")
@@ -149,6 +178,13 @@ def backup_cache():
             except Exception as e:
                 print(f"   ❌ Error con {file.name}: {e}")
     
+    chunk_store_dir = cache_dir / 'chunk_store'
+    if chunk_store_dir.exists():
+        import shutil
+        shutil.copytree(chunk_store_dir, backup_subdir / 'chunk_store')
+        print("   ✅ Backup: chunk_store/")
+        files_backed_up += 1
+    
     print(f"\n✅ Backup completado ({files_backed_up} archivos)")
 
 def main():